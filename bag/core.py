@@ -3,7 +3,8 @@
 """This is the core bag module.
 """
 
-from typing import TYPE_CHECKING, Dict, Any, Tuple, Optional, Union, Type, Sequence, TypeVar
+from typing import TYPE_CHECKING, Dict, Any, Tuple, Optional, Union, Type, Sequence, TypeVar, \
+    Iterable
 
 import os
 import string
@@ -22,6 +23,7 @@ from .layout.template import TemplateDB
 from .layout.core import DummyTechInfo
 from .io import read_file, sim_data
 from .concurrent.core import batch_async_task
+from .util.profiler import GenerationProfiler
 
 if TYPE_CHECKING:
     from .interface.simulator import SimAccess
@@ -572,8 +574,8 @@ class BagProject(object):
         return self.impl_db.get_cells_in_library(lib_name)
 
     def make_template_db(self, impl_lib, grid_specs, use_cybagoa=True, gds_lay_file='',
-                         cache_dir=''):
-        # type: (str, Dict[str, Any], bool, str, str) -> TemplateDB
+                         cache_dir='', store_dir=''):
+        # type: (str, Dict[str, Any], bool, str, str, str) -> TemplateDB
         """Create and return a new TemplateDB instance.
 
         Parameters
@@ -588,6 +590,8 @@ class BagProject(object):
             the GDS layout information file.
         cache_dir : str
             the cache directory name.
+        store_dir : str
+            the persistent master store directory name.
         """
         layers = grid_specs['layers']
         widths = grid_specs['widths']
@@ -598,7 +602,7 @@ class BagProject(object):
         routing_grid = RoutingGrid(self.tech_info, layers, spaces, widths, bot_dir,
                                    width_override=width_override)
         tdb = TemplateDB('template_libs.def', routing_grid, impl_lib, use_cybagoa=use_cybagoa,
-                         gds_lay_file=gds_lay_file, cache_dir=cache_dir)
+                         gds_lay_file=gds_lay_file, cache_dir=cache_dir, store_dir=store_dir)
 
         return tdb
 
@@ -644,7 +648,13 @@ class BagProject(object):
         save_cache : bool
             True to save instances in this template to cache.
         **kwargs :
-            Additional optional arguments.
+            Additional optional arguments.  Supports the following:
+
+            gen_profile_fname : str
+                If not empty, record the finalize time of each layout generator and
+                master.  A text report is saved to this file, and self times in folded
+                stack format for flame graph tools are saved to this file name with
+                the '.folded' extension appended.
 
         Returns
         -------
@@ -653,6 +663,7 @@ class BagProject(object):
         """
         prefix = kwargs.get('prefix', '')
         suffix = kwargs.get('suffix', '')
+        gen_profile_fname = kwargs.get('gen_profile_fname', '')
 
         impl_lib = specs['impl_lib']
         impl_cell = specs['impl_cell']
@@ -662,6 +673,7 @@ class BagProject(object):
         params = specs['params']
         gds_lay_file = specs.get('gds_lay_file', '')
         cache_dir = specs.get('cache_dir', '')
+        store_dir = specs.get('store_dir', '')
         if use_cache:
             db_cache_dir = specs.get('cache_dir', '')
         else:
@@ -669,7 +681,10 @@ class BagProject(object):
 
         if gen_lay or gen_sch:
             temp_db = self.make_template_db(impl_lib, grid_specs, use_cybagoa=use_cybagoa,
-                                            gds_lay_file=gds_lay_file, cache_dir=db_cache_dir)
+                                            gds_lay_file=gds_lay_file, cache_dir=db_cache_dir,
+                                            store_dir=store_dir)
+            if gen_profile_fname:
+                temp_db.profiler = GenerationProfiler()
 
             name_list = [impl_cell]
             print('computing layout...')
@@ -684,6 +699,9 @@ class BagProject(object):
 
             temp = temp_db.new_template(params=params, temp_cls=temp_cls, debug=debug)
             print('computation done.')
+            if gen_profile_fname:
+                temp_db.profiler.write_report(gen_profile_fname)
+                temp_db.profiler.write_folded(gen_profile_fname + '.folded')
             temp_list = [temp]
 
             if save_cache and cache_dir:
@@ -945,7 +963,7 @@ class BagProject(object):
                                               inst_lib, inst_cell, params, pin_mapping)
 
     def instantiate_layout(self, lib_name, view_name, via_tech, layout_list):
-        # type: (str, str, str, Sequence[Any]) -> None
+        # type: (str, str, str, Iterable[Any]) -> None
         """Create a batch of layouts.
 
         Parameters
@@ -956,8 +974,8 @@ class BagProject(object):
             layout view name.
         via_tech : str
             via technology name.
-        layout_list : Sequence[Any]
-            a list of layouts to create
+        layout_list : Iterable[Any]
+            an iterable of layouts to create, children before parents.
         """
         if self.impl_db is None:
             raise Exception('BAG Server is not set up.')
@@ -5,8 +5,8 @@
 
 import os
 import abc
-from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Any, Type, Set, Sequence, \
-    Callable, Union
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Any, Type, Set, Callable, \
+    Union, Iterable
 
 from bag import float_to_si_string
 from bag.io import read_yaml
@@ -84,15 +84,15 @@ class ModuleDB(MasterDB):
         return gen_cls(self, **kwargs)
 
     def create_masters_in_db(self, lib_name, content_list, debug=False):
-        # type: (str, Sequence[Any], bool) -> None
+        # type: (str, Iterable[Any], bool) -> None
         """Create the masters in the design database.
 
         Parameters
         ----------
         lib_name : str
             library to create the designs in.
-        content_list : Sequence[Any]
-            a list of the master contents.  Must be created in this order.
+        content_list : Iterable[Any]
+            an iterable of the master contents.  Must be created in this order.
         debug : bool
             True to print debug messages
         """
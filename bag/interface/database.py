@@ -3,7 +3,7 @@
 """This module defines DbAccess, the base class for CAD database manipulation.
 """
 
-from typing import TYPE_CHECKING, List, Dict, Tuple, Optional, Sequence, Any, Union
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional, Sequence, Iterable, Any, Union
 
 import os
 import abc
@@ -287,7 +287,7 @@ class DbAccess(InterfaceBase, abc.ABC):
 
     @abc.abstractmethod
     def instantiate_layout(self, lib_name, view_name, via_tech, layout_list):
-        # type: (str, str, str, Sequence[Any]) -> None
+        # type: (str, str, str, Iterable[Any]) -> None
         """Create a batch of layouts.
 
         Parameters
@@ -298,8 +298,8 @@ class DbAccess(InterfaceBase, abc.ABC):
             layout view name.
         via_tech : str
             via technology library name.
-        layout_list : Sequence[Any]
-            a list of layouts to create
+        layout_list : Iterable[Any]
+            an iterable of layouts to create, children before parents.
         """
         pass
 
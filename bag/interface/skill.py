@@ -20,6 +20,9 @@ try:
 except ImportError:
     cybagoa = None
 
+# maximum number of layout objects to send to Virtuoso in a single create_layout() call.
+_LAYOUT_BATCH_MAX_OBJECTS = 100000
+
 
 def _dict_to_pcell_params(table):
     """Convert given parameter dictionary to pcell parameter list format.
@@ -438,15 +441,25 @@ class SkillInterface(DbAccess):
             layout view name.
         via_tech : str
             via technology library name.
-        layout_list : list[any]
-            a list of layouts to create
+        layout_list : iterable[any]
+            an iterable of layouts to create, children before parents.  Layouts are sent
+            to Virtuoso in batches, so only one batch is kept in memory.
+
+        Returns
+        -------
+        result : Any
+            the result of the last batch.
         """
         # create library in case it doesn't exist
         self.create_library(lib_name)
 
-        # convert parameter dictionary to pcell params list format
+        cmd = 'create_layout( "%s" "%s" "%s" {layout_list} )' % (lib_name, view_name, via_tech)
         new_layout_list = []
+        num_obj = 0
+        result = None
+        sent = False
         for info_list in layout_list:
+            # convert parameter dictionary to pcell params list format
             new_inst_list = []
             for inst in info_list[1]:
                 if 'params' in inst:
@@ -457,10 +470,17 @@ class SkillInterface(DbAccess):
             new_info_list = info_list[:]
             new_info_list[1] = new_inst_list
             new_layout_list.append(new_info_list)
-
-        cmd = 'create_layout( "%s" "%s" "%s" {layout_list} )' % (lib_name, view_name, via_tech)
-        in_files = {'layout_list': new_layout_list}
-        return self._eval_skill(cmd, input_files=in_files)
+            num_obj += sum((len(obj_list) for obj_list in info_list[1:]))
+            if num_obj >= _LAYOUT_BATCH_MAX_OBJECTS:
+                # children are created before parents, so partial batches are consistent.
+                result = self._eval_skill(cmd, input_files={'layout_list': new_layout_list})
+                sent = True
+                new_layout_list = []
+                num_obj = 0
+
+        if new_layout_list or not sent:
+            result = self._eval_skill(cmd, input_files={'layout_list': new_layout_list})
+        return result
 
     def release_write_locks(self, lib_name, cell_view_list):
         """Release write locks from all the given cells.
@@ -0,0 +1,729 @@
+# -*- coding: utf-8 -*-
+
+"""This module provides a streaming GDSII stream format writer, and a GDSII reader.
+
+Coordinates are given in database units.  Structures are encoded into memory one at a
+time, and written to the output file as soon as they are complete, so memory usage does
+not depend on library size.  The reader memory-maps the file, and returns shape bounding
+boxes as NumPy arrays.
+"""
+
+from typing import Dict, Set, Tuple, Sequence, Optional, List, Any
+
+import math
+import mmap
+import time
+import struct
+
+import numpy as np
+
+# record types, already combined with their data types
+_HEADER = 0x0002
+_BGNLIB = 0x0102
+_LIBNAME = 0x0206
+_UNITS = 0x0305
+_ENDLIB = 0x0400
+_BGNSTR = 0x0502
+_STRNAME = 0x0606
+_ENDSTR = 0x0700
+_BOUNDARY = 0x0800
+_SREF = 0x0A00
+_AREF = 0x0B00
+_TEXT = 0x0C00
+_LAYER = 0x0D02
+_DATATYPE = 0x0E02
+_XY = 0x1003
+_ENDEL = 0x1100
+_SNAME = 0x1206
+_COLROW = 0x1302
+_TEXTTYPE = 0x1602
+_STRING = 0x1906
+_STRANS = 0x1A01
+_ANGLE = 0x1C05
+
+# GDSII version number written in the HEADER record.
+_VERSION = 600
+# maximum number of points in a XY record.
+_MAX_XY_POINTS = 8191
+
+
+def _pack_real8(val):
+    # type: (float) -> bytes
+    """Returns the GDSII 8-byte excess-64 real encoding of the given value."""
+    if val == 0:
+        return b'\x00' * 8
+    sign = 0x80 if val < 0 else 0
+    val = abs(val)
+    # find exponent such that val = mant * 16 ** exp, with 1/16 <= mant < 1
+    exp = (math.frexp(val)[1] + 3) // 4
+    mant = int(round(math.ldexp(val, 56 - 4 * exp)))
+    if mant >= (1 << 56):
+        mant >>= 4
+        exp += 1
+    return struct.pack('>Q', ((sign | (exp + 64)) << 56) | mant)
+
+
+def _pack_str(rtype, val):
+    # type: (int, str) -> bytes
+    data = val.encode('ascii')
+    if len(data) % 2 != 0:
+        data += b'\x00'
+    return struct.pack('>2H', 4 + len(data), rtype) + data
+
+
+def _pack_int2(rtype, *vals):
+    # type: (int, int) -> bytes
+    return struct.pack('>2H%dh' % len(vals), 4 + 2 * len(vals), rtype, *vals)
+
+
+def _pack_xy(xy_list):
+    # type: (Sequence[int]) -> bytes
+    num = len(xy_list)
+    return struct.pack('>2H%dl' % num, 4 + 4 * num, _XY, *xy_list)
+
+
+def _pack_timestamp(timestamp):
+    # type: (time.struct_time) -> Tuple[int, ...]
+    return tuple(timestamp[:6]) * 2
+
+
+def _pack_strans(angle, reflect):
+    # type: (int, bool) -> bytes
+    if not reflect and angle == 0:
+        return b''
+    ans = struct.pack('>3H', 6, _STRANS, 0x8000 if reflect else 0)
+    if angle != 0:
+        ans += struct.pack('>2H', 12, _ANGLE) + _pack_real8(angle)
+    return ans
+
+
+def _rotate(x, y, angle):
+    # type: (int, int, int) -> Tuple[int, int]
+    angle %= 360
+    if angle == 0:
+        return x, y
+    if angle == 90:
+        return -y, x
+    if angle == 180:
+        return -x, -y
+    if angle == 270:
+        return y, -x
+    rad = math.radians(angle)
+    cval, sval = math.cos(rad), math.sin(rad)
+    return int(round(x * cval - y * sval)), int(round(x * sval + y * cval))
+
+
+def get_box_cell_name(layer, datatype, width, height):
+    # type: (int, int, int, int) -> str
+    """Returns the name of the shared cell containing a single box.
+
+    Parameters
+    ----------
+    layer : int
+        the GDS layer number.
+    datatype : int
+        the GDS datatype number.
+    width : int
+        the box width, in database units.
+    height : int
+        the box height, in database units.
+
+    Returns
+    -------
+    cell_name : str
+        the cell name.
+    """
+    return 'BAG_BOX_L%d_D%d_%dx%d' % (layer, datatype, width, height)
+
+
+class GDSCell(object):
+    """The records of a single GDSII structure.
+
+    Parameters
+    ----------
+    name : str
+        the structure name.
+    timestamp : Optional[time.struct_time]
+        the structure creation time.  Defaults to current time.
+    """
+
+    def __init__(self, name, timestamp=None):
+        # type: (str, Optional[time.struct_time]) -> None
+        if timestamp is None:
+            timestamp = time.localtime()
+        self._name = name
+        self._timestamp = timestamp
+        self._shared_cells = {}  # type: Dict[str, GDSCell]
+        self._data = bytearray(_pack_int2(_BGNSTR, *_pack_timestamp(timestamp)))
+        self._data += _pack_str(_STRNAME, name)
+
+    @property
+    def name(self):
+        # type: () -> str
+        """Returns the structure name."""
+        return self._name
+
+    @property
+    def timestamp(self):
+        # type: () -> time.struct_time
+        """Returns the structure creation time."""
+        return self._timestamp
+
+    @property
+    def shared_cells(self):
+        # type: () -> Dict[str, GDSCell]
+        """Returns a dictionary from name to shared structures referenced by this structure.
+
+        Shared structures are written to the library only once, before their first user.
+        """
+        return self._shared_cells
+
+    def create_cell(self, name):
+        # type: (str) -> GDSCell
+        """Create a new structure with the same creation time as this structure.
+
+        Parameters
+        ----------
+        name : str
+            the structure name.
+
+        Returns
+        -------
+        cell : GDSCell
+            the new structure.
+        """
+        return GDSCell(name, timestamp=self._timestamp)
+
+    def get_data(self):
+        # type: () -> bytes
+        """Returns the records of this structure."""
+        return bytes(self._data) + struct.pack('>2H', 4, _ENDSTR)
+
+    def add_polygon(self, layer, datatype, points):
+        # type: (int, int, Sequence[Tuple[int, int]]) -> None
+        """Add a polygon.
+
+        Parameters
+        ----------
+        layer : int
+            the GDS layer number.
+        datatype : int
+            the GDS datatype number.
+        points : Sequence[Tuple[int, int]]
+            the polygon vertices.  The polygon is closed automatically.
+        """
+        if len(points) + 1 > _MAX_XY_POINTS:
+            raise ValueError('Polygon with %d points exceeds GDSII limit.' % len(points))
+        xy_list = [coord for pt in points for coord in pt]
+        xy_list.extend(points[0])
+        self._data += (struct.pack('>2H', 4, _BOUNDARY) + _pack_int2(_LAYER, layer) +
+                       _pack_int2(_DATATYPE, datatype) + _pack_xy(xy_list) +
+                       struct.pack('>2H', 4, _ENDEL))
+
+    def add_box(self, layer, datatype, x0, y0, x1, y1):
+        # type: (int, int, int, int, int, int) -> None
+        """Add a rectangle.
+
+        Parameters
+        ----------
+        layer : int
+            the GDS layer number.
+        datatype : int
+            the GDS datatype number.
+        x0 : int
+            the left coordinate.
+        y0 : int
+            the bottom coordinate.
+        x1 : int
+            the right coordinate.
+        y1 : int
+            the top coordinate.
+        """
+        self._data += (struct.pack('>2H', 4, _BOUNDARY) + _pack_int2(_LAYER, layer) +
+                       _pack_int2(_DATATYPE, datatype) +
+                       _pack_xy((x0, y0, x0, y1, x1, y1, x1, y0, x0, y0)) +
+                       struct.pack('>2H', 4, _ENDEL))
+
+    def add_boxes(self, layer, datatype, boxes):
+        # type: (int, int, np.ndarray) -> None
+        """Add many rectangles on the same layer.
+
+        All records are encoded at once with NumPy.
+
+        Parameters
+        ----------
+        layer : int
+            the GDS layer number.
+        datatype : int
+            the GDS datatype number.
+        boxes : np.ndarray
+            a N x 4 integer array of [left, bottom, right, top] coordinates.
+        """
+        num = boxes.shape[0]
+        if num == 0:
+            return
+        head = (struct.pack('>2H', 4, _BOUNDARY) + _pack_int2(_LAYER, layer) +
+                _pack_int2(_DATATYPE, datatype) + struct.pack('>2H', 44, _XY))
+        # each record is 5 words of header, 10 coordinates, and the ENDEL word.
+        records = np.empty((num, 16), dtype='>i4')
+        records[:, 0:5] = np.frombuffer(head, dtype='>i4')
+        x0, y0, x1, y1 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        for idx, col in enumerate((x0, y0, x0, y1, x1, y1, x1, y0, x0, y0)):
+            records[:, 5 + idx] = col
+        records[:, 15] = np.frombuffer(struct.pack('>2H', 4, _ENDEL), dtype='>i4')[0]
+        self._data += records.tobytes()
+
+    def add_box_array(self, layer, datatype, x0, y0, x1, y1, nx=1, ny=1, spx=0, spy=0):
+        # type: (int, int, int, int, int, int, int, int, int, int) -> None
+        """Add an array of rectangles.
+
+        Arrays are written as an array reference to a shared cell containing a single
+        rectangle.
+
+        Parameters
+        ----------
+        layer : int
+            the GDS layer number.
+        datatype : int
+            the GDS datatype number.
+        x0 : int
+            the left coordinate of the lower-left rectangle.
+        y0 : int
+            the bottom coordinate of the lower-left rectangle.
+        x1 : int
+            the right coordinate of the lower-left rectangle.
+        y1 : int
+            the top coordinate of the lower-left rectangle.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+        """
+        if nx == 1 and ny == 1:
+            self.add_box(layer, datatype, x0, y0, x1, y1)
+        else:
+            w, h = x1 - x0, y1 - y0
+            box_name = get_box_cell_name(layer, datatype, w, h)
+            if box_name not in self._shared_cells:
+                box_cell = GDSCell(box_name, timestamp=self._timestamp)
+                box_cell.add_box(layer, datatype, 0, 0, w, h)
+                self._shared_cells[box_name] = box_cell
+            self.add_ref(box_name, x0, y0, nx=nx, ny=ny, spx=spx, spy=spy)
+
+    def add_shared_ref(self, cell, x, y, angle=0, reflect=False, nx=1, ny=1, spx=0, spy=0):
+        # type: (GDSCell, int, int, int, bool, int, int, int, int) -> None
+        """Add a reference, or an array of references, to a shared structure.
+
+        Shared structures are identified by name, so structures with the same name must
+        have the same content.
+
+        Parameters
+        ----------
+        cell : GDSCell
+            the shared structure.
+        x : int
+            the X coordinate of the reference origin.
+        y : int
+            the Y coordinate of the reference origin.
+        angle : int
+            counter-clockwise rotation angle, in degrees.
+        reflect : bool
+            True to reflect about the X axis before rotation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+        """
+        self._shared_cells[cell.name] = cell
+        self.add_ref(cell.name, x, y, angle=angle, reflect=reflect, nx=nx, ny=ny, spx=spx,
+                     spy=spy)
+
+    def add_ref(self, cell_name, x, y, angle=0, reflect=False, nx=1, ny=1, spx=0, spy=0):
+        # type: (str, int, int, int, bool, int, int, int, int) -> None
+        """Add a structure reference, or an array of structure references.
+
+        The array pitches are given in the coordinate system of the referenced structure.
+
+        Parameters
+        ----------
+        cell_name : str
+            the referenced structure name.
+        x : int
+            the X coordinate of the reference origin.
+        y : int
+            the Y coordinate of the reference origin.
+        angle : int
+            counter-clockwise rotation angle, in degrees.
+        reflect : bool
+            True to reflect about the X axis before rotation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+        """
+        strans = _pack_strans(angle, reflect)
+        if nx == 1 and ny == 1:
+            self._data += (struct.pack('>2H', 4, _SREF) + _pack_str(_SNAME, cell_name) +
+                           strans + _pack_xy((x, y)) + struct.pack('>2H', 4, _ENDEL))
+        else:
+            dx1, dy1 = _rotate(nx * spx, 0, angle)
+            dx2, dy2 = _rotate(0, -ny * spy if reflect else ny * spy, angle)
+            self._data += (struct.pack('>2H', 4, _AREF) + _pack_str(_SNAME, cell_name) +
+                           strans + _pack_int2(_COLROW, nx, ny) +
+                           _pack_xy((x, y, x + dx1, y + dy1, x + dx2, y + dy2)) +
+                           struct.pack('>2H', 4, _ENDEL))
+
+    def add_text(self, layer, texttype, text, x, y, angle=0):
+        # type: (int, int, str, int, int, int) -> None
+        """Add a text label.
+
+        Parameters
+        ----------
+        layer : int
+            the GDS layer number.
+        texttype : int
+            the GDS text type number.
+        text : str
+            the label text.
+        x : int
+            the X coordinate of the label.
+        y : int
+            the Y coordinate of the label.
+        angle : int
+            counter-clockwise rotation angle, in degrees.
+        """
+        self._data += (struct.pack('>2H', 4, _TEXT) + _pack_int2(_LAYER, layer) +
+                       _pack_int2(_TEXTTYPE, texttype) + _pack_strans(angle, False) +
+                       _pack_xy((x, y)) + _pack_str(_STRING, text) +
+                       struct.pack('>2H', 4, _ENDEL))
+
+
+class GDSWriter(object):
+    """Writes a GDSII library to a file, one structure at a time.
+
+    Parameters
+    ----------
+    fname : str
+        the output file name.
+    lib_name : str
+        the library name.
+    unit : float
+        the user unit, in meters.
+    precision : float
+        the database unit, in meters.
+    buffer_size : int
+        the output file buffer size, in bytes.
+    timestamp : Optional[time.struct_time]
+        the library creation time.  Defaults to current time.
+    """
+
+    def __init__(self, fname, lib_name, unit, precision, buffer_size=1 << 20,
+                 timestamp=None):
+        # type: (str, str, float, float, int, Optional[time.struct_time]) -> None
+        if timestamp is None:
+            timestamp = time.localtime()
+        self._timestamp = timestamp
+        self._shared_names = set()  # type: Set[str]
+        self._file = open(fname, 'wb', buffering=buffer_size)
+        self._file.write(_pack_int2(_HEADER, _VERSION) +
+                         _pack_int2(_BGNLIB, *_pack_timestamp(timestamp)) +
+                         _pack_str(_LIBNAME, lib_name) +
+                         struct.pack('>2H', 20, _UNITS) + _pack_real8(precision / unit) +
+                         _pack_real8(precision))
+
+    def __enter__(self):
+        # type: () -> GDSWriter
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def timestamp(self):
+        # type: () -> time.struct_time
+        """Returns the library creation time."""
+        return self._timestamp
+
+    def new_cell(self, name):
+        # type: (str) -> GDSCell
+        """Create a new structure with the library creation time.
+
+        Parameters
+        ----------
+        name : str
+            the structure name.
+
+        Returns
+        -------
+        cell : GDSCell
+            the new structure.  Write it to the file with write_cell().
+        """
+        return GDSCell(name, timestamp=self._timestamp)
+
+    def write_cell(self, cell):
+        # type: (GDSCell) -> None
+        """Write the given structure, and all shared cells it needs, to the file.
+
+        Parameters
+        ----------
+        cell : GDSCell
+            the structure to write.
+        """
+        shared_cells = cell.shared_cells
+        for name in sorted(shared_cells.keys()):
+            if name not in self._shared_names:
+                self._shared_names.add(name)
+                self.write_cell(shared_cells[name])
+        self._file.write(cell.get_data())
+
+    def close(self):
+        # type: () -> None
+        """Finish the library and close the file."""
+        if not self._file.closed:
+            self._file.write(struct.pack('>2H', 4, _ENDLIB))
+            self._file.close()
+
+
+def _unpack_real8(data, offset):
+    # type: (Any, int) -> float
+    """Returns the value of the GDSII 8-byte real at the given offset."""
+    val = struct.unpack_from('>Q', data, offset)[0]
+    exp = ((val >> 56) & 0x7f) - 64
+    ans = math.ldexp(val & 0x00ffffffffffffff, 4 * exp - 56)
+    return -ans if val >> 63 else ans
+
+
+def _transform_boxes(boxes, angle, reflect, mag):
+    # type: (np.ndarray, float, bool, float) -> np.ndarray
+    """Returns the bounding boxes of the given boxes after reflection, magnification, and
+    rotation about the origin."""
+    xl, yb, xr, yt = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    if reflect:
+        yb, yt = -yt, -yb
+    if mag != 1:
+        xl, yb, xr, yt = (np.rint(val * mag).astype(np.int64) for val in (xl, yb, xr, yt))
+    angle %= 360
+    if angle == 0:
+        ans = (xl, yb, xr, yt)
+    elif angle == 90:
+        ans = (-yt, xl, -yb, xr)
+    elif angle == 180:
+        ans = (-xr, -yt, -xl, -yb)
+    elif angle == 270:
+        ans = (yb, -xr, yt, -xl)
+    else:
+        rad = math.radians(angle)
+        cval, sval = math.cos(rad), math.sin(rad)
+        xc = np.stack((xl, xl, xr, xr), axis=1)
+        yc = np.stack((yb, yt, yb, yt), axis=1)
+        xn = xc * cval - yc * sval
+        yn = xc * sval + yc * cval
+        ans = (np.floor(xn.min(axis=1)), np.floor(yn.min(axis=1)),
+               np.ceil(xn.max(axis=1)), np.ceil(yn.max(axis=1)))
+    return np.stack(ans, axis=1).astype(np.int64)
+
+
+class GDSReader(object):
+    """Reads shapes of a GDSII library.
+
+    The file is memory-mapped and scanned once.  Shapes are returned as bounding boxes in
+    NumPy arrays, so large cells are never materialized as Python objects.
+
+    Parameters
+    ----------
+    fname : str
+        the GDS file name.
+    """
+
+    def __init__(self, fname):
+        # type: (str) -> None
+        self._file = open(fname, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._unit = self._precision = 0.0
+        # structure name -> [layer/datatype/XY offset/point count lists, path list, ref list]
+        self._struct_table = {}  # type: Dict[str, List[Any]]
+        self._flat_table = {}  # type: Dict[str, Dict[Tuple[int, int], np.ndarray]]
+        self._scan()
+
+    def __enter__(self):
+        # type: () -> GDSReader
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        # type: () -> None
+        """Close the file."""
+        self._flat_table.clear()
+        if not self._mm.closed:
+            self._mm.close()
+            self._file.close()
+
+    @property
+    def unit(self):
+        # type: () -> float
+        """Returns the user unit, in meters."""
+        return self._unit
+
+    @property
+    def precision(self):
+        # type: () -> float
+        """Returns the database unit, in meters."""
+        return self._precision
+
+    def cell_names(self):
+        # type: () -> List[str]
+        """Returns the names of all structures in this library."""
+        return list(self._struct_table.keys())
+
+    def _scan(self):
+        # type: () -> None
+        mm = self._mm
+        size = len(mm)
+        unpack = struct.unpack_from
+        offset = 0
+        cur = None  # type: Optional[List[Any]]
+        etype = layer = dtype = width = xy_off = xy_num = 0
+        sname = ''
+        angle = 0.0
+        mag = 1.0
+        reflect = False
+        colrow = (1, 1)
+        while offset + 4 <= size:
+            rlen, rtype = unpack('>2H', mm, offset)
+            if rlen < 4:
+                # null padding after ENDLIB
+                break
+            rec = rtype >> 8
+            if rec == 0x10:
+                xy_off, xy_num = offset + 4, (rlen - 4) // 8
+            elif rec == 0x0D:
+                layer = unpack('>h', mm, offset + 4)[0]
+            elif rec == 0x0E or rec == 0x2E:
+                dtype = unpack('>h', mm, offset + 4)[0]
+            elif rec == 0x11:
+                if etype == 0x08 or etype == 0x2D:
+                    cur[0].append(layer)
+                    cur[1].append(dtype)
+                    cur[2].append(xy_off)
+                    cur[3].append(xy_num)
+                elif etype == 0x09:
+                    xy = unpack('>%dl' % (2 * xy_num), mm, xy_off)
+                    cur[4].append((layer, dtype, abs(width) // 2, xy))
+                elif etype == 0x0A or etype == 0x0B:
+                    xy = unpack('>%dl' % (2 * xy_num), mm, xy_off)
+                    cur[5].append((sname, angle, reflect, mag, colrow, xy))
+                etype = 0
+            elif 0x08 <= rec <= 0x0C or rec == 0x15 or rec == 0x2D:
+                etype = rec
+                width = 0
+                angle = 0.0
+                mag = 1.0
+                reflect = False
+                colrow = (1, 1)
+            elif rec == 0x12:
+                sname = mm[offset + 4:offset + rlen].rstrip(b'\x00').decode('ascii')
+            elif rec == 0x1A:
+                reflect = (unpack('>H', mm, offset + 4)[0] & 0x8000) != 0
+            elif rec == 0x1C:
+                angle = _unpack_real8(mm, offset + 4)
+            elif rec == 0x1B:
+                mag = _unpack_real8(mm, offset + 4)
+            elif rec == 0x13:
+                colrow = unpack('>2h', mm, offset + 4)
+            elif rec == 0x0F:
+                width = unpack('>l', mm, offset + 4)[0]
+            elif rec == 0x06:
+                name = mm[offset + 4:offset + rlen].rstrip(b'\x00').decode('ascii')
+                cur = self._struct_table[name] = [[], [], [], [], [], []]
+            elif rec == 0x07:
+                cur = None
+            elif rec == 0x03:
+                self._precision = _unpack_real8(mm, offset + 12)
+                self._unit = self._precision / _unpack_real8(mm, offset + 4)
+            offset += rlen
+
+    def get_boxes(self, cell_name):
+        # type: (str) -> Dict[Tuple[int, int], np.ndarray]
+        """Returns the bounding boxes of all shapes in the given cell, with hierarchy
+        flattened.
+
+        Polygons and boxes are represented by their bounding boxes.  Paths are represented
+        by the bounding box of their center line, expanded by half the path width.  Results
+        are cached per structure, so shared structures are only read once.
+
+        Parameters
+        ----------
+        cell_name : str
+            the cell name.
+
+        Returns
+        -------
+        box_table : Dict[Tuple[int, int], np.ndarray]
+            a dictionary from (layer, datatype) to a N x 4 int64 array of (xl, yb, xr, yt)
+            bounding boxes, in database units.
+        """
+        ans = self._flat_table.get(cell_name, None)
+        if ans is not None:
+            return ans
+
+        if cell_name not in self._struct_table:
+            raise ValueError('Cell %s not found in GDS file.' % cell_name)
+        lay_list, dt_list, off_list, num_list, path_list, ref_list = self._struct_table[cell_name]
+        box_lists = {}  # type: Dict[Tuple[int, int], List[np.ndarray]]
+        if off_list:
+            # gather all XY records at once, then reduce each shape to its bounding box.
+            num_arr = np.array(num_list, dtype=np.int64)
+            off_arr = np.array(off_list, dtype=np.int64)
+            nbytes = num_arr * 8
+            starts = np.cumsum(nbytes) - nbytes
+            idx = np.repeat(off_arr - starts, nbytes) + np.arange(starts[-1] + nbytes[-1])
+            buf = np.frombuffer(self._mm, dtype=np.uint8)
+            xy = buf[idx].view('>i4').astype(np.int64).reshape(-1, 2)
+            pt_starts = starts // 8
+            boxes = np.stack((np.minimum.reduceat(xy[:, 0], pt_starts),
+                              np.minimum.reduceat(xy[:, 1], pt_starts),
+                              np.maximum.reduceat(xy[:, 0], pt_starts),
+                              np.maximum.reduceat(xy[:, 1], pt_starts)), axis=1)
+            lay_dt = np.array(lay_list, dtype=np.int64) * 65536 + np.array(dt_list)
+            for key in np.unique(lay_dt):
+                box_lists[(int(key) // 65536, int(key) % 65536)] = [boxes[lay_dt == key]]
+        for layer, dtype, hw, xy in path_list:
+            xc, yc = xy[0::2], xy[1::2]
+            box = np.array([[min(xc) - hw, min(yc) - hw, max(xc) + hw, max(yc) + hw]],
+                           dtype=np.int64)
+            box_lists.setdefault((layer, dtype), []).append(box)
+        for sname, angle, reflect, mag, (nx, ny), xy in ref_list:
+            x0, y0 = xy[0], xy[1]
+            if len(xy) >= 6:
+                # AREF displacement points are in this cell's coordinate system.
+                offsets = np.array([[x0 + ((xy[2] - x0) * cidx) // nx +
+                                     ((xy[4] - x0) * ridx) // ny,
+                                     y0 + ((xy[3] - y0) * cidx) // nx +
+                                     ((xy[5] - y0) * ridx) // ny]
+                                    for ridx in range(ny) for cidx in range(nx)],
+                                   dtype=np.int64)
+            else:
+                offsets = np.array([[x0, y0]], dtype=np.int64)
+            offsets = np.tile(offsets, 2).reshape(-1, 1, 4)
+            for key, child_boxes in self.get_boxes(sname).items():
+                cur_boxes = _transform_boxes(child_boxes, angle, reflect, mag)
+                box_lists.setdefault(key, []).append((cur_boxes + offsets).reshape(-1, 4))
+
+        ans = {key: np.concatenate(val_list) if len(val_list) > 1 else val_list[0]
+               for key, val_list in box_lists.items()}
+        self._flat_table[cell_name] = ans
+        return ans
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+
+"""This module provides a streaming OASIS stream format writer.
+
+The interface mirrors the GDSII writer in bag.io.gds.  Coordinates are given in database
+units.  Arrays of rectangles and references are written as single records with repetitions,
+and the records of each cell are compressed in a CBLOCK.
+"""
+
+from typing import TYPE_CHECKING, Dict, Set, Tuple, Sequence
+
+import math
+import zlib
+import struct
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# record IDs
+_START = 1
+_END = 2
+_CELL = 14
+_PLACEMENT = 17
+_PLACEMENT_TRANS = 18
+_TEXT = 19
+_RECTANGLE = 20
+_POLYGON = 21
+_CBLOCK = 34
+
+_MAGIC = b'%SEMI-OASIS\r\n'
+# the END record is always 256 bytes long.
+_END_SIZE = 256
+# cell records shorter than this are not compressed.
+_CBLOCK_MIN_SIZE = 64
+
+
+def _pack_uint(val):
+    # type: (int) -> bytes
+    if val < 0x80:
+        return bytes((val,))
+    ans = bytearray()
+    while True:
+        byte = val & 0x7f
+        val >>= 7
+        if val:
+            ans.append(byte | 0x80)
+        else:
+            ans.append(byte)
+            return bytes(ans)
+
+
+def _pack_sint(val):
+    # type: (int) -> bytes
+    return _pack_uint((-val << 1) | 1 if val < 0 else val << 1)
+
+
+def _pack_str(val):
+    # type: (str) -> bytes
+    data = val.encode('ascii')
+    return _pack_uint(len(data)) + data
+
+
+def _pack_real(val):
+    # type: (float) -> bytes
+    if val == int(val):
+        return _pack_uint(0) + _pack_uint(int(val)) if val >= 0 else \
+            _pack_uint(1) + _pack_uint(-int(val))
+    return _pack_uint(7) + struct.pack('<d', val)
+
+
+def _pack_gdelta(dx, dy):
+    # type: (int, int) -> bytes
+    """Returns the general form encoding of the given displacement."""
+    return _pack_uint((abs(dx) << 2) | (2 if dx < 0 else 0) | 1) + _pack_sint(dy)
+
+
+def _pack_repetition(nx, ny, col_vec, row_vec):
+    # type: (int, int, Tuple[int, int], Tuple[int, int]) -> bytes
+    """Returns the repetition of a nx by ny array with the given displacement vectors."""
+    cx, cy = col_vec
+    rx, ry = row_vec
+    if nx > 1 and ny > 1:
+        if cy == 0 and rx == 0 and cx > 0 and ry > 0:
+            return (_pack_uint(1) + _pack_uint(nx - 2) + _pack_uint(ny - 2) + _pack_uint(cx) +
+                    _pack_uint(ry))
+        return (_pack_uint(8) + _pack_uint(nx - 2) + _pack_uint(ny - 2) + _pack_gdelta(cx, cy) +
+                _pack_gdelta(rx, ry))
+    if nx > 1:
+        num, dx, dy = nx, cx, cy
+    else:
+        num, dx, dy = ny, rx, ry
+    if dy == 0 and dx > 0:
+        return _pack_uint(2) + _pack_uint(num - 2) + _pack_uint(dx)
+    if dx == 0 and dy > 0:
+        return _pack_uint(3) + _pack_uint(num - 2) + _pack_uint(dy)
+    return _pack_uint(9) + _pack_uint(num - 2) + _pack_gdelta(dx, dy)
+
+
+def _rotate(x, y, angle):
+    # type: (int, int, int) -> Tuple[int, int]
+    angle %= 360
+    if angle == 0:
+        return x, y
+    if angle == 90:
+        return -y, x
+    if angle == 180:
+        return -x, -y
+    if angle == 270:
+        return y, -x
+    rad = math.radians(angle)
+    cval, sval = math.cos(rad), math.sin(rad)
+    return int(round(x * cval - y * sval)), int(round(x * sval + y * cval))
+
+
+class OASISCell(object):
+    """The records of a single OASIS cell.
+
+    Parameters
+    ----------
+    name : str
+        the cell name.
+    compress : bool
+        True to compress the cell records in a CBLOCK.
+    """
+
+    def __init__(self, name, compress=True):
+        # type: (str, bool) -> None
+        self._name = name
+        self._compress = compress
+        self._shared_cells = {}  # type: Dict[str, OASISCell]
+        self._data = bytearray()
+
+    @property
+    def name(self):
+        # type: () -> str
+        """Returns the cell name."""
+        return self._name
+
+    @property
+    def shared_cells(self):
+        # type: () -> Dict[str, OASISCell]
+        """Returns a dictionary from name to shared cells referenced by this cell.
+
+        Shared cells are written to the file only once, before their first user.
+        """
+        return self._shared_cells
+
+    def create_cell(self, name):
+        # type: (str) -> OASISCell
+        """Create a new cell with the same settings as this cell.
+
+        Parameters
+        ----------
+        name : str
+            the cell name.
+
+        Returns
+        -------
+        cell : OASISCell
+            the new cell.
+        """
+        return OASISCell(name, compress=self._compress)
+
+    def get_data(self):
+        # type: () -> bytes
+        """Returns the records of this cell."""
+        header = _pack_uint(_CELL) + _pack_str(self._name)
+        data = bytes(self._data)
+        if not self._compress or len(data) < _CBLOCK_MIN_SIZE:
+            return header + data
+        comp_obj = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        comp_data = comp_obj.compress(data) + comp_obj.flush()
+        return (header + _pack_uint(_CBLOCK) + _pack_uint(0) + _pack_uint(len(data)) +
+                _pack_uint(len(comp_data)) + comp_data)
+
+    def add_polygon(self, layer, datatype, points):
+        # type: (int, int, Sequence[Tuple[int, int]]) -> None
+        """Add a polygon.
+
+        Parameters
+        ----------
+        layer : int
+            the layer number.
+        datatype : int
+            the datatype number.
+        points : Sequence[Tuple[int, int]]
+            the polygon vertices.  The polygon is closed automatically.
+        """
+        x0, y0 = points[0]
+        point_list = bytearray(_pack_uint(4) + _pack_uint(len(points) - 1))
+        xp, yp = x0, y0
+        for x, y in points[1:]:
+            point_list += _pack_gdelta(x - xp, y - yp)
+            xp, yp = x, y
+        self._data += (_pack_uint(_POLYGON) + b'\x3b' + _pack_uint(layer) +
+                       _pack_uint(datatype) + point_list + _pack_sint(x0) + _pack_sint(y0))
+
+    def add_box(self, layer, datatype, x0, y0, x1, y1):
+        # type: (int, int, int, int, int, int) -> None
+        """Add a rectangle.
+
+        Parameters
+        ----------
+        layer : int
+            the layer number.
+        datatype : int
+            the datatype number.
+        x0 : int
+            the left coordinate.
+        y0 : int
+            the bottom coordinate.
+        x1 : int
+            the right coordinate.
+        y1 : int
+            the top coordinate.
+        """
+        self.add_box_array(layer, datatype, x0, y0, x1, y1)
+
+    def add_boxes(self, layer, datatype, boxes):
+        # type: (int, int, np.ndarray) -> None
+        """Add many rectangles on the same layer.
+
+        Parameters
+        ----------
+        layer : int
+            the layer number.
+        datatype : int
+            the datatype number.
+        boxes : np.ndarray
+            a N x 4 integer array of [left, bottom, right, top] coordinates.
+        """
+        for x0, y0, x1, y1 in boxes.tolist():
+            self.add_box_array(layer, datatype, x0, y0, x1, y1)
+
+    def add_box_array(self, layer, datatype, x0, y0, x1, y1, nx=1, ny=1, spx=0, spy=0):
+        # type: (int, int, int, int, int, int, int, int, int, int) -> None
+        """Add an array of rectangles, as a single rectangle with a repetition.
+
+        Parameters
+        ----------
+        layer : int
+            the layer number.
+        datatype : int
+            the datatype number.
+        x0 : int
+            the left coordinate of the lower-left rectangle.
+        y0 : int
+            the bottom coordinate of the lower-left rectangle.
+        x1 : int
+            the right coordinate of the lower-left rectangle.
+        y1 : int
+            the top coordinate of the lower-left rectangle.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+        """
+        data = _pack_uint(layer) + _pack_uint(datatype) + _pack_uint(x1 - x0) + \
+            _pack_uint(y1 - y0) + _pack_sint(x0) + _pack_sint(y0)
+        if nx == 1 and ny == 1:
+            # info byte: width, height, x, y, datatype, and layer are present
+            self._data += _pack_uint(_RECTANGLE) + b'\x7b' + data
+        else:
+            self._data += (_pack_uint(_RECTANGLE) + b'\x7f' + data +
+                           _pack_repetition(nx, ny, (spx, 0), (0, spy)))
+
+    def add_ref(self, cell_name, x, y, angle=0, reflect=False, nx=1, ny=1, spx=0, spy=0):
+        # type: (str, int, int, int, bool, int, int, int, int) -> None
+        """Add a cell placement, or an array of cell placements.
+
+        The array pitches are given in the coordinate system of the referenced cell.
+
+        Parameters
+        ----------
+        cell_name : str
+            the referenced cell name.
+        x : int
+            the X coordinate of the placement origin.
+        y : int
+            the Y coordinate of the placement origin.
+        angle : int
+            counter-clockwise rotation angle, in degrees.
+        reflect : bool
+            True to reflect about the X axis before rotation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+        """
+        is_array = nx > 1 or ny > 1
+        # info byte: cell name, x, and y are present
+        info = 0xB0 | (0x08 if is_array else 0) | (0x01 if reflect else 0)
+        if angle % 90 == 0:
+            info |= ((angle % 360) // 90) << 1
+            data = _pack_uint(_PLACEMENT) + bytes((info,)) + _pack_str(cell_name)
+        else:
+            info |= 0x02
+            data = (_pack_uint(_PLACEMENT_TRANS) + bytes((info,)) + _pack_str(cell_name) +
+                    _pack_real(angle))
+        data += _pack_sint(x) + _pack_sint(y)
+        if is_array:
+            # repetition displacements are in the coordinate system of this cell.
+            col_vec = _rotate(spx, 0, angle)
+            row_vec = _rotate(0, -spy if reflect else spy, angle)
+            data += _pack_repetition(nx, ny, col_vec, row_vec)
+        self._data += data
+
+    def add_shared_ref(self, cell, x, y, angle=0, reflect=False, nx=1, ny=1, spx=0, spy=0):
+        # type: (OASISCell, int, int, int, bool, int, int, int, int) -> None
+        """Add a placement, or an array of placements, of a shared cell.
+
+        Shared cells are identified by name, so cells with the same name must have the
+        same content.
+
+        Parameters
+        ----------
+        cell : OASISCell
+            the shared cell.
+        x : int
+            the X coordinate of the placement origin.
+        y : int
+            the Y coordinate of the placement origin.
+        angle : int
+            counter-clockwise rotation angle, in degrees.
+        reflect : bool
+            True to reflect about the X axis before rotation.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch.
+        spy : int
+            row pitch.
+        """
+        self._shared_cells[cell.name] = cell
+        self.add_ref(cell.name, x, y, angle=angle, reflect=reflect, nx=nx, ny=ny, spx=spx,
+                     spy=spy)
+
+    def add_text(self, layer, texttype, text, x, y, angle=0):
+        # type: (int, int, str, int, int, int) -> None
+        """Add a text label.
+
+        OASIS text has no orientation, so the angle is ignored.
+
+        Parameters
+        ----------
+        layer : int
+            the layer number.
+        texttype : int
+            the text type number.
+        text : str
+            the label text.
+        x : int
+            the X coordinate of the label.
+        y : int
+            the Y coordinate of the label.
+        angle : int
+            counter-clockwise rotation angle, in degrees.
+        """
+        # info byte: text string, x, y, text type, and text layer are present
+        self._data += (_pack_uint(_TEXT) + b'\x5b' + _pack_str(text) + _pack_uint(layer) +
+                       _pack_uint(texttype) + _pack_sint(x) + _pack_sint(y))
+
+
+class OASISWriter(object):
+    """Writes an OASIS file, one cell at a time.
+
+    Parameters
+    ----------
+    fname : str
+        the output file name.
+    unit : float
+        the user unit, in meters.
+    precision : float
+        the database unit, in meters.
+    buffer_size : int
+        the output file buffer size, in bytes.
+    compress : bool
+        True to compress the records of each cell in a CBLOCK.
+    """
+
+    def __init__(self, fname, unit, precision, buffer_size=1 << 20, compress=True):
+        # type: (str, float, float, int, bool) -> None
+        self._compress = compress
+        self._shared_names = set()  # type: Set[str]
+        # OASIS unit is the number of database units per micron
+        db_per_um = 1e-6 / precision
+        if abs(db_per_um - round(db_per_um)) < 1e-6:
+            db_per_um = round(db_per_um)
+        self._file = open(fname, 'wb', buffering=buffer_size)
+        # table offsets are stored in the START record, and are all zero.
+        self._file.write(_MAGIC + _pack_uint(_START) + _pack_str('1.0') + _pack_real(db_per_um) +
+                         _pack_uint(0) + b'\x00' * 12)
+
+    def __enter__(self):
+        # type: () -> OASISWriter
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def new_cell(self, name):
+        # type: (str) -> OASISCell
+        """Create a new cell.
+
+        Parameters
+        ----------
+        name : str
+            the cell name.
+
+        Returns
+        -------
+        cell : OASISCell
+            the new cell.  Write it to the file with write_cell().
+        """
+        return OASISCell(name, compress=self._compress)
+
+    def write_cell(self, cell):
+        # type: (OASISCell) -> None
+        """Write the given cell, and all shared cells it needs, to the file.
+
+        Parameters
+        ----------
+        cell : OASISCell
+            the cell to write.
+        """
+        shared_cells = cell.shared_cells
+        for name in sorted(shared_cells.keys()):
+            if name not in self._shared_names:
+                self._shared_names.add(name)
+                self.write_cell(shared_cells[name])
+        self._file.write(cell.get_data())
+
+    def close(self):
+        # type: () -> None
+        """Write the END record and close the file."""
+        if not self._file.closed:
+            # END record: record ID, padding string, and validation scheme 0 (none).
+            pad_len = _END_SIZE - 2 - len(_pack_uint(_END_SIZE))
+            self._file.write(_pack_uint(_END) + _pack_uint(pad_len) + b'\x00' * pad_len +
+                             _pack_uint(0))
+            self._file.close()
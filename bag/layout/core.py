@@ -7,11 +7,15 @@ from typing import Dict, List, Iterator, Tuple, Optional, Union, Callable, Any
 
 import abc
 import math
-from itertools import chain
+import heapq
+from itertools import chain, repeat
+from collections import OrderedDict
+
+import numpy as np
 
 import bag
 import bag.io
-from .util import BBox
+from .util import BBox, BBoxArray, transform_box_array
 from .objects import Rect, Via, ViaInfo, Instance, InstanceInfo, PinInfo
 from .objects import Path, Polygon, Blockage, Boundary
 from bag.util.search import BinaryIterator
@@ -22,6 +26,9 @@ try:
 except ImportError:
     cybagoa = None
 
+# maximum number of via solutions cached by each TechInfo.
+_VIA_CACHE_SIZE = 4096
+
 
 class TechInfo(object, metaclass=abc.ABCMeta):
     """A base class that create vias.
@@ -51,6 +58,9 @@ class TechInfo(object, metaclass=abc.ABCMeta):
         self._layout_unit = layout_unit
         self._via_tech = via_tech
         self.tech_params = process_params
+        # via solutions keyed by via signature, and the hit/miss counts of each signature.
+        # maps via signature to the [solution, hits, misses] list.
+        self._via_cache = OrderedDict()  # type: Dict[Tuple[Any, ...], List[Any]]
 
     @abc.abstractmethod
     def get_well_layers(self, sub_type):
@@ -243,6 +253,56 @@ class TechInfo(object, metaclass=abc.ABCMeta):
         """
         return 0.0
 
+    def get_min_space_array(self, layer_type, widths, same_color=False):
+        # type: (str, np.ndarray, bool) -> np.ndarray
+        """Returns the minimum spacing of many wires on the given layer.
+
+        This is the batch version of get_min_space(), in resolution units.  Subclasses may
+        override this with a vectorized implementation.
+
+        Parameters
+        ----------
+        layer_type : str
+            the wiring layer type.
+        widths : np.ndarray
+            the wire widths, in resolution units.
+        same_color : bool
+            True to use same-color spacing.
+
+        Returns
+        -------
+        sp : np.ndarray
+            the minimum spacing of each wire, in resolution units.
+        """
+        w_unique, w_idx = np.unique(widths, return_inverse=True)
+        sp = np.array([self.get_min_space(layer_type, w, unit_mode=True, same_color=same_color)
+                       for w in w_unique.tolist()], dtype=np.int64)
+        return sp[w_idx].reshape(np.shape(widths))
+
+    def get_min_line_end_space_array(self, layer_type, widths):
+        # type: (str, np.ndarray) -> np.ndarray
+        """Returns the minimum line-end spacing of many wires on the given layer.
+
+        This is the batch version of get_min_line_end_space(), in resolution units.
+        Subclasses may override this with a vectorized implementation.
+
+        Parameters
+        ----------
+        layer_type : str
+            the wiring layer type.
+        widths : np.ndarray
+            the wire widths, in resolution units.
+
+        Returns
+        -------
+        sp : np.ndarray
+            the minimum line-end spacing of each wire, in resolution units.
+        """
+        w_unique, w_idx = np.unique(widths, return_inverse=True)
+        sp = np.array([self.get_min_line_end_space(layer_type, w, unit_mode=True)
+                       for w in w_unique.tolist()], dtype=np.int64)
+        return sp[w_idx].reshape(np.shape(widths))
+
     @abc.abstractmethod
     def get_min_length(self, layer_type, width):
         # type: (str, float) -> float
@@ -690,16 +750,15 @@ class TechInfo(object, metaclass=abc.ABCMeta):
 
             # print nx_max, ny_max, dim, w, h, spx_min, spy_min
 
-            # generate list of possible nx/ny configuration
-            nxy_list = [(a * b, a, b) for a in range(1, nx_max + 1) for b in range(1, ny_max + 1)]
-            nxy_list = sorted(nxy_list, reverse=True)
-
             # find best nx/ny configuration
             opt_nxy = None
             opt_mdim_list = None
             opt_adim = None
             opt_sp = None
-            for num, nx, ny in nxy_list:
+            for num, nx, ny in self._via_nxy_iter(nx_max, ny_max):
+                if best_num is not None and weight * num < best_num:
+                    # cannot beat the best via type so far, and no smaller array can.
+                    break
                 # check if we need to use sp3
                 if nx == 2 and ny == 2:
                     sp_combo = sp2_list
@@ -779,6 +838,20 @@ class TechInfo(object, metaclass=abc.ABCMeta):
             return None
         return best_nxy, best_mdim_list, best_type, best_vdim, best_sp, best_adim
 
+    @classmethod
+    def _via_nxy_iter(cls, nx_max, ny_max):
+        # type: (int, int) -> Iterator[Tuple[int, int, int]]
+        """Iterate over (nx * ny, nx, ny) via array dimensions in decreasing order.
+
+        This is the same order as sorting all dimensions in reverse, but lazily merges the
+        columns of the nx/ny table, so only the dimensions that are tested get generated.
+        """
+        # column nx yields (-nx * ny, -nx, -ny) for ny from ny_max down to 1.
+        col_iters = [zip(range(-nx * ny_max, 0, nx), repeat(-nx), range(-ny_max, 0))
+                     for nx in range(1, nx_max + 1)]
+        for num, nx, ny in heapq.merge(*col_iters):
+            yield -num, -nx, -ny
+
     def _via_better(self, mdim_list1, mdim_list2):
         """Returns true if the via in mdim_list1 has smaller area compared with via in mdim_list2"""
         res = self._resolution
@@ -871,20 +944,33 @@ class TechInfo(object, metaclass=abc.ABCMeta):
         bot_layer = bag.io.fix_string(bot_layer)
         top_layer = bag.io.fix_string(top_layer)
 
-        bot_id = self.get_layer_id(bot_layer)
-        bmtype = self.get_layer_type(bot_layer)
-        tmtype = self.get_layer_type(top_layer)
-        vname = self.get_via_name(bot_id)
-
         if not top_dir:
             top_dir = 'x' if bot_dir == 'y' else 'y'
 
-        via_result = self.get_best_via_array(vname, bmtype, tmtype, bot_dir, top_dir,
-                                             bbox.width, bbox.height, extend)
-        if via_result is None:
+        # the via solution does not depend on the via location, so it is cached.
+        via_sig = (bot_layer, top_layer, bot_dir, top_dir, bbox.width_unit, bbox.height_unit,
+                   extend, bot_len, top_len)
+        if kwargs:
+            # EM parameters may not be hashable, do not cache.
+            solution = self._get_via_solution(*via_sig, **kwargs)
+        else:
+            cache = self._via_cache
+            entry = cache.get(via_sig, None)
+            if entry is not None:
+                entry[1] += 1
+                cache.move_to_end(via_sig)
+                solution = entry[0]
+            else:
+                solution = self._get_via_solution(*via_sig)
+                cache[via_sig] = [solution, 0, 1]
+                if len(cache) > _VIA_CACHE_SIZE:
+                    cache.popitem(last=False)
+
+        if solution is None:
             # no solution found
             return None
 
+        via_result, (idc, irms, ipeak) = solution
         (nx, ny), mdim_list, vtype, vdim, (spx, spy), (warr_norm, harr_norm) = via_result
 
         res = self.resolution
@@ -902,12 +988,6 @@ class TechInfo(object, metaclass=abc.ABCMeta):
         enc2_x = (wtop_norm - warr_norm) // 2 * res
         enc2_y = (htop_norm - harr_norm) // 2 * res
 
-        # compute EM rule dimensions
-        if bot_dir == 'x':
-            bw, tw = hbot_norm * res, wtop_norm * res
-        else:
-            bw, tw = wbot_norm * res, htop_norm * res
-
         bot_xl_norm = xc_norm - wbot_norm // 2
         bot_yb_norm = yc_norm - hbot_norm // 2
         top_xl_norm = xc_norm - wtop_norm // 2
@@ -918,10 +998,6 @@ class TechInfo(object, metaclass=abc.ABCMeta):
         top_box = BBox(top_xl_norm, top_yb_norm, top_xl_norm + wtop_norm,
                        top_yb_norm + htop_norm, res, unit_mode=True)
 
-        idc, irms, ipeak = self.get_via_em_specs(vname, bot_layer, top_layer, via_type=vtype,
-                                                 bm_dim=(bw, bot_len), tm_dim=(tw, top_len),
-                                                 array=nx > 1 or ny > 1, **kwargs)
-
         params = {'id': self.get_via_id(bot_layer, top_layer),
                   'loc': (xc_norm * res, yc_norm * res),
                   'orient': 'R0',
@@ -947,6 +1023,60 @@ class TechInfo(object, metaclass=abc.ABCMeta):
             bot_box=bot_box,
         )
 
+    def _get_via_solution(self, bot_layer, top_layer, bot_dir, top_dir, w_unit, h_unit, extend,
+                          bot_len, top_len, **kwargs):
+        # type: (str, str, str, str, int, int, bool, float, float, **Any) -> Optional[Any]
+        """Returns the via array solution and its EM specs, or None if there is no solution.
+
+        This is the location independent part of get_via_info().
+        """
+        res = self.resolution
+        bot_id = self.get_layer_id(bot_layer)
+        bmtype = self.get_layer_type(bot_layer)
+        tmtype = self.get_layer_type(top_layer)
+        vname = self.get_via_name(bot_id)
+
+        via_result = self.get_best_via_array(vname, bmtype, tmtype, bot_dir, top_dir,
+                                             w_unit * res, h_unit * res, extend)
+        if via_result is None:
+            return None
+
+        (nx, ny), mdim_list, vtype = via_result[:3]
+        # compute EM rule dimensions
+        if bot_dir == 'x':
+            bw, tw = mdim_list[0][1] * res, mdim_list[1][0] * res
+        else:
+            bw, tw = mdim_list[0][0] * res, mdim_list[1][1] * res
+
+        em_specs = self.get_via_em_specs(vname, bot_layer, top_layer, via_type=vtype,
+                                         bm_dim=(bw, bot_len), tm_dim=(tw, top_len),
+                                         array=nx > 1 or ny > 1, **kwargs)
+        return via_result, em_specs
+
+    def get_via_cache_stats(self):
+        # type: () -> Dict[Tuple[Any, ...], Tuple[int, int]]
+        """Returns the via solution cache statistics of get_via_info().
+
+        Statistics are kept with the cached solutions, so they are dropped when a via
+        signature is evicted from the cache.
+
+        Returns
+        -------
+        stats : Dict[Tuple[Any, ...], Tuple[int, int]]
+            a dictionary from cached via signature to the number of cache hits and misses.
+            The via signature is the (bot_layer, top_layer, bot_dir, top_dir, width, height,
+            extend, bot_len, top_len) tuple, with width and height in resolution units.
+        """
+        return {key: (val[1], val[2]) for key, val in self._via_cache.items()}
+
+    def clear_via_cache(self):
+        # type: () -> None
+        """Clears cached via solutions and their statistics.
+
+        Call this after changing via rules.
+        """
+        self._via_cache.clear()
+
     def design_resistor(self, res_type, res_targ, idc=0.0, iac_rms=0.0,
                         iac_peak=0.0, num_even=True, **kwargs):
         """Finds the optimal resistor dimension that meets the given specs.
@@ -1143,6 +1273,244 @@ class DummyTechInfo(TechInfo):
         return float('inf'), float('inf'), float('inf')
 
 
+class RectStore(object):
+    """A columnar store of (arrayed) rectangles.
+
+    Rectangles are kept in NumPy arrays instead of Rect objects: the [left, bottom, right, top]
+    coordinates and the [nx, ny, spx, spy] arraying parameters in resolution units, and an
+    index into the list of (layer, purpose) pairs.  Iterating over this store yields the same
+    dictionaries as Rect.content.
+
+    Parameters
+    ----------
+    res : float
+        the layout resolution.
+    """
+
+    def __init__(self, res):
+        # type: (float) -> None
+        self._res = res
+        self._lay_list = []  # type: List[Tuple[str, str]]
+        self._lay_table = {}  # type: Dict[Tuple[str, str], int]
+        self._size = 0
+        self._boxes = np.empty((0, 4), dtype=np.int64)
+        self._arr_params = np.empty((0, 4), dtype=np.int64)
+        self._lay_idx = np.empty(0, dtype=np.int32)
+
+    def __getstate__(self):
+        # type: () -> Dict[str, Any]
+        state = self.__dict__.copy()
+        size = self._size
+        state['_boxes'] = self._boxes[:size].copy()
+        state['_arr_params'] = self._arr_params[:size].copy()
+        state['_lay_idx'] = self._lay_idx[:size].copy()
+        return state
+
+    def __len__(self):
+        # type: () -> int
+        return self._size
+
+    def __iter__(self):
+        # type: () -> Iterator[Dict[str, Any]]
+        res = self._res
+        lay_list = self._lay_list
+        for lay_idx, (xl, yb, xr, yt), (nx, ny, spx, spy) in zip(self.layer_indices.tolist(),
+                                                                 self.boxes.tolist(),
+                                                                 self.arr_params.tolist()):
+            content = dict(layer=list(lay_list[lay_idx]),
+                           bbox=[[xl * res, yb * res], [xr * res, yt * res]],
+                           )
+            if nx > 1 or ny > 1:
+                content['arr_nx'] = nx
+                content['arr_ny'] = ny
+                content['arr_spx'] = spx * res
+                content['arr_spy'] = spy * res
+            yield content
+
+    @property
+    def layers(self):
+        # type: () -> List[Tuple[str, str]]
+        """List of (layer, purpose) pairs referenced by layer_indices."""
+        return self._lay_list
+
+    @property
+    def layer_indices(self):
+        # type: () -> np.ndarray
+        """The layer index of each rectangle."""
+        return self._lay_idx[:self._size]
+
+    @property
+    def boxes(self):
+        # type: () -> np.ndarray
+        """A N x 4 array of [left, bottom, right, top] coordinates, in resolution units."""
+        return self._boxes[:self._size]
+
+    @property
+    def arr_params(self):
+        # type: () -> np.ndarray
+        """A N x 4 array of [nx, ny, spx, spy] arraying parameters, in resolution units."""
+        return self._arr_params[:self._size]
+
+    def _get_layer_index(self, layer):
+        # type: (Tuple[str, str]) -> int
+        """Returns the index of the given layer, adding it if necessary."""
+        if isinstance(layer, str):
+            layer = (layer, 'drawing')
+        elif not isinstance(layer, tuple):
+            layer = layer[0], layer[1]
+        idx = self._lay_table.get(layer, None)
+        if idx is None:
+            idx = self._lay_table[layer] = len(self._lay_list)
+            self._lay_list.append(layer)
+        return idx
+
+    def _reserve(self, num):
+        # type: (int) -> None
+        """Make sure there is room for the given number of new rectangles."""
+        size = self._size
+        cap = self._boxes.shape[0]
+        if size + num > cap:
+            cap = max(size + num, 2 * cap, 16)
+            boxes = np.empty((cap, 4), dtype=np.int64)
+            arr_params = np.empty((cap, 4), dtype=np.int64)
+            lay_idx = np.empty(cap, dtype=np.int32)
+            boxes[:size] = self._boxes[:size]
+            arr_params[:size] = self._arr_params[:size]
+            lay_idx[:size] = self._lay_idx[:size]
+            self._boxes, self._arr_params, self._lay_idx = boxes, arr_params, lay_idx
+
+    def add(self, layer, xl, yb, xr, yt, nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[str, str], int, int, int, int, int, int, int, int) -> None
+        """Add a new (arrayed) rectangle.
+
+        Parameters
+        ----------
+        layer : Union[str, Tuple[str, str]]
+            the layer name, or the (layer, purpose) pair.
+        xl : int
+            the left coordinate, in resolution units.
+        yb : int
+            the bottom coordinate, in resolution units.
+        xr : int
+            the right coordinate, in resolution units.
+        yt : int
+            the top coordinate, in resolution units.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch, in resolution units.
+        spy : int
+            row pitch, in resolution units.
+        """
+        self._reserve(1)
+        idx = self._size
+        self._boxes[idx] = (xl, yb, xr, yt)
+        self._arr_params[idx] = (nx, ny, spx, spy)
+        self._lay_idx[idx] = self._get_layer_index(layer)
+        self._size = idx + 1
+
+    def add_boxes(self, layer, boxes, nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[str, str], np.ndarray, int, int, int, int) -> None
+        """Add many (arrayed) rectangles on the same layer.
+
+        Parameters
+        ----------
+        layer : Tuple[str, str]
+            the (layer, purpose) pair.
+        boxes : np.ndarray
+            a N x 4 integer array of [left, bottom, right, top] coordinates, in
+            resolution units.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch, in resolution units.
+        spy : int
+            row pitch, in resolution units.
+        """
+        num = boxes.shape[0]
+        self._reserve(num)
+        start = self._size
+        stop = start + num
+        self._boxes[start:stop] = boxes
+        self._arr_params[start:stop] = (nx, ny, spx, spy)
+        self._lay_idx[start:stop] = self._get_layer_index(layer)
+        self._size = stop
+
+    def move_by(self, dx, dy):
+        # type: (int, int) -> None
+        """Move all rectangles by the given amount, in resolution units."""
+        boxes = self._boxes[:self._size]
+        boxes[:, 0::2] += dx
+        boxes[:, 1::2] += dy
+
+    def compact(self):
+        # type: () -> None
+        """Removes non-physical rectangles, and releases unused memory."""
+        boxes = self.boxes
+        keep = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+        lay_idx = self.layer_indices
+        for idx in np.flatnonzero(~keep).tolist():
+            print('WARNING: rectangle with non-physical bounding box found.',
+                  self._lay_list[lay_idx[idx]])
+        self._boxes = boxes[keep]
+        self._arr_params = self.arr_params[keep]
+        self._lay_idx = lay_idx[keep]
+        self._size = self._boxes.shape[0]
+
+    def get_overall_bbox(self, layer):
+        # type: (Tuple[str, str]) -> BBox
+        """Returns the overall bounding box of all rectangles on the given layer."""
+        idx = self._lay_table.get(layer, None)
+        if idx is not None:
+            sel = self.layer_indices == idx
+            if np.any(sel):
+                boxes = self.boxes[sel]
+                arr_params = self.arr_params[sel]
+                xr = boxes[:, 2] + (arr_params[:, 0] - 1) * arr_params[:, 2]
+                yt = boxes[:, 3] + (arr_params[:, 1] - 1) * arr_params[:, 3]
+                return BBox(int(boxes[:, 0].min()), int(boxes[:, 1].min()), int(xr.max()),
+                            int(yt.max()), self._res, unit_mode=True)
+        return BBox.get_invalid_bbox()
+
+    def get_box_arrays(self):
+        # type: () -> Dict[Tuple[str, str], np.ndarray]
+        """Returns all rectangles grouped by layer, with arrays expanded.
+
+        Returns
+        -------
+        box_arrays : Dict[Tuple[str, str], np.ndarray]
+            a dictionary from (layer, purpose) pair to a N x 4 integer array of
+            [left, bottom, right, top] boxes, in resolution units.
+        """
+        lay_idx = self.layer_indices
+        order = np.argsort(lay_idx, kind='stable')
+        counts = np.bincount(lay_idx, minlength=len(self._lay_list)).tolist()
+        boxes_sorted = self.boxes[order]
+        arr_sorted = self.arr_params[order]
+        ans = {}
+        start = 0
+        for layer, cnt in zip(self._lay_list, counts):
+            if cnt > 0:
+                stop = start + cnt
+                boxes = boxes_sorted[start:stop]
+                arr_params = arr_sorted[start:stop]
+                arrayed = (arr_params[:, 0] > 1) | (arr_params[:, 1] > 1)
+                if np.any(arrayed):
+                    arr_list = [boxes[~arrayed]]
+                    for idx in np.flatnonzero(arrayed).tolist():
+                        nx, ny, spx, spy = arr_params[idx].tolist()
+                        arr_list.append(transform_box_array(boxes[idx:idx + 1], nx=nx, ny=ny,
+                                                            spx=spx, spy=spy))
+                    boxes = np.concatenate(arr_list)
+                ans[layer] = boxes
+                start = stop
+        return ans
+
+
 class BagLayout(object):
     """This class contains layout information of a cell.
 
@@ -1160,8 +1528,11 @@ class BagLayout(object):
         self._pin_purpose = grid.tech_info.pin_purpose
         self._make_pin_rect = True
         self._inst_list = []  # type: List[Instance]
+        # incremented whenever an instance is added or changed
+        self._inst_change_cnt = [0]
         self._inst_primitives = []  # type: List[InstanceInfo]
         self._rect_list = []  # type: List[Rect]
+        self._rect_store = RectStore(self._res)
         self._via_list = []  # type: List[Via]
         self._via_primitives = []  # type: List[ViaInfo]
         self._pin_list = []  # type: List[PinInfo]
@@ -1186,10 +1557,27 @@ class BagLayout(object):
         """Returns True if this layout is empty."""
         return self._is_empty
 
+    @property
+    def num_geometries(self):
+        # type: () -> int
+        """Returns the number of geometry objects in this layout, excluding instances.
+
+        Arrayed objects count as one object.
+        """
+        if self._raw_content is None:
+            return 0
+        return sum((len(obj_list) for obj_list in self._raw_content[2:]))
+
     def inst_iter(self):
         # type: () -> Iterator[Instance]
         return iter(self._inst_list)
 
+    @property
+    def inst_version(self):
+        # type: () -> int
+        """A counter that changes every time an instance is added or changed."""
+        return self._inst_change_cnt[0]
+
     def finalize(self):
         # type: () -> None
         """Prevents any further changes to this layout.
@@ -1197,14 +1585,15 @@ class BagLayout(object):
         self._finalized = True
 
         # get rectangles
-        rect_list = []
+        rect_list = self._rect_store
         for obj in self._rect_list:
             if obj.valid:
-                if not obj.bbox.is_physical():
-                    print('WARNING: rectangle with non-physical bounding box found.', obj.layer)
-                else:
-                    obj_content = obj.content
-                    rect_list.append(obj_content)
+                bbox = obj.bbox
+                rect_list.add(obj.layer, bbox.left_unit, bbox.bottom_unit, bbox.right_unit,
+                              bbox.top_unit, nx=obj.nx, ny=obj.ny, spx=obj.spx_unit,
+                              spy=obj.spy_unit)
+        rect_list.compact()
+        self._rect_list = []
 
         # filter out invalid geometries
         path_list, polygon_list, blockage_list, boundary_list, via_list = [], [], [], [], []
@@ -1254,7 +1643,7 @@ class BagLayout(object):
         if isinstance(layer, str):
             layer = (layer, 'drawing')
 
-        box = BBox.get_invalid_bbox()
+        box = self._rect_store.get_overall_bbox(layer)
         for rect in self._rect_list:
             if layer == rect.layer:
                 box = box.merge(rect.bbox_array.get_overall_bbox())
@@ -1264,10 +1653,72 @@ class BagLayout(object):
 
         return box
 
+    def get_box_arrays(self):
+        # type: () -> Dict[Tuple[str, str], np.ndarray]
+        """Returns the boxes drawn directly in this layout, grouped by layer.
+
+        This includes rectangles, via metal boxes, and pin rectangles, but not
+        instances, primitive instances or via cuts.
+
+        Returns
+        -------
+        box_arrays : Dict[Tuple[str, str], np.ndarray]
+            a dictionary from (layer, purpose) pair to a N x 4 integer array of
+            [left, bottom, right, top] boxes, in resolution units.
+        """
+        box_table = {}  # type: Dict[Tuple[str, str], List[np.ndarray]]
+        for layer, boxes in self._rect_store.get_box_arrays().items():
+            box_table[layer] = [boxes]
+        for obj in self._rect_list:
+            if obj.valid and obj.bbox.is_physical():
+                self._add_box_array(box_table, obj.layer, obj.bbox, obj.nx, obj.ny,
+                                    obj.spx_unit, obj.spy_unit)
+        for obj in self._via_list:
+            if obj.valid:
+                for layer, box in ((obj.bot_layer, obj.bottom_box), (obj.top_layer, obj.top_box)):
+                    self._add_box_array(box_table, layer, box, obj.nx, obj.ny,
+                                        obj.spx_unit, obj.spy_unit)
+        for pin in self._pin_list:
+            if pin.make_rect:
+                self._add_box_array(box_table, pin.layer, pin.bbox, 1, 1, 0, 0)
+
+        return {layer: np.concatenate(arr_list) for layer, arr_list in box_table.items()}
+
+    @staticmethod
+    def _add_box_array(box_table,  # type: Dict[Tuple[str, str], List[np.ndarray]]
+                       layer,  # type: Tuple[str, str]
+                       box,  # type: BBox
+                       nx,  # type: int
+                       ny,  # type: int
+                       spx,  # type: int
+                       spy,  # type: int
+                       ):
+        # type: (...) -> None
+        """Adds the given box array to the box table."""
+        arr = np.array([[box.left_unit, box.bottom_unit, box.right_unit, box.top_unit]],
+                       dtype=np.int64)
+        if nx > 1 or ny > 1:
+            arr = transform_box_array(arr, nx=nx, ny=ny, spx=spx, spy=spy)
+        layer = layer[0], layer[1]
+        if layer in box_table:
+            box_table[layer].append(arr)
+        else:
+            box_table[layer] = [arr]
+
     def get_masters_set(self):
         """Returns a set of all template master keys used in this layout."""
         return set((inst.master.key for inst in self._inst_list))
 
+    def update_inst_cell_names(self):
+        # type: () -> None
+        """Update instance cell names in the finalized content to match their masters."""
+        if not self._finalized:
+            raise Exception('Layout is not finalized.')
+
+        valid_inst_iter = (inst for inst in self._inst_list if inst.valid)
+        for inst_info, inst in zip(self._raw_content[0], valid_inst_iter):
+            inst_info['cell'] = inst.master.cell_name
+
     def _get_unused_inst_name(self, inst_name):
         """Returns a new inst name."""
         if inst_name is None or inst_name in self._used_inst_names:
@@ -1292,6 +1743,7 @@ class BagLayout(object):
                     lib_name,  # type: str
                     cell_name,  # type: str
                     rename_fun,  # type: Callable[[str], str]
+                    rect_store=False,  # type: bool
                     ):
         # type: (...) -> Union[List[Any], Tuple[str, 'cybagoa.PyOALayout']]
         """returns a list describing geometries in this layout.
@@ -1304,6 +1756,8 @@ class BagLayout(object):
             the layout top level cell name.
         rename_fun : Callable[[str], str]
             the layout cell renaming function.
+        rect_store : bool
+            True to return rectangles as a RectStore instead of a list of dictionaries.
 
         Returns
         -------
@@ -1349,6 +1803,8 @@ class BagLayout(object):
 
             return cell_name, oa_layout
         else:
+            if not rect_store:
+                rect_list = list(rect_list)
             ans = [cell_name, inst_tot_list, rect_list, via_list, pin_list, path_list,
                    blockage_list, boundary_list, polygon_list]
             return ans
@@ -1368,6 +1824,8 @@ class BagLayout(object):
         #     raise Exception('float nx/ny')
 
         self._inst_list.append(instance)
+        instance.set_change_counter(self._inst_change_cnt)
+        self._inst_change_cnt[0] += 1
 
     def move_all_by(self, dx=0.0, dy=0.0, unit_mode=False):
         # type: (Union[float, int], Union[float, int], bool) -> None
@@ -1391,6 +1849,11 @@ class BagLayout(object):
                          self._polygon_list):
             obj.move_by(dx=dx, dy=dy, unit_mode=unit_mode)
 
+        if not unit_mode:
+            dx = int(round(dx / self._res))
+            dy = int(round(dy / self._res))
+        self._rect_store.move_by(dx, dy)
+
     def add_instance_primitive(self,  # type: BagLayout
                                lib_name,  # type: str
                                cell_name,  # type: str
@@ -1489,6 +1952,54 @@ class BagLayout(object):
 
         self._rect_list.append(rect)
 
+    def add_box_array(self, layer, bbox):
+        # type: (Tuple[str, str], Union[BBox, BBoxArray]) -> None
+        """Add a new (arrayed) rectangle without creating a Rect object.
+
+        Parameters
+        ----------
+        layer : Tuple[str, str]
+            the (layer, purpose) pair.
+        bbox : Union[BBox, BBoxArray]
+            the rectangle bounding box, or bounding box array.
+        """
+        if self._finalized:
+            raise Exception('Layout is already finalized.')
+
+        if isinstance(bbox, BBoxArray):
+            base = bbox.base
+            self._rect_store.add(layer, base.left_unit, base.bottom_unit, base.right_unit,
+                                 base.top_unit, nx=bbox.nx, ny=bbox.ny, spx=bbox.spx_unit,
+                                 spy=bbox.spy_unit)
+        else:
+            self._rect_store.add(layer, bbox.left_unit, bbox.bottom_unit, bbox.right_unit,
+                                 bbox.top_unit)
+
+    def add_boxes(self, layer, boxes, nx=1, ny=1, spx=0, spy=0):
+        # type: (Tuple[str, str], np.ndarray, int, int, int, int) -> None
+        """Add many (arrayed) rectangles on the same layer without creating Rect objects.
+
+        Parameters
+        ----------
+        layer : Tuple[str, str]
+            the (layer, purpose) pair.
+        boxes : np.ndarray
+            a N x 4 integer array of [left, bottom, right, top] coordinates, in
+            resolution units.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch, in resolution units.
+        spy : int
+            row pitch, in resolution units.
+        """
+        if self._finalized:
+            raise Exception('Layout is already finalized.')
+
+        self._rect_store.add_boxes(layer, boxes, nx=nx, ny=ny, spx=spx, spy=spy)
+
     def add_path(self, path):
         # type: (Path) -> None
         """Add a new path.
@@ -9,8 +9,10 @@ import abc
 import numpy as np
 from copy import deepcopy
 
-from .util import transform_table, BBox, BBoxArray, transform_point, get_inverse_transform
+from .util import transform_table, BBox, BBoxArray, transform_point, get_inverse_transform, \
+    transform_box_array
 from .routing.base import Port, WireArray
+from .routing.fill import get_blockage_array
 
 import bag.io
 
@@ -86,6 +88,12 @@ class Figure(object, metaclass=abc.ABCMeta):
         # type: () -> None
         """Destroy this instance."""
         self._destroyed = True
+        self._changed()
+
+    def _changed(self):
+        # type: () -> None
+        """Called after this figure changes.  Does nothing by default."""
+        pass
 
 
 # noinspection PyAbstractClass
@@ -136,6 +144,7 @@ class Arrayable(Figure, metaclass=abc.ABCMeta):
         if val <= 0:
             raise ValueError('Cannot have non-positive number of columns.')
         self._nx = val
+        self._changed()
 
     @property
     def ny(self):
@@ -151,6 +160,7 @@ class Arrayable(Figure, metaclass=abc.ABCMeta):
         if val <= 0:
             raise ValueError('Cannot have non-positive number of rows.')
         self._ny = val
+        self._changed()
 
     @property
     def spx(self):
@@ -166,6 +176,7 @@ class Arrayable(Figure, metaclass=abc.ABCMeta):
         if val < 0:
             raise ValueError('Currently does not support negative pitches.')
         self._spx_unit = int(round(val / self.resolution))
+        self._changed()
 
     @property
     def spx_unit(self):
@@ -181,6 +192,7 @@ class Arrayable(Figure, metaclass=abc.ABCMeta):
         if val < 0:
             raise ValueError('Currently does not support negative pitches.')
         self._spx_unit = val
+        self._changed()
 
     @property
     def spy(self):
@@ -196,6 +208,7 @@ class Arrayable(Figure, metaclass=abc.ABCMeta):
         if val < 0:
             raise ValueError('Currently does not support negative pitches.')
         self._spy_unit = int(round(val / self.resolution))
+        self._changed()
 
     @property
     def spy_unit(self):
@@ -211,6 +224,7 @@ class Arrayable(Figure, metaclass=abc.ABCMeta):
         if val < 0:
             raise ValueError('Currently does not support negative pitches.')
         self._spy_unit = val
+        self._changed()
 
     @Figure.valid.getter
     def valid(self):
@@ -452,6 +466,25 @@ class Instance(Arrayable):
         else:
             self._loc_unit = int(round(loc[0] / res)), int(round(loc[1] / res))
         self._orient = orient
+        self._change_cnt = None  # type: Optional[List[int]]
+
+    def set_change_counter(self, counter):
+        # type: (List[int]) -> None
+        """Sets the counter to increment when this instance changes.
+
+        Parameters
+        ----------
+        counter : List[int]
+            a single element list, shared by all instances of a layout.
+        """
+        self._change_cnt = counter
+
+    def _changed(self):
+        # type: () -> None
+        # instances pickled by older versions have no change counter
+        counter = getattr(self, '_change_cnt', None)
+        if counter is not None:
+            counter[0] += 1
 
     def new_master_with(self, **kwargs):
         # type: (**Any) -> None
@@ -467,18 +500,19 @@ class Instance(Arrayable):
             a dictionary of new parameter values.
         """
         self._master = self._master.new_template_with(**kwargs)
+        self._changed()
 
-    def blockage_iter(self, layer_id, test_box, spx=0, spy=0):
-        # type: (int, BBox, int, int) -> Generator[BBox, None, None]
-        # transform the given BBox to master coordinate
-        if self.destroyed:
-            return
+    def _get_item_range(self, layer_id, test_box):
+        # type: (int, BBox) -> Optional[Tuple[int, int, int, int]]
+        """Returns the range of array elements whose tracks on the given layer may touch test_box.
 
+        Returns None if no element can touch test_box, otherwise returns the
+        (col0, col1, row0, row1) inclusive range.
+        """
         base_box = self._master.get_track_bbox(layer_id)
         if not base_box.is_physical():
-            return
+            return None
         base_box = self.translate_master_box(base_box)
-        test = test_box.expand(dx=spx, dy=spy, unit_mode=True)
 
         inst_spx = max(self.spx_unit, 1)
         inst_spy = max(self.spy_unit, 1)
@@ -486,71 +520,128 @@ class Instance(Arrayable):
         yb = base_box.bottom_unit
         xr = base_box.right_unit
         yt = base_box.top_unit
-        nx0 = max(0, -(-(test.left_unit - xr) // inst_spx))
-        nx1 = min(self.nx - 1, (test.right_unit - xl) // inst_spx)
-        ny0 = max(0, -(-(test.bottom_unit - yt) // inst_spy))
-        ny1 = min(self.ny - 1, (test.top_unit - yb) // inst_spy)
+        nx0 = max(0, -(-(test_box.left_unit - xr) // inst_spx))
+        nx1 = min(self.nx - 1, (test_box.right_unit - xl) // inst_spx)
+        ny0 = max(0, -(-(test_box.bottom_unit - yt) // inst_spy))
+        ny1 = min(self.ny - 1, (test_box.top_unit - yb) // inst_spy)
+        if nx1 < nx0 or ny1 < ny0:
+            return None
+        return nx0, nx1, ny0, ny1
+
+    def _transform_rect_array(self, rect_arr, col0, row0, nx, ny):
+        # type: (np.ndarray, int, int, int, int) -> np.ndarray
+        """Transform an array of master rectangles to the given block of array elements.
+
+        Parameters
+        ----------
+        rect_arr : np.ndarray
+            a N x 6 integer array of (xl, yb, xr, yt, dx, dy) rectangles in master coordinate.
+        col0 : int
+            the first column.
+        row0 : int
+            the first row.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+
+        Returns
+        -------
+        new_arr : np.ndarray
+            a (nx * ny * N) x 6 array of the corresponding rectangles in instance coordinate.
+        """
         orient = self._orient
+        spx, spy = self.spx_unit, self.spy_unit
         x0, y0 = self._loc_unit
+        loc = x0 + col0 * spx, y0 + row0 * spy
+        boxes = transform_box_array(rect_arr[:, :4], loc, orient, nx=nx, ny=ny, spx=spx, spy=spy)
+        ans = np.empty((boxes.shape[0], 6), dtype=np.int64)
+        ans[:, :4] = boxes
         if (orient == 'R90' or orient == 'R270' or
                 orient == 'MXR90' or orient == 'MYR90'):
-            spx, spy = spy, spx
-        for row in range(ny0, ny1 + 1):
-            for col in range(nx0, nx1 + 1):
-                dx, dy = self.get_item_location(row=row, col=col, unit_mode=True)
-                loc = dx + x0, dy + y0
-                inv_loc, inv_orient = get_inverse_transform(loc, orient)
-                cur_box = test_box.transform(inv_loc, inv_orient, unit_mode=True)
-                for box in self._master.blockage_iter(layer_id, cur_box, spx=spx, spy=spy):
-                    yield box.transform(loc, orient, unit_mode=True)
+            ans[:, 4:] = np.tile(rect_arr[:, [5, 4]], (nx * ny, 1))
+        else:
+            ans[:, 4:] = np.tile(rect_arr[:, 4:], (nx * ny, 1))
+        return ans
 
-    def all_rect_iter(self):
-        # type: () -> Generator[Tuple[BBox, int, int], None, None]
+    def get_rect_array(self, layer_id, test_box):
+        # type: (int, BBox) -> np.ndarray
+        """Returns all rectangles on the given layer whose spacing box intersects test_box.
+
+        The master is queried once with a box covering test_box in the coordinate of every
+        array element that may touch it, then the result is transformed in batch.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        test_box : BBox
+            the query box.
+
+        Returns
+        -------
+        rect_arr : np.ndarray
+            a N x 6 integer array of (xl, yb, xr, yt, dx, dy) rectangles and their spacing,
+            in resolution units.
+        """
         if self.destroyed:
-            return
+            return np.empty((0, 6), dtype=np.int64)
+        item_range = self._get_item_range(layer_id, test_box)
+        if item_range is None:
+            return np.empty((0, 6), dtype=np.int64)
 
-        orient = self._orient
+        nx0, nx1, ny0, ny1 = item_range
+        spx, spy = self.spx_unit, self.spy_unit
         x0, y0 = self._loc_unit
-        flip = (orient == 'R90' or orient == 'R270' or orient == 'MXR90' or orient == 'MYR90')
-        for layer_id, box, sdx, sdy in self._master.all_rect_iter():
-            if flip:
-                sdx, sdy = sdy, sdx
-            for row in range(self.ny):
-                for col in range(self.nx):
-                    dx, dy = self.get_item_location(row=row, col=col, unit_mode=True)
-                    loc = dx + x0, dy + y0
-                    yield layer_id, box.transform(loc, orient, unit_mode=True), sdx, sdy
-
-    def intersection_rect_iter(self, layer_id, test_box):
-        # type: (int, BBox) -> Generator[BBox, None, None]
+        txl, tyb, txr, tyt = test_box.get_bounds(unit_mode=True)
+        query_box = BBox(txl - x0 - nx1 * spx, tyb - y0 - ny1 * spy,
+                         txr - x0 - nx0 * spx, tyt - y0 - ny0 * spy,
+                         test_box.resolution, unit_mode=True)
+        inv_orient = get_inverse_transform((0, 0), self._orient)[1]
+        query_box = query_box.transform(orient=inv_orient, unit_mode=True)
+        rect_arr = self._master.get_rect_array(layer_id, query_box)
+        if rect_arr.shape[0] == 0:
+            return rect_arr
+
+        ans = self._transform_rect_array(rect_arr, nx0, ny0, nx1 - nx0 + 1, ny1 - ny0 + 1)
+        if nx0 == nx1 and ny0 == ny1:
+            return ans
+        # remove rectangles of elements that do not touch test_box
+        xl, yb, xr, yt, sdx, sdy = ans.T
+        keep = ((xl - sdx <= txr) & (xr + sdx >= txl) & (yb - sdy <= tyt) & (yt + sdy >= tyb))
+        return ans[keep]
+
+    def get_all_rect_arrays(self):
+        # type: () -> Dict[int, np.ndarray]
+        """Returns all rectangles of this instance, as a dictionary from layer ID to array.
+
+        See get_rect_array() for the array format.
+        """
         if self.destroyed:
-            return
+            return {}
+        return {layer_id: self._transform_rect_array(rect_arr, 0, 0, self.nx, self.ny)
+                for layer_id, rect_arr in self._master.get_all_rect_arrays().items()}
 
-        base_box = self._master.get_track_bbox(layer_id)
-        if not base_box.is_physical():
-            return
-        base_box = self.translate_master_box(base_box)
+    def blockage_iter(self, layer_id, test_box, spx=0, spy=0):
+        # type: (int, BBox, int, int) -> Generator[BBox, None, None]
+        test = test_box.expand(dx=spx, dy=spy, unit_mode=True)
+        res = test_box.resolution
+        box_arr = get_blockage_array(self.get_rect_array(layer_id, test), test_box, spx, spy)
+        for xl, yb, xr, yt in box_arr.tolist():
+            yield BBox(xl, yb, xr, yt, res, unit_mode=True)
 
-        inst_spx = max(self.spx_unit, 1)
-        inst_spy = max(self.spy_unit, 1)
-        xl = base_box.left_unit
-        yb = base_box.bottom_unit
-        xr = base_box.right_unit
-        yt = base_box.top_unit
-        nx0 = max(0, -(-(test_box.left_unit - xr) // inst_spx))
-        nx1 = min(self.nx - 1, (test_box.right_unit - xl) // inst_spx)
-        ny0 = max(0, -(-(test_box.bottom_unit - yt) // inst_spy))
-        ny1 = min(self.ny - 1, (test_box.top_unit - yb) // inst_spy)
-        orient = self._orient
-        x0, y0 = self._loc_unit
-        for row in range(ny0, ny1 + 1):
-            for col in range(nx0, nx1 + 1):
-                dx, dy = self.get_item_location(row=row, col=col, unit_mode=True)
-                loc = dx + x0, dy + y0
-                inv_loc, inv_orient = get_inverse_transform(loc, orient)
-                cur_box = test_box.transform(inv_loc, inv_orient, unit_mode=True)
-                for box in self._master.intersection_rect_iter(layer_id, cur_box):
-                    yield box.transform(loc, orient, unit_mode=True)
+    def all_rect_iter(self):
+        # type: () -> Generator[Tuple[int, BBox, int, int], None, None]
+        res = self.resolution
+        for layer_id, rect_arr in self.get_all_rect_arrays().items():
+            for xl, yb, xr, yt, sdx, sdy in rect_arr.tolist():
+                yield layer_id, BBox(xl, yb, xr, yt, res, unit_mode=True), sdx, sdy
+
+    def intersection_rect_iter(self, layer_id, test_box):
+        # type: (int, BBox) -> Generator[BBox, None, None]
+        res = test_box.resolution
+        for xl, yb, xr, yt, _, _ in self.get_rect_array(layer_id, test_box).tolist():
+            yield BBox(xl, yb, xr, yt, res, unit_mode=True)
 
     def get_rect_bbox(self, layer):
         """Returns the overall bounding box of all rectangles on the given layer.
@@ -589,6 +680,7 @@ class Instance(Arrayable):
         self.check_destroyed()
         self._loc_unit = (int(round(new_loc[0] / self.resolution)),
                           int(round(new_loc[1] / self.resolution)))
+        self._changed()
 
     @property
     def location_unit(self):
@@ -602,6 +694,7 @@ class Instance(Arrayable):
         """Sets the instance location."""
         self.check_destroyed()
         self._loc_unit = (new_loc[0], new_loc[1])
+        self._changed()
 
     @property
     def orientation(self):
@@ -617,6 +710,7 @@ class Instance(Arrayable):
         if val not in transform_table:
             raise ValueError('Unsupported orientation: %s' % val)
         self._orient = val
+        self._changed()
 
     @property
     def content(self):
@@ -695,6 +789,7 @@ class Instance(Arrayable):
             dx = int(round(dx / self.resolution))
             dy = int(round(dy / self.resolution))
         self._loc_unit = self._loc_unit[0] + dx, self._loc_unit[1] + dy
+        self._changed()
 
     def translate_master_box(self, box):
         # type: (BBox) -> BBox
@@ -712,6 +807,23 @@ class Instance(Arrayable):
         """
         return box.transform(self.location_unit, self.orientation, unit_mode=True)
 
+    def translate_master_box_array(self, boxes):
+        # type: (np.ndarray) -> np.ndarray
+        """Transform boxes in master template to all elements of this instance.
+
+        Parameters
+        ----------
+        boxes : np.ndarray
+            a N x 4 integer array of boxes in master template coordinate, in resolution units.
+
+        Returns
+        -------
+        new_boxes : np.ndarray
+            a (nx * ny * N) x 4 array of the corresponding boxes in instance coordinate.
+        """
+        return transform_box_array(boxes, self._loc_unit, self._orient, nx=self.nx, ny=self.ny,
+                                   spx=self.spx_unit, spy=self.spy_unit)
+
     def translate_master_location(self,
                                   mloc,  # type: Tuple[Union[float, int], Union[float, int]]
                                   unit_mode=False,  # type: bool
@@ -904,6 +1016,7 @@ class Instance(Arrayable):
             ans = deepcopy(self)
         ans._loc_unit = loc
         ans._orient = orient
+        ans._changed()
         return ans
 
 
@@ -1688,10 +1801,14 @@ class Via(Arrayable):
         top layer extension direction.  Can force to extend in same direction as bottom.
     unit_mode : bool
         True if array pitches are given in resolution units.
+    info : Optional[Dict[str, Any]]
+        the via information of this bounding box, as returned by TechInfo.get_via_info().
+        Computed if not given.
     """
 
     def __init__(self, tech, bbox, bot_layer, top_layer, bot_dir,
-                 nx=1, ny=1, spx=0, spy=0, extend=True, top_dir=None, unit_mode=False):
+                 nx=1, ny=1, spx=0, spy=0, extend=True, top_dir=None, unit_mode=False,
+                 info=None):
         if isinstance(bbox, BBoxArray):
             self._bbox = bbox.base
             Arrayable.__init__(self, tech.resolution, nx=bbox.nx, ny=bbox.ny,
@@ -1717,8 +1834,10 @@ class Via(Arrayable):
         self._bot_dir = bot_dir
         self._top_dir = top_dir
         self._extend = extend
-        self._info = self._tech.get_via_info(self._bbox, bot_layer, top_layer, bot_dir,
-                                             top_dir=top_dir, extend=extend)
+        if info is None:
+            info = self._tech.get_via_info(self._bbox, bot_layer, top_layer, bot_dir,
+                                           top_dir=top_dir, extend=extend)
+        self._info = info
         if self._info is None:
             raise ValueError('Cannot make via with bounding box %s' % self._bbox)
 
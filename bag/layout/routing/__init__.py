@@ -6,3 +6,4 @@
 from .base import TrackID, WireArray, Port, TrackManager
 from .grid import RoutingGrid
 from .fill import UsedTracks
+from .maze import MazeRouter
@@ -8,7 +8,7 @@ from typing import Tuple, Union, Generator, Dict, List, Sequence
 import numbers
 
 from ...util.search import BinaryIterator
-from ..util import BBox, BBoxArray
+from ..util import BBox, BBoxArray, get_slots_state
 from .grid import RoutingGrid
 
 
@@ -29,17 +29,62 @@ class TrackID(object):
         pitch between adjacent tracks, in number of track pitches.
     """
 
+    __slots__ = ('_layer_id', '_hidx', '_w', '_n', '_hpitch')
+
     def __init__(self, layer_id, track_idx, width=1, num=1, pitch=0.0):
         # type: (int, Union[float, int], int, int, Union[float, int]) -> None
         if num < 1:
             raise ValueError('TrackID must have 1 or more tracks.')
 
         self._layer_id = layer_id
-        self._hidx = int(round(2 * track_idx)) + 1
+        if track_idx.__class__ is int:
+            self._hidx = 2 * track_idx + 1
+        else:
+            self._hidx = int(round(2 * track_idx)) + 1
         self._w = width
         self._n = num
         self._hpitch = 0 if num == 1 else int(pitch * 2)
 
+    @classmethod
+    def from_htr(cls, layer_id, hidx, width=1, num=1, hpitch=0):
+        # type: (int, int, int, int, int) -> TrackID
+        """Create a TrackID from half-track indices, skipping index conversion.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        hidx : int
+            the smallest track index in half-track units, as returned by index_htr.
+        width : int
+            width of one track in number of tracks.
+        num : int
+            number of tracks in this array.
+        hpitch : int
+            pitch between adjacent tracks, in half-track units.
+
+        Returns
+        -------
+        track_id : TrackID
+            the new TrackID.
+        """
+        if num < 1:
+            raise ValueError('TrackID must have 1 or more tracks.')
+        ans = cls.__new__(cls)
+        ans._layer_id = layer_id
+        ans._hidx = hidx
+        ans._w = width
+        ans._n = num
+        ans._hpitch = 0 if num == 1 else hpitch
+        return ans
+
+    def __getstate__(self):
+        return self._layer_id, self._hidx, self._w, self._n, self._hpitch
+
+    def __setstate__(self, state):
+        (self._layer_id, self._hidx, self._w, self._n,
+         self._hpitch) = get_slots_state(state, self.__slots__, 'TrackID')
+
     def __repr__(self):
         arg_list = ['layer=%d' % self._layer_id]
         if self._hidx % 2 == 1:
@@ -216,6 +261,8 @@ class WireArray(object):
         True if lower/upper are specified in resolution units.
     """
 
+    __slots__ = ('_track_id', '_res', '_lower_unit', '_upper_unit')
+
     def __init__(self, track_id, lower, upper, res=None, unit_mode=False):
         # type: (TrackID, Union[float, int], Union[float, int], Optional[float], bool) -> None
         if res is None:
@@ -224,12 +271,19 @@ class WireArray(object):
         self._track_id = track_id
         self._res = res
         if unit_mode:
-            self._lower_unit = int(lower)  # type: int
-            self._upper_unit = int(upper)  # type: int
+            self._lower_unit = lower if lower.__class__ is int else int(lower)  # type: int
+            self._upper_unit = upper if upper.__class__ is int else int(upper)  # type: int
         else:
             self._lower_unit = int(round(lower / res))
             self._upper_unit = int(round(upper / res))
 
+    def __getstate__(self):
+        return self._track_id, self._res, self._lower_unit, self._upper_unit
+
+    def __setstate__(self, state):
+        (self._track_id, self._res, self._lower_unit,
+         self._upper_unit) = get_slots_state(state, self.__slots__, 'WireArray')
+
     def __repr__(self):
         return '%s(%s, %.d, %.d, %.4g)' % (self.__class__.__name__, self._track_id,
                                            self._lower_unit, self._upper_unit, self._res)
@@ -331,9 +385,11 @@ class WireArray(object):
         tid = self._track_id
         layer = tid.layer_id
         width = tid.width
-        for tr in tid:
-            yield WireArray(TrackID(layer, tr, width=width), self._lower_unit,
-                            self._upper_unit, res=self._res, unit_mode=True)
+        hidx = tid.index_htr
+        hpitch = tid.pitch_htr
+        for idx in range(tid.num):
+            yield WireArray(TrackID.from_htr(layer, hidx + idx * hpitch, width=width),
+                            self._lower_unit, self._upper_unit, res=self._res, unit_mode=True)
 
     def get_bbox_array(self, grid):
         # type: ('RoutingGrid') -> BBoxArray
@@ -3,9 +3,11 @@
 """This module defines classes that provides automatic fill utility on a grid.
 """
 
-from typing import TYPE_CHECKING, Optional, Union, List, Tuple, Any, Generator
+from typing import TYPE_CHECKING, Optional, Union, List, Tuple, Any, Generator, Dict
 
-from rtree.index import Index, Property
+import os
+
+import numpy as np
 
 from bag.layout.util import BBox
 from bag.util.search import BinaryIterator, minimize_cost_golden
@@ -17,60 +19,205 @@ if TYPE_CHECKING:
 
 
 class RectIndex(object):
-    """A R-tree that stores all tracks on a layer."""
+    """A spatial index of all tracks on a layer.
+
+    Rectangles are stored in integer arrays together with their spacing boxes.  When
+    queried, the index sorts rectangles by the lower coordinate of their spacing box along
+    the axis where they are narrowest, which buckets wires by track, so a query only
+    checks rectangles in a small window of the sorted arrays.  Rectangles much larger than
+    usual along that axis, and rectangles recorded since the last sort, are checked one
+    array operation at a time.
+
+    Parameters
+    ----------
+    resolution : float
+        the layout resolution.
+    basename : Optional[str]
+        if given, the rectangles are saved to basename + '.npy' when this index is closed,
+        and loaded from that file if it exists and overwrite is False.
+    overwrite : bool
+        True to ignore any existing saved rectangles.
+    """
 
     def __init__(self, resolution, basename=None, overwrite=False):
         # type: (float, Optional[str], bool) -> None
         self._res = resolution
         self._cnt = 0
-        if basename is None:
-            self._index = Index(interleaved=True)
-        else:
-            p = Property(overwrite=overwrite)
-            self._index = Index(basename, interleaved=True, properties=p)
+        # rectangles are stored as [sorted | large | unsorted] in these arrays.
+        self._num_sorted = 0
+        self._num_large = 0
+        self._axis = 0
+        self._max_ext = 0
+        self._rects = np.empty((0, 6), dtype=np.int64)
+        self._sp_boxes = np.empty((0, 4), dtype=np.int64)
+        self._fname = None  # type: Optional[str]
+        if basename is not None:
+            fname = basename + '.npy'
+            if not overwrite and os.path.isfile(fname):
+                rects = np.load(fname)
+                self.record_box_array(rects[:, :4], rects[:, 4], rects[:, 5])
+            # rectangles recorded after loading are saved too
+            self._fname = fname
+
+    def __getstate__(self):
+        return dict(res=self._res, rects=self._rects[:self._cnt])
+
+    def __setstate__(self, state):
+        self.__init__(state['res'])
+        rects = state['rects']
+        self.record_box_array(rects[:, :4], rects[:, 4], rects[:, 5])
+
+    def __len__(self):
+        # type: () -> int
+        return self._cnt
 
     @property
     def bound_box(self):
         # type: () -> BBox
-        xl, yb, xr, yt = self._index.bounds
-        return BBox(int(xl), int(yb), int(xr), int(yt), self._res, unit_mode=True)
+        """The bounding box of all spacing boxes."""
+        if self._cnt == 0:
+            return BBox.get_invalid_bbox()
+        sp_boxes = self._sp_boxes[:self._cnt]
+        xl, yb = sp_boxes[:, :2].min(axis=0).tolist()
+        xr, yt = sp_boxes[:, 2:].max(axis=0).tolist()
+        return BBox(xl, yb, xr, yt, self._res, unit_mode=True)
 
     def close(self):
-        self._index.close()
+        if self._fname is not None:
+            np.save(self._fname, self._rects[:self._cnt])
+
+    def _reserve(self, num):
+        # type: (int) -> None
+        """Make sure there is room for the given number of new rectangles."""
+        cnt = self._cnt
+        cap = self._rects.shape[0]
+        if cnt + num > cap:
+            cap = max(cnt + num, 2 * cap, 16)
+            rects = np.empty((cap, 6), dtype=np.int64)
+            sp_boxes = np.empty((cap, 4), dtype=np.int64)
+            rects[:cnt] = self._rects[:cnt]
+            sp_boxes[:cnt] = self._sp_boxes[:cnt]
+            self._rects, self._sp_boxes = rects, sp_boxes
+
+    def _sort(self):
+        # type: () -> None
+        """Sort all rectangles so they can be queried efficiently."""
+        cnt = self._cnt
+        sp_boxes = self._sp_boxes[:cnt]
+        ext_x = sp_boxes[:, 2] - sp_boxes[:, 0]
+        ext_y = sp_boxes[:, 3] - sp_boxes[:, 1]
+        med_x = int(np.median(ext_x))
+        med_y = int(np.median(ext_y))
+        if med_x <= med_y:
+            axis, ext, med = 0, ext_x, med_x
+        else:
+            axis, ext, med = 1, ext_y, med_y
+
+        # rectangles much larger than usual are not sorted, so they do not widen the
+        # search window of every query.
+        is_large = ext > 4 * max(med, 1)
+        small_idx = np.flatnonzero(~is_large)
+        small_idx = small_idx[np.argsort(sp_boxes[small_idx, axis], kind='stable')]
+        order = np.concatenate((small_idx, np.flatnonzero(is_large)))
+        self._rects[:cnt] = self._rects[order]
+        self._sp_boxes[:cnt] = self._sp_boxes[order]
+        self._num_sorted = small_idx.size
+        self._num_large = cnt - small_idx.size
+        self._axis = axis
+        self._max_ext = int(ext[small_idx].max()) if small_idx.size > 0 else 0
 
     def record_box(self, box, dx, dy):
         # type: (BBox, int, int) -> None
         """Record the given BBox."""
-        sp_box = box.expand(dx=dx, dy=dy, unit_mode=True)
-        bnds = sp_box.get_bounds(unit_mode=True)
-        obj = (box.left_unit, box.bottom_unit, box.right_unit, box.top_unit, dx, dy)
-        self._index.insert(self._cnt, bnds, obj=obj)
-        self._cnt += 1
+        xl, yb, xr, yt = box.left_unit, box.bottom_unit, box.right_unit, box.top_unit
+        self._reserve(1)
+        idx = self._cnt
+        self._rects[idx] = (xl, yb, xr, yt, dx, dy)
+        self._sp_boxes[idx] = (xl - dx, yb - dy, xr + dx, yt + dy)
+        self._cnt = idx + 1
+
+    def record_box_array(self, boxes, dx, dy):
+        # type: (np.ndarray, Union[int, np.ndarray], Union[int, np.ndarray]) -> None
+        """Record many bounding boxes at once.
+
+        Parameters
+        ----------
+        boxes : np.ndarray
+            a N x 4 integer array of (xl, yb, xr, yt) boxes, in resolution units.
+        dx : Union[int, np.ndarray]
+            the horizontal spacing of all boxes, or an array of spacing of each box.
+        dy : Union[int, np.ndarray]
+            the vertical spacing of all boxes, or an array of spacing of each box.
+        """
+        num = boxes.shape[0]
+        if num == 0:
+            return
+        self._reserve(num)
+        start = self._cnt
+        stop = start + num
+        rects = self._rects[start:stop]
+        rects[:, :4] = boxes
+        rects[:, 4] = dx
+        rects[:, 5] = dy
+        self._sp_boxes[start:stop] = rects[:, :4] + rects[:, [4, 5, 4, 5]] * [-1, -1, 1, 1]
+        self._cnt = stop
+
+    def get_rect_array(self, box=None):
+        # type: (Optional[BBox]) -> np.ndarray
+        """Returns recorded rectangles as an array.
+
+        Parameters
+        ----------
+        box : Optional[BBox]
+            if given, only return rectangles whose spacing box intersects this box.
+            Boxes that only touch at the boundary are considered intersecting.
+
+        Returns
+        -------
+        rect_arr : np.ndarray
+            a N x 6 integer array of (xl, yb, xr, yt, dx, dy) rectangles and their spacing,
+            in resolution units.
+        """
+        cnt = self._cnt
+        if box is None:
+            return self._rects[:cnt].copy()
+
+        num_unsorted = cnt - self._num_sorted - self._num_large
+        if num_unsorted >= max(64, self._num_sorted // 8):
+            self._sort()
+
+        bnds = box.get_bounds(unit_mode=True)
+        xl, yb, xr, yt = bnds
+        axis = self._axis
+        # find sorted rectangles whose lower coordinate is in the search window
+        lower_arr = self._sp_boxes[:self._num_sorted, axis]
+        idx0 = np.searchsorted(lower_arr, bnds[axis] - self._max_ext, side='left')
+        idx1 = np.searchsorted(lower_arr, bnds[axis + 2], side='right')
+        idx = np.concatenate((np.arange(idx0, idx1), np.arange(self._num_sorted, cnt)))
+        sp_boxes = self._sp_boxes[idx]
+        keep = ((sp_boxes[:, 0] <= xr) & (sp_boxes[:, 2] >= xl) &
+                (sp_boxes[:, 1] <= yt) & (sp_boxes[:, 3] >= yb))
+        return self._rects[idx[keep]]
 
     def rect_iter(self):
         # type: () -> Generator[Tuple[BBox, int, int], None, None]
-        for xl, yb, xr, yt, sdx, sdy in self._index.intersection(self._index.bounds, objects='raw'):
-            box_real = BBox(xl, yb, xr, yt, self._res, unit_mode=True)
-            yield box_real, sdx, sdy
+        res = self._res
+        for xl, yb, xr, yt, sdx, sdy in self._rects[:self._cnt].tolist():
+            yield BBox(xl, yb, xr, yt, res, unit_mode=True), sdx, sdy
 
     def intersection_iter(self, box, dx=0, dy=0):
         # type: (BBox, int, int) -> Generator[BBox, None, None]
         """Finds all bounding box that intersects the given box."""
         res = self._res
-        test_box = box.expand(dx=dx, dy=dy, unit_mode=True)
-        box_iter = self._index.intersection(test_box.get_bounds(unit_mode=True), objects='raw')
-        for xl, yb, xr, yt, sdx, sdy in box_iter:
-            box_real = BBox(xl, yb, xr, yt, res, unit_mode=True)
-            box_sp = box_real.expand(dx=sdx, dy=sdy, unit_mode=True)
-            if box_sp.overlaps(box) or test_box.overlaps(box_real):
-                yield box_real.expand(dx=max(dx, sdx), dy=max(dy, sdy), unit_mode=True)
+        rect_arr = self.get_rect_array(box.expand(dx=dx, dy=dy, unit_mode=True))
+        for xl, yb, xr, yt in get_blockage_array(rect_arr, box, dx, dy).tolist():
+            yield BBox(xl, yb, xr, yt, res, unit_mode=True)
 
     def intersection_rect_iter(self, box):
         # type: (BBox) -> Generator[BBox, None, None]
         """Finds all bounding box that intersects the given box."""
         res = self._res
-        box_iter = self._index.intersection(box.get_bounds(unit_mode=True), objects='raw')
-        for xl, yb, xr, yt, sdx, sdy in box_iter:
+        for xl, yb, xr, yt, _, _ in self.get_rect_array(box).tolist():
             yield BBox(xl, yb, xr, yt, res, unit_mode=True)
 
 
@@ -83,10 +230,28 @@ class UsedTracks(object):
         self._idx_table = {}
         self._save_file_basename = save_file_basename
         self._overwrite = overwrite
+        self._version = 0
+        self._layer_version = {}  # type: Dict[int, int]
 
     def __iter__(self):
         return self._idx_table.keys()
 
+    @property
+    def version(self):
+        # type: () -> int
+        """A counter that changes every time rectangles are recorded."""
+        return self._version
+
+    def get_layer_version(self, layer_id):
+        # type: (int) -> int
+        """Returns a counter that changes every time rectangles are recorded on the layer."""
+        return self._layer_version.get(layer_id, 0)
+
+    def _bump_version(self, layer_id):
+        # type: (int) -> None
+        self._version += 1
+        self._layer_version[layer_id] = self._layer_version.get(layer_id, 0) + 1
+
     def get_track_bbox(self, layer_id):
         # type: (int) -> BBox
         if layer_id not in self._idx_table:
@@ -109,11 +274,96 @@ class UsedTracks(object):
         else:
             index = self._idx_table[layer_id]
         index.record_box(box, dx, dy)
+        self._bump_version(layer_id)
+
+    def record_box_array(self, layer_id, boxes, dx, dy, res):
+        # type: (int, np.ndarray, Union[int, np.ndarray], Union[int, np.ndarray], float) -> None
+        """Record many bounding boxes on the given layer at once.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        boxes : np.ndarray
+            a N x 4 integer array of (xl, yb, xr, yt) boxes, in resolution units.
+        dx : Union[int, np.ndarray]
+            the horizontal spacing of all boxes, or an array of spacing of each box.
+        dy : Union[int, np.ndarray]
+            the vertical spacing of all boxes, or an array of spacing of each box.
+        res : float
+            the layout resolution.
+        """
+        if layer_id not in self._idx_table:
+            if self._save_file_basename is None:
+                basename = None
+            else:
+                basename = self._save_file_basename + ('_%d' % layer_id)
+            index = self._idx_table[layer_id] = RectIndex(res, basename, self._overwrite)
+        else:
+            index = self._idx_table[layer_id]
+        index.record_box_array(boxes, dx, dy)
+        self._bump_version(layer_id)
 
     def close(self):
         for index in self._idx_table.values():
             index.close()
 
+    def record_boxes(self, grid, layer_name, boxes, dx=-1, dy=-1):
+        # type: (RoutingGrid, Union[Tuple[str, str], str], np.ndarray, int, int) -> Optional[int]
+        """Record many bounding boxes on the same layer.  Returns the added layer ID.
+
+        This is the batch version of record_rect(); spacing is looked up with the batch
+        TechInfo methods.
+
+        Parameters
+        ----------
+        grid : RoutingGrid
+            the RoutingGrid instance.
+        layer_name : Union[Tuple[str, str], str]
+            the layer name, or the (layer, purpose) pair.
+        boxes : np.ndarray
+            a N x 4 integer array of (xl, yb, xr, yt) boxes, in resolution units.
+        dx : int
+            the horizontal spacing.  Negative to use the minimum spacing.
+        dy : int
+            the vertical spacing.  Negative to use the minimum spacing.
+
+        Returns
+        -------
+        layer_id : Optional[int]
+            the added layer ID, or None if the layer is not a routing layer.
+        """
+        tech_info = grid.tech_info
+
+        if isinstance(layer_name, tuple):
+            if layer_name[1] == 'exclude':
+                return None
+            layer_name = layer_name[0]
+        try:
+            layer_id = tech_info.get_layer_id(layer_name)
+        except ValueError:
+            return None
+
+        if layer_id not in grid:
+            return None
+
+        layer_type = tech_info.get_layer_type(layer_name)
+        is_horiz = grid.get_direction(layer_id) == 'x'
+        if is_horiz:
+            widths = boxes[:, 3] - boxes[:, 1]
+        else:
+            widths = boxes[:, 2] - boxes[:, 0]
+        sp = tech_info.get_min_space_array(layer_type, widths)
+        sp_le = tech_info.get_min_line_end_space_array(layer_type, widths)
+        if is_horiz:
+            dx0, dy0 = sp_le, sp
+        else:
+            dx0, dy0 = sp, sp_le
+
+        self.record_box_array(layer_id, boxes, dx0 if dx < 0 else dx, dy0 if dy < 0 else dy,
+                              grid.resolution)
+        return layer_id
+
     def record_rect(self, grid, layer_name, box_arr, dx=-1, dy=-1):
         # type: (RoutingGrid, Union[Tuple[str, str], str], BBoxArray, int, int) -> Optional[int]
         """Record the given bounding box array.  Returns the added layer ID."""
@@ -159,9 +409,28 @@ class UsedTracks(object):
 
         for box in box_arr:
             index.record_box(box, dx, dy)
+        self._bump_version(layer_id)
 
         return layer_id
 
+    def get_rect_array(self, layer_id, box):
+        # type: (int, BBox) -> np.ndarray
+        """Returns all rectangles on the given layer whose spacing box intersects the given box.
+
+        See RectIndex.get_rect_array() for the array format.
+        """
+        if layer_id not in self._idx_table:
+            return np.empty((0, 6), dtype=np.int64)
+        return self._idx_table[layer_id].get_rect_array(box)
+
+    def get_all_rect_arrays(self):
+        # type: () -> Dict[int, np.ndarray]
+        """Returns all recorded rectangles, as a dictionary from layer ID to rectangle array.
+
+        See RectIndex.get_rect_array() for the array format.
+        """
+        return {layer_id: index.get_rect_array() for layer_id, index in self._idx_table.items()}
+
     def all_rect_iter(self):
         # type: () -> Generator[Tuple[int, BBox, int, int], None, None]
         for layer_id, index in self._idx_table.items():
@@ -180,6 +449,42 @@ class UsedTracks(object):
             yield from self._idx_table[layer_id].intersection_iter(test_box, dx=spx, dy=spy)
 
 
+def get_blockage_array(rect_arr, test_box, spx=0, spy=0):
+    # type: (np.ndarray, BBox, int, int) -> np.ndarray
+    """Computes blockages of the given test box from an array of rectangles.
+
+    This is the vectorized equivalent of RectIndex.intersection_iter().
+
+    Parameters
+    ----------
+    rect_arr : np.ndarray
+        a N x 6 integer array of (xl, yb, xr, yt, dx, dy) rectangles, as returned by
+        RectIndex.get_rect_array().
+    test_box : BBox
+        the test box.
+    spx : int
+        the horizontal spacing of the test box, in resolution units.
+    spy : int
+        the vertical spacing of the test box, in resolution units.
+
+    Returns
+    -------
+    box_arr : np.ndarray
+        a M x 4 integer array of the blocking rectangles, expanded by their spacing.
+    """
+    xl, yb, xr, yt, sdx, sdy = rect_arr.T
+    txl, tyb, txr, tyt = test_box.get_bounds(unit_mode=True)
+    # rectangle spacing box overlaps the test box
+    keep = ((np.maximum(xl - sdx, txl) < np.minimum(xr + sdx, txr)) &
+            (np.maximum(yb - sdy, tyb) < np.minimum(yt + sdy, tyt)))
+    # test spacing box overlaps the rectangle
+    keep |= ((np.maximum(xl, txl - spx) < np.minimum(xr, txr + spx)) &
+             (np.maximum(yb, tyb - spy) < np.minimum(yt, tyt + spy)))
+    dx = np.maximum(sdx[keep], spx)
+    dy = np.maximum(sdy[keep], spy)
+    return np.stack((xl[keep] - dx, yb[keep] - dy, xr[keep] + dx, yt[keep] + dy), axis=1)
+
+
 def fill_symmetric_const_space(area, sp_max, n_min, n_max, offset=0):
     # type: (int, int, int, int, int) -> List[Tuple[int, int]]
     """Fill the given 1-D area given maximum space spec alone.
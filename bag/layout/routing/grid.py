@@ -83,6 +83,8 @@ class RoutingGrid(object):
         self.block_pitch = {}
         self.w_override = {}
         self.private_layers = []
+        # memoized design rule lookups; cleared when track widths change.
+        self._rule_cache = {}  # type: Dict[Tuple[Any, ...], Any]
 
         cur_dir = bot_dir
         for lay, sp, w, max_num in zip(layers, spaces, widths, max_num_tr):
@@ -348,6 +350,43 @@ class RoutingGrid(object):
             return w_unit
         return w_unit * self._resolution
 
+    def get_track_width_array(self, layer_id, width_ntr):
+        # type: (int, np.ndarray) -> np.ndarray
+        """Batch version of get_track_width(), in resolution units.
+
+        Parameters
+        ----------
+        layer_id : int
+            the track layer ID
+        width_ntr : np.ndarray
+            the track widths in number of tracks.  Scalars are also accepted.
+
+        Returns
+        -------
+        width : np.ndarray
+            the track widths in resolution units, with the same shape as width_ntr.
+        """
+        width_ntr = np.asarray(width_ntr, dtype=np.int64)
+        w = self.w_tracks[layer_id]
+        sp = self.sp_tracks[layer_id]
+        ans = np.array(width_ntr * (w + sp) - sp, ndmin=1)
+        width_arr = width_ntr.reshape(ans.shape)
+        for ntr, w_unit in self.w_override[layer_id].items():
+            ans[width_arr == ntr] = w_unit
+        return ans.reshape(width_ntr.shape)
+
+    def _get_layer_type(self, layer_id):
+        # type: (int) -> str
+        """Returns the layer type of the given routing layer."""
+        key = ('type', layer_id)
+        layer_type = self._rule_cache.get(key, None)
+        if layer_type is None:
+            layer_name = self.tech_info.get_layer_name(layer_id)
+            if isinstance(layer_name, tuple):
+                layer_name = layer_name[0]
+            layer_type = self._rule_cache[key] = self.tech_info.get_layer_type(layer_name)
+        return layer_type
+
     def get_track_width_inverse(self, layer_id, width, mode=-1, unit_mode=False):
         # type: (int, Union[float, int], int, bool) -> int
         """Given track width in layout/resolution units, compute equivalent number of tracks.
@@ -441,13 +480,12 @@ class RoutingGrid(object):
         min_length : Union[float, int]
             the minimum length.
         """
-        layer_name = self.tech_info.get_layer_name(layer_id)
-        if isinstance(layer_name, tuple):
-            layer_name = layer_name[0]
-        layer_type = self.tech_info.get_layer_type(layer_name)
-
-        width = self.get_track_width(layer_id, width_ntr)
-        min_length = self.tech_info.get_min_length(layer_type, width)
+        key = ('len_min', layer_id, width_ntr)
+        min_length = self._rule_cache.get(key, None)
+        if min_length is None:
+            width = self.get_track_width(layer_id, width_ntr)
+            min_length = self.tech_info.get_min_length(self._get_layer_type(layer_id), width)
+            self._rule_cache[key] = min_length
 
         if unit_mode:
             return int(round(min_length / self._resolution))
@@ -474,18 +512,39 @@ class RoutingGrid(object):
         sp : Union[int, float]
             minimum space needed around the given track in layout/resolution units.
         """
-        layer_name = self.tech_info.get_layer_name(layer_id)
-        if isinstance(layer_name, tuple):
-            layer_name = layer_name[0]
-        layer_type = self.tech_info.get_layer_type(layer_name)
-
-        width = self.get_track_width(layer_id, width_ntr, unit_mode=True)
-        sp_min_unit = self.tech_info.get_min_space(layer_type, width, unit_mode=True,
-                                                   same_color=same_color)
+        key = ('sp', layer_id, width_ntr, same_color)
+        sp_min_unit = self._rule_cache.get(key, None)
+        if sp_min_unit is None:
+            width = self.get_track_width(layer_id, width_ntr, unit_mode=True)
+            sp_min_unit = self.tech_info.get_min_space(self._get_layer_type(layer_id), width,
+                                                       unit_mode=True, same_color=same_color)
+            self._rule_cache[key] = sp_min_unit
         if unit_mode:
             return sp_min_unit
         return sp_min_unit * self._resolution
 
+    def get_space_array(self, layer_id, width_ntr, same_color=False):
+        # type: (int, np.ndarray, bool) -> np.ndarray
+        """Batch version of get_space(), in resolution units.
+
+        Parameters
+        ----------
+        layer_id : int
+            the track layer ID
+        width_ntr : np.ndarray
+            the track widths in number of tracks.
+        same_color : bool
+            True to use same-color spacing.
+
+        Returns
+        -------
+        sp : np.ndarray
+            minimum space needed around each track, in resolution units.
+        """
+        widths = self.get_track_width_array(layer_id, width_ntr)
+        return self.tech_info.get_min_space_array(self._get_layer_type(layer_id), widths,
+                                                  same_color=same_color)
+
     def get_num_space_tracks(self, layer_id, width_ntr, half_space=False, same_color=False):
         # type: (int, int, bool, bool) -> Union[int, float]
         """Returns the number of tracks needed for space around a track of the given width.
@@ -510,6 +569,11 @@ class RoutingGrid(object):
         num_sp_tracks : Union[int, float]
             minimum space needed around the given track in number of tracks.
         """
+        key = ('sp_ntr', layer_id, width_ntr, half_space, same_color)
+        ans = self._rule_cache.get(key, None)
+        if ans is not None:
+            return ans
+
         width = self.get_track_width(layer_id, width_ntr, unit_mode=True)
         sp_min_unit = self.get_space(layer_id, width_ntr, same_color=same_color, unit_mode=True)
         w_unit = self.w_tracks[layer_id]
@@ -520,11 +584,13 @@ class RoutingGrid(object):
         half_pitch = (w_unit + sp_unit) // 2
         num_half_pitch = -(-(sp_min_unit - sp_unit - extra_space) // half_pitch)
         if num_half_pitch % 2 == 0:
-            return num_half_pitch // 2
+            ans = num_half_pitch // 2
         elif half_space:
-            return num_half_pitch / 2.0
+            ans = num_half_pitch / 2.0
         else:
-            return (num_half_pitch + 1) // 2
+            ans = (num_half_pitch + 1) // 2
+        self._rule_cache[key] = ans
+        return ans
 
     def get_line_end_space(self, layer_id, width_ntr, unit_mode=False):
         # type: (int, int, bool) -> Union[float, int]
@@ -544,16 +610,37 @@ class RoutingGrid(object):
         space : Union[float, int]
             the line-end spacing.
         """
-        layer_name = self.tech_info.get_layer_name(layer_id)
-        if isinstance(layer_name, tuple):
-            layer_name = layer_name[0]
-        layer_type = self.tech_info.get_layer_type(layer_name)
-        width = self.get_track_width(layer_id, width_ntr, unit_mode=True)
-        ans = self.tech_info.get_min_line_end_space(layer_type, width, unit_mode=True)
+        key = ('sp_le', layer_id, width_ntr)
+        ans = self._rule_cache.get(key, None)
+        if ans is None:
+            width = self.get_track_width(layer_id, width_ntr, unit_mode=True)
+            ans = self.tech_info.get_min_line_end_space(self._get_layer_type(layer_id), width,
+                                                        unit_mode=True)
+            self._rule_cache[key] = ans
         if not unit_mode:
             return ans * self._resolution
         return ans
 
+    def get_line_end_space_array(self, layer_id, width_ntr):
+        # type: (int, np.ndarray) -> np.ndarray
+        """Batch version of get_line_end_space(), in resolution units.
+
+        Parameters
+        ----------
+        layer_id : int
+            wire layer ID.
+        width_ntr : np.ndarray
+            wire widths, in number of tracks.
+
+        Returns
+        -------
+        space : np.ndarray
+            the line-end spacing of each wire, in resolution units.
+        """
+        widths = self.get_track_width_array(layer_id, width_ntr)
+        return self.tech_info.get_min_line_end_space_array(self._get_layer_type(layer_id),
+                                                           widths)
+
     def get_line_end_space_tracks(self, wire_layer, space_layer, width_ntr, half_space=False):
         # type: (int, int, int, bool) -> Union[float, int]
         """Returns the minimum line end spacing in number of space tracks.
@@ -1034,6 +1121,36 @@ class RoutingGrid(object):
         else:
             return lower * self._resolution, upper * self._resolution
 
+    def get_wire_bounds_array(self, layer_id, tr_idx, width=1, unit_mode=False):
+        # type: (int, np.ndarray, Union[int, np.ndarray], bool) -> Tuple[np.ndarray, np.ndarray]
+        """Batch version of get_wire_bounds().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        tr_idx : np.ndarray
+            the center track indices.
+        width : Union[int, np.ndarray]
+            width of the wires in number of tracks.
+        unit_mode : bool
+            True to return coordinates in resolution units.
+
+        Returns
+        -------
+        lower : np.ndarray
+            the lower bound coordinates perpendicular to wire direction.
+        upper : np.ndarray
+            the upper bound coordinates perpendicular to wire direction.
+        """
+        width_unit = self.get_track_width_array(layer_id, width)
+        center = self.track_to_coord_array(layer_id, tr_idx, unit_mode=True)
+        lower, upper = center - width_unit // 2, center + width_unit // 2
+        if unit_mode:
+            return lower, upper
+        else:
+            return lower * self._resolution, upper * self._resolution
+
     def get_bbox(self, layer_id, tr_idx, lower, upper, width=1, unit_mode=False):
         # type: (int, Union[int, float], Union[int, float], Union[int, float], int, bool) -> BBox
         """Compute bounding box for the given wire.
@@ -1442,6 +1559,42 @@ class RoutingGrid(object):
         else:
             raise ValueError('coordinate %.4g is not on track.' % coord)
 
+    def _coord_to_unit_array(self, coord, unit_mode):
+        # type: (np.ndarray, bool) -> np.ndarray
+        """Returns the given coordinates as an integer array in resolution units."""
+        if unit_mode:
+            return np.asarray(coord, dtype=np.int64)
+        return np.round(np.asarray(coord) / self._resolution).astype(np.int64)
+
+    def coord_to_track_array(self, layer_id, coord, unit_mode=False):
+        # type: (int, np.ndarray, bool) -> np.ndarray
+        """Batch version of coord_to_track().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer number.
+        coord : np.ndarray
+            the coordinates perpendicular to the track direction.
+        unit_mode : bool
+            True if coordinates are given in resolution units.
+
+        Returns
+        -------
+        track : np.ndarray
+            the track numbers, as a float array.
+        """
+        coord = self._coord_to_unit_array(coord, unit_mode)
+
+        pitch = self.get_track_pitch(layer_id, unit_mode=True)
+        q, r = np.divmod(coord - self._get_track_offset(layer_id), pitch)
+
+        is_half = (r != 0) & (r == (pitch // 2))
+        bad_mask = (r != 0) & ~is_half
+        if np.any(bad_mask):
+            raise ValueError('coordinate %.4g is not on track.' % coord[bad_mask].flat[0])
+        return q + np.where(is_half, 0.5, 0.0)
+
     def find_next_track(self, layer_id, coord, tr_width=1, half_track=False,
                         mode=1, unit_mode=False):
         # type: (int, Union[float, int], int, bool, int, bool) -> Union[float, int]
@@ -1546,6 +1699,49 @@ class RoutingGrid(object):
         else:
             return q / 2
 
+    def coord_to_nearest_track_array(self, layer_id, coord, half_track=False, mode=0,
+                                     unit_mode=False):
+        # type: (int, np.ndarray, bool, int, bool) -> np.ndarray
+        """Batch version of coord_to_nearest_track().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer number.
+        coord : np.ndarray
+            the coordinates perpendicular to the track direction.
+        half_track : bool
+            if True, allow half integer track numbers.
+        mode : int
+            the "rounding" mode, same as in coord_to_nearest_track().
+        unit_mode : bool
+            True if the given coordinates are in resolution units.
+
+        Returns
+        -------
+        track : np.ndarray
+            the track numbers, as a float array.
+        """
+        coord = self._coord_to_unit_array(coord, unit_mode)
+
+        pitch = self.get_track_pitch(layer_id, unit_mode=True)
+        if half_track:
+            pitch //= 2
+
+        q, r = np.divmod(coord - self._get_track_offset(layer_id), pitch)
+
+        on_track = r == 0
+        if mode == -2:
+            q -= on_track
+        elif mode == 2:
+            q += on_track
+        if mode > 0:
+            q += ~on_track
+        elif mode == 0:
+            q += ~on_track & (r >= pitch / 2)
+
+        return q / 2 if half_track else q.astype(float)
+
     def coord_to_nearest_fill_track(self, layer_id, coord, fill_config, mode=0,
                                     unit_mode=False):
         # type: (int, Union[float, int], Dict[int, Any], int, bool) -> Union[float, int]
@@ -1576,6 +1772,32 @@ class RoutingGrid(object):
 
         return self.coord_to_track(layer_id, fill_q * fill_pitch + fill_pitch2, unit_mode=True)
 
+    def _get_track_transform(self, layer_id, dx, dy, orient, unit_mode):
+        # type: (int, Union[float, int], Union[float, int], str, bool) -> Tuple[int, int]
+        """Returns the scale and shift that transform_track() applies to half-track indices."""
+        if not unit_mode:
+            dx = int(round(dx / self._resolution))
+            dy = int(round(dy / self._resolution))
+
+        is_x = self.get_direction(layer_id) == 'x'
+        if is_x:
+            hidx_shift = int(2 * self.coord_to_track(layer_id, dy, unit_mode=True)) + 1
+        else:
+            hidx_shift = int(2 * self.coord_to_track(layer_id, dx, unit_mode=True)) + 1
+
+        if orient == 'R0':
+            hidx_scale = 1
+        elif orient == 'R180':
+            hidx_scale = -1
+        elif orient == 'MX':
+            hidx_scale = -1 if is_x else 1
+        elif orient == 'MY':
+            hidx_scale = 1 if is_x else -1
+        else:
+            raise ValueError('Unsupported orientation: %s' % orient)
+
+        return hidx_scale, hidx_shift
+
     def transform_track(self,  # type: RoutingGrid
                         layer_id,  # type: int
                         track_idx,  # type: Union[float, int]
@@ -1607,26 +1829,7 @@ class RoutingGrid(object):
         new_track_idx : Union[float, int]
             the transformed track index.
         """
-        if not unit_mode:
-            dx = int(round(dx / self._resolution))
-            dy = int(round(dy / self._resolution))
-
-        is_x = self.get_direction(layer_id) == 'x'
-        if is_x:
-            hidx_shift = int(2 * self.coord_to_track(layer_id, dy, unit_mode=True)) + 1
-        else:
-            hidx_shift = int(2 * self.coord_to_track(layer_id, dx, unit_mode=True)) + 1
-
-        if orient == 'R0':
-            hidx_scale = 1
-        elif orient == 'R180':
-            hidx_scale = -1
-        elif orient == 'MX':
-            hidx_scale = -1 if is_x else 1
-        elif orient == 'MY':
-            hidx_scale = 1 if is_x else -1
-        else:
-            raise ValueError('Unsupported orientation: %s' % orient)
+        hidx_scale, hidx_shift = self._get_track_transform(layer_id, dx, dy, orient, unit_mode)
 
         old_hidx = int(track_idx * 2 + 1)
         new_hidx = old_hidx * hidx_scale + hidx_shift
@@ -1635,6 +1838,42 @@ class RoutingGrid(object):
         else:
             return (new_hidx - 1) / 2
 
+    def transform_track_array(self,  # type: RoutingGrid
+                              layer_id,  # type: int
+                              track_idx,  # type: np.ndarray
+                              dx=0,  # type: Union[float, int]
+                              dy=0,  # type: Union[float, int]
+                              orient='R0',  # type: str
+                              unit_mode=False,  # type: bool
+                              ):
+        # type: (...) -> np.ndarray
+        """Batch version of transform_track().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        track_idx : np.ndarray
+            the track indices.
+        dx : Union[float, int]
+            X shift.
+        dy : Union[float, int]
+            Y shift.
+        orient : str
+            orientation.
+        unit_mode : bool
+            True if dx/dy are given in resolution units.
+
+        Returns
+        -------
+        new_track_idx : np.ndarray
+            the transformed track indices, as a float array.
+        """
+        hidx_scale, hidx_shift = self._get_track_transform(layer_id, dx, dy, orient, unit_mode)
+
+        old_hidx = np.trunc(np.asarray(track_idx) * 2 + 1).astype(np.int64)
+        return (old_hidx * hidx_scale + hidx_shift - 1) / 2
+
     def track_to_coord(self, layer_id, track_idx, unit_mode=False):
         # type: (int, Union[float, int], bool) -> Union[float, int]
         """Convert given track number to coordinate.
@@ -1659,6 +1898,31 @@ class RoutingGrid(object):
             return coord_unit
         return coord_unit * self._resolution
 
+    def track_to_coord_array(self, layer_id, track_idx, unit_mode=False):
+        # type: (int, np.ndarray, bool) -> np.ndarray
+        """Batch version of track_to_coord().
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer number.
+        track_idx : np.ndarray
+            the track numbers.
+        unit_mode : bool
+            True to return coordinates in resolution units.
+
+        Returns
+        -------
+        coord : np.ndarray
+            the coordinates perpendicular to track direction.
+        """
+        pitch = self.get_track_pitch(layer_id, unit_mode=True)
+        coord_unit = np.trunc(pitch * np.asarray(track_idx) +
+                              self._get_track_offset(layer_id)).astype(np.int64)
+        if unit_mode:
+            return coord_unit
+        return coord_unit * self._resolution
+
     def interval_to_track(self,  # type: RoutingGrid
                           layer_id,  # type: int
                           intv,  # type: Tuple[Union[float, int], Union[float, int]]
@@ -1727,6 +1991,7 @@ class RoutingGrid(object):
         attrs['block_pitch'] = self.block_pitch.copy()
         attrs['w_override'] = self.w_override.copy()
         attrs['private_layers'] = list(self.private_layers)
+        attrs['_rule_cache'] = self._rule_cache.copy()
         for lay in self.layers:
             attrs['w_override'][lay] = self.w_override[lay].copy()
 
@@ -1812,6 +2077,7 @@ class RoutingGrid(object):
         self.max_num_tr_tracks[layer_id] = max_num_tr
         if layer_id not in self._flip_parity:
             self._flip_parity[layer_id] = (1, 0)
+        self._rule_cache.clear()
 
     def set_track_offset(self, layer_id, offset, unit_mode=False):
         # type: (int, Union[float, int], bool) -> None
@@ -1859,3 +2125,4 @@ class RoutingGrid(object):
             self.w_override[layer_id] = {width_ntr: tr_width}
         else:
             self.w_override[layer_id][width_ntr] = tr_width
+        self._rule_cache.clear()
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines a grid-based maze router.
+"""
+
+from typing import TYPE_CHECKING, Optional, List, Tuple, Dict, Iterable
+
+import heapq
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from bag.util.interval import IntervalSet
+from .base import TrackID, WireArray
+from .fill import get_blockage_array
+
+if TYPE_CHECKING:
+    from bag.layout.util import BBox
+    from bag.layout.template import TemplateBase
+
+
+class MazeRouter(object):
+    """A point-to-point A* router on the routing grid of a template.
+
+    The router searches a lattice whose nodes are the crossings of every routing track in the
+    routing region with the tracks of the adjacent layers.  Moving between neighboring nodes
+    of a track costs wire length, and moving between the two layers at a crossing costs a via.
+    Wires are only drawn on whole tracks with the default width, in the track direction.
+
+    Used tracks of the template are read once, when the router is created, except on pin
+    tracks, where shapes inside the pins are ignored when routing their net.  Afterwards the
+    router keeps track of the wires it draws itself, so all routing in the region should go
+    through the same router.  Wires are not extended to the minimum length.
+
+    Parameters
+    ----------
+    template : TemplateBase
+        the template to draw wires in.
+    bot_layer : int
+        the bottom routing layer ID.
+    top_layer : int
+        the top routing layer ID.
+    box : Optional[BBox]
+        the routing region.  Defaults to the template bounding box.
+    wire_cost : float
+        cost of one resolution unit of wire.
+    via_cost : Optional[float]
+        cost of one via.  Defaults to the wire cost of two track pitches of the top layer.
+    layer_cost : Optional[Dict[int, float]]
+        dictionary from layer ID to wire cost multiplier.  Defaults to 1.  Use this to
+        prefer some layers over others.
+    """
+
+    def __init__(self,  # type: MazeRouter
+                 template,  # type: TemplateBase
+                 bot_layer,  # type: int
+                 top_layer,  # type: int
+                 box=None,  # type: Optional[BBox]
+                 wire_cost=1.0,  # type: float
+                 via_cost=None,  # type: Optional[float]
+                 layer_cost=None,  # type: Optional[Dict[int, float]]
+                 ):
+        # type: (...) -> None
+        if top_layer <= bot_layer:
+            raise ValueError('top_layer must be greater than bot_layer.')
+        grid = template.grid
+        if box is None:
+            box = template.bound_box
+        if via_cost is None:
+            via_cost = 2 * wire_cost * grid.get_track_pitch(top_layer, unit_mode=True)
+        if layer_cost is None:
+            layer_cost = {}
+
+        self._template = template
+        self._bot_layer = bot_layer
+        self._via_cost = via_cost
+        layer_ids = list(range(bot_layer, top_layer + 1))
+        self._unit_cost = [wire_cost * layer_cost.get(lay_id, 1.0) for lay_id in layer_ids]
+        self._is_horiz = [grid.get_direction(lay_id) == 'x' for lay_id in layer_ids]
+
+        # routing tracks in the region
+        self._tr0 = []  # type: List[int]
+        tr_coords = []  # type: List[np.ndarray]
+        for lay_id, is_horiz in zip(layer_ids, self._is_horiz):
+            lower, upper = (box.bottom_unit, box.top_unit) if is_horiz else \
+                (box.left_unit, box.right_unit)
+            tr0 = int(grid.coord_to_nearest_track(lay_id, lower, mode=1, unit_mode=True))
+            tr1 = int(grid.coord_to_nearest_track(lay_id, upper, mode=-1, unit_mode=True))
+            if tr1 < tr0:
+                raise ValueError('No layer %d tracks in routing region.' % lay_id)
+            self._tr0.append(tr0)
+            tr_coords.append(grid.track_to_coord_array(lay_id, np.arange(tr0, tr1 + 1),
+                                                       unit_mode=True).astype(np.int64))
+
+        # the stops of a track are the coordinates of adjacent layer tracks, and the half
+        # length of a wire around a stop is set by the largest via on that layer.
+        self._tr_coords = [arr.tolist() for arr in tr_coords]
+        self._stops = []  # type: List[List[int]]
+        self._ext = []  # type: List[int]
+        self._sp = []  # type: List[Tuple[int, int, int]]
+        for idx, lay_id in enumerate(layer_ids):
+            stops = np.empty(0, dtype=np.int64)
+            ext = 0
+            if idx > 0:
+                stops = np.union1d(stops, tr_coords[idx - 1])
+                w_bot = grid.get_track_width(lay_id - 1, 1, unit_mode=True)
+                ext = max(ext, w_bot // 2 + grid.get_via_extensions(lay_id - 1, 1, 1,
+                                                                    unit_mode=True)[1])
+            if idx < len(layer_ids) - 1:
+                stops = np.union1d(stops, tr_coords[idx + 1])
+                w_top = grid.get_track_width(lay_id + 1, 1, unit_mode=True)
+                ext = max(ext, w_top // 2 + grid.get_via_extensions(lay_id, 1, 1,
+                                                                    unit_mode=True)[0])
+            self._stops.append(stops.tolist())
+            self._ext.append(int(ext))
+            # wires block tracks closer than width plus spacing, with line-end spacing
+            # along their own track.
+            w = grid.get_track_width(lay_id, 1, unit_mode=True)
+            sp = int(grid.get_space(lay_id, 1, unit_mode=True))
+            sp_le = int(grid.get_line_end_space(lay_id, 1, unit_mode=True))
+            self._sp.append((w + sp, sp, sp_le))
+
+        # nodes are numbered track by track, layer by layer.  The edge from a node to
+        # the next stop on its track has the same number as the node.
+        self._base = []  # type: List[int]
+        num_nodes = 0
+        for coords, stops in zip(self._tr_coords, self._stops):
+            self._base.append(num_nodes)
+            num_nodes += len(coords) * len(stops)
+        self._node_free = bytearray(num_nodes)
+        self._edge_free = bytearray(num_nodes)
+        self._node_used = bytearray(num_nodes)
+        self._edge_used = bytearray(num_nodes)
+
+        # for each layer, map stops to the tracks they cross on the layers above and below,
+        # and map tracks to the stops they are on in the layers above and below.  -1 means
+        # the stop is not on an adjacent layer track.
+        num_lay = len(layer_ids)
+        self._up_track = [[] for _ in range(num_lay)]  # type: List[List[int]]
+        self._up_stop = [[] for _ in range(num_lay)]  # type: List[List[int]]
+        self._dn_track = [[] for _ in range(num_lay)]  # type: List[List[int]]
+        self._dn_stop = [[] for _ in range(num_lay)]  # type: List[List[int]]
+        for idx in range(num_lay):
+            stops = np.array(self._stops[idx], dtype=np.int64)
+            for adj_idx, tr_map, stop_map in ((idx + 1, self._up_track, self._up_stop),
+                                              (idx - 1, self._dn_track, self._dn_stop)):
+                if 0 <= adj_idx < num_lay:
+                    adj_tr = tr_coords[adj_idx]
+                    adj_stops = np.array(self._stops[adj_idx], dtype=np.int64)
+                    tidx = np.minimum(np.searchsorted(adj_tr, stops), adj_tr.size - 1)
+                    tr_map[idx] = np.where(adj_tr[tidx] == stops, tidx, -1).tolist()
+                    stop_map[idx] = np.searchsorted(adj_stops, tr_coords[idx]).tolist()
+
+        self._mark_free()
+
+    def _mark_free(self):
+        # type: () -> None
+        """Marks nodes and edges that do not overlap used tracks of the template as free."""
+        for idx, (coords, stops) in enumerate(zip(self._tr_coords, self._stops)):
+            lay_id = self._bot_layer + idx
+            ext = self._ext[idx]
+            lower, upper = stops[0] - ext, stops[-1] + ext
+            for tidx in range(len(coords)):
+                tid = TrackID(lay_id, self._tr0[idx] + tidx)
+                intv_list = list(self._template.open_interval_iter(tid, lower, upper))
+                self._set_track_free(idx, tidx, intv_list)
+
+    def _set_track_free(self, lay_idx, tidx, intv_list):
+        # type: (int, int, List[Tuple[int, int]]) -> None
+        """Sets the free nodes and edges of a track from its open intervals.
+
+        Nodes and edges marked as used by this router stay used.
+        """
+        stops = self._stops[lay_idx]
+        nstops = len(stops)
+        offset = self._base[lay_idx] + tidx * nstops
+        if not intv_list:
+            self._node_free[offset:offset + nstops] = bytes(nstops)
+            self._edge_free[offset:offset + nstops] = bytes(nstops)
+            return
+
+        ext = self._ext[lay_idx]
+        stop_arr = np.array(stops, dtype=np.int64)
+        starts, ends = np.array(intv_list, dtype=np.int64).T
+        # a node or edge is free if it lies in a single open interval
+        k = np.searchsorted(starts, stop_arr - ext, side='right') - 1
+        node_ok = (k >= 0) & (stop_arr + ext <= ends[np.maximum(k, 0)])
+        k = np.searchsorted(starts, stop_arr[:-1], side='right') - 1
+        edge_ok = np.zeros(nstops, dtype=bool)
+        edge_ok[:-1] = (k >= 0) & (stop_arr[1:] <= ends[np.maximum(k, 0)])
+        node_used = np.frombuffer(self._node_used, dtype=np.uint8, count=nstops, offset=offset)
+        edge_used = np.frombuffer(self._edge_used, dtype=np.uint8, count=nstops, offset=offset)
+        self._node_free[offset:offset + nstops] = (node_ok & (node_used == 0)).tobytes()
+        self._edge_free[offset:offset + nstops] = (edge_ok & (edge_used == 0)).tobytes()
+
+    def _get_pin_open_intervals(self, lay_idx, tidx, box_list):
+        # type: (int, int, List[BBox]) -> List[Tuple[int, int]]
+        """Returns the open intervals of a pin track, ignoring shapes inside the given pins."""
+        template = self._template
+        grid = template.grid
+        lay_id = self._bot_layer + lay_idx
+        stops = self._stops[lay_idx]
+        ext = self._ext[lay_idx]
+        lower, upper = stops[0] - ext, stops[-1] + ext
+        sp = int(grid.get_space(lay_id, 1, unit_mode=True))
+        sp_le = int(grid.get_line_end_space(lay_id, 1, unit_mode=True))
+        test_box = grid.get_bbox(lay_id, self._tr0[lay_idx] + tidx, lower, upper,
+                                 unit_mode=True)
+        if self._is_horiz[lay_idx]:
+            spx, spy, cols = sp_le, sp, [0, 2]
+        else:
+            spx, spy, cols = sp, sp_le, [1, 3]
+
+        rect_arr = template.get_rect_array(lay_id, test_box.expand(dx=spx, dy=spy,
+                                                                   unit_mode=True))
+        keep = np.ones(rect_arr.shape[0], dtype=bool)
+        for box in box_list:
+            xl, yb, xr, yt = box.get_bounds(unit_mode=True)
+            keep &= ~((rect_arr[:, 0] >= xl) & (rect_arr[:, 1] >= yb) &
+                      (rect_arr[:, 2] <= xr) & (rect_arr[:, 3] <= yt))
+        intv_set = IntervalSet()
+        for lo, hi in get_blockage_array(rect_arr[keep], test_box, spx, spy)[:, cols].tolist():
+            lo, hi = max(lo, lower), min(hi, upper)
+            if lo < hi:
+                intv_set.add((lo, hi), merge=True, abut=True)
+        return list(intv_set.complement_iter((lower, upper)))
+
+    def _node_id(self, lay_idx, tidx, sidx):
+        # type: (int, int, int) -> int
+        return self._base[lay_idx] + tidx * len(self._stops[lay_idx]) + sidx
+
+    def _decode(self, node):
+        # type: (int) -> Tuple[int, int, int]
+        """Returns the layer index, track index and stop index of the given node."""
+        lay_idx = bisect_right(self._base, node) - 1
+        tidx, sidx = divmod(node - self._base[lay_idx], len(self._stops[lay_idx]))
+        return lay_idx, tidx, sidx
+
+    def _node_xy(self, node):
+        # type: (int) -> Tuple[int, int]
+        lay_idx, tidx, sidx = self._decode(node)
+        if self._is_horiz[lay_idx]:
+            return self._stops[lay_idx][sidx], self._tr_coords[lay_idx][tidx]
+        return self._tr_coords[lay_idx][tidx], self._stops[lay_idx][sidx]
+
+    def _get_pin_nodes(self, warr, pin_tracks):
+        # type: (WireArray, Dict[Tuple[int, int], List[BBox]]) -> List[int]
+        """Returns the nodes on the given pin wires.
+
+        The tracks of the pin wires are added to pin_tracks, together with the pin boxes.
+        """
+        tid = warr.track_id
+        lay_id = tid.layer_id
+        lay_idx = lay_id - self._bot_layer
+        if lay_idx < 0 or lay_idx >= len(self._stops):
+            raise ValueError('Pin layer %d is not a routing layer.' % lay_id)
+        if tid.width != 1:
+            raise ValueError('Only pins with the default width are supported.')
+        grid = self._template.grid
+        stops = self._stops[lay_idx]
+        ntr = len(self._tr_coords[lay_idx])
+        lower, upper = warr.lower_unit, warr.upper_unit
+        sidx0 = bisect_left(stops, lower)
+        sidx1 = bisect_right(stops, upper)
+        node_list = []
+        for tr_idx in tid:
+            tidx = tr_idx - self._tr0[lay_idx]
+            if tidx != int(tidx):
+                raise ValueError('Pin track %s is not a whole track.' % tr_idx)
+            tidx = int(tidx)
+            if 0 <= tidx < ntr and sidx0 < sidx1:
+                start = self._node_id(lay_idx, tidx, sidx0)
+                node_list.extend(range(start, start + sidx1 - sidx0))
+                box = grid.get_bbox(lay_id, tr_idx, lower, upper, unit_mode=True)
+                key = (lay_idx, tidx)
+                if key in pin_tracks:
+                    pin_tracks[key].append(box)
+                else:
+                    pin_tracks[key] = [box]
+        if not node_list:
+            raise ValueError('Pin %s has no routing nodes.' % warr)
+        return node_list
+
+    def route(self, src, dst):
+        # type: (WireArray, WireArray) -> Optional[List[WireArray]]
+        """Route a wire between the given pins.
+
+        The route may extend the pins along their tracks, or connect to them with vias.
+
+        Parameters
+        ----------
+        src : WireArray
+            the source pin.  Connecting to any wire of the array is allowed.
+        dst : WireArray
+            the destination pin.  Connecting to any wire of the array is allowed.
+
+        Returns
+        -------
+        warr_list : Optional[List[WireArray]]
+            the wires drawn, with vias between them.  None if no route is found.
+        """
+        pin_tracks = {}  # type: Dict[Tuple[int, int], List[BBox]]
+        src_nodes = self._get_pin_nodes(src, pin_tracks)
+        dst_nodes = self._get_pin_nodes(dst, pin_tracks)
+
+        # pins are used tracks, but are free for this net.
+        save_list = []
+        for (lay_idx, tidx), box_list in pin_tracks.items():
+            nstops = len(self._stops[lay_idx])
+            offset = self._base[lay_idx] + tidx * nstops
+            save_list.append((offset, nstops, self._node_free[offset:offset + nstops],
+                              self._edge_free[offset:offset + nstops]))
+            self._set_track_free(lay_idx, tidx,
+                                 self._get_pin_open_intervals(lay_idx, tidx, box_list))
+        path = self._search(src_nodes, dst_nodes)
+        for offset, nstops, node_val, edge_val in save_list:
+            self._node_free[offset:offset + nstops] = node_val
+            self._edge_free[offset:offset + nstops] = edge_val
+
+        if path is None:
+            return None
+        return self._draw_path(path)
+
+    def route_nets(self, pin_list):
+        # type: (Iterable[Tuple[WireArray, WireArray]]) -> List[Optional[List[WireArray]]]
+        """Route the given nets in order.
+
+        Parameters
+        ----------
+        pin_list : Iterable[Tuple[WireArray, WireArray]]
+            list of source and destination pins of each net.
+
+        Returns
+        -------
+        route_list : List[Optional[List[WireArray]]]
+            the wires drawn for each net.  None for nets that cannot be routed.
+        """
+        return [self.route(src, dst) for src, dst in pin_list]
+
+    def _search(self, src_nodes, dst_nodes):
+        # type: (List[int], List[int]) -> Optional[List[int]]
+        """A* search from the source nodes to the nearest destination node."""
+        node_free = self._node_free
+        edge_free = self._edge_free
+        base = self._base
+        stops_list = self._stops
+        tr_list = self._tr_coords
+        is_horiz = self._is_horiz
+        unit_cost = self._unit_cost
+        via_cost = self._via_cost
+        up_track = self._up_track
+        up_stop = self._up_stop
+        dn_track = self._dn_track
+        dn_stop = self._dn_stop
+        num_lay = len(base)
+
+        # the heuristic is the distance to the destination bounding box on the cheapest
+        # layer, plus one via per layer to the nearest destination layer.
+        dst_set = set(dst_nodes)
+        dst_xy = [self._node_xy(node) for node in dst_nodes]
+        dxl = min(x for x, _ in dst_xy)
+        dxh = max(x for x, _ in dst_xy)
+        dyl = min(y for _, y in dst_xy)
+        dyh = max(y for _, y in dst_xy)
+        dst_lay = sorted(set(self._decode(node)[0] for node in dst_nodes))
+        min_cost = min(unit_cost)
+        lay_h = [via_cost * min(abs(lay_idx - dl) for dl in dst_lay) for lay_idx in range(num_lay)]
+
+        def heuristic(lay_idx, x, y):
+            dx = dxl - x if x < dxl else (x - dxh if x > dxh else 0)
+            dy = dyl - y if y < dyl else (y - dyh if y > dyh else 0)
+            return min_cost * (dx + dy) + lay_h[lay_idx]
+
+        g_score = {}  # type: Dict[int, float]
+        parent = {}  # type: Dict[int, int]
+        heap = []  # type: List[Tuple[float, float, int]]
+        for node in src_nodes:
+            if node not in g_score:
+                g_score[node] = 0
+                parent[node] = -1
+                x, y = self._node_xy(node)
+                heap.append((heuristic(self._decode(node)[0], x, y), 0, node))
+        heapq.heapify(heap)
+
+        closed = set()
+        while heap:
+            _, g, node = heapq.heappop(heap)
+            if node in closed:
+                continue
+            if node in dst_set:
+                path = [node]
+                while parent[node] >= 0:
+                    node = parent[node]
+                    path.append(node)
+                path.reverse()
+                return path
+            closed.add(node)
+
+            lay_idx = bisect_right(base, node) - 1
+            stops = stops_list[lay_idx]
+            nstops = len(stops)
+            tidx, sidx = divmod(node - base[lay_idx], nstops)
+            tcoord = tr_list[lay_idx][tidx]
+            cost = unit_cost[lay_idx]
+            nbr_list = []
+            if sidx > 0 and edge_free[node - 1] and node_free[node - 1]:
+                nbr_list.append((node - 1, g + cost * (stops[sidx] - stops[sidx - 1]),
+                                 lay_idx, stops[sidx - 1], tcoord))
+            if sidx < nstops - 1 and edge_free[node] and node_free[node + 1]:
+                nbr_list.append((node + 1, g + cost * (stops[sidx + 1] - stops[sidx]),
+                                 lay_idx, stops[sidx + 1], tcoord))
+            # the neighbor across a via has this track coordinate as its stop coordinate,
+            # and this stop coordinate as its track coordinate.
+            if lay_idx < num_lay - 1:
+                adj_tidx = up_track[lay_idx][sidx]
+                if adj_tidx >= 0:
+                    nbr = (base[lay_idx + 1] + adj_tidx * len(stops_list[lay_idx + 1]) +
+                           up_stop[lay_idx][tidx])
+                    if node_free[nbr]:
+                        nbr_list.append((nbr, g + via_cost, lay_idx + 1, tcoord, stops[sidx]))
+            if lay_idx > 0:
+                adj_tidx = dn_track[lay_idx][sidx]
+                if adj_tidx >= 0:
+                    nbr = (base[lay_idx - 1] + adj_tidx * len(stops_list[lay_idx - 1]) +
+                           dn_stop[lay_idx][tidx])
+                    if node_free[nbr]:
+                        nbr_list.append((nbr, g + via_cost, lay_idx - 1, tcoord, stops[sidx]))
+
+            for nbr, g_nbr, nbr_lay, u, v in nbr_list:
+                if nbr in closed or g_nbr >= g_score.get(nbr, float('inf')):
+                    continue
+                g_score[nbr] = g_nbr
+                parent[nbr] = node
+                # u is the stop coordinate of the neighbor, v its track coordinate
+                if is_horiz[nbr_lay]:
+                    f = g_nbr + heuristic(nbr_lay, u, v)
+                else:
+                    f = g_nbr + heuristic(nbr_lay, v, u)
+                heapq.heappush(heap, (f, g_nbr, nbr))
+
+        return None
+
+    def _draw_path(self, path):
+        # type: (List[int]) -> List[WireArray]
+        """Draws wires and vias along the given path, and marks them as used."""
+        template = self._template
+        bot_layer = self._bot_layer
+        warr_list = []
+        prev = None  # type: Optional[Tuple[int, int]]
+        start = 0
+        node_info = [self._decode(node) for node in path]
+        for idx in range(1, len(path) + 1):
+            if idx == len(path) or node_info[idx][0] != node_info[start][0]:
+                # draw the wire on this layer
+                lay_idx, tidx = node_info[start][:2]
+                sidx_list = [info[2] for info in node_info[start:idx]]
+                stops = self._stops[lay_idx]
+                ext = self._ext[lay_idx]
+                lower = stops[min(sidx_list)] - ext
+                upper = stops[max(sidx_list)] + ext
+                tr_idx = self._tr0[lay_idx] + tidx
+                warr_list.append(template.add_wires(bot_layer + lay_idx, tr_idx, lower, upper,
+                                                    unit_mode=True))
+                self._mark_used(lay_idx, tidx, lower, upper)
+                if prev is not None:
+                    # draw the via to the previous wire
+                    prev_lay, prev_tr = prev
+                    if prev_lay < lay_idx:
+                        template.add_via_on_grid(bot_layer + prev_lay, prev_tr, tr_idx)
+                    else:
+                        template.add_via_on_grid(bot_layer + lay_idx, tr_idx, prev_tr)
+                prev = lay_idx, tr_idx
+                start = idx
+
+        return warr_list
+
+    def _mark_used(self, lay_idx, tidx, lower, upper):
+        # type: (int, int, int, int) -> None
+        """Marks nodes and edges too close to the given wire as used."""
+        node_free = self._node_free
+        edge_free = self._edge_free
+        node_used = self._node_used
+        edge_used = self._edge_used
+        coords = self._tr_coords[lay_idx]
+        stops = self._stops[lay_idx]
+        nstops = len(stops)
+        ext = self._ext[lay_idx]
+        pitch_sp, sp, sp_le = self._sp[lay_idx]
+        tcoord = coords[tidx]
+        for cur_tidx in range(bisect_right(coords, tcoord - pitch_sp),
+                              bisect_left(coords, tcoord + pitch_sp)):
+            sp_cur = sp_le if cur_tidx == tidx else sp
+            lo, hi = lower - sp_cur, upper + sp_cur
+            offset = self._base[lay_idx] + cur_tidx * nstops
+            start = bisect_right(stops, lo - ext)
+            stop = bisect_left(stops, hi + ext)
+            if start < stop:
+                node_free[offset + start:offset + stop] = bytes(stop - start)
+                node_used[offset + start:offset + stop] = b'\x01' * (stop - start)
+            start = max(bisect_right(stops, lo) - 1, 0)
+            stop = min(bisect_left(stops, hi), nstops - 1)
+            if start < stop:
+                edge_free[offset + start:offset + stop] = bytes(stop - start)
+                edge_used[offset + start:offset + stop] = b'\x01' * (stop - start)
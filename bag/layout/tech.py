@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
-from typing import List, Tuple, Union, Optional, Callable, TYPE_CHECKING
+from typing import List, Tuple, Union, Optional, Callable, Dict, TYPE_CHECKING
 
 import abc
+import bisect
+
+import numpy as np
 
 from .core import TechInfo
 
@@ -21,6 +24,9 @@ class TechInfoConfig(TechInfo, metaclass=abc.ABCMeta):
         self._mos_entry_name = mos_entry_name
         self.idc_temp = tech_params['layout']['em']['dc_temp']
         self.irms_dt = tech_params['layout']['em']['rms_dt']
+        # compiled width rule tables and minimum length lookups.
+        self._rule_tables = {}  # type: Dict[Tuple[str, str], Tuple[List[int], List[int]]]
+        self._min_len_cache = {}  # type: Dict[Tuple[str, int], int]
 
     @abc.abstractmethod
     def get_metal_em_specs(self, layer_name, w, l=-1, vertical=False, **kwargs):
@@ -204,19 +210,43 @@ class TechInfoConfig(TechInfo, metaclass=abc.ABCMeta):
 
         return sp, sp2_list, sp3_list, dim, enc_cur, arr_enc, arr_test
 
-    def _space_helper(self, config_name, layer_type, width):
-        sp_min_config = self.config[config_name]
-        if layer_type not in sp_min_config:
-            raise ValueError('Unsupported layer type: %s' % layer_type)
-
-        sp_min_config = sp_min_config[layer_type]
-        w_list = sp_min_config['w_list']
-        sp_list = sp_min_config['sp_list']
+    def _get_rule_table(self, config_name, layer_type):
+        # type: (str, str) -> Tuple[List[int], List[int]]
+        """Returns the width rule table of the given layer type.
+
+        Each rule applies to widths less than or equal to its width.  Rules shadowed by an
+        earlier rule with a larger width are removed, so the returned width list is strictly
+        increasing and can be binary searched.
+        """
+        key = (config_name, layer_type)
+        table = self._rule_tables.get(key, None)
+        if table is None:
+            sp_min_config = self.config[config_name]
+            if layer_type not in sp_min_config:
+                raise ValueError('Unsupported layer type: %s' % layer_type)
+
+            sp_min_config = sp_min_config[layer_type]
+            w_list, sp_list = [], []
+            for w, sp in zip(sp_min_config['w_list'], sp_min_config['sp_list']):
+                if not w_list or w > w_list[-1]:
+                    w_list.append(w)
+                    sp_list.append(sp)
+            table = self._rule_tables[key] = (w_list, sp_list)
+        return table
 
-        for w, sp in zip(w_list, sp_list):
-            if width <= w:
-                return sp
-        return None
+    def _space_helper(self, config_name, layer_type, width):
+        w_list, sp_list = self._get_rule_table(config_name, layer_type)
+        idx = bisect.bisect_left(w_list, width)
+        return sp_list[idx] if idx < len(sp_list) else None
+
+    def _space_helper_array(self, config_name, layer_type, widths):
+        # type: (str, str, np.ndarray) -> np.ndarray
+        w_list, sp_list = self._get_rule_table(config_name, layer_type)
+        idx = np.searchsorted(w_list, widths, side='left')
+        if np.any(idx >= len(sp_list)):
+            raise ValueError('Width larger than %s rules of layer type %s' %
+                             (config_name, layer_type))
+        return np.array(sp_list, dtype=np.int64)[idx]
 
     def get_min_space_unit(self, layer_type, w_unit, same_color=False):
         # type: (str, int, bool) -> int
@@ -230,6 +260,19 @@ class TechInfoConfig(TechInfo, metaclass=abc.ABCMeta):
     def get_min_line_end_space_unit(self, layer_type, w_unit):
         return self._space_helper('sp_le_min', layer_type, w_unit)
 
+    def get_min_space_array(self, layer_type, widths, same_color=False):
+        # type: (str, np.ndarray, bool) -> np.ndarray
+        if not same_color or 'sp_sc_min' not in self.config:
+            config_name = 'sp_min'
+        else:
+            config_name = 'sp_sc_min'
+
+        return self._space_helper_array(config_name, layer_type, widths)
+
+    def get_min_line_end_space_array(self, layer_type, widths):
+        # type: (str, np.ndarray) -> np.ndarray
+        return self._space_helper_array('sp_le_min', layer_type, widths)
+
     def get_min_space(self, layer_type, width, unit_mode=False, same_color=False):
         # type: (str, float, bool, bool) -> Union[float, int]
         res = self.config['resolution']
@@ -260,6 +303,13 @@ class TechInfoConfig(TechInfo, metaclass=abc.ABCMeta):
         return type_dict[name_dict[layer_id]]
 
     def get_min_length_unit(self, layer_type, w_unit):
+        key = (layer_type, w_unit)
+        ans = self._min_len_cache.get(key, None)
+        if ans is None:
+            ans = self._min_len_cache[key] = self._get_min_length_unit(layer_type, w_unit)
+        return ans
+
+    def _get_min_length_unit(self, layer_type, w_unit):
         len_min_config = self.config['len_min']
         if layer_type not in len_min_config:
             raise ValueError('Unsupported layer type: %s' % layer_type)
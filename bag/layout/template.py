@@ -12,20 +12,26 @@ import copy
 import time
 import bisect
 import pickle
+import hashlib
+import multiprocessing
+from collections import deque, OrderedDict
 from itertools import islice, product, chain
 
 import yaml
+import numpy as np
 import shapely.ops as shops
 import shapely.geometry as shgeo
 
 from bag.util.cache import DesignMaster, MasterDB
 from bag.util.interval import IntervalSet
-from .core import BagLayout
-from .util import BBox, BBoxArray, tuple2_to_int, tuple2_to_float_int
+from .core import BagLayout, RectStore
+from .util import BBox, BBoxArray, tuple2_to_int, tuple2_to_float_int, transform_box_array
 from ..io import get_encoding, open_file
+from ..io.gds import GDSWriter, GDSReader
+from ..io.oasis import OASISWriter
 from .routing import Port, TrackID, WireArray
 from .routing.fill import UsedTracks, fill_symmetric_max_num_info, fill_symmetric_interval, \
-    NoFillChoiceError
+    NoFillChoiceError, get_blockage_array
 from .objects import Instance, Rect, Via, Path
 
 if TYPE_CHECKING:
@@ -39,14 +45,60 @@ try:
     import cybagoa
 except ImportError:
     cybagoa = None
-try:
-    # noinspection PyPackageRequirements
-    import gdspy
-except ImportError:
-    gdspy = None
 
 TemplateType = TypeVar('TemplateType', bound='TemplateBase')
 
+# number of cells to create in OpenAccess between write lock releases.
+_OA_BATCH_SIZE = 100
+# number of cells sent to a GDS worker process at once.
+_GDS_BATCH_SIZE = 32
+# maximum number of GDS batches in flight per worker process.
+_GDS_MAX_PENDING = 4
+# minimum margin around a query when computing track occupancy, in resolution units.
+_TRACK_OCC_MARGIN = 10000
+# maximum number of rectangle query results cached by each finalized template.
+_RECT_QUERY_CACHE_SIZE = 1024
+# minimum number of rectangles drawn together with one add_boxes() call.
+_BOX_BATCH_MIN = 16
+
+# the template database, layer map, via information, resolution, cell constructor, via cell
+# cache, and names of shared cells already returned, in GDS worker processes.
+_gds_fork_state = None  # type: Optional[Tuple[Any, ...]]
+
+
+def _create_gds_cells_in_worker(content_list):
+    # type: (List[Any]) -> List[Any]
+    """Encode the given master contents as GDS or OASIS cells in a forked worker process.
+
+    Shared cells already returned by this process are removed, since they are written to
+    the library before the results of any later batch.
+    """
+    tdb, lay_map, via_info, res, new_cell, via_cells, sent_names = _gds_fork_state
+    ans = []
+    for content in content_list:
+        gds_cell = new_cell(content[0])
+        tdb._create_gds_cell(content, gds_cell, lay_map, via_info, res, via_cells)
+        shared_cells = gds_cell.shared_cells
+        for name in list(shared_cells.keys()):
+            if name in sent_names:
+                del shared_cells[name]
+            else:
+                sent_names.add(name)
+        ans.append(gds_cell)
+    return ans
+
+
+def _get_index_runs(mask):
+    # type: (np.ndarray) -> List[Tuple[int, int]]
+    """Returns the (start, length) runs of consecutive True values in the given 1D mask."""
+    idx = np.flatnonzero(mask)
+    if idx.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) != 1) + 1
+    starts = idx[np.concatenate(([0], breaks))]
+    stops = idx[np.concatenate((breaks - 1, [idx.size - 1]))] + 1
+    return list(zip(starts.tolist(), (stops - starts).tolist()))
+
 
 class TemplateDB(MasterDB):
     """A database of all templates.
@@ -73,9 +125,28 @@ class TemplateDB(MasterDB):
     gds_lay_file : str
         The GDS layer/purpose mapping file.
     flatten : bool
-        True to compute flattened layout.
+        True to compute the flattened geometries of every template when it is finalized.
+        See TemplateBase.get_flat_boxes().
     **kwargs :
-        additional arguments.
+        additional arguments.  Supports the following:
+
+        store_dir : str
+            if not empty, the persistent master store directory.  Unchanged masters
+            are loaded from this directory instead of being drawn again, and only
+            changed cells are created in the layout library.
+        max_masters : int
+            maximum number of finalized templates kept in memory.  0 for no limit.
+            Least recently used templates are evicted to disk, and are reloaded when
+            they are used again.
+        spill_dir : str
+            directory to write evicted templates in.  Defaults to the system temporary
+            directory.
+        gds_num_workers : int
+            number of worker processes used to encode GDS cells.  Cells are encoded
+            serially if less than 2.
+        stream_fmt : str
+            the stream format written when gds_lay_file is given.  Either 'gds' or
+            'oasis'.  Defaults to 'gds'.
     """
 
     def __init__(self,  # type: TemplateDB
@@ -91,14 +162,15 @@ class TemplateDB(MasterDB):
                  **kwargs):
         # type: (...) -> None
         MasterDB.__init__(self, lib_name, lib_defs=lib_defs,
-                          name_prefix=name_prefix, name_suffix=name_suffix)
+                          name_prefix=name_prefix, name_suffix=name_suffix,
+                          store_dir=kwargs.get('store_dir', ''),
+                          max_masters=kwargs.get('max_masters', 0),
+                          spill_dir=kwargs.get('spill_dir', ''))
 
         pure_oa = kwargs.get('pure_oa', False)
         cache_dir = kwargs.get('cache_dir', '')
 
         if gds_lay_file:
-            if gdspy is None:
-                raise ValueError('gdspy module not found; cannot export GDS.')
             # GDS export takes precedence over other options
             use_cybagoa = pure_oa = False
         if pure_oa:
@@ -110,8 +182,13 @@ class TemplateDB(MasterDB):
         self._grid = routing_grid
         self._use_cybagoa = use_cybagoa and cybagoa is not None
         self._gds_lay_file = gds_lay_file
+        self._gds_num_workers = kwargs.get('gds_num_workers', 0)
+        self._stream_fmt = kwargs.get('stream_fmt', 'gds')
+        if self._stream_fmt not in ('gds', 'oasis'):
+            raise ValueError('Unsupported stream format: %s' % self._stream_fmt)
         self._flatten = flatten
         self._pure_oa = pure_oa
+        self._store_fingerprint = None  # type: Optional[str]
 
         if cache_dir and os.path.isdir(cache_dir):
             print('loading template cache...')
@@ -157,32 +234,28 @@ class TemplateDB(MasterDB):
         return gen_cls(self, lib_name, params, used_cell_names, **kwargs)
 
     def create_masters_in_db(self, lib_name, content_list, debug=False):
-        # type: (str, Sequence[Any], bool) -> None
+        # type: (str, Iterable[Any], bool) -> None
         """Create the masters in the design database.
 
         Parameters
         ----------
         lib_name : str
             library to create the designs in.
-        content_list : Sequence[Any]
-            a list of the master contents.  Must be created in this order.
+        content_list : Iterable[Any]
+            an iterable of the master contents.  Must be created in this order.
         debug : bool
             True to print debug messages
         """
+        if self._gds_lay_file:
+            self._create_gds(lib_name, content_list, debug=debug)
+            return
         if self._prj is None:
             raise ValueError('BagProject is not defined.')
 
-        if self._gds_lay_file:
-            self._create_gds(lib_name, content_list, debug=debug)
-        elif self._use_cybagoa:
-            # remove write locks from old layouts
-            cell_view_list = [(item[0], 'layout') for item in content_list]
-            if self._pure_oa:
-                pass
-            else:
+        if self._use_cybagoa:
+            if not self._pure_oa:
                 # create library if it does not exist
                 self._prj.create_library(self._lib_name)
-                self._prj.release_write_locks(self._lib_name, cell_view_list)
 
             if debug:
                 print('Instantiating layout')
@@ -209,8 +282,17 @@ class TemplateDB(MasterDB):
                 lib.add_purpose('boundary', 250)
                 lib.add_purpose('pin', 251)
 
-                for cell_name, oa_layout in content_list:
-                    lib.create_layout(cell_name, 'layout', oa_layout)
+                # create layouts in batches, so only a batch of OALayouts is kept in memory.
+                content_iter = iter(content_list)
+                batch = list(islice(content_iter, _OA_BATCH_SIZE))
+                while batch:
+                    if not self._pure_oa:
+                        # remove write locks from old layouts
+                        cell_view_list = [(item[0], 'layout') for item in batch]
+                        self._prj.release_write_locks(self._lib_name, cell_view_list)
+                    for cell_name, oa_layout in batch:
+                        lib.create_layout(cell_name, 'layout', oa_layout)
+                    batch = list(islice(content_iter, _OA_BATCH_SIZE))
             end = time.time()
             if debug:
                 print('layout instantiation took %.4g seconds' % (end - start))
@@ -233,6 +315,77 @@ class TemplateDB(MasterDB):
         """Returns the default routing grid instance."""
         return self._grid
 
+    @property
+    def flatten(self):
+        # type: () -> bool
+        """Returns True if templates compute their flattened geometries when finalized."""
+        return self._flatten
+
+    @property
+    def gds_lay_file(self):
+        # type: () -> str
+        """Returns the GDS layer/purpose mapping file."""
+        return self._gds_lay_file
+
+    def read_gds_lay_file(self, fname=''):
+        # type: (str) -> Tuple[Dict[Any, Any], Dict[str, Any]]
+        """Read the given GDS layer/purpose mapping file.
+
+        Parameters
+        ----------
+        fname : str
+            the GDS layer/purpose mapping file.  Defaults to the file of this database.
+
+        Returns
+        -------
+        lay_map : Dict[Any, Any]
+            the GDS layer map.
+        via_info : Dict[str, Any]
+            the GDS via information dictionary.
+        """
+        with open(fname or self._gds_lay_file, 'r') as f:
+            lay_info = yaml.load(f, Loader=yaml.Loader)
+        return lay_info['layer_map'], lay_info.get('via_info', {})
+
+    def supports_incremental_output(self):
+        # type: () -> bool
+        """Returns True if create_masters_in_db() can create a subset of all cells.
+
+        GDS export writes the whole library to a single file, so all cells are needed.
+        """
+        return not self._gds_lay_file
+
+    def get_store_fingerprint(self):
+        # type: () -> str
+        """Returns a string describing the technology used by this database."""
+        if self._store_fingerprint is None:
+            tech_info = self._grid.tech_info
+            tech_fp = self.master_store.get_class_fingerprint(tech_info.__class__)
+            self._store_fingerprint = repr((tech_fp, tech_info.resolution, tech_info.layout_unit,
+                                            tech_info.via_tech_name, tech_info.tech_params,
+                                            self._use_cybagoa))
+        return self._store_fingerprint
+
+    def get_store_persistent_id(self, obj):
+        # type: (Any) -> Any
+        if obj is self._grid:
+            return 'grid',
+        if obj is self._grid.tech_info:
+            return 'tech',
+        return MasterDB.get_store_persistent_id(self, obj)
+
+    def resolve_store_persistent_id(self, pid):
+        # type: (Any) -> Any
+        if pid[0] == 'grid':
+            return self._grid
+        if pid[0] == 'tech':
+            return self._grid.tech_info
+        return MasterDB.resolve_store_persistent_id(self, pid)
+
+    def new_stored_master(self, gen_cls, params):
+        # type: (Type[TemplateType], Dict[str, Any]) -> TemplateType
+        return self.new_template(params=params, temp_cls=gen_cls)
+
     def new_template(self, lib_name='', temp_name='', params=None, temp_cls=None, debug=False,
                      **kwargs):
         # type: (str, str, Dict[str, Any], Type[TemplateType], bool, **Any) -> TemplateType
@@ -264,6 +417,33 @@ class TemplateDB(MasterDB):
 
         return master
 
+    def new_template_list(self,  # type: TemplateDB
+                          spec_list,  # type: Sequence[Tuple[Type[TemplateType], Dict[str, Any]]]
+                          num_workers=0,  # type: int
+                          debug=False,  # type: bool
+                          **kwargs):
+        # type: (...) -> List[TemplateType]
+        """Create a list of templates, finalizing independent templates in parallel.
+
+        Parameters
+        ----------
+        spec_list : Sequence[Tuple[Type[TemplateType], Dict[str, Any]]]
+            list of (template class, parameters) tuples.
+        num_workers : int
+            number of worker processes.  If less than 2, templates are created serially.
+        debug : bool
+            True to print debug messages.
+        **kwargs : Any
+            optional template parameters.
+
+        Returns
+        -------
+        temp_list : List[TemplateType]
+            list of new template instances.
+        """
+        kwargs['use_cybagoa'] = self._use_cybagoa
+        return self.new_master_list(spec_list, num_workers=num_workers, debug=debug, **kwargs)
+
     def instantiate_layout(self, prj, template, top_cell_name=None, debug=False, rename_dict=None):
         # type: (BagProject, TemplateBase, Optional[str], bool, Optional[Dict[str, str]]) -> None
         """Instantiate the layout of the given :class:`~bag.layout.template.TemplateBase`.
@@ -290,6 +470,7 @@ class TemplateDB(MasterDB):
                      lib_name='',  # type: str
                      debug=False,  # type: bool
                      rename_dict=None,  # type: Optional[Dict[str, str]]
+                     num_workers=0,  # type: int
                      ):
         # type: (...) -> None
         """Instantiate all given templates.
@@ -298,8 +479,9 @@ class TemplateDB(MasterDB):
         ----------
         prj : BagProject
             the :class:`~bag.BagProject` instance used to create layout.
-        template_list : Sequence[TemplateBase]
-            list of templates to instantiate.
+        template_list : Sequence[Union[TemplateBase, Tuple[Type[TemplateBase], Dict[str, Any]]]]
+            list of templates to instantiate.  Entries can also be (template class, parameters)
+            tuples, in which case the templates are created with new_template_list().
         name_list : Optional[Sequence[Optional[str]]]
             list of template layout names.  If not given, default names will be used.
         lib_name : str
@@ -308,8 +490,18 @@ class TemplateDB(MasterDB):
             True to print debugging messages
         rename_dict : Optional[Dict[str, str]]
             optional master cell renaming dictionary.
+        num_workers : int
+            number of worker processes used to create templates given as tuples.
         """
         self._prj = prj
+        spec_idx_list = [idx for idx, temp in enumerate(template_list) if isinstance(temp, tuple)]
+        if spec_idx_list:
+            template_list = list(template_list)
+            new_temp_list = self.new_template_list([template_list[idx] for idx in spec_idx_list],
+                                                   num_workers=num_workers, debug=debug)
+            for idx, temp in zip(spec_idx_list, new_temp_list):
+                template_list[idx] = temp
+
         self.instantiate_masters(template_list, name_list=name_list, lib_name=lib_name,
                                  debug=debug, rename_dict=rename_dict)
 
@@ -330,15 +522,23 @@ class TemplateDB(MasterDB):
             pickle.dump(info, f, protocol=-1)
 
     def _create_gds(self, lib_name, content_list, debug=False):
-        # type: (str, Sequence[Any], bool) -> None
-        """Create a GDS file containing the given layouts
+        # type: (str, Iterable[Any], bool) -> None
+        """Create a GDS or OASIS file containing the given layouts
+
+        Each cell is written to the file as soon as it is created, and instances reference
+        their masters by name.  Each unique via definition is written once as a shared cell,
+        and arrayed rectangles, via cuts, and via arrays are written as array references in
+        GDS, or as repetitions in OASIS.  OASIS cells are compressed in CBLOCKs.
+
+        If gds_num_workers is at least 2, cells are encoded in batches by forked worker
+        processes, and written in the given order.
 
         Parameters
         ----------
         lib_name : str
             library to create the designs in.
-        content_list : Sequence[Any]
-            a list of the master contents.  Must be created in this order.
+        content_list : Iterable[Any]
+            an iterable of the master contents.  Must be created in this order.
         debug : bool
             True to print debug messages
         """
@@ -346,114 +546,178 @@ class TemplateDB(MasterDB):
         lay_unit = tech_info.layout_unit
         res = tech_info.resolution
 
-        with open(self._gds_lay_file, 'r') as f:
-            lay_info = yaml.load(f)
-            lay_map = lay_info['layer_map']
-            via_info = lay_info['via_info']
+        lay_map, via_info = self.read_gds_lay_file()
 
-        out_fname = '%s.gds' % lib_name
-        gds_lib = gdspy.GdsLibrary(name=lib_name)
-        cell_dict = gds_lib.cell_dict
+        if self._stream_fmt == 'oasis':
+            gds_writer = OASISWriter('%s.oas' % lib_name, lay_unit, res * lay_unit)
+        else:
+            gds_writer = GDSWriter('%s.gds' % lib_name, lib_name, lay_unit, res * lay_unit)
         if debug:
             print('Instantiating layout')
 
+        global _gds_fork_state
+
         start = time.time()
-        for content in content_list:
-            (cell_name, inst_tot_list, rect_list, via_list, pin_list,
-             path_list, blockage_list, boundary_list, polygon_list) = content
-            gds_cell = gdspy.Cell(cell_name, exclude_from_current=True)
-            gds_lib.add(gds_cell)
-
-            # add instances
-            for inst_info in inst_tot_list:  # type: InstanceInfo
-                if inst_info.params is not None:
-                    raise ValueError('Cannot instantiate PCells in GDS.')
-                num_rows = inst_info.num_rows
-                num_cols = inst_info.num_cols
-                angle, reflect = inst_info.angle_reflect
-                if num_rows > 1 or num_cols > 1:
-                    cur_inst = gdspy.CellArray(cell_dict[inst_info.cell], num_cols, num_rows,
-                                               (inst_info.sp_cols, inst_info.sp_rows),
-                                               origin=inst_info.loc, rotation=angle,
-                                               x_reflection=reflect)
-                else:
-                    cur_inst = gdspy.CellReference(cell_dict[inst_info.cell], origin=inst_info.loc,
-                                                   rotation=angle, x_reflection=reflect)
-                gds_cell.add(cur_inst)
+        num_workers = self._gds_num_workers
+        with gds_writer:
+            if num_workers >= 2 and 'fork' in multiprocessing.get_all_start_methods():
+                _gds_fork_state = (self, lay_map, via_info, res, gds_writer.new_cell, {}, set())
+                try:
+                    with multiprocessing.get_context('fork').Pool(processes=num_workers) as pool:
+                        # submit batches from this process, so the content iterator is
+                        # consumed only as fast as cells are written.
+                        pending = deque()
+                        content_iter = iter(content_list)
+                        batch = list(islice(content_iter, _GDS_BATCH_SIZE))
+                        while batch or pending:
+                            if batch:
+                                pending.append(pool.apply_async(_create_gds_cells_in_worker,
+                                                                (batch,)))
+                                batch = list(islice(content_iter, _GDS_BATCH_SIZE))
+                            if not batch or len(pending) >= num_workers * _GDS_MAX_PENDING:
+                                for gds_cell in pending.popleft().get():
+                                    gds_writer.write_cell(gds_cell)
+                finally:
+                    _gds_fork_state = None
+            else:
+                via_cells = {}  # type: Dict[Any, Any]
+                for content in content_list:
+                    gds_cell = gds_writer.new_cell(content[0])
+                    self._create_gds_cell(content, gds_cell, lay_map, via_info, res, via_cells)
+                    gds_writer.write_cell(gds_cell)
+        end = time.time()
+        if debug:
+            print('layout instantiation took %.4g seconds' % (end - start))
+
+    def _create_gds_cell(self, content, gds_cell, lay_map, via_info, res, via_cells):
+        # type: (Any, Any, Dict[Any, Any], Dict[str, Any], float, Dict[Any, Any]) -> None
+        """Add the given master content to a GDS or OASIS cell.
 
-            # add rectangles
+        Parameters
+        ----------
+        content : Any
+            the master content.
+        gds_cell : Any
+            the GDSCell or OASISCell.
+        lay_map : Dict[Any, Any]
+            the GDS layer map.
+        via_info : Dict[str, Any]
+            the GDS via information dictionary.
+        res : float
+            the layout resolution.
+        via_cells : Dict[Any, Any]
+            the via cell cache.
+        """
+        (cell_name, inst_tot_list, rect_list, via_list, pin_list,
+         path_list, blockage_list, boundary_list, polygon_list) = content
+
+        # add instances
+        for inst_info in inst_tot_list:  # type: InstanceInfo
+            if inst_info.params is not None:
+                raise ValueError('Cannot instantiate PCells in GDS.')
+            angle, reflect = inst_info.angle_reflect
+            x0, y0 = inst_info.loc
+            gds_cell.add_ref(inst_info.cell, round(x0 / res), round(y0 / res),
+                             angle=angle, reflect=reflect,
+                             nx=inst_info.num_cols, ny=inst_info.num_rows,
+                             spx=round(inst_info.sp_cols / res),
+                             spy=round(inst_info.sp_rows / res))
+
+        # add rectangles
+        if isinstance(rect_list, RectStore):
+            self._add_gds_rect_store(rect_list, gds_cell, lay_map)
+        else:
             for rect in rect_list:
-                nx, ny = rect.get('arr_nx', 1), rect.get('arr_ny', 1)
                 (x0, y0), (x1, y1) = rect['bbox']
                 lay_id, purp_id = lay_map[tuple(rect['layer'])]
+                gds_cell.add_box_array(lay_id, purp_id, round(x0 / res), round(y0 / res),
+                                       round(x1 / res), round(y1 / res),
+                                       nx=rect.get('arr_nx', 1), ny=rect.get('arr_ny', 1),
+                                       spx=round(rect.get('arr_spx', 0) / res),
+                                       spy=round(rect.get('arr_spy', 0) / res))
+
+        # add vias
+        for via in via_list:  # type: ViaInfo
+            via_cell = self._get_gds_via_cell(via, lay_map, via_info[via.id], res, gds_cell,
+                                              via_cells)
+            x0, y0 = via.loc
+            gds_cell.add_shared_ref(via_cell, round(x0 / res), round(y0 / res),
+                                    nx=via.arr_nx, ny=via.arr_ny,
+                                    spx=round(via.arr_spx / res), spy=round(via.arr_spy / res))
+
+        # add pins
+        for pin in pin_list:  # type: PinInfo
+            lay_id, purp_id = lay_map[pin.layer]
+            bbox = pin.bbox
+            label = pin.label
+            if pin.make_rect:
+                gds_cell.add_box(lay_id, purp_id, round(bbox.left / res),
+                                 round(bbox.bottom / res), round(bbox.right / res),
+                                 round(bbox.top / res))
+            angle = 90 if bbox.height_unit > bbox.width_unit else 0
+            gds_cell.add_text(lay_id, purp_id, label, round(bbox.xc / res),
+                              round(bbox.yc / res), angle=angle)
+
+        for path in path_list:
+            pass
 
-                if nx > 1 or ny > 1:
-                    spx, spy = rect['arr_spx'], rect['arr_spy']
-                    for xidx in range(nx):
-                        dx = xidx * spx
-                        for yidx in range(ny):
-                            dy = yidx * spy
-                            cur_rect = gdspy.Rectangle((x0 + dx, y0 + dy), (x1 + dx, y1 + dy),
-                                                       layer=lay_id, datatype=purp_id)
-                            gds_cell.add(cur_rect)
-                else:
-                    cur_rect = gdspy.Rectangle((x0, y0), (x1, y1), layer=lay_id, datatype=purp_id)
-                    gds_cell.add(cur_rect)
-
-            # add vias
-            for via in via_list:  # type: ViaInfo
-                via_lay_info = via_info[via.id]
-
-                nx, ny = via.arr_nx, via.arr_ny
-                x0, y0 = via.loc
-                if nx > 1 or ny > 1:
-                    spx, spy = via.arr_spx, via.arr_spy
-                    for xidx in range(nx):
-                        xc = x0 + xidx * spx
-                        for yidx in range(ny):
-                            yc = y0 + yidx * spy
-                            self._add_gds_via(gds_cell, via, lay_map, via_lay_info, xc, yc)
-                else:
-                    self._add_gds_via(gds_cell, via, lay_map, via_lay_info, x0, y0)
-
-            # add pins
-            for pin in pin_list:  # type: PinInfo
-                lay_id, purp_id = lay_map[pin.layer]
-                bbox = pin.bbox
-                label = pin.label
-                if pin.make_rect:
-                    cur_rect = gdspy.Rectangle((bbox.left, bbox.bottom), (bbox.right, bbox.top),
-                                               layer=lay_id, datatype=purp_id)
-                    gds_cell.add(cur_rect)
-                angle = 90 if bbox.height_unit > bbox.width_unit else 0
-                cur_lbl = gdspy.Label(label, (bbox.xc, bbox.yc), rotation=angle,
-                                      layer=lay_id, texttype=purp_id)
-                gds_cell.add(cur_lbl)
-
-            for path in path_list:
-                pass
+        for blockage in blockage_list:
+            pass
 
-            for blockage in blockage_list:
-                pass
+        for boundary in boundary_list:
+            pass
 
-            for boundary in boundary_list:
-                pass
+        for polygon in polygon_list:
+            lay_id, purp_id = lay_map[polygon['layer']]
+            points = [(round(x / res), round(y / res)) for x, y in polygon['points']]
+            gds_cell.add_polygon(lay_id, purp_id, points)
 
-            for polygon in polygon_list:
-                lay_id, purp_id = lay_map[polygon['layer']]
-                cur_poly = gdspy.Polygon(polygon['points'], layer=lay_id, datatype=purp_id,
-                                         verbose=False)
-                gds_cell.add(cur_poly.fracture(precision=res))
+    @staticmethod
+    def _add_gds_rect_store(rect_store, gds_cell, lay_map):
+        # type: (RectStore, Any, Dict[Any, Any]) -> None
+        """Add all rectangles in the given RectStore to a GDS or OASIS cell.
 
-        gds_lib.write_gds(out_fname, unit=lay_unit, precision=res * lay_unit)
-        end = time.time()
-        if debug:
-            print('layout instantiation took %.4g seconds' % (end - start))
+        Single rectangles on the same layer are added in one batch.
+        """
+        lay_idx = rect_store.layer_indices
+        boxes = rect_store.boxes
+        arr_params = rect_store.arr_params
+        arrayed = (arr_params[:, 0] > 1) | (arr_params[:, 1] > 1)
+        for idx, layer in enumerate(rect_store.layers):
+            lay_id, purp_id = lay_map[layer]
+            on_layer = lay_idx == idx
+            gds_cell.add_boxes(lay_id, purp_id, boxes[on_layer & ~arrayed])
+            sel = np.flatnonzero(on_layer & arrayed)
+            for (x0, y0, x1, y1), (nx, ny, spx, spy) in zip(boxes[sel].tolist(),
+                                                            arr_params[sel].tolist()):
+                gds_cell.add_box_array(lay_id, purp_id, x0, y0, x1, y1, nx=nx, ny=ny,
+                                       spx=spx, spy=spy)
+
+    @staticmethod
+    def _get_gds_via_cell(via, lay_map, via_lay_info, res, parent, via_cells):
+        # type: (ViaInfo, Dict[Any, Any], Dict[str, Any], float, Any, Dict[Any, Any]) -> Any
+        """Returns the shared GDS or OASIS cell of the given via, centered at the origin.
 
-    def _add_gds_via(self, gds_cell, via, lay_map, via_lay_info, x0, y0):
-        blay, bpurp = lay_map[via_lay_info['bot_layer']]
-        tlay, tpurp = lay_map[via_lay_info['top_layer']]
-        vlay, vpurp = lay_map[via_lay_info['via_layer']]
+        Parameters
+        ----------
+        via : ViaInfo
+            the via.
+        lay_map : Dict[Any, Any]
+            the GDS layer map.
+        via_lay_info : Dict[str, Any]
+            the GDS information of this via type.
+        res : float
+            the layout resolution.
+        parent : Any
+            the cell using this via.  New via cells are created with its create_cell().
+        via_cells : Dict[Any, Any]
+            the via cell cache.  New via cells are added to this dictionary.
+
+        Returns
+        -------
+        via_cell : Any
+            the shared via cell.
+        """
         cw, ch = via.cut_width, via.cut_height
         if cw < 0:
             cw = via_lay_info['cut_width']
@@ -461,28 +725,34 @@ class TemplateDB(MasterDB):
             ch = via_lay_info['cut_height']
 
         num_cols, num_rows = via.num_cols, via.num_rows
-        sp_cols, sp_rows = via.sp_cols, via.sp_rows
+        cw, ch = round(cw / res), round(ch / res)
+        sp_cols, sp_rows = round(via.sp_cols / res), round(via.sp_rows / res)
+        enc1 = tuple((round(val / res) for val in via.enc1))
+        enc2 = tuple((round(val / res) for val in via.enc2))
+        via_key = (via.id, cw, ch, num_cols, num_rows, sp_cols, sp_rows, enc1, enc2)
+        via_cell = via_cells.get(via_key, None)
+        if via_cell is not None:
+            return via_cell
+
+        blay, bpurp = lay_map[via_lay_info['bot_layer']]
+        tlay, tpurp = lay_map[via_lay_info['top_layer']]
+        vlay, vpurp = lay_map[via_lay_info['via_layer']]
         w_arr = num_cols * cw + (num_cols - 1) * sp_cols
         h_arr = num_rows * ch + (num_rows - 1) * sp_rows
-        x0 -= w_arr / 2
-        y0 -= h_arr / 2
-        bl, br, bt, bb = via.enc1
-        tl, tr, tt, tb = via.enc2
-        bot_p0, bot_p1 = (x0 - bl, y0 - bb), (x0 + w_arr + br, y0 + h_arr + bt)
-        top_p0, top_p1 = (x0 - tl, y0 - tb), (x0 + w_arr + tr, y0 + h_arr + tt)
-
-        cur_rect = gdspy.Rectangle(bot_p0, bot_p1, layer=blay, datatype=bpurp)
-        gds_cell.add(cur_rect)
-        cur_rect = gdspy.Rectangle(top_p0, top_p1, layer=tlay, datatype=tpurp)
-        gds_cell.add(cur_rect)
-
-        for xidx in range(num_cols):
-            dx = xidx * (cw + sp_cols)
-            for yidx in range(num_rows):
-                dy = yidx * (ch + sp_rows)
-                cur_rect = gdspy.Rectangle((x0 + dx, y0 + dy), (x0 + cw + dx, y0 + ch + dy),
-                                           layer=vlay, datatype=vpurp)
-                gds_cell.add(cur_rect)
+        x0 = -(w_arr // 2)
+        y0 = -(h_arr // 2)
+        bl, br, bt, bb = enc1
+        tl, tr, tt, tb = enc2
+
+        # via cells are named by their content, so names are the same in every library.
+        digest = hashlib.blake2b(repr(via_key).encode('utf-8'), digest_size=8).hexdigest()
+        via_cell = parent.create_cell('BAG_VIA_%s_%s' % (via.id, digest))
+        via_cell.add_box(blay, bpurp, x0 - bl, y0 - bb, x0 + w_arr + br, y0 + h_arr + bt)
+        via_cell.add_box(tlay, tpurp, x0 - tl, y0 - tb, x0 + w_arr + tr, y0 + h_arr + tt)
+        via_cell.add_box_array(vlay, vpurp, x0, y0, x0 + cw, y0 + ch, nx=num_cols,
+                               ny=num_rows, spx=cw + sp_cols, spy=ch + sp_rows)
+        via_cells[via_key] = via_cell
+        return via_cell
 
 
 class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
@@ -537,6 +807,9 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         self._used_tracks = UsedTracks()
         self._track_boxes = {}  # type: Dict[int, BBox]
         self._merge_used_tracks = False
+        self._flat_boxes = None  # type: Optional[Dict[Tuple[str, str], np.ndarray]]
+        self._track_occ_table = {}  # type: Dict[int, Tuple[Tuple[Any, ...], Dict[Any, Any]]]
+        self._rect_query_cache = OrderedDict()  # type: Dict[Tuple[int, ...], np.ndarray]
 
         # add hidden parameters
         if 'hidden_params' in kwargs:
@@ -621,7 +894,9 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         """
         if not self.finalized:
             raise ValueError('This template is not finalized yet')
-        return self._layout.get_content(lib_name, self.cell_name, rename_fun)
+        # stream writers read rectangles directly from the columnar store.
+        return self._layout.get_content(lib_name, self.cell_name, rename_fun,
+                                        rect_store=bool(self.template_db.gds_lay_file))
 
     def finalize(self):
         # type: () -> None
@@ -675,15 +950,55 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
                     else:
                         self._track_boxes[layer_id] = bbox.merge(self._track_boxes[layer_id])
 
+        # occupancy tables built while drawing are never checked again once finalized
+        self._track_occ_table = {}
+
         # call super finalize routine
         DesignMaster.finalize(self)
 
+        if self.template_db.flatten:
+            self.get_flat_boxes()
+
     @classmethod
     def get_cache_properties(cls):
         # type: () -> List[str]
         """Returns a list of properties to cache."""
         return []
 
+    def get_store_fingerprint(self):
+        # type: () -> str
+        """Returns the RoutingGrid settings of this template."""
+        grid = self._grid
+        return repr((grid.layers, grid.private_layers, sorted(grid.sp_tracks.items()),
+                     sorted(grid.w_tracks.items()), sorted(grid.dir_tracks.items()),
+                     sorted(grid.offset_tracks.items()), sorted(grid.max_num_tr_tracks.items()),
+                     sorted(grid.block_pitch.items()),
+                     sorted((lay, sorted(val.items())) for lay, val in grid.w_override.items()),
+                     sorted(grid.get_flip_parity().items())))
+
+    def get_num_geometries(self):
+        # type: () -> int
+        return self._layout.num_geometries
+
+    def get_store_state(self):
+        # type: () -> Optional[Dict[str, Any]]
+        state = self.__dict__.copy()
+        # cell name is assigned by the current database.
+        del state['_cell_name']
+        # flattened geometries and track occupancies are recomputed when needed.
+        state['_flat_boxes'] = None
+        state['_track_occ_table'] = {}
+        state['_rect_query_cache'] = OrderedDict()
+        return state
+
+    def set_store_state(self, state):
+        # type: (Dict[str, Any]) -> None
+        cell_name = self._cell_name
+        self.__dict__.update(state)
+        self._cell_name = cell_name
+        # child masters may have different cell names in this database
+        self._layout.update_inst_cell_names()
+
     @property
     def template_db(self):
         # type: () -> TemplateDB
@@ -800,28 +1115,259 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
     def instance_iter(self):
         return self._layout.inst_iter()
 
+    def get_rect_array(self, layer_id, box):
+        # type: (int, BBox) -> np.ndarray
+        """Returns all rectangles on the given layer whose spacing box intersects the given box.
+
+        Once this template is finalized, recent query results are cached, so they are
+        shared by all instances of this template.  Spacing is applied by the caller, so
+        blockage queries with different spacing share results too.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        box : BBox
+            the query box.
+
+        Returns
+        -------
+        rect_arr : np.ndarray
+            a N x 6 integer array of (xl, yb, xr, yt, dx, dy) rectangles and their spacing,
+            in resolution units.  Read-only if this template is finalized.
+        """
+        finalized = self.finalized
+        if finalized:
+            key = (layer_id, ) + box.get_bounds(unit_mode=True)
+            cache = self._rect_query_cache
+            rect_arr = cache.get(key, None)
+            if rect_arr is not None:
+                cache.move_to_end(key)
+                return rect_arr
+
+        arr_list = [self._used_tracks.get_rect_array(layer_id, box)]
+        if not self._merge_used_tracks:
+            for inst in self._layout.inst_iter():
+                rect_arr = inst.get_rect_array(layer_id, box)
+                if rect_arr.shape[0] > 0:
+                    arr_list.append(rect_arr)
+        rect_arr = arr_list[0] if len(arr_list) == 1 else np.concatenate(arr_list)
+
+        if finalized:
+            rect_arr.flags.writeable = False
+            cache[key] = rect_arr
+            if len(cache) > _RECT_QUERY_CACHE_SIZE:
+                cache.popitem(last=False)
+        return rect_arr
+
+    def get_all_rect_arrays(self):
+        # type: () -> Dict[int, np.ndarray]
+        """Returns all rectangles in this template, as a dictionary from layer ID to array.
+
+        See get_rect_array() for the array format.
+        """
+        arr_table = {layer_id: [rect_arr] for layer_id, rect_arr in
+                     self._used_tracks.get_all_rect_arrays().items()}
+        if not self._merge_used_tracks:
+            for inst in self._layout.inst_iter():
+                for layer_id, rect_arr in inst.get_all_rect_arrays().items():
+                    if layer_id in arr_table:
+                        arr_table[layer_id].append(rect_arr)
+                    else:
+                        arr_table[layer_id] = [rect_arr]
+        return {layer_id: arr_list[0] if len(arr_list) == 1 else np.concatenate(arr_list)
+                for layer_id, arr_list in arr_table.items()}
+
+    def get_blockage_array(self, layer_id, test_box, spx=0, spy=0):
+        # type: (int, BBox, int, int) -> np.ndarray
+        """Returns all blockages of the given rectangle.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        test_box : BBox
+            the test rectangle.
+        spx : int
+            the horizontal spacing of the test rectangle, in resolution units.
+        spy : int
+            the vertical spacing of the test rectangle, in resolution units.
+
+        Returns
+        -------
+        box_arr : np.ndarray
+            a N x 4 integer array of blocking rectangles expanded by their spacing, in
+            resolution units.
+        """
+        rect_arr = self.get_rect_array(layer_id, test_box.expand(dx=spx, dy=spy, unit_mode=True))
+        return get_blockage_array(rect_arr, test_box, spx, spy)
+
     def blockage_iter(self, layer_id, test_box, spx=0, spy=0):
         # type: (int, BBox, int, int) -> Generator[BBox, None, None]
         """Returns all block intersecting the given rectangle."""
-        yield from self._used_tracks.blockage_iter(layer_id, test_box, spx=spx, spy=spy)
-        if not self._merge_used_tracks:
-            for inst in self._layout.inst_iter():
-                yield from inst.blockage_iter(layer_id, test_box, spx=spx, spy=spy)
+        res = self.grid.resolution
+        for xl, yb, xr, yt in self.get_blockage_array(layer_id, test_box, spx, spy).tolist():
+            yield BBox(xl, yb, xr, yt, res, unit_mode=True)
 
     def all_rect_iter(self):
         # type: () -> Generator[Tuple[int, BBox, int, int], None, None]
         """Returns all rectangle objects in this """
-        yield from self._used_tracks.all_rect_iter()
-        if not self._merge_used_tracks:
+        res = self.grid.resolution
+        for layer_id, rect_arr in self.get_all_rect_arrays().items():
+            for xl, yb, xr, yt, dx, dy in rect_arr.tolist():
+                yield layer_id, BBox(xl, yb, xr, yt, res, unit_mode=True), dx, dy
+
+    def get_flat_boxes(self):
+        # type: () -> Dict[Tuple[str, str], np.ndarray]
+        """Returns all boxes in this template with the hierarchy flattened.
+
+        The flattened boxes of each master are computed once and shared by all of its
+        instances.  Every instance transforms its master's boxes in batch, for all of its
+        array elements at once.  Primitive instances and via cuts are not included.
+
+        Returns
+        -------
+        box_arrays : Dict[Tuple[str, str], np.ndarray]
+            a dictionary from (layer, purpose) pair to a read-only N x 4 integer array of
+            [left, bottom, right, top] boxes, in resolution units.
+        """
+        if not self.finalized:
+            raise ValueError('This template is not finalized yet')
+
+        if self._flat_boxes is None:
+            box_table = {}  # type: Dict[Tuple[str, str], List[np.ndarray]]
+            for layer, boxes in self._layout.get_box_arrays().items():
+                box_table[layer] = [boxes]
             for inst in self._layout.inst_iter():
-                yield from inst.all_rect_iter()
+                if inst.valid:
+                    for layer, boxes in inst.master.get_flat_boxes().items():
+                        inst_boxes = inst.translate_master_box_array(boxes)
+                        if layer in box_table:
+                            box_table[layer].append(inst_boxes)
+                        else:
+                            box_table[layer] = [inst_boxes]
+
+            flat_boxes = {}
+            for layer, arr_list in box_table.items():
+                boxes = arr_list[0] if len(arr_list) == 1 else np.concatenate(arr_list)
+                boxes.flags.writeable = False
+                flat_boxes[layer] = boxes
+            self._flat_boxes = flat_boxes
+
+        return self._flat_boxes
 
     def intersection_rect_iter(self, layer_id, box):
         # type: (int, BBox) -> Generator[BBox, None, None]
-        yield from self._used_tracks.intersection_rect_iter(layer_id, box)
-        if not self._merge_used_tracks:
-            for inst in self._layout.inst_iter():
-                yield from inst.intersection_rect_iter(layer_id, box)
+        res = self.grid.resolution
+        for xl, yb, xr, yt, _, _ in self.get_rect_array(layer_id, box).tolist():
+            yield BBox(xl, yb, xr, yt, res, unit_mode=True)
+
+    def _get_track_occupancy_table(self, layer_id):
+        # type: (int) -> Dict[Tuple[int, int, int, int], Tuple[int, int, IntervalSet]]
+        """Returns the track occupancy cache of the given layer.
+
+        The cache is cleared if used tracks on the given layer or instances changed since it
+        was last used.  Finalized templates cannot change, so their cache is only cleared once
+        in finalize().
+        """
+        entry = self._track_occ_table.get(layer_id, None)
+        if self.finalized:
+            if entry is None:
+                entry = self._track_occ_table[layer_id] = (None, {})
+            return entry[1]
+
+        used_tracks = self._used_tracks
+        stamp = (used_tracks, used_tracks.get_layer_version(layer_id), self._merge_used_tracks,
+                 self._layout.inst_version)
+        if entry is None or entry[0] != stamp:
+            entry = self._track_occ_table[layer_id] = (stamp, {})
+        return entry[1]
+
+    def _get_track_occupancy(self, layer_id, tr_idx, width, sp, sp_le, lower, upper,
+                             occ_table=None):
+        # type: (int, Union[float, int], int, int, int, int, int, Optional[Dict]) -> IntervalSet
+        """Returns the used intervals of the given track around the given interval.
+
+        A wire on the given track between lower and upper is blocked if and only if it
+        overlaps one of the returned intervals.  The intervals include spacing and line-end
+        spacing.  They are computed for a window around the given interval, then cached, so
+        queries of nearby intervals on the same track are lookups.
+
+        Parameters
+        ----------
+        layer_id : int
+            the layer ID.
+        tr_idx : Union[float, int]
+            the track index.
+        width : int
+            the wire width, in number of tracks.
+        sp : int
+            the wire spacing, in resolution units.
+        sp_le : int
+            the wire line-end spacing, in resolution units.
+        lower : int
+            the lower coordinate of the wire, in resolution units.
+        upper : int
+            the upper coordinate of the wire, in resolution units.
+        occ_table : Optional[Dict]
+            the track occupancy cache of this layer.  If None, it is retrieved from this
+            template.
+
+        Returns
+        -------
+        intv_set : IntervalSet
+            the used intervals along the track, in resolution units.  Only intervals
+            overlapping [lower, upper] are guaranteed to be complete.
+        """
+        if occ_table is None:
+            occ_table = self._get_track_occupancy_table(layer_id)
+
+        htr = int(round(2 * tr_idx + 1))
+        key = (htr, width, sp, sp_le)
+        entry = occ_table.get(key, None)
+        if entry is not None and entry[0] <= lower and upper <= entry[1]:
+            return entry[2]
+
+        # compute the occupancy of a window around the query, so nearby queries are hits.
+        margin = max(upper - lower, _TRACK_OCC_MARGIN)
+        wl, wu = lower - margin, upper + margin
+        grid = self.grid
+        res = grid.resolution
+        tl, tu = grid.get_wire_bounds(layer_id, (htr - 1) / 2, width=width, unit_mode=True)
+        if grid.get_direction(layer_id) == 'x':
+            test_box = BBox(wl - sp_le, tl - sp, wu + sp_le, tu + sp, res, unit_mode=True)
+            al, pl, au, pu, sda, sdp = self.get_rect_array(layer_id, test_box).T
+        else:
+            test_box = BBox(tl - sp, wl - sp_le, tu + sp, wu + sp_le, res, unit_mode=True)
+            pl, al, pu, au, sdp, sda = self.get_rect_array(layer_id, test_box).T
+
+        # a rectangle blocks the wire if its spacing box overlaps the wire, or if the wire
+        # spacing box overlaps it.  Each condition has its own spacing along the track.
+        blk_rect = (pl - sdp < tu) & (pu + sdp > tl)
+        blk_wire = (pl < tu + sp) & (pu > tl - sp)
+        ext = np.where(blk_rect, sda, 0)
+        ext[blk_wire] = np.maximum(ext[blk_wire], sp_le)
+        keep = blk_rect | blk_wire
+        lower_arr = (al - ext)[keep]
+        upper_arr = (au + ext)[keep]
+
+        # merge overlapping intervals
+        num = lower_arr.size
+        if num == 0:
+            intv_set = IntervalSet()
+        else:
+            order = np.argsort(lower_arr, kind='stable')
+            lower_arr = lower_arr[order]
+            upper_arr = np.maximum.accumulate(upper_arr[order])
+            is_start = np.empty(num, dtype=bool)
+            is_start[0] = True
+            is_start[1:] = lower_arr[1:] > upper_arr[:-1]
+            start_idx = np.flatnonzero(is_start)
+            end_idx = np.append(start_idx[1:] - 1, num - 1)
+            intv_set = IntervalSet(intv_list=zip(lower_arr[start_idx].tolist(),
+                                                 upper_arr[end_idx].tolist()))
+        occ_table[key] = (wl, wu, intv_set)
+        return intv_set
 
     def open_interval_iter(self,  # type: TemplateBase
                            track_id,  # type: TrackID
@@ -833,27 +1379,20 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
                            ):
         # type: (...) -> Generator[Tuple[int, int], None, None]
 
-        res = self.grid.resolution
         layer_id = track_id.layer_id
         width = track_id.width
-        intv_dir = self.grid.get_direction(layer_id)
-        warr = WireArray(track_id, lower, upper, res=res, unit_mode=True)
-        test_box = warr.get_bbox_array(self.grid).base
         sp = max(sp, int(self.grid.get_space(layer_id, width, unit_mode=True)))
         sp_le = max(sp_le, int(self.grid.get_line_end_space(layer_id, width, unit_mode=True)))
-        if intv_dir == 'x':
-            spx, spy = sp_le, sp
-        else:
-            spx, spy = sp, sp_le
+        intv_set = self._get_track_occupancy(layer_id, track_id.base_index, width, sp, sp_le,
+                                             lower, upper)
 
-        intv_set = IntervalSet()
-        for box in self.blockage_iter(layer_id, test_box, spx=spx, spy=spy):
-            bl, bu = tuple2_to_int(box.get_interval(intv_dir, unit_mode=True))
-            intv_set.add((max(bl, lower), min(bu, upper)), merge=True, abut=True)
-
-        for intv in intv_set.complement_iter((lower, upper)):
-            if intv[1] - intv[0] >= min_len:
-                yield intv
+        marker = lower
+        for start, end in intv_set.overlap_intervals((lower, upper)):
+            if start - marker >= min_len and marker < start:
+                yield marker, start
+            marker = end
+        if upper - marker >= min_len and marker < upper:
+            yield marker, upper
 
     def is_track_available(self,  # type: TemplateBase
                            layer_id,  # type: int
@@ -866,8 +1405,8 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
                            unit_mode=False,  # type: bool
                            ):
         """Returns True if the given track is available."""
-        res = self.grid.resolution
         if not unit_mode:
+            res = self.grid.resolution
             lower = int(round(lower / res))
             upper = int(round(upper / res))
             sp = int(round(sp / res))
@@ -878,22 +1417,10 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
             sp = int(sp)
             sp_le = int(sp_le)
 
-        intv_dir = self.grid.get_direction(layer_id)
-        track_id = TrackID(layer_id, tr_idx, width=width)
-        warr = WireArray(track_id, lower, upper, res=res, unit_mode=True)
-        test_box = warr.get_bbox_array(self.grid).base
         sp = max(sp, int(self.grid.get_space(layer_id, width, unit_mode=True)))
         sp_le = max(sp_le, int(self.grid.get_line_end_space(layer_id, width, unit_mode=True)))
-        if intv_dir == 'x':
-            spx, spy = sp_le, sp
-        else:
-            spx, spy = sp, sp_le
-
-        try:
-            next(self.blockage_iter(layer_id, test_box, spx=spx, spy=spy))
-        except StopIteration:
-            return True
-        return False
+        intv_set = self._get_track_occupancy(layer_id, tr_idx, width, sp, sp_le, lower, upper)
+        return not intv_set.has_overlap((lower, upper))
 
     def get_rect_bbox(self, layer):
         # type: (Union[str, Tuple[str, str]]) -> BBox
@@ -1053,8 +1580,9 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
 
         res = self.grid.resolution
         save_tracks = UsedTracks(fname, overwrite=True)
-        for layer_id, box, dx, dy in self.all_rect_iter():
-            save_tracks.record_box(layer_id, box, dx, dy, res)
+        for layer_id, rect_arr in self.get_all_rect_arrays().items():
+            save_tracks.record_box_array(layer_id, rect_arr[:, :4], rect_arr[:, 4],
+                                         rect_arr[:, 5], res)
         save_tracks.close()
 
         template_info = dict(
@@ -1082,8 +1610,9 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
             self._merge_used_tracks = True
             res = self.grid.resolution
             for inst in self._layout.inst_iter():
-                for layer_id, box, dx, dy in inst.all_rect_iter():
-                    self._used_tracks.record_box(layer_id, box, dx, dy, res)
+                for layer_id, rect_arr in inst.get_all_rect_arrays().items():
+                    self._used_tracks.record_box_array(layer_id, rect_arr[:, :4], rect_arr[:, 4],
+                                                       rect_arr[:, 5], res)
 
     def get_pin_name(self, name):
         # type: (str) -> str
@@ -1368,6 +1897,50 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         self._used_tracks.record_rect(self.grid, layer, rect.bbox_array)
         return rect
 
+    def add_boxes(self,  # type: TemplateBase
+                  layer,  # type: Union[str, Tuple[str, str]]
+                  boxes,  # type: np.ndarray
+                  nx=1,  # type: int
+                  ny=1,  # type: int
+                  spx=0,  # type: int
+                  spy=0,  # type: int
+                  ):
+        # type: (...) -> None
+        """Add many (arrayed) rectangles on the same layer.
+
+        Unlike add_rect(), no Rect objects are created, so the rectangles cannot be
+        modified afterwards.  Use this to draw large numbers of rectangles, such as fill.
+
+        Parameters
+        ----------
+        layer: Union[str, Tuple[str, str]]
+            the layer name, or the (layer, purpose) pair.
+        boxes : np.ndarray
+            a N x 4 integer array of [left, bottom, right, top] coordinates, in
+            resolution units.
+        nx : int
+            number of columns.
+        ny : int
+            number of rows.
+        spx : int
+            column pitch, in resolution units.
+        spy : int
+            row pitch, in resolution units.
+        """
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self._layout.add_boxes(layer, boxes, nx=nx, ny=ny, spx=spx, spy=spy)
+        if nx > 1 or ny > 1:
+            boxes = transform_box_array(boxes, nx=nx, ny=ny, spx=spx, spy=spy)
+        self._used_tracks.record_boxes(self.grid, layer, boxes)
+
+    def _add_rect_fast(self, layer, bbox):
+        # type: (Union[str, Tuple[str, str]], Union[BBox, BBoxArray]) -> None
+        """Add a new (arrayed) rectangle without creating a Rect object."""
+        self._layout.add_box_array(layer, bbox)
+        if not isinstance(bbox, BBoxArray):
+            bbox = BBoxArray(bbox)
+        self._used_tracks.record_rect(self.grid, layer, bbox)
+
     def add_res_metal(self, layer_id, bbox, **kwargs):
         # type: (int, Union[BBox, BBoxArray], **Any) -> List[Rect]
         """Add a new metal resistor.
@@ -1693,6 +2266,78 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
 
         return via
 
+    def _add_via_cached(self,  # type: TemplateBase
+                        via_cache,  # type: Dict[Tuple[Any, ...], Tuple[BBox, Dict[str, Any]]]
+                        bbox,  # type: BBox
+                        bot_layer,  # type: Union[str, Tuple[str, str]]
+                        top_layer,  # type: Union[str, Tuple[str, str]]
+                        bot_dir,  # type: str
+                        nx=1,  # type: int
+                        ny=1,  # type: int
+                        spx=0.0,  # type: Union[float, int]
+                        spy=0.0,  # type: Union[float, int]
+                        unit_mode=False,  # type: bool
+                        ):
+        # type: (...) -> Via
+        """Adds a via like add_via(), reusing the via solution of an earlier via of same size.
+
+        The via solution only depends on the via layers, direction and bounding box
+        dimension, so via_cache maps those to the first bounding box and its via
+        information, which is translated to the given bounding box.
+        """
+        tech_info = self.grid.tech_info
+        key = (bot_layer, top_layer, bot_dir, bbox.width_unit, bbox.height_unit)
+        cache_val = via_cache.get(key, None)
+        if cache_val is None:
+            base_info = tech_info.get_via_info(bbox, bot_layer, top_layer, bot_dir)
+            if base_info is None:
+                raise ValueError('Cannot make via with bounding box %s' % bbox)
+            base_box = bbox
+            via_cache[key] = base_box, base_info
+        else:
+            base_box, base_info = cache_val
+
+        dx = bbox.xc_unit - base_box.xc_unit
+        dy = bbox.yc_unit - base_box.yc_unit
+        params = base_info['params'].copy()
+        params['loc'] = (bbox.xc, bbox.yc)
+        info = dict(base_info, params=params,
+                    top_box=base_info['top_box'].move_by(dx=dx, dy=dy, unit_mode=True),
+                    bot_box=base_info['bot_box'].move_by(dx=dx, dy=dy, unit_mode=True))
+        via = Via(tech_info, bbox, bot_layer, top_layer, bot_dir, nx=nx, ny=ny, spx=spx, spy=spy,
+                  unit_mode=unit_mode, info=info)
+        self._layout.add_via(via)
+
+        return via
+
+    @classmethod
+    def _add_to_box_table(cls, box_table, layer, bounds, nx=1, ny=1, spx=0, spy=0):
+        # type: (Dict[Tuple[Any, ...], List[Tuple[int, ...]]], str, Tuple[int, ...], ...) -> None
+        """Records the given (arrayed) rectangle in box_table, to be drawn by _draw_box_table().
+
+        bounds and array pitches are in resolution units.
+        """
+        key = (layer, nx, ny, spx, spy)
+        box_list = box_table.get(key, None)
+        if box_list is None:
+            box_table[key] = box_list = []
+        box_list.append(bounds)
+
+    def _draw_box_table(self, box_table):
+        # type: (Dict[Tuple[Any, ...], List[Tuple[int, ...]]]) -> None
+        """Draws all rectangles recorded by _add_to_box_table(), one add_boxes() call per key."""
+        res = self.grid.resolution
+        for (layer, nx, ny, spx, spy), box_list in box_table.items():
+            if len(box_list) < _BOX_BATCH_MIN:
+                # batch methods have a large constant overhead, draw few rectangles directly.
+                for xl, yb, xr, yt in box_list:
+                    self._add_rect_fast(layer, BBoxArray(BBox(xl, yb, xr, yt, res, unit_mode=True),
+                                                         nx=nx, ny=ny, spx=spx, spy=spy,
+                                                         unit_mode=True))
+            else:
+                self.add_boxes(layer, np.array(box_list, dtype=np.int64), nx=nx, ny=ny, spx=spx,
+                               spy=spy)
+
     def add_via_primitive(self, via_type,  # type: str
                           loc,  # type: Tuple[float, float]
                           num_rows=1,  # type: int
@@ -1881,7 +2526,7 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
 
                 new_warr = WireArray(warr.track_id, cur_lower, cur_upper, res=res, unit_mode=True)
                 for layer_name, bbox_arr in new_warr.wire_arr_iter(self.grid):
-                    self.add_rect(layer_name, bbox_arr)
+                    self._add_rect_fast(layer_name, bbox_arr)
 
                 new_warr_list.append(new_warr)
 
@@ -1933,7 +2578,7 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         warr = WireArray(tid, lower, upper, res=res, unit_mode=True)
 
         for layer_name, bbox_arr in warr.wire_arr_iter(self.grid):
-            self.add_rect(layer_name, bbox_arr)
+            self._add_rect_fast(layer_name, bbox_arr)
 
         return warr
 
@@ -2326,8 +2971,7 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         conn_list : List[WireArray]
             list of connection wires created.
         """
-        grid = self.grid
-        res = grid.resolution
+        res = self.grid.resolution
 
         if not unit_mode:
             if lower is not None:
@@ -2340,6 +2984,27 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
             if upper is not None:
                 upper = int(upper)
 
+        box_table = {}  # type: Dict[Tuple[Any, ...], List[Tuple[int, ...]]]
+        new_warr_list = self._connect_wires_helper(wire_arr_list, lower, upper, debug, box_table)
+        self._draw_box_table(box_table)
+        return new_warr_list
+
+    def _connect_wires_helper(self,  # type: TemplateBase
+                              wire_arr_list,  # type: Union[WireArray, List[WireArray]]
+                              lower,  # type: Optional[int]
+                              upper,  # type: Optional[int]
+                              debug,  # type: bool
+                              box_table,  # type: Dict[Tuple[Any, ...], List[Tuple[int, ...]]]
+                              ):
+        # type: (...) -> List[WireArray]
+        """Helper method of connect_wires().
+
+        lower/upper are in resolution units.  Connection wires are recorded in box_table
+        instead of being drawn.
+        """
+        grid = self.grid
+        res = grid.resolution
+
         if isinstance(wire_arr_list, WireArray):
             wire_arr_list = [wire_arr_list]
         else:
@@ -2400,10 +3065,10 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
                 tr_id = grid.coord_to_track(layer_id, (cur_lower + cur_upper) // 2, unit_mode=True)
                 layer_name = grid.get_layer_name(layer_id, tr_id)
                 if is_horiz:
-                    box = BBox(cur_start, cur_lower, cur_end, cur_upper, res, unit_mode=True)
+                    bounds = (cur_start, cur_lower, cur_end, cur_upper)
                 else:
-                    box = BBox(cur_lower, cur_start, cur_upper, cur_end, res, unit_mode=True)
-                self.add_rect(layer_name, box)
+                    bounds = (cur_lower, cur_start, cur_upper, cur_end)
+                self._add_to_box_table(box_table, layer_name, bounds)
 
             if debug:
                 print('wires intv: %s, range: (%d, %d)' % (intv, cur_start, cur_end))
@@ -2473,11 +3138,16 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         return new_warr_list
 
     def _draw_via_on_track(self, wlayer, box_arr, track_id, tl_unit=None,
-                           tu_unit=None):
-        # type: (str, BBoxArray, TrackID, Optional[float], Optional[float]) -> Tuple[float, float]
-        """Helper method.  Draw vias on the intersection of the BBoxArray and TrackID."""
+                           tu_unit=None, via_cache=None):
+        # type: (str, BBoxArray, TrackID, Optional[int], Optional[int], ...) -> Tuple[int, int]
+        """Helper method.  Draw vias on the intersection of the BBoxArray and TrackID.
+
+        via_cache is passed to _add_via_cached(), so vias of the same size share via solutions.
+        """
         grid = self.grid
         res = grid.resolution
+        if via_cache is None:
+            via_cache = {}
 
         tr_layer_id = track_id.layer_id
         tr_width = track_id.width
@@ -2504,8 +3174,8 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
                 via_box = BBox(wbase.left_unit, tl, wbase.right_unit, tu, res, unit_mode=True)
                 nx, ny = box_arr.nx, sub_track_id.num
                 spx, spy = box_arr.spx, sub_track_id.pitch * tr_pitch
-                via = self.add_via(via_box, bot_layer, top_layer, bot_dir,
-                                   nx=nx, ny=ny, spx=spx, spy=spy)
+                via = self._add_via_cached(via_cache, via_box, bot_layer, top_layer, bot_dir,
+                                           nx=nx, ny=ny, spx=spx, spy=spy)
                 vtbox = via.bottom_box if w_layer_id > tr_layer_id else via.top_box
                 if tl_unit is None:
                     tl_unit = vtbox.left_unit
@@ -2519,8 +3189,8 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
                 via_box = BBox(tl, wbase.bottom_unit, tu, wbase.top_unit, res, unit_mode=True)
                 nx, ny = sub_track_id.num, box_arr.ny
                 spx, spy = sub_track_id.pitch * tr_pitch, box_arr.spy
-                via = self.add_via(via_box, bot_layer, top_layer, bot_dir,
-                                   nx=nx, ny=ny, spx=spx, spy=spy)
+                via = self._add_via_cached(via_cache, via_box, bot_layer, top_layer, bot_dir,
+                                           nx=nx, ny=ny, spx=spx, spy=spy)
                 vtbox = via.bottom_box if w_layer_id > tr_layer_id else via.top_box
                 if tl_unit is None:
                     tl_unit = vtbox.bottom_unit
@@ -2604,13 +3274,12 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         tr_dir = grid.get_direction(tr_layer)
         base = box_arr.base
         if tr_dir == 'x':
-            self.add_rect(layer_name,
-                          base.extend(y=tl, unit_mode=True).extend(y=tu, unit_mode=True),
-                          nx=box_arr.nx, ny=box_arr.ny, spx=box_arr.spx, spy=box_arr.spy)
+            new_base = base.extend(y=tl, unit_mode=True).extend(y=tu, unit_mode=True)
         else:
-            self.add_rect(layer_name,
-                          base.extend(x=tl, unit_mode=True).extend(x=tu, unit_mode=True),
-                          nx=box_arr.nx, ny=box_arr.ny, spx=box_arr.spx, spy=box_arr.spy)
+            new_base = base.extend(x=tl, unit_mode=True).extend(x=tu, unit_mode=True)
+        self._add_rect_fast(layer_name, BBoxArray(new_base, nx=box_arr.nx, ny=box_arr.ny,
+                                                  spx=box_arr.spx_unit, spy=box_arr.spy_unit,
+                                                  unit_mode=True))
 
         # draw vias
         tl_unit, tu_unit = self._draw_via_on_track(layer_name, box_arr, track_id,
@@ -2634,7 +3303,7 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
                     tu_unit = tl_unit + min_len
         result = WireArray(track_id, tl_unit, tu_unit, res=res, unit_mode=True)
         for layer_name, bbox_arr in result.wire_arr_iter(grid):
-            self.add_rect(layer_name, bbox_arr)
+            self._add_rect_fast(layer_name, bbox_arr)
 
         return result
 
@@ -2864,105 +3533,173 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
             If there was nothing to do, the first argument will be None.
             Otherwise, returns a WireArray.
         """
-        if isinstance(wire_arr_list, WireArray):
-            # convert to list.
-            wire_arr_list = [wire_arr_list]
+        res = self.grid.resolution
+        if not unit_mode:
+            wire_lower, wire_upper, track_lower, track_upper = (
+                None if val is None else int(round(val / res))
+                for val in (wire_lower, wire_upper, track_lower, track_upper))
+
+        conn_list = [(wire_arr_list, track_id, wire_lower, wire_upper, track_lower, track_upper)]
+        result, wire_list = self._connect_to_tracks_helper(conn_list, min_len_mode, debug)[0]
+        if return_wires:
+            return result, wire_list
         else:
-            pass
+            return result
 
-        if not wire_arr_list:
-            # do nothing
-            if return_wires:
-                return None, []
-            return None
+    def connect_to_tracks_batch(self,  # type: TemplateBase
+                                conn_list,  # type: Sequence[Tuple[Any, TrackID]]
+                                wire_lower=None,  # type: Optional[Union[float, int]]
+                                wire_upper=None,  # type: Optional[Union[float, int]]
+                                track_lower=None,  # type: Optional[Union[float, int]]
+                                track_upper=None,  # type: Optional[Union[float, int]]
+                                unit_mode=False,  # type: bool
+                                min_len_mode=None,  # type: Optional[int]
+                                debug=False,  # type: bool
+                                ):
+        # type: (...) -> List[Optional[WireArray]]
+        """Batch version of connect_to_tracks().
+
+        Makes many independent connections at once.  Vias of the same size share their
+        via solution, and all wires and tracks are drawn and recorded as used tracks
+        with one add_boxes() call per layer at the end.
+
+        Parameters
+        ----------
+        conn_list : Sequence[Tuple[Union[WireArray, List[WireArray]], TrackID]]
+            list of (wires, track_id) connections.  For each connection, the wires are connected
+            to the given track(s) as in connect_to_tracks().
+        wire_lower : Optional[Union[float, int]]
+            if given, extend wire(s) to this lower coordinate.
+        wire_upper : Optional[Union[float, int]]
+            if given, extend wire(s) to this upper coordinate.
+        track_lower : Optional[Union[float, int]]
+            if given, extend track(s) to this lower coordinate.
+        track_upper : Optional[Union[float, int]]
+            if given, extend track(s) to this upper coordinate.
+        unit_mode : bool
+            True if coordinates are given in resolution units.
+        min_len_mode : Optional[int]
+            If not None, will extend track so it satisfy minimum length requirement.
+            Use -1 to extend lower bound, 1 to extend upper bound, 0 to extend both equally.
+        debug : bool
+            True to print debug messages.
 
+        Returns
+        -------
+        warr_list : List[Optional[WireArray]]
+            the tracks created for each connection.  None if the connection had no wires.
+        """
+        res = self.grid.resolution
+        if not unit_mode:
+            wire_lower, wire_upper, track_lower, track_upper = (
+                None if val is None else int(round(val / res))
+                for val in (wire_lower, wire_upper, track_lower, track_upper))
+
+        conn_list = [(wires, tid, wire_lower, wire_upper, track_lower, track_upper)
+                     for wires, tid in conn_list]
+        return [result for result, _ in
+                self._connect_to_tracks_helper(conn_list, min_len_mode, debug)]
+
+    def _connect_to_tracks_helper(self,  # type: TemplateBase
+                                  conn_list,  # type: Sequence[Tuple[Any, ...]]
+                                  min_len_mode,  # type: Optional[int]
+                                  debug,  # type: bool
+                                  ):
+        # type: (...) -> List[Tuple[Optional[WireArray], List[WireArray]]]
+        """Helper method of connect_to_tracks() and connect_to_tracks_batch().
+
+        Each element of conn_list is a (wires, track_id, wire_lower, wire_upper, track_lower,
+        track_upper) tuple, with coordinates in resolution units.  Returns the track and the
+        connected wires of each connection.
+        """
         grid = self.grid
         res = grid.resolution
 
-        if track_upper is not None:
-            if not unit_mode:
-                track_upper = int(round(track_upper / res))
+        via_cache = {}  # type: Dict[Tuple[Any, ...], Tuple[BBox, Dict[str, Any]]]
+        box_table = {}  # type: Dict[Tuple[Any, ...], List[Tuple[int, ...]]]
+        ans = []  # type: List[Tuple[Optional[WireArray], List[WireArray]]]
+        for wire_arr_list, track_id, wire_lower, wire_upper, track_lower, track_upper in conn_list:
+            if isinstance(wire_arr_list, WireArray):
+                # convert to list.
+                wire_arr_list = [wire_arr_list]
             else:
-                track_upper = int(track_upper)
-        if track_lower is not None:
-            if not unit_mode:
-                track_lower = int(round(track_lower / res))
-            else:
-                track_lower = int(track_lower)
-
-        # find min/max track Y coordinates
-        tr_layer_id = track_id.layer_id
-        wl, wu = tuple2_to_int(track_id.get_bounds(grid, unit_mode=True))
-        if wire_lower is not None:
-            if not unit_mode:
-                wire_lower = int(round(wire_lower / res))
-            else:
-                wire_lower = int(wire_lower)
-            wl = min(wire_lower, wl)
+                pass
 
-        if wire_upper is not None:
-            if not unit_mode:
-                wire_upper = int(round(wire_upper / res))
-            else:
-                wire_upper = int(wire_upper)
-            wu = max(wire_upper, wu)
+            if not wire_arr_list:
+                # do nothing
+                ans.append((None, []))
+                continue
 
-        # get top wire and bottom wire list
-        top_list = []
-        bot_list = []
-        for wire_arr in wire_arr_list:
-            cur_layer_id = wire_arr.layer_id
-            if cur_layer_id == tr_layer_id + 1:
-                top_list.append(wire_arr)
-            elif cur_layer_id == tr_layer_id - 1:
-                bot_list.append(wire_arr)
-            else:
-                raise ValueError(
-                    'WireArray layer %d cannot connect to layer %d' % (cur_layer_id, tr_layer_id))
-
-        # connect wires together
-        top_wire_list = self.connect_wires(top_list, lower=wl, upper=wu, unit_mode=True,
-                                           debug=debug)
-        bot_wire_list = self.connect_wires(bot_list, lower=wl, upper=wu, unit_mode=True,
-                                           debug=debug)
+            if track_upper is not None:
+                track_upper = int(track_upper)
+            if track_lower is not None:
+                track_lower = int(track_lower)
 
-        # draw vias
-        for w_layer_id, wire_list in ((tr_layer_id + 1, top_wire_list),
-                                      (tr_layer_id - 1, bot_wire_list)):
-            for wire_arr in wire_list:
-                for wlayer, box_arr in wire_arr.wire_arr_iter(grid):
-                    track_lower, track_upper = self._draw_via_on_track(wlayer, box_arr, track_id,
-                                                                       tl_unit=track_lower,
-                                                                       tu_unit=track_upper)
-        assert_msg = "track_lower/track_upper should have been set just above"
-        assert track_lower is not None and track_upper is not None, assert_msg
+            # find min/max track Y coordinates
+            tr_layer_id = track_id.layer_id
+            wl, wu = tuple2_to_int(track_id.get_bounds(grid, unit_mode=True))
+            if wire_lower is not None:
+                wl = min(int(wire_lower), wl)
+            if wire_upper is not None:
+                wu = max(int(wire_upper), wu)
 
-        if min_len_mode is not None:
-            # extend track to meet minimum length
-            min_len = int(grid.get_min_length(tr_layer_id, track_id.width, unit_mode=True))
-            # make sure minimum length is even so that middle coordinate exists
-            min_len = -(-min_len // 2) * 2
-            tr_len = track_upper - track_lower
-            if min_len > tr_len:
-                ext = min_len - tr_len
-                if min_len_mode < 0:
-                    track_lower -= ext
-                elif min_len_mode > 0:
-                    track_upper += ext
+            # get top wire and bottom wire list
+            top_list = []
+            bot_list = []
+            for wire_arr in wire_arr_list:
+                cur_layer_id = wire_arr.layer_id
+                if cur_layer_id == tr_layer_id + 1:
+                    top_list.append(wire_arr)
+                elif cur_layer_id == tr_layer_id - 1:
+                    bot_list.append(wire_arr)
                 else:
-                    track_lower -= ext // 2
-                    track_upper = track_lower + min_len
+                    raise ValueError('WireArray layer %d cannot connect to layer %d' %
+                                     (cur_layer_id, tr_layer_id))
+
+            # connect wires together
+            top_wire_list = self._connect_wires_helper(top_list, wl, wu, debug, box_table)
+            bot_wire_list = self._connect_wires_helper(bot_list, wl, wu, debug, box_table)
+
+            # draw vias
+            for wire_list in (top_wire_list, bot_wire_list):
+                for wire_arr in wire_list:
+                    for wlayer, box_arr in wire_arr.wire_arr_iter(grid):
+                        track_lower, track_upper = self._draw_via_on_track(
+                            wlayer, box_arr, track_id, tl_unit=track_lower, tu_unit=track_upper,
+                            via_cache=via_cache)
+            assert_msg = "track_lower/track_upper should have been set just above"
+            assert track_lower is not None and track_upper is not None, assert_msg
+
+            if min_len_mode is not None:
+                # extend track to meet minimum length
+                min_len = int(grid.get_min_length(tr_layer_id, track_id.width, unit_mode=True))
+                # make sure minimum length is even so that middle coordinate exists
+                min_len = -(-min_len // 2) * 2
+                tr_len = track_upper - track_lower
+                if min_len > tr_len:
+                    ext = min_len - tr_len
+                    if min_len_mode < 0:
+                        track_lower -= ext
+                    elif min_len_mode > 0:
+                        track_upper += ext
+                    else:
+                        track_lower -= ext // 2
+                        track_upper = track_lower + min_len
 
-        # draw tracks
-        result = WireArray(track_id, track_lower, track_upper, res=res, unit_mode=True)
-        for layer_name, bbox_arr in result.wire_arr_iter(grid):
-            self.add_rect(layer_name, bbox_arr)
+            # record tracks
+            result = WireArray(track_id, track_lower, track_upper, res=res, unit_mode=True)
+            for layer_name, bbox_arr in result.wire_arr_iter(grid):
+                self._add_to_box_table(box_table, layer_name,
+                                       bbox_arr.base.get_bounds(unit_mode=True),
+                                       nx=bbox_arr.nx, ny=bbox_arr.ny, spx=bbox_arr.spx_unit,
+                                       spy=bbox_arr.spy_unit)
 
-        if return_wires:
             top_wire_list.extend(bot_wire_list)
-            return result, top_wire_list
-        else:
-            return result
+            ans.append((result, top_wire_list))
+
+        # draw all wires and tracks
+        self._draw_box_table(box_table)
+        return ans
 
     def connect_to_track_wires(self,  # type: TemplateBase
                                wire_arr_list,  # type: Union[WireArray, List[WireArray]]
@@ -2990,25 +3727,15 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         wire_arr : Union[WireArray, List[WireArray]]
             WireArray representing the tracks created.  None if nothing to do.
         """
-        res = self.grid.resolution
-
-        ans = []  # type: List[WireArray]
         if isinstance(track_wires, WireArray):
             ans_is_list = False
             track_wires = [track_wires]
         else:
             ans_is_list = True
 
-        for warr in track_wires:
-            track_lower = int(round(warr.lower / res))
-            track_upper = int(round(warr.upper / res))
-            tr = self.connect_to_tracks(wire_arr_list, warr.track_id,
-                                        track_lower=track_lower, track_upper=track_upper,
-                                        unit_mode=True, min_len_mode=min_len_mode, debug=debug,
-                                        return_wires=False)
-            assert tr is not None, "connect_to_tracks did nothing"
-            assert isinstance(tr, WireArray), "return_wires=False should return a WireArray"
-            ans.append(tr)
+        conn_list = [(wire_arr_list, warr.track_id, None, None, warr.lower_unit, warr.upper_unit)
+                     for warr in track_wires]
+        ans = [tr for tr, _ in self._connect_to_tracks_helper(conn_list, min_len_mode, debug)]
 
         if not ans_is_list:
             return ans[0]
@@ -3543,6 +4270,9 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         # type: (Union[WireArray, List[WireArray]], Union[WireArray, List[WireArray]]) -> None
         """Draw vias on all intersections of the two given wire groups.
 
+        Intersections are found with track bound arrays, and each regular lattice of
+        intersections is drawn as one arrayed via.
+
         Parameters
         ----------
         bot_warr_list : Union[WireArray, List[WireArray]]
@@ -3562,39 +4292,60 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         grid = self.grid
         res = grid.resolution
 
+        # top wire track bounds, per sub-track with the same layer name.
+        top_info_list = [(twarr, [self._get_sub_track_info(sub_id) for sub_id in
+                                  twarr.track_id.sub_tracks_iter(grid)])
+                         for twarr in top_warr_list]
+
+        via_cache = {}  # type: Dict[Tuple[Any, ...], Tuple[BBox, Dict[str, Any]]]
         for bwarr in bot_warr_list:
             bot_tl = bwarr.lower_unit
             bot_tu = bwarr.upper_unit
-            bot_track_idx = bwarr.track_id
-            bot_layer_id = bot_track_idx.layer_id
-            top_layer_id = bot_layer_id + 1
-            bot_width = bot_track_idx.width
-            bot_dir = self.grid.get_direction(bot_layer_id)
+            bot_dir = grid.get_direction(bwarr.layer_id)
             bot_horizontal = (bot_dir == 'x')
-            for bot_index in bot_track_idx:
-                bot_lay_name = self.grid.get_layer_name(bot_layer_id, bot_index)
-                btl, btu = tuple2_to_int(
-                    grid.get_wire_bounds(bot_layer_id, bot_index, width=bot_width,
-                                         unit_mode=True))
-                for twarr in top_warr_list:
-                    top_tl = twarr.lower_unit
-                    top_tu = twarr.upper_unit
-                    top_track_idx = twarr.track_id
-                    top_width = top_track_idx.width
-                    if top_tu >= btu and top_tl <= btl:
-                        # top wire cuts bottom wire, possible intersection
-                        for top_index in top_track_idx:
-                            ttl, ttu = tuple2_to_int(grid.get_wire_bounds(top_layer_id, top_index,
-                                                                          width=top_width,
-                                                                          unit_mode=True))
-                            if bot_tu >= ttu and bot_tl <= ttl:
-                                # bottom wire cuts top wire, we have intersection.  Make bbox
-                                if bot_horizontal:
-                                    box = BBox(ttl, btl, ttu, btu, res, unit_mode=True)
-                                else:
-                                    box = BBox(btl, ttl, btu, ttu, res, unit_mode=True)
-                                top_lay_name = self.grid.get_layer_name(top_layer_id, top_index)
-                                self.add_via(box, bot_lay_name, top_lay_name, bot_dir)
+            for bot_sub_id in bwarr.track_id.sub_tracks_iter(grid):
+                bot_lay_name, btl, btu, bot_sp = self._get_sub_track_info(bot_sub_id)
+                for twarr, top_sub_list in top_info_list:
+                    # bottom tracks that the top wire cuts
+                    bot_runs = _get_index_runs((twarr.upper_unit >= btu) &
+                                               (twarr.lower_unit <= btl))
+                    if not bot_runs:
+                        continue
+                    for top_lay_name, ttl, ttu, top_sp in top_sub_list:
+                        # top tracks that the bottom wire cuts
+                        top_runs = _get_index_runs((bot_tu >= ttu) & (bot_tl <= ttl))
+                        # draw one via array per lattice of intersections
+                        for (bidx, bnum), (tidx, tnum) in product(bot_runs, top_runs):
+                            if bot_sp < 0:
+                                bidx += bnum - 1
+                            if top_sp < 0:
+                                tidx += tnum - 1
+                            bl, bu = int(btl[bidx]), int(btu[bidx])
+                            tl, tu = int(ttl[tidx]), int(ttu[tidx])
+                            if bot_horizontal:
+                                box = BBox(tl, bl, tu, bu, res, unit_mode=True)
+                                nx, ny, spx, spy = tnum, bnum, abs(top_sp), abs(bot_sp)
+                            else:
+                                box = BBox(bl, tl, bu, tu, res, unit_mode=True)
+                                nx, ny, spx, spy = bnum, tnum, abs(bot_sp), abs(top_sp)
+                            self._add_via_cached(via_cache, box, bot_lay_name, top_lay_name,
+                                                 bot_dir, nx=nx, ny=ny, spx=spx, spy=spy,
+                                                 unit_mode=True)
+
+    def _get_sub_track_info(self, track_id):
+        # type: (TrackID) -> Tuple[str, np.ndarray, np.ndarray, int]
+        """Returns the layer name, wire bounds and pitch of tracks with the same layer name.
+
+        Wire bounds are integer arrays and the pitch is in resolution units.
+        """
+        grid = self.grid
+        layer_id = track_id.layer_id
+        lay_name = grid.get_layer_name(layer_id, track_id.base_index)
+        hidx_arr = track_id.index_htr + track_id.pitch_htr * np.arange(track_id.num)
+        lower, upper = grid.get_wire_bounds_array(layer_id, (hidx_arr - 1) / 2,
+                                                  width=track_id.width, unit_mode=True)
+        pitch = track_id.pitch_htr * grid.get_track_pitch(layer_id, unit_mode=True) // 2
+        return lay_name, lower, upper, pitch
 
     def mark_bbox_used(self, layer_id, bbox):
         # type: (int, BBox) -> None
@@ -3619,10 +4370,17 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
             lower = int(round(lower / res))
             upper = int(round(upper / res))
             margin = int(round(margin / res))
+        else:
+            lower = int(lower)
+            upper = int(upper)
+            margin = int(margin)
 
+        sp = max(margin, int(self.grid.get_space(layer_id, width, unit_mode=True)))
+        sp_le = max(margin, int(self.grid.get_line_end_space(layer_id, width, unit_mode=True)))
+        occ_table = self._get_track_occupancy_table(layer_id)
         return [tr_idx for tr_idx in tr_idx_list
-                if self.is_track_available(layer_id, tr_idx, lower, upper, width=width,
-                                           sp=margin, sp_le=margin, unit_mode=True)]
+                if not self._get_track_occupancy(layer_id, tr_idx, width, sp, sp_le, lower, upper,
+                                                 occ_table=occ_table).has_overlap((lower, upper))]
 
     def do_power_fill(self,  # type: TemplateBase
                       layer_id,  # type: int
@@ -3695,7 +4453,7 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
 
         for warr in chain(top_vdd, top_vss):
             for lay, box_arr in warr.wire_arr_iter(self.grid):
-                self.add_rect(lay, box_arr)
+                self._add_rect_fast(lay, box_arr)
 
         if vdd_warrs:
             self.draw_vias_on_intersections(vdd_warrs, top_vdd)
@@ -3747,7 +4505,7 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
         dim_tran = dim_tran1 - dim_tran0
         dim_long = dim_long1 - dim_long0
 
-        self.add_rect(tech_info.get_exclude_layer(layer_id), bound_box)
+        self._add_rect_fast(tech_info.get_exclude_layer(layer_id), bound_box)
         if dim_tran <= ip_margin or dim_long <= ip_margin_le:
             return
 
@@ -3925,7 +4683,7 @@ class TemplateBase(DesignMaster, metaclass=abc.ABCMeta):
 
         dim_tran = dim_tran1 - dim_tran0
         dim_long = dim_long1 - dim_long0
-        self.add_rect(tech_info.get_exclude_layer(layer_id), bound_box_resolved)
+        self._add_rect_fast(tech_info.get_exclude_layer(layer_id), bound_box_resolved)
         if dim_tran <= ip_margin or dim_long <= ip_margin_le:
             return
 
@@ -4222,3 +4980,99 @@ class BlackBoxTemplate(TemplateBase):
                 self.add_pin(term_name, warr, show=show_pins)
             else:
                 self.add_pin_primitive(term_name, lay_name, box, show=show_pins)
+
+
+class GDSBlackBoxTemplate(BlackBoxTemplate):
+    """A black box template of a cell in a GDS file.
+
+    The cell is instantiated as a primitive.  Its shapes on routing layers are read from
+    the GDS file, with hierarchy flattened, and bulk loaded into the used track index, so
+    blockage queries respect the actual cell geometry.
+    """
+
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(
+            lib_name='The library name.',
+            cell_name='The layout cell name.',
+            gds_fname='The GDS file name.',
+            top_layer='The top level layer.',
+            ports='The port information dictionary.',
+            show_pins='True to show pins.',
+            lay_map_file='The GDS layer/purpose mapping file.  Defaults to the database file.',
+        )
+
+    @classmethod
+    def get_default_param_values(cls):
+        # type: () -> Dict[str, Any]
+        return dict(
+            ports={},
+            show_pins=True,
+            lay_map_file='',
+        )
+
+    def draw_layout(self):
+        # type: () -> None
+        lib_name = self.params['lib_name']
+        cell_name = self.params['cell_name']
+        gds_fname = self.params['gds_fname']
+        top_layer = self.params['top_layer']
+        ports = self.params['ports']
+        show_pins = self.params['show_pins']
+
+        grid = self.grid
+        res = grid.resolution
+        tech_info = grid.tech_info
+        lay_map = self.template_db.read_gds_lay_file(self.params['lay_map_file'])[0]
+        # GDS (layer, datatype) to routing layer ID and layer name
+        layer_table = {}  # type: Dict[Tuple[int, int], Tuple[int, str]]
+        for (lay_name, purpose), gds_lay in lay_map.items():
+            if purpose != 'exclude':
+                try:
+                    layer_id = tech_info.get_layer_id(lay_name)
+                except ValueError:
+                    continue
+                if layer_id in grid:
+                    layer_table[tuple(gds_lay)] = (layer_id, lay_name)
+
+        with GDSReader(gds_fname) as reader:
+            box_table = reader.get_boxes(cell_name)
+            scale = reader.precision / (res * tech_info.layout_unit)
+
+        layer_boxes = {}  # type: Dict[Tuple[int, str], List[np.ndarray]]
+        bnd_list = []
+        for gds_lay, boxes in box_table.items():
+            if abs(scale - 1) > 1e-9:
+                boxes = np.rint(boxes * scale).astype(np.int64)
+            bnd_list.append(np.concatenate((boxes[:, :2].min(axis=0), boxes[:, 2:].max(axis=0))))
+            layer_info = layer_table.get(gds_lay, None)
+            if layer_info is not None:
+                layer_boxes.setdefault(layer_info, []).append(boxes)
+
+        for (layer_id, lay_name), box_list in layer_boxes.items():
+            boxes = np.concatenate(box_list) if len(box_list) > 1 else box_list[0]
+            self.used_tracks.record_boxes(grid, lay_name, boxes)
+
+        for term_name, pin_dict in ports.items():
+            for lay_name, bbox_list in pin_dict.items():
+                lay_id = tech_info.get_layer_id(lay_name)
+                for xl, yb, xr, yt in bbox_list:
+                    box = BBox(xl, yb, xr, yt, res, unit_mode=True)
+                    self._register_pin(lay_id, lay_name, term_name, box, show_pins)
+
+        self.add_instance_primitive(lib_name, cell_name, (0, 0), unit_mode=True)
+
+        self.prim_top_layer = top_layer
+        if bnd_list:
+            bnd_arr = np.array(bnd_list)
+            self.prim_bound_box = BBox(int(bnd_arr[:, 0].min()), int(bnd_arr[:, 1].min()),
+                                       int(bnd_arr[:, 2].max()), int(bnd_arr[:, 3].max()),
+                                       res, unit_mode=True)
+        else:
+            self.prim_bound_box = BBox(0, 0, 0, 0, res, unit_mode=True)
+
+        self._sch_params = dict(
+            lib_name=lib_name,
+            cell_name=cell_name,
+        )
@@ -10,7 +10,8 @@ import pprint
 import numpy as np
 
 __all__ = ['BBox', 'BBoxArray', 'Pin', 'transform_table', 'transform_point',
-           'get_inverse_transform', 'tuple2_to_int', 'tuple2_to_float_int']
+           'get_inverse_transform', 'transform_box_array', 'tuple2_to_int',
+           'tuple2_to_float_int']
 
 transform_table = {'R0': np.array([[1, 0], [0, 1]], dtype=int),
                    'MX': np.array([[1, 0], [0, -1]], dtype=int),
@@ -22,6 +23,46 @@ transform_table = {'R0': np.array([[1, 0], [0, 1]], dtype=int),
                    'R270': np.array([[0, 1], [-1, 0]], dtype=int),
                    }
 
+# transformation matrices as (xx, xy, yx, yy) tuples, for scalar arithmetic
+_orient_coeffs = {key: tuple(val.ravel().tolist()) for key, val in transform_table.items()}
+# orientations that are not their own inverse
+_inverse_orient = {'R90': 'R270', 'R270': 'R90'}
+
+
+def get_slots_state(state, attr_names, cls_name):
+    # type: (Any, Tuple[str, ...], str) -> Tuple[Any, ...]
+    """Returns the attribute values of a slotted object from its pickled state.
+
+    Objects pickled before their class used __slots__ store their __dict__, and slotted
+    objects without __getstate__ store a (None, slots_dict) tuple.  Both are converted to a
+    tuple of the given attributes.
+
+    Parameters
+    ----------
+    state : Any
+        the pickled state.
+    attr_names : Tuple[str, ...]
+        the attribute names, in the order of the returned tuple.
+    cls_name : str
+        the class name, used in error messages.
+
+    Returns
+    -------
+    values : Tuple[Any, ...]
+        the attribute values.
+    """
+    if isinstance(state, tuple) and len(state) == 2 and state[0] is None:
+        state = state[1]
+    if isinstance(state, dict):
+        try:
+            return tuple(state[name] for name in attr_names)
+        except KeyError as ex:
+            raise ValueError('Cannot unpickle %s: attribute %s not found.' %
+                             (cls_name, ex.args[0]))
+    if not isinstance(state, tuple) or len(state) != len(attr_names):
+        raise ValueError('Cannot unpickle %s from state %r' % (cls_name, state))
+    return state
+
 
 def tuple2_to_int(input_tuple: Tuple[Any, Any]) -> Tuple[int, int]:
     """
@@ -54,16 +95,58 @@ def transform_point(x, y, loc, orient):
 
 def get_inverse_transform(loc, orient):
     """Returns the inverse transform"""
-    if orient == 'R90':
-        orient_inv = 'R270'
-    elif orient == 'R270':
-        orient_inv = 'R90'
-    else:
-        orient_inv = orient
+    orient_inv = _inverse_orient.get(orient, orient)
+    xx, xy, yx, yy = _orient_coeffs[orient_inv]
+    x, y = -loc[0], -loc[1]
+    return (xx * x + xy * y, yx * x + yy * y), orient_inv
+
 
-    inv_mat = transform_table[orient_inv]
-    new_shift = np.dot(inv_mat, -np.asarray(loc))
-    return (new_shift.item(0), new_shift.item(1)), orient_inv
+def transform_box_array(boxes, loc=(0, 0), orient='R0', nx=1, ny=1, spx=0, spy=0):
+    # type: (np.ndarray, Tuple[int, int], str, int, int, int, int) -> np.ndarray
+    """Transform and array boxes in batch.
+
+    Array elements are placed the same way as in Instance; each box is transformed
+    with the given location and orientation, then shifted by the column and row pitch.
+
+    Parameters
+    ----------
+    boxes : np.ndarray
+        a N x 4 integer array of [left, bottom, right, top] boxes, in resolution units.
+    loc : Tuple[int, int]
+        the location, in resolution units.
+    orient : str
+        the orientation.
+    nx : int
+        number of columns.
+    ny : int
+        number of rows.
+    spx : int
+        column pitch, in resolution units.
+    spy : int
+        row pitch, in resolution units.
+
+    Returns
+    -------
+    ans : np.ndarray
+        a (nx * ny * N) x 4 array of the transformed boxes, ordered by array element.
+    """
+    if orient not in transform_table:
+        raise ValueError('Unsupported orientation: %s' % orient)
+
+    mat = transform_table[orient].T
+    pt0 = np.dot(boxes[:, 0:2], mat)
+    pt1 = np.dot(boxes[:, 2:4], mat)
+    ans = np.empty((boxes.shape[0], 4), dtype=np.int64)
+    np.minimum(pt0, pt1, out=ans[:, 0:2])
+    np.maximum(pt0, pt1, out=ans[:, 2:4])
+    ans[:, 0::2] += loc[0]
+    ans[:, 1::2] += loc[1]
+    if nx > 1 or ny > 1:
+        dx = np.tile(np.arange(nx, dtype=np.int64) * spx, ny)
+        dy = np.repeat(np.arange(ny, dtype=np.int64) * spy, nx)
+        offsets = np.stack((dx, dy, dx, dy), axis=1)
+        ans = (ans[np.newaxis, :, :] + offsets[:, np.newaxis, :]).reshape(-1, 4)
+    return ans
 
 
 def transform_loc_orient(loc, orient, trans_loc, trans_orient):
@@ -131,6 +214,8 @@ class BBox(object):
 
     """
 
+    __slots__ = ('_left_unit', '_bot_unit', '_right_unit', '_top_unit', '_res', '_hash')
+
     def __init__(self, left, bottom, right, top, resolution, unit_mode=False):
         if not unit_mode:
             self._left_unit = int(round(left / resolution))
@@ -138,15 +223,13 @@ class BBox(object):
             self._right_unit = int(round(right / resolution))
             self._top_unit = int(round(top / resolution))
         else:
-            self._left_unit = int(round(left))
-            self._bot_unit = int(round(bottom))
-            self._right_unit = int(round(right))
-            self._top_unit = int(round(top))
-            # self._left_unit = left
-            # self._bot_unit = bottom
-            # self._right_unit = right
-            # self._top_unit = top
+            # integer coordinates are stored as is
+            self._left_unit = left if left.__class__ is int else int(round(left))
+            self._bot_unit = bottom if bottom.__class__ is int else int(round(bottom))
+            self._right_unit = right if right.__class__ is int else int(round(right))
+            self._top_unit = top if top.__class__ is int else int(round(top))
         self._res = resolution
+        self._hash = None
 
     @classmethod
     def get_invalid_bbox(cls):
@@ -415,10 +498,17 @@ class BBox(object):
         if not unit_mode:
             loc = int(round(loc[0] / self._res)), int(round(loc[1] / self._res))
 
-        p1 = transform_point(self._left_unit, self._bot_unit, loc, orient)
-        p2 = transform_point(self._right_unit, self._top_unit, loc, orient)
-        return BBox(min(p1[0], p2[0]), min(p1[1], p2[1]),
-                    max(p1[0], p2[0]), max(p1[1], p2[1]),
+        try:
+            xx, xy, yx, yy = _orient_coeffs[orient]
+        except KeyError:
+            raise ValueError('Unsupported orientation: %s' % orient)
+        x0, y0 = loc
+        xl, yb, xr, yt = self._left_unit, self._bot_unit, self._right_unit, self._top_unit
+        x1 = xx * xl + xy * yb + x0
+        y1 = yx * xl + yy * yb + y0
+        x2 = xx * xr + xy * yt + x0
+        y2 = yx * xr + yy * yt + y0
+        return BBox(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2),
                     self._res, unit_mode=True)
 
     def move_by(self, dx=0, dy=0, unit_mode=False):
@@ -540,10 +630,26 @@ class BBox(object):
         fmt_str = '%s(%.{0}f, %.{0}f, %.{0}f, %.{0}f)'.format(precision)
         return fmt_str % (self.__class__.__name__, self.left, self.bottom, self.right, self.top)
 
+    def __getstate__(self):
+        # the cached hash depends on string hashing, which differs between processes.
+        return (self._left_unit, self._bot_unit, self._right_unit, self._top_unit, self._res)
+
+    def __setstate__(self, state):
+        (self._left_unit, self._bot_unit, self._right_unit, self._top_unit,
+         self._res) = get_slots_state(state, self.__slots__[:5], 'BBox')
+        self._hash = None
+
     def __hash__(self):
-        return hash(self.get_immutable_key())
+        ans = self._hash
+        if ans is None:
+            ans = self._hash = hash(self.get_immutable_key())
+        return ans
 
     def __eq__(self, other):
+        if other.__class__ is self.__class__:
+            return (self._left_unit == other._left_unit and self._bot_unit == other._bot_unit and
+                    self._right_unit == other._right_unit and
+                    self._top_unit == other._top_unit and self._res == other._res)
         return self.get_immutable_key() == other.get_immutable_key()
 
 
@@ -568,9 +674,11 @@ class BBoxArray(object):
         True if layout dimensions are specified in resolution units.
     """
 
+    __slots__ = ('_bbox', '_nx', '_ny', '_spx_unit', '_spy_unit')
+
     def __init__(self, bbox, nx=1, ny=1, spx=0, spy=0, unit_mode=False):
         # type: (BBox, int, int, Union[float, int], Union[float, int], bool) -> None
-        if not isinstance(bbox, BBox):
+        if bbox.__class__ is not BBox and not isinstance(bbox, BBox):
             raise ValueError('%s is not a BBox object' % bbox)
         if nx <= 0 or ny <= 0:
             raise ValueError('Cannot have 0 bounding boxes.')
@@ -581,12 +689,19 @@ class BBoxArray(object):
         self._nx = nx
         self._ny = ny
         if unit_mode:
-            self._spx_unit = int(spx)  # type: int
-            self._spy_unit = int(spy)  # type: int
+            self._spx_unit = spx if spx.__class__ is int else int(spx)  # type: int
+            self._spy_unit = spy if spy.__class__ is int else int(spy)  # type: int
         else:
             self._spx_unit = int(round(spx / bbox.resolution))
             self._spy_unit = int(round(spy / bbox.resolution))
 
+    def __getstate__(self):
+        return self._bbox, self._nx, self._ny, self._spx_unit, self._spy_unit
+
+    def __setstate__(self, state):
+        (self._bbox, self._nx, self._ny, self._spx_unit,
+         self._spy_unit) = get_slots_state(state, self.__slots__, 'BBoxArray')
+
     def __iter__(self):
         # type: () -> Iterator[BBox]
         """Iterates over all bounding boxes in this BBoxArray.
@@ -389,7 +389,13 @@ class DesignManager(object):
     prj : Optional[BagProject]
         The BagProject instance.
     spec_file : str
-        the specification file name or the data directory.
+        the specification file name or the data directory.  Besides the required entries,
+        the specification supports the following optional entries:
+
+        num_workers : int
+            number of worker processes used to create layouts in parallel.  See
+            TemplateDB.new_template_list().  Layouts are created serially if less than 2.
+            Defaults to 0.
     """
 
     def __init__(self, prj, spec_file):
@@ -708,7 +714,8 @@ class DesignManager(object):
         width_override = grid_specs.get('width_override', None)
 
         routing_grid = RoutingGrid(self.prj.tech_info, layers, spaces, widths, bot_dir, width_override=width_override)
-        tdb = TemplateDB('', routing_grid, target_lib, use_cybagoa=True)
+        tdb = TemplateDB('', routing_grid, target_lib, use_cybagoa=True,
+                         max_masters=self.specs.get('max_masters', 0))
         return tdb
 
     def get_layout_params(self, val_list):
@@ -759,7 +766,11 @@ class DesignManager(object):
 
     def create_dut_layouts(self, lay_params_list, cell_name_list, temp_db):
         # type: (Sequence[Dict[str, Any]], Sequence[str], TemplateDB) -> Sequence[Dict[str, Any]]
-        """Create multiple layouts"""
+        """Create multiple layouts.
+
+        The layouts are created with the number of worker processes given by the
+        num_workers specification entry.
+        """
         if self.prj is None:
             raise ValueError('BagProject instance is not given.')
 
@@ -769,11 +780,10 @@ class DesignManager(object):
         lay_module = importlib.import_module(cls_package)
         temp_cls = getattr(lay_module, cls_name)
 
-        temp_list, sch_params_list = [], []
-        for lay_params in lay_params_list:
-            template = temp_db.new_template(params=lay_params, temp_cls=temp_cls, debug=False)
-            temp_list.append(template)
-            sch_params_list.append(template.sch_params)
+        num_workers = self.specs.get('num_workers', 0)
+        spec_list = [(temp_cls, lay_params) for lay_params in lay_params_list]
+        temp_list = temp_db.new_template_list(spec_list, num_workers=num_workers)
+        sch_params_list = [template.sch_params for template in temp_list]
         temp_db.batch_layout(self.prj, temp_list, cell_name_list)
         return sch_params_list
 
@@ -3,18 +3,36 @@
 """This module defines classes used to cache existing design masters
 """
 
-from typing import Sequence, Dict, Set, Any, Optional, TypeVar, Type, Callable, Iterable
+from typing import (Sequence, Dict, Set, Any, Optional, TypeVar, Type, Callable, Iterable, List,
+                    Tuple)
 
+import io
 import sys
 import os
+import zlib
 import time
+import pickle
+import hashlib
+import inspect
+import tempfile
 import numbers
 import importlib
 import abc
+import multiprocessing
+from itertools import chain
 from collections import OrderedDict
 
 from ..io import readlines_iter, write_file, fix_string
 from .search import BinaryIterator
+from .hashkey import get_key
+from .profiler import GenerationProfiler
+
+# (key, generator class, parameters, serialized state, store information) of a master.
+SerialInfo = Tuple[Any, Any, Dict[str, Any], Optional[bytes], Optional[Tuple[str, str]]]
+
+# master attributes kept in memory when a master is evicted by MasterDB.
+_EVICT_KEEP_ATTRS = frozenset(('_master_db', '_lib_name', '_used_names', '_cell_name', '_key',
+                               '_prelim_key', 'params', 'children', '_finalized'))
 
 
 def _get_unique_name(basename, *args):
@@ -160,6 +178,367 @@ class ClassImporter(object):
         return getattr(cell_package, module_cls)
 
 
+class MasterStore(object):
+    """A persistent, content-addressed store of finalized design masters.
+
+    Each entry is keyed by a digest of the master's unique key, the source code of
+    every module in the generator class hierarchy, and an environment fingerprint
+    (technology and routing grid).  Any change to one of these produces a new digest,
+    so stale entries are never loaded; they are simply left unused on disk.
+
+    Each entry also has a dependency node, which records the generator class, the
+    digest of the serialized state, and the digests of all child masters.  Together
+    these nodes form the persisted dependency graph of all stored masters.  An entry
+    is only valid if the generator classes of all its descendants are unchanged, so
+    editing a generator invalidates every master that transitively depends on it.
+
+    The store also records the cells emitted to each library, so unchanged cells
+    do not have to be created again.
+
+    Parameters
+    ----------
+    root_dir : str
+        the store root directory.  Created if it does not exist.
+    """
+
+    def __init__(self, root_dir):
+        # type: (str) -> None
+        self._root_dir = os.path.realpath(root_dir)
+        os.makedirs(self._root_dir, exist_ok=True)
+        self._mod_fingerprints = {}  # type: Dict[str, Optional[str]]
+        self._cls_fingerprints = {}  # type: Dict[type, Optional[str]]
+        self._nodes = {}  # type: Dict[str, Optional[Dict[str, Any]]]
+        self._valid = {}  # type: Dict[str, bool]
+
+    @property
+    def root_dir(self):
+        # type: () -> str
+        """Returns the store root directory."""
+        return self._root_dir
+
+    def _get_module_fingerprint(self, mod_name):
+        # type: (str) -> Optional[str]
+        """Returns the digest of the given module's source code, or None if unavailable."""
+        if mod_name in self._mod_fingerprints:
+            return self._mod_fingerprints[mod_name]
+
+        module = sys.modules.get(mod_name, None)
+        if mod_name == 'builtins':
+            ans = ''
+        elif module is None:
+            ans = None
+        else:
+            try:
+                src = inspect.getsource(module)
+                ans = hashlib.sha1(src.encode('utf-8')).hexdigest()
+            except (TypeError, OSError):
+                ans = None
+
+        self._mod_fingerprints[mod_name] = ans
+        return ans
+
+    def get_class_fingerprint(self, gen_cls):
+        # type: (type) -> Optional[str]
+        """Returns a fingerprint of the source code of the given class hierarchy.
+
+        Parameters
+        ----------
+        gen_cls : type
+            the generator class.
+
+        Returns
+        -------
+        fingerprint : Optional[str]
+            the fingerprint.  None if the source of any class in the hierarchy
+            cannot be found, in which case masters of this class are not stored.
+        """
+        if gen_cls in self._cls_fingerprints:
+            return self._cls_fingerprints[gen_cls]
+
+        digest = hashlib.sha1()
+        ans = None
+        for cls in gen_cls.__mro__:
+            mod_fp = self._get_module_fingerprint(cls.__module__)
+            if mod_fp is None:
+                break
+            digest.update(('%s.%s:%s;' % (cls.__module__, cls.__qualname__,
+                                          mod_fp)).encode('utf-8'))
+        else:
+            ans = digest.hexdigest()
+
+        self._cls_fingerprints[gen_cls] = ans
+        return ans
+
+    def get_digest(self, master, env_fingerprint):
+        # type: (DesignMaster, str) -> Optional[str]
+        """Returns the store digest of the given master.
+
+        Parameters
+        ----------
+        master : DesignMaster
+            the non-finalized master.
+        env_fingerprint : str
+            the environment fingerprint.
+
+        Returns
+        -------
+        digest : Optional[str]
+            the digest, or None if this master cannot be stored.
+        """
+        cls_fp = self.get_class_fingerprint(master.__class__)
+        if cls_fp is None:
+            return None
+
+        digest = hashlib.sha256()
+        digest.update(repr(master.key).encode('utf-8'))
+        digest.update(cls_fp.encode('utf-8'))
+        digest.update(env_fingerprint.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _get_path(self, digest, ext='.pickle'):
+        # type: (str, str) -> str
+        return os.path.join(self._root_dir, digest[:2], digest + ext)
+
+    @staticmethod
+    def _read_file(fname):
+        # type: (str) -> Optional[bytes]
+        if not os.path.isfile(fname):
+            return None
+        with open(fname, 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def _write_file(fname, data):
+        # type: (str, bytes) -> None
+        """Write the given file atomically, so concurrent processes sharing the same
+        store never observe partially written files.
+        """
+        dir_name = os.path.dirname(fname)
+        os.makedirs(dir_name, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, fname)
+        except OSError:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+    def load(self, digest):
+        # type: (str) -> Optional[bytes]
+        """Returns the stored data with the given digest, or None if not found."""
+        return self._read_file(self._get_path(digest))
+
+    def save(self, digest, data):
+        # type: (str, bytes) -> None
+        """Save the given data under the given digest."""
+        self._write_file(self._get_path(digest), data)
+
+    def get_node(self, digest):
+        # type: (str) -> Optional[Dict[str, Any]]
+        """Returns the dependency node of the entry with the given digest, or None if not found.
+
+        Parameters
+        ----------
+        digest : str
+            the entry digest.
+
+        Returns
+        -------
+        node : Optional[Dict[str, Any]]
+            the dependency node.  Contains the generator module and class name, the class
+            fingerprint, the cell name, the serialized state digest, and a list of
+            (digest, state digest) of all child masters.
+        """
+        if digest in self._nodes:
+            return self._nodes[digest]
+
+        data = self._read_file(self._get_path(digest, ext='.dep'))
+        node = None
+        if data is not None:
+            try:
+                node = pickle.loads(data)
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                pass
+        self._nodes[digest] = node
+        return node
+
+    def save_node(self, digest, gen_cls, cell_name, data_hash, child_list):
+        # type: (str, type, str, str, Sequence[Tuple[str, str]]) -> None
+        """Save the dependency node of the entry with the given digest.
+
+        Parameters
+        ----------
+        digest : str
+            the entry digest.
+        gen_cls : type
+            the generator class.
+        cell_name : str
+            the master cell name.
+        data_hash : str
+            the digest of the serialized state.
+        child_list : Sequence[Tuple[str, str]]
+            list of (digest, state digest) of all child masters.
+        """
+        node = dict(module=gen_cls.__module__,
+                    name=gen_cls.__qualname__,
+                    cls_fp=self.get_class_fingerprint(gen_cls),
+                    cell_name=cell_name,
+                    data_hash=data_hash,
+                    children=list(child_list),
+                    )
+        self._write_file(self._get_path(digest, ext='.dep'),
+                         pickle.dumps(node, protocol=pickle.HIGHEST_PROTOCOL))
+        self._nodes[digest] = node
+        self._valid[digest] = True
+
+    def _is_class_changed(self, node):
+        # type: (Dict[str, Any]) -> bool
+        """Returns True if the generator class of the given node changed or no longer exists."""
+        try:
+            gen_cls = importlib.import_module(node['module'])
+            for attr in node['name'].split('.'):
+                gen_cls = getattr(gen_cls, attr)
+        except (ImportError, AttributeError):
+            return True
+        if not isinstance(gen_cls, type):
+            return True
+        return self.get_class_fingerprint(gen_cls) != node['cls_fp']
+
+    def is_valid(self, digest):
+        # type: (str) -> bool
+        """Returns True if the entry with the given digest is up-to-date.
+
+        An entry is up-to-date if it exists, the generator classes of it and all its
+        descendants are unchanged, and every child entry has the same state as when
+        this entry was saved.
+
+        Parameters
+        ----------
+        digest : str
+            the entry digest.
+
+        Returns
+        -------
+        valid : bool
+            True if the entry can be loaded.
+        """
+        if digest in self._valid:
+            return self._valid[digest]
+
+        # mark as invalid first to guard against cycles.
+        self._valid[digest] = False
+        node = self.get_node(digest)
+        if node is None or not os.path.isfile(self._get_path(digest)):
+            return False
+        if self._is_class_changed(node):
+            return False
+        for child_digest, child_hash in node['children']:
+            child_node = self.get_node(child_digest)
+            if child_node is None or child_node['data_hash'] != child_hash or \
+                    not self.is_valid(child_digest):
+                return False
+
+        self._valid[digest] = True
+        return True
+
+    def _get_emitted_path(self, lib_name):
+        # type: (str) -> str
+        lib_digest = hashlib.sha1(lib_name.encode('utf-8')).hexdigest()
+        return os.path.join(self._root_dir, 'emitted', lib_digest + '.pickle')
+
+    def get_emitted(self, lib_name):
+        # type: (str) -> Dict[str, str]
+        """Returns the cells emitted to the given library.
+
+        Parameters
+        ----------
+        lib_name : str
+            the library name.
+
+        Returns
+        -------
+        emit_table : Dict[str, str]
+            dictionary from cell name to the emission digest of the cell.
+        """
+        data = self._read_file(self._get_emitted_path(lib_name))
+        if data is not None:
+            try:
+                return pickle.loads(data)
+            except (pickle.UnpicklingError, EOFError, ValueError):
+                pass
+        return {}
+
+    def save_emitted(self, lib_name, emit_table):
+        # type: (str, Dict[str, str]) -> None
+        """Save the cells emitted to the given library.
+
+        Parameters
+        ----------
+        lib_name : str
+            the library name.
+        emit_table : Dict[str, str]
+            dictionary from cell name to the emission digest of the cell.
+        """
+        self._write_file(self._get_emitted_path(lib_name),
+                         pickle.dumps(emit_table, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def clear_emitted(self, lib_name):
+        # type: (str) -> None
+        """Forget the cells emitted to the given library, so all cells are emitted again.
+
+        Call this method if the library was modified or deleted outside of BAG.
+        """
+        fname = self._get_emitted_path(lib_name)
+        if os.path.isfile(fname):
+            os.remove(fname)
+
+
+class _MasterPickler(pickle.Pickler):
+    """A pickler that replaces database-owned objects with persistent IDs."""
+
+    def __init__(self, file, master_db, master):
+        # type: (Any, MasterDB, DesignMaster) -> None
+        pickle.Pickler.__init__(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._master_db = master_db
+        self._master = master
+
+    def persistent_id(self, obj):
+        if obj is self._master:
+            return 'self',
+        return self._master_db.get_store_persistent_id(obj)
+
+
+class _MasterUnpickler(pickle.Unpickler):
+    """An unpickler that resolves persistent IDs created by _MasterPickler."""
+
+    def __init__(self, file, master_db, master):
+        # type: (Any, MasterDB, DesignMaster) -> None
+        pickle.Unpickler.__init__(self, file)
+        self._master_db = master_db
+        self._master = master
+
+    def persistent_load(self, pid):
+        if pid[0] == 'self':
+            return self._master
+        return self._master_db.resolve_store_persistent_id(pid)
+
+
+# the master database, root generator list, known master keys, and generator arguments
+# shared with forked worker processes by MasterDB.new_master_list().
+_fork_state = None  # type: Optional[Tuple[MasterDB, Sequence[Any], Set[Any], Dict[str, Any]]]
+
+
+def _finalize_in_worker(idx):
+    # type: (int) -> List[SerialInfo]
+    """Finalize the root master with the given index in a forked worker process."""
+    master_db, spec_list, known_keys, kwargs = _fork_state
+    gen_cls, params = spec_list[idx]
+    master = master_db.new_master(gen_cls=gen_cls, params=params, **kwargs)
+    return master_db.serialize_hierarchy(master, known_keys)
+
+
 class DesignMaster(abc.ABC):
     """A design master instance.
 
@@ -192,7 +571,7 @@ class DesignMaster(abc.ABC):
         if params_info is None:
             # compatibility with old schematics generators
             self.params.update(params)
-            self._prelim_key = self.to_immutable_id((self._get_qualified_name(), params))
+            self._prelim_key = self.to_master_key((self._get_qualified_name(), params))
             self._key = None
         else:
             self.populate_params(params, params_info, default_params, **kwargs)
@@ -203,6 +582,16 @@ class DesignMaster(abc.ABC):
         self.children = None
         self._finalized = False
 
+    def __getattr__(self, name):
+        # type: (str) -> Any
+        # only called if an attribute is not found, which happens after the master database
+        # evicts this master from memory.  Reload the master and try again.
+        master_db = self.__dict__.get('_master_db', None)
+        if name.startswith('__') or master_db is None or not master_db.rehydrate_master(self):
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                 (self.__class__.__name__, name))
+        return getattr(self, name)
+
     def update_master_info(self):
         self._cell_name = _get_unique_name(self.get_master_basename(), self._used_names)
         self._key = self.compute_unique_key()
@@ -245,6 +634,15 @@ class DesignMaster(abc.ABC):
         else:
             raise Exception('Unrecognized value %s with type %s' % (str(val), type(val)))
 
+    @classmethod
+    def to_master_key(cls, val):
+        # type: (Any) -> bytes
+        """Returns a compact digest key of the given object for use in master lookup tables.
+
+        Values that have equal immutable IDs (see to_immutable_id()) have equal keys.
+        """
+        return get_key(val)
+
     @classmethod
     @abc.abstractmethod
     def get_params_info(cls):
@@ -366,7 +764,58 @@ class DesignMaster(abc.ABC):
         unique_id : Any
             a hashable unique ID representing the given parameters.
         """
-        return self.to_immutable_id((self._get_qualified_name(), self.params))
+        return self.to_master_key((self._get_qualified_name(), self.params))
+
+    def get_num_geometries(self):
+        # type: () -> int
+        """Returns the number of geometry objects in this master.  Used for profiling."""
+        return 0
+
+    def get_store_fingerprint(self):
+        # type: () -> str
+        """Returns a string describing master-specific environment not captured by the key.
+
+        Used to compute the persistent store digest.  Override this method if a master
+        depends on settings that are not part of its parameters.
+
+        Returns
+        -------
+        fingerprint : str
+            the environment fingerprint of this master.
+        """
+        return ''
+
+    def get_store_state(self):
+        # type: () -> Optional[Dict[str, Any]]
+        """Returns the finalized state of this master to save in the persistent store.
+
+        Returns
+        -------
+        state : Optional[Dict[str, Any]]
+            the master state.  None if this master does not support persistent storage.
+        """
+        return None
+
+    def set_store_state(self, state):
+        # type: (Dict[str, Any]) -> None
+        """Restore the finalized state of this master from the persistent store.
+
+        Subclasses that override get_store_state() must override this method too.  The
+        persistent store never saves masters whose get_store_state() returns None, so the
+        default implementation is only reached on a corrupt store entry.
+
+        Parameters
+        ----------
+        state : Dict[str, Any]
+            the master state returned by get_store_state().
+
+        Raises
+        ------
+        ValueError
+            if this master does not support persistent storage.
+        """
+        raise ValueError('%s does not support persistent storage; '
+                         'get_store_state() returns None.' % self.__class__.__name__)
 
 
 MasterType = TypeVar('MasterType', bound=DesignMaster)
@@ -388,10 +837,23 @@ class MasterDB(abc.ABC):
         generated master name prefix.
     name_suffix : str
         generated master name suffix.
+    store_dir : str
+        if not empty, the persistent master store directory.  Finalized masters are saved
+        in this directory, and unchanged masters are loaded from it instead of being
+        finalized again.
+    max_masters : int
+        maximum number of finalized masters kept in memory.  0 for no limit.  When this
+        limit is exceeded, the least recently used masters not referenced by masters being
+        finalized are evicted: their state is written to a compressed file in spill_dir,
+        and is reloaded transparently when the master is used again.
+    spill_dir : str
+        directory to create the temporary spill directory in.  If empty, use the system
+        default temporary directory.
     """
 
-    def __init__(self, lib_name, lib_defs='', name_prefix='', name_suffix=''):
-        # type: (str, str, str, str) -> None
+    def __init__(self, lib_name, lib_defs='', name_prefix='', name_suffix='', store_dir='',
+                 max_masters=0, spill_dir=''):
+        # type: (str, str, str, str, str, int, str) -> None
 
         self._lib_name = lib_name
         self._name_prefix = name_prefix
@@ -402,12 +864,28 @@ class MasterDB(abc.ABC):
         self._key_lookup = {}  # type: Dict[Any, Any]
         self._master_lookup = {}  # type: Dict[Any, DesignMaster]
         self._rename_dict = {}  # type: Dict[str, str]
+        self._store = MasterStore(store_dir) if store_dir else None  # type: Optional[MasterStore]
+        # maps master keys to the (store digest, state digest) of stored masters.
+        self._store_info = {}  # type: Dict[Any, Tuple[str, str]]
+
+        self._max_masters = max_masters
+        self._spill_dir = spill_dir
+        self._spill_tmp = None  # type: Optional[tempfile.TemporaryDirectory]
+        self._spill_files = {}  # type: Dict[Any, str]
+        # keys of finalized masters in memory, from least to most recently used.
+        self._resident = OrderedDict()  # type: Dict[Any, None]
+        # keys of masters used by each master being finalized.
+        self._pending = []  # type: List[Set[Any]]
+        self._profiler = None  # type: Optional[GenerationProfiler]
 
     def clear(self):
         """Clear all existing schematic masters."""
         self._key_lookup.clear()
         self._master_lookup.clear()
         self._rename_dict.clear()
+        self._store_info.clear()
+        self._spill_files.clear()
+        self._resident.clear()
 
     @abc.abstractmethod
     def create_master_instance(self, gen_cls, lib_name, params, used_cell_names, **kwargs):
@@ -438,15 +916,17 @@ class MasterDB(abc.ABC):
 
     @abc.abstractmethod
     def create_masters_in_db(self, lib_name, content_list, debug=False):
-        # type: (str, Sequence[Any], bool) -> None
+        # type: (str, Iterable[Any], bool) -> None
         """Create the masters in the design database.
 
         Parameters
         ----------
         lib_name : str
             library to create the designs in.
-        content_list : Sequence[Any]
-            a list of the master contents.  Must be created in this order.
+        content_list : Iterable[Any]
+            an iterable of the master contents, children before parents.  Must be created
+            in this order.  Contents are created on demand, so implementations should
+            consume them one at a time instead of collecting them in a list.
         debug : bool
             True to print debug messages
         """
@@ -487,6 +967,105 @@ class MasterDB(abc.ABC):
         # type: () -> Set[str]
         return self._used_cell_names
 
+    @property
+    def max_masters(self):
+        # type: () -> int
+        """Returns the maximum number of finalized masters kept in memory.  0 for no limit."""
+        return self._max_masters
+
+    @property
+    def num_resident_masters(self):
+        # type: () -> int
+        """Returns the number of evictable finalized masters in memory."""
+        return len(self._resident)
+
+    @property
+    def profiler(self):
+        # type: () -> Optional[GenerationProfiler]
+        """Returns the generation profiler, or None if profiling is disabled."""
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, new_val):
+        # type: (Optional[GenerationProfiler]) -> None
+        """Set the generation profiler.  Set to None to disable profiling."""
+        self._profiler = new_val
+
+    @property
+    def master_store(self):
+        # type: () -> Optional[MasterStore]
+        """Returns the persistent master store, or None if not enabled."""
+        return self._store
+
+    def supports_incremental_output(self):
+        # type: () -> bool
+        """Returns True if create_masters_in_db() can create a subset of all cells.
+
+        If True and the persistent master store is enabled, instantiate_masters() only
+        creates cells that changed since they were last created.  Override this method
+        to return False if create_masters_in_db() overwrites the whole library.
+        """
+        return True
+
+    def get_store_fingerprint(self):
+        # type: () -> str
+        """Returns a string describing the database environment, such as technology settings.
+
+        Used to compute the persistent store digest of all masters in this database.
+        """
+        return ''
+
+    def get_store_persistent_id(self, obj):
+        # type: (Any) -> Any
+        """Returns the persistent ID of objects owned by this database, or None.
+
+        Objects with persistent ID are not saved in the persistent store, but are
+        resolved by resolve_store_persistent_id() when a master is loaded.
+        """
+        if obj is self:
+            return 'db',
+        if obj is self._used_cell_names:
+            return 'used_names',
+        if isinstance(obj, DesignMaster):
+            return 'master', obj.key, obj.__class__, obj.params
+        return None
+
+    def resolve_store_persistent_id(self, pid):
+        # type: (Any) -> Any
+        """Returns the object corresponding to the given persistent ID."""
+        tag = pid[0]
+        if tag == 'db':
+            return self
+        if tag == 'used_names':
+            return self._used_cell_names
+        if tag == 'master':
+            key, gen_cls, params = pid[1:]
+            if key in self._master_lookup:
+                return self._master_lookup[key]
+            master = self.new_stored_master(gen_cls, params)
+            if master.key != key:
+                raise ValueError('Stored master key mismatch for %s' % gen_cls.__name__)
+            return master
+        raise ValueError('Unknown persistent ID: %s' % (pid,))
+
+    def new_stored_master(self, gen_cls, params):
+        # type: (Type[MasterType], Dict[str, Any]) -> MasterType
+        """Create a master referenced by a master loaded from the persistent store.
+
+        Parameters
+        ----------
+        gen_cls : Type[MasterType]
+            the generator class.
+        params : Dict[str, Any]
+            the parameter dictionary.
+
+        Returns
+        -------
+        master : MasterType
+            the finalized master.
+        """
+        return self.new_master(gen_cls=gen_cls, params=params)
+
     def format_cell_name(self, cell_name):
         # type: (str) -> str
         """Returns the formatted cell name.
@@ -606,13 +1185,15 @@ class MasterDB(abc.ABC):
             if prelim_key in self._key_lookup:
                 key = self._key_lookup[prelim_key]
                 master = self._master_lookup[key]
+                if self._profiler is not None:
+                    self._profiler.record_hit(master)
                 if debug:
                     print('master cached')
             else:
                 if debug:
                     print('finalizing master')
                 start = time.time()
-                master.finalize()
+                self._finalize_new_master(master, debug=debug)
                 end = time.time()
 
                 key = master.key
@@ -628,23 +1209,359 @@ class MasterDB(abc.ABC):
         else:
             if key in self._master_lookup:
                 master = self._master_lookup[key]
+                if self.rehydrate_master(master) and debug:
+                    print('master reloaded from spill file')
+                if self._profiler is not None:
+                    self._profiler.record_hit(master)
                 if debug:
                     print('master cached')
             else:
                 if debug:
                     print('finalizing master')
                 start = time.time()
-                master.finalize()
+                self._finalize_new_master(master, debug=debug)
                 end = time.time()
                 self.register_master(key, master)
                 if debug:
                     print('finalizing master took %.4g seconds' % (end - start))
 
+        if self._max_masters > 0:
+            if self._pending:
+                # the master being finalized uses this master, so do not evict it.
+                self._pending[-1].add(key)
+            if key in self._resident:
+                self._resident.move_to_end(key)
+            self._evict_masters()
+
         return master
 
+    def _finalize_new_master(self, master, debug=False):
+        # type: (DesignMaster, bool) -> None
+        """Finalize a master created by new_master().
+
+        Keeps track of masters being finalized, and records profiling statistics.
+        """
+        profiler = self._profiler
+        use_store = master.key is not None
+        self._pending.append(set())
+        if profiler is not None:
+            profiler.start_master(master)
+        try:
+            if use_store:
+                self._finalize_master(master, debug=debug)
+            else:
+                master.finalize()
+        finally:
+            self._pending.pop()
+            if profiler is not None:
+                profiler.stop_master(master)
+
+    def _evict_masters(self):
+        # type: () -> None
+        """Evict least recently used masters until the memory limit is satisfied."""
+        max_masters = self._max_masters
+        if max_masters <= 0 or len(self._resident) <= max_masters:
+            return
+
+        pinned = set()  # type: Set[Any]
+        for key_set in self._pending:
+            pinned.update(key_set)
+        for key in list(self._resident.keys()):
+            if len(self._resident) <= max_masters:
+                break
+            if key not in pinned:
+                self._evict_master(key)
+
+    def _evict_master(self, key):
+        # type: (Any) -> None
+        """Write the state of the given master to disk, and remove it from memory.
+
+        The master object itself is kept as a stub, so references to it remain valid.
+        Masters are immutable once finalized, so the spill file is reused if the master
+        is evicted again.
+        """
+        master = self._master_lookup[key]
+        del self._resident[key]
+        if key not in self._spill_files:
+            data = self._dump_master_state(master)
+            if data is None:
+                # this master cannot be serialized, so it stays in memory.
+                return
+            if self._spill_tmp is None:
+                self._spill_tmp = tempfile.TemporaryDirectory(prefix='bag_spill_',
+                                                              dir=self._spill_dir or None)
+            fd, fname = tempfile.mkstemp(dir=self._spill_tmp.name, suffix='.pickle')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(data, 1))
+            self._spill_files[key] = fname
+
+        master_dict = master.__dict__
+        for attr in list(master_dict.keys()):
+            if attr not in _EVICT_KEEP_ATTRS:
+                del master_dict[attr]
+
+    def rehydrate_master(self, master):
+        # type: (DesignMaster) -> bool
+        """Reload the given master if it was evicted from memory.
+
+        Parameters
+        ----------
+        master : DesignMaster
+            the master.
+
+        Returns
+        -------
+        reloaded : bool
+            True if the master was evicted and is now reloaded.
+        """
+        key = master.__dict__.get('_key', None)
+        if key in self._resident or key not in self._spill_files or \
+                self._master_lookup.get(key, None) is not master:
+            return False
+
+        with open(self._spill_files[key], 'rb') as f:
+            data = zlib.decompress(f.read())
+        # child masters are stubs or in memory, so loading does not create new masters.
+        state = _MasterUnpickler(io.BytesIO(data), self, master).load()
+        master.set_store_state(state)
+        self._resident[key] = None
+        return True
+
+    def _dump_master_state(self, master, debug=False):
+        # type: (DesignMaster, bool) -> Optional[bytes]
+        """Serialize the state of the given finalized master.
+
+        Parameters
+        ----------
+        master : DesignMaster
+            the finalized master.
+        debug : bool
+            True to print debug messages.
+
+        Returns
+        -------
+        data : Optional[bytes]
+            the serialized state, or None if this master cannot be serialized.
+        """
+        self.rehydrate_master(master)
+        state = master.get_store_state()
+        if state is None:
+            return None
+        buf = io.BytesIO()
+        try:
+            _MasterPickler(buf, self, master).dump(state)
+        except (pickle.PicklingError, TypeError, AttributeError) as ex:
+            if debug:
+                print('cannot serialize master %s: %s' % (master.cell_name, ex))
+            return None
+        return buf.getvalue()
+
+    def _load_master_state(self, master, data, cell_name=''):
+        # type: (DesignMaster, bytes, str) -> None
+        """Restore the given non-finalized master from serialized state.
+
+        Child masters referenced by the state are looked up in this database, and are
+        created if they do not exist yet.
+
+        Parameters
+        ----------
+        master : DesignMaster
+            the non-finalized master.
+        data : bytes
+            the serialized state returned by _dump_master_state().
+        cell_name : str
+            the preferred cell name.  Used if it is not taken yet.
+        """
+        state = _MasterUnpickler(io.BytesIO(data), self, master).load()
+        # children are created while loading, so check cell names afterwards.
+        if cell_name and cell_name not in self._used_cell_names:
+            master._cell_name = cell_name
+        elif master.cell_name in self._used_cell_names:
+            master._cell_name = _get_unique_name(master.get_master_basename(),
+                                                 self._used_cell_names)
+        master.set_store_state(state)
+
+    @staticmethod
+    def _get_data_hash(data):
+        # type: (bytes) -> str
+        return hashlib.sha256(data).hexdigest()
+
+    def _finalize_master(self, master, debug=False):
+        # type: (DesignMaster, bool) -> None
+        """Finalize the given master, using the persistent store if enabled.
+
+        Parameters
+        ----------
+        master : DesignMaster
+            the master to finalize.
+        debug : bool
+            True to print debug messages.
+        """
+        store = self._store
+        if store is None:
+            master.finalize()
+            return
+
+        env_fp = self.get_store_fingerprint() + master.get_store_fingerprint()
+        digest = store.get_digest(master, env_fp)
+        if digest is not None and store.is_valid(digest):
+            data = store.load(digest)
+            # check state digest in case the entry was modified after the node was saved.
+            if data is not None:
+                data_hash = self._get_data_hash(data)
+                node = store.get_node(digest)
+                if data_hash == node['data_hash']:
+                    try:
+                        # reuse the stored cell name, so unchanged cells keep their names.
+                        self._load_master_state(master, data, cell_name=node['cell_name'])
+                        self._store_info[master.key] = (digest, data_hash)
+                        if debug:
+                            print('master loaded from store')
+                        return
+                    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+                            ValueError) as ex:
+                        if debug:
+                            print('cannot load master from store: %s' % ex)
+        elif debug and digest is not None:
+            print('master not in store or out of date')
+
+        master.finalize()
+
+        if digest is not None:
+            # a master can only be validated if all its children are stored.
+            child_list = [self._store_info.get(child_key, None)
+                          for child_key in sorted(master.children, key=repr)]
+            if None not in child_list:
+                data = self._dump_master_state(master, debug=debug)
+                if data is not None:
+                    data_hash = self._get_data_hash(data)
+                    store.save(digest, data)
+                    store.save_node(digest, master.__class__, master.cell_name, data_hash,
+                                    child_list)
+                    self._store_info[master.key] = (digest, data_hash)
+
+    def serialize_hierarchy(self, master, known_keys):
+        # type: (DesignMaster, Set[Any]) -> List[SerialInfo]
+        """Serialize all masters in the given master's hierarchy.
+
+        Parameters
+        ----------
+        master : DesignMaster
+            the finalized top level master.
+        known_keys : Set[Any]
+            keys of masters to skip.
+
+        Returns
+        -------
+        info_list : List[SerialInfo]
+            list of (key, generator class, parameters, serialized state, store information)
+            of each master, with children before parents.  The state is None if the master
+            cannot be serialized.  The store information is the (store digest, state digest)
+            tuple, or None if the master is not in the persistent store.
+        """
+        order = []  # type: List[DesignMaster]
+        self._serialize_hierarchy_helper(master, known_keys, set(), order)
+        return [(m.key, m.__class__, m.params, self._dump_master_state(m),
+                 self._store_info.get(m.key, None)) for m in order]
+
+    def _serialize_hierarchy_helper(self, master, known_keys, visited, order):
+        # type: (DesignMaster, Set[Any], Set[Any], List[DesignMaster]) -> None
+        visited.add(master.key)
+        # sort children so the order does not depend on set iteration order.
+        for child_key in sorted(master.children, key=repr):
+            if child_key not in visited and child_key not in known_keys:
+                self._serialize_hierarchy_helper(self._master_lookup[child_key], known_keys,
+                                                 visited, order)
+        if master.key not in known_keys:
+            order.append(master)
+
+    def merge_hierarchy(self, info_list, **kwargs):
+        # type: (Sequence[SerialInfo], **Any) -> None
+        """Add masters serialized by serialize_hierarchy() to this database.
+
+        Cell names are assigned in the given order, so the result does not depend on
+        which process finalized each master.
+
+        Parameters
+        ----------
+        info_list : Sequence[SerialInfo]
+            the serialized masters, children before parents.
+        **kwargs : Any
+            optional arguments for the generators.
+        """
+        for key, gen_cls, params, data, store_info in info_list:
+            if key in self._master_lookup:
+                continue
+            if data is None:
+                # cannot serialize this master, finalize it here instead.
+                self.new_master(gen_cls=gen_cls, params=params, **kwargs)
+            else:
+                master = self.create_master_instance(gen_cls, self._lib_name, params,
+                                                     self._used_cell_names, **kwargs)
+                if master.key != key:
+                    raise ValueError('Serialized master key mismatch for %s' % gen_cls.__name__)
+                self._load_master_state(master, data)
+                self.register_master(key, master)
+                if store_info is not None:
+                    self._store_info[key] = store_info
+                self._evict_masters()
+
+    def new_master_list(self,  # type: MasterDB
+                        spec_list,  # type: Sequence[Tuple[Type[MasterType], Dict[str, Any]]]
+                        num_workers=0,  # type: int
+                        debug=False,  # type: bool
+                        **kwargs):
+        # type: (...) -> List[MasterType]
+        """Create a list of generator instances, finalizing them in parallel.
+
+        Each root master is finalized in a worker process, together with all masters in
+        its hierarchy that do not exist in this database yet.  The finalized masters are
+        merged back in the order of spec_list, so cell names are deterministic.  If
+        num_workers is less than 2 or the fork start method is not available, masters
+        are finalized serially.
+
+        Parameters
+        ----------
+        spec_list : Sequence[Tuple[Type[MasterType], Dict[str, Any]]]
+            list of (generator class, parameters) tuples.
+        num_workers : int
+            number of worker processes.
+        debug : bool
+            True to print debug messages.
+        **kwargs :
+            optional arguments for generator.
+
+        Returns
+        -------
+        master_list : List[MasterType]
+            list of generator instances.
+        """
+        global _fork_state
+
+        if num_workers >= 2 and len(spec_list) >= 2 and \
+                'fork' in multiprocessing.get_all_start_methods():
+            if debug:
+                print('finalizing %d masters with %d workers' % (len(spec_list), num_workers))
+            start = time.time()
+            _fork_state = (self, spec_list, set(self._master_lookup.keys()), kwargs)
+            try:
+                with multiprocessing.get_context('fork').Pool(processes=num_workers) as pool:
+                    for info_list in pool.imap(_finalize_in_worker, range(len(spec_list))):
+                        self.merge_hierarchy(info_list, **kwargs)
+            finally:
+                _fork_state = None
+            end = time.time()
+            if debug:
+                print('parallel finalization took %.4g seconds' % (end - start))
+
+        return [self.new_master(gen_cls=gen_cls, params=params, debug=debug, **kwargs)
+                for gen_cls, params in spec_list]
+
     def register_master(self, key, master):
         self._master_lookup[key] = master
         self._used_cell_names.add(master.cell_name)
+        if self._max_masters > 0 and key == master.key:
+            self._resident[key] = None
 
     def instantiate_masters(self,
                             master_list,  # type: Sequence[DesignMaster]
@@ -704,7 +1621,7 @@ class MasterDB(abc.ABC):
                     reverse_rename[name2] = name
 
         if debug:
-            print('Retrieving master contents')
+            print('Traversing master hierarchy')
 
         # use ordered dict so that children are created before parents.
         info_dict = OrderedDict()  # type: Dict[str, DesignMaster]
@@ -718,13 +1635,79 @@ class MasterDB(abc.ABC):
         if not lib_name:
             raise ValueError('master library name is not specified.')
 
-        content_list = [master.get_content(lib_name, self.format_cell_name)
-                        for master in info_dict.values()]
+        if debug:
+            print('master hierarchy traversal took %.4g seconds' % (end - start))
+
+        store = self._store
+        if store is None or not self.supports_incremental_output():
+            emit_table = None
+        else:
+            emit_table = store.get_emitted(lib_name)
+
+        # stream master contents, so only the contents being created are kept in memory.
+        content_iter = self._content_iter(info_dict.values(), lib_name, emit_table, debug=debug)
+        first_content = next(content_iter, None)
+        if first_content is not None:
+            self.create_masters_in_db(lib_name, chain((first_content,), content_iter),
+                                      debug=debug)
+        if emit_table is not None:
+            store.save_emitted(lib_name, emit_table)
+
+    def _content_iter(self, master_iter, lib_name, emit_table, debug=False):
+        # type: (Iterable[DesignMaster], str, Optional[Dict[str, str]], bool) -> Iterable[Any]
+        """Yields the contents of the given masters, one master at a time.
+
+        Parameters
+        ----------
+        master_iter : Iterable[DesignMaster]
+            the masters to create, children before parents.
+        lib_name : str
+            the library to create the masters in.
+        emit_table : Optional[Dict[str, str]]
+            if given, the cells emitted to the library.  Only masters that changed since
+            they were last emitted are yielded, and this table is updated accordingly.
+        debug : bool
+            True to print debug messages.
+
+        Yields
+        ------
+        content : Any
+            the master content.
+        """
+        num_tot = num_emit = 0
+        for master in master_iter:
+            num_tot += 1
+            if emit_table is not None:
+                cell_name = self.format_cell_name(master.cell_name)
+                emit_hash = self._get_emit_hash(master, lib_name)
+                if emit_hash is None:
+                    emit_table.pop(cell_name, None)
+                elif emit_table.get(cell_name, None) == emit_hash:
+                    continue
+                else:
+                    emit_table[cell_name] = emit_hash
+            num_emit += 1
+            yield master.get_content(lib_name, self.format_cell_name)
+            # evict masters reloaded to get their contents.
+            self._evict_masters()
 
         if debug:
-            print('master content retrieval took %.4g seconds' % (end - start))
+            print('%d of %d cells emitted' % (num_emit, num_tot))
+
+    def _get_emit_hash(self, master, lib_name):
+        # type: (DesignMaster, str) -> Optional[str]
+        """Returns the emission digest of the given master, or None if it is not stored.
 
-        self.create_masters_in_db(lib_name, content_list, debug=debug)
+        The emission digest changes if the master state, the cell name, or the names of
+        the child cells change.
+        """
+        store_info = self._store_info.get(master.key, None)
+        if store_info is None:
+            return None
+        child_names = [self.format_cell_name(self._master_lookup[child_key].cell_name)
+                       for child_key in sorted(master.children, key=repr)]
+        emit_info = (store_info, lib_name, self.format_cell_name(master.cell_name), child_names)
+        return hashlib.sha256(repr(emit_info).encode('utf-8')).hexdigest()
 
     def _instantiate_master_helper(self, info_dict, master):
         # type: (Dict[str, DesignMaster], DesignMaster) -> None
@@ -737,8 +1720,9 @@ class MasterDB(abc.ABC):
         master : DesignMaster
             the master object to create.
         """
-        # get template master for all children
-        for master_key in master.children:
+        # get template master for all children.  Sort keys so the order does not depend on
+        # set iteration order.
+        for master_key in sorted(master.children, key=repr):
             child_temp = self._master_lookup[master_key]
             if child_temp.cell_name not in info_dict:
                 self._instantiate_master_helper(info_dict, child_temp)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""This module computes compact digest keys used to identify design masters.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import hashlib
+import numbers
+
+from ..io import fix_string
+
+# containers with at least this many elements are encoded as the digest of their content.
+_SUB_DIGEST_MIN_SIZE = 32
+
+
+class KeyEncoder(object):
+    """Computes compact, fixed-size digest keys of parameter values.
+
+    The key of a value is the 16-byte BLAKE2b digest of its canonical encoding.  Two values
+    that were considered equal by tuple keys (lists and tuples with equal elements, dictionaries
+    with equal items, and numbers with equal values) have the same key.
+
+    Large containers are encoded as the digest of their content, so repeated sub-structures
+    are only encoded once per key.  The content digest of large hashable tuples is interned
+    across calls.
+
+    Parameters
+    ----------
+    max_intern : int
+        maximum number of interned tuple digests.  The table is cleared when full.
+    """
+
+    def __init__(self, max_intern=4096):
+        # type: (int) -> None
+        self._max_intern = max_intern
+        self._intern = {}  # type: Dict[tuple, str]
+
+    def clear(self):
+        # type: () -> None
+        """Clear the interned digest table."""
+        self._intern.clear()
+
+    def get_key(self, val):
+        # type: (Any) -> bytes
+        """Returns the digest key of the given value.
+
+        Parameters
+        ----------
+        val : Any
+            the value.  Can be None, a number, a string, a list/tuple/set/dict of these, or
+            an object with the get_immutable_key() method.
+
+        Returns
+        -------
+        key : bytes
+            the 16-byte digest key.
+        """
+        parts = []  # type: List[str]
+        self._encode(val, parts, {})
+        return hashlib.blake2b(''.join(parts).encode('utf-8'), digest_size=16).digest()
+
+    def _encode(self, val, parts, memo):
+        # type: (Any, List[str], Dict[int, Tuple[Any, str]]) -> None
+        val_type = type(val)
+        # check common types first
+        if val_type is str:
+            parts.append('s%d:%s' % (len(val), val))
+        elif val_type is int or val_type is bool:
+            parts.append('i%d' % val)
+        elif val is None:
+            parts.append('N')
+        elif val_type is float:
+            parts.append(self._encode_float(val))
+        elif val_type is tuple or val_type is list or val_type is dict:
+            if len(val) >= _SUB_DIGEST_MIN_SIZE:
+                parts.append(self._get_sub_digest(val, memo))
+            else:
+                self._encode_container(val, parts, memo)
+        elif isinstance(val, bytes):
+            self._encode(fix_string(val), parts, memo)
+        elif isinstance(val, (set, frozenset)):
+            parts.append('<')
+            for item in sorted(val):
+                self._encode(item, parts, memo)
+            parts.append('>')
+        elif isinstance(val, numbers.Integral):
+            parts.append('i%d' % int(val))
+        elif isinstance(val, numbers.Real):
+            parts.append(self._encode_float(float(val)))
+        elif isinstance(val, numbers.Number):
+            parts.append('c%r' % val)
+        elif isinstance(val, (list, tuple, dict)):
+            self._encode_container(val, parts, memo)
+        elif hasattr(val, 'get_immutable_key') and callable(val.get_immutable_key):
+            self._encode(val.get_immutable_key(), parts, memo)
+        else:
+            raise Exception('Unrecognized value %s with type %s' % (str(val), type(val)))
+
+    @staticmethod
+    def _encode_float(val):
+        # type: (float) -> str
+        # integral floats compare equal to integers, so they must have the same encoding.
+        if val.is_integer():
+            return 'i%d' % int(val)
+        return 'f%r' % val
+
+    def _encode_container(self, val, parts, memo):
+        # type: (Any, List[str], Dict[int, Tuple[Any, str]]) -> None
+        # strings and integers are encoded inline to avoid function call overhead.
+        encode = self._encode
+        append = parts.append
+        if isinstance(val, dict):
+            append('{')
+            for key in sorted(val):
+                if type(key) is str:
+                    append('s%d:%s' % (len(key), key))
+                else:
+                    encode(key, parts, memo)
+                item = val[key]
+                item_type = type(item)
+                if item_type is str:
+                    append('s%d:%s' % (len(item), item))
+                elif item_type is int:
+                    append('i%d' % item)
+                else:
+                    encode(item, parts, memo)
+            append('}')
+        else:
+            append('(')
+            for item in val:
+                item_type = type(item)
+                if item_type is int:
+                    append('i%d' % item)
+                elif item_type is str:
+                    append('s%d:%s' % (len(item), item))
+                else:
+                    encode(item, parts, memo)
+            append(')')
+
+    def _get_sub_digest(self, val, memo):
+        # type: (Any, Dict[int, Tuple[Any, str]]) -> str
+        # memo keeps every object alive, so temporaries such as get_immutable_key() results
+        # cannot be freed and have their IDs reused during this get_key() call.
+        obj_id = id(val)
+        entry = memo.get(obj_id, None)
+        if entry is not None and entry[0] is val:
+            return entry[1]
+        token = None
+
+        hashable = type(val) is tuple
+        if hashable:
+            try:
+                token = self._intern.get(val, None)
+            except TypeError:
+                hashable = False
+
+        if token is None:
+            sub_parts = []  # type: List[str]
+            self._encode_container(val, sub_parts, memo)
+            token = 'h%s' % hashlib.blake2b(''.join(sub_parts).encode('utf-8'),
+                                            digest_size=16).hexdigest()
+            if hashable:
+                if len(self._intern) >= self._max_intern:
+                    self._intern.clear()
+                self._intern[val] = token
+
+        memo[obj_id] = (val, token)
+        return token
+
+
+_default_encoder = KeyEncoder()
+
+
+def get_key(val):
+    # type: (Any) -> bytes
+    """Returns the digest key of the given value, using the default KeyEncoder.
+
+    Parameters
+    ----------
+    val : Any
+        the value.
+
+    Returns
+    -------
+    key : bytes
+        the 16-byte digest key.
+    """
+    return _default_encoder.get_key(val)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""This module defines a profiler that records design master generation statistics.
+"""
+
+from typing import TYPE_CHECKING, Dict, List, Tuple, Any, Callable
+
+import time
+from collections import Counter
+
+if TYPE_CHECKING:
+    from .cache import DesignMaster
+
+
+class MasterStats(object):
+    """Generation statistics of a design master, or of all masters of a generator class.
+
+    Parameters
+    ----------
+    name : str
+        the generator class name.
+    cell_name : str
+        the master cell name.  Empty for generator class statistics.
+    """
+
+    def __init__(self, name, cell_name=''):
+        # type: (str, str) -> None
+        self.name = name
+        self.cell_name = cell_name
+        self.num_masters = 0
+        self.hits = 0
+        self.misses = 0
+        self.self_time = 0.0
+        self.cum_time = 0.0
+        self.num_geometries = 0
+
+
+class GenerationProfiler(object):
+    """Records the finalize time of design masters created by a MasterDB.
+
+    For each generator class and each master, this class records the self and cumulative
+    finalize time, the number of cache hits and misses, and the number of geometry objects
+    produced.  Self time excludes time spent finalizing child masters.
+
+    Assign an instance to MasterDB.profiler to enable profiling.
+
+    Parameters
+    ----------
+    timer : Callable[[], float]
+        the timer function.
+    """
+
+    def __init__(self, timer=time.perf_counter):
+        # type: (Callable[[], float]) -> None
+        self._timer = timer
+        # each entry is [class name, start time, time spent in children]
+        self._stack = []  # type: List[List[Any]]
+        self._active = Counter()  # type: Dict[str, int]
+        self._cls_stats = {}  # type: Dict[str, MasterStats]
+        self._master_stats = {}  # type: Dict[Any, MasterStats]
+        self._folded = Counter()  # type: Dict[Tuple[str, ...], float]
+
+    def clear(self):
+        # type: () -> None
+        """Clear all recorded statistics."""
+        self._stack.clear()
+        self._active.clear()
+        self._cls_stats.clear()
+        self._master_stats.clear()
+        self._folded.clear()
+
+    @property
+    def class_stats(self):
+        # type: () -> Dict[str, MasterStats]
+        """Returns a dictionary from generator class name to its statistics."""
+        return self._cls_stats
+
+    @property
+    def master_stats(self):
+        # type: () -> Dict[Any, MasterStats]
+        """Returns a dictionary from master key to its statistics."""
+        return self._master_stats
+
+    @staticmethod
+    def _get_class_name(master):
+        # type: (DesignMaster) -> str
+        cls = master.__class__
+        return '%s.%s' % (cls.__module__, cls.__name__)
+
+    def _get_stats(self, master, name):
+        # type: (DesignMaster, str) -> Tuple[MasterStats, MasterStats]
+        cls_stats = self._cls_stats.get(name, None)
+        if cls_stats is None:
+            cls_stats = self._cls_stats[name] = MasterStats(name)
+
+        key = master.key
+        if key is None:
+            key = master.prelim_key
+        master_stats = self._master_stats.get(key, None)
+        if master_stats is None:
+            master_stats = self._master_stats[key] = MasterStats(name, master.cell_name)
+            cls_stats.num_masters += 1
+        return cls_stats, master_stats
+
+    def record_hit(self, master):
+        # type: (DesignMaster) -> None
+        """Record a cache hit of the given master."""
+        cls_stats, master_stats = self._get_stats(master, self._get_class_name(master))
+        cls_stats.hits += 1
+        master_stats.hits += 1
+
+    def start_master(self, master):
+        # type: (DesignMaster) -> None
+        """Start finalizing the given master."""
+        name = self._get_class_name(master)
+        self._active[name] += 1
+        self._stack.append([name, self._timer(), 0.0])
+
+    def stop_master(self, master):
+        # type: (DesignMaster) -> None
+        """Stop finalizing the given master.
+
+        Parameters
+        ----------
+        master : DesignMaster
+            the master passed to start_master().  May be finalized.
+        """
+        stop = self._timer()
+        name, start, child_time = self._stack.pop()
+        cum_time = stop - start
+        self_time = cum_time - child_time
+        if self._stack:
+            self._stack[-1][2] += cum_time
+
+        cls_stats, master_stats = self._get_stats(master, name)
+        if master.finalized:
+            master_stats.cell_name = master.cell_name
+            num_geo = master.get_num_geometries()
+        else:
+            num_geo = 0
+        for stats in (cls_stats, master_stats):
+            stats.misses += 1
+            stats.self_time += self_time
+            stats.num_geometries += num_geo
+        master_stats.cum_time += cum_time
+        # do not count time of recursive generators twice.
+        self._active[name] -= 1
+        if self._active[name] == 0:
+            cls_stats.cum_time += cum_time
+
+        frames = tuple((frame[0] for frame in self._stack)) + (name,)
+        self._folded[frames] += self_time
+
+    def write_folded(self, fname):
+        # type: (str) -> None
+        """Write self times in folded stack format, as used by flame graph tools.
+
+        Each line contains the semicolon-separated generator class stack, followed by the
+        self time in microseconds.
+
+        Parameters
+        ----------
+        fname : str
+            the output file name.
+        """
+        with open(fname, 'w') as f:
+            for frames, self_time in sorted(self._folded.items()):
+                f.write('%s %d\n' % (';'.join(frames), int(round(self_time * 1e6))))
+
+    def get_report(self, sort_by='self_time', num_masters=20):
+        # type: (str, int) -> str
+        """Returns a text report of the recorded statistics.
+
+        Parameters
+        ----------
+        sort_by : str
+            the MasterStats attribute to sort by, in descending order.
+        num_masters : int
+            number of masters to list.  Negative to list all masters.
+
+        Returns
+        -------
+        report : str
+            the text report.
+        """
+        header = '%10s %10s %8s %8s %12s  %s' % ('self (s)', 'cum (s)', 'hits', 'misses',
+                                                 'geometries', '%s')
+        row_fmt = '%10.4f %10.4f %8d %8d %12d  %s'
+
+        def sort_key(stats):
+            return getattr(stats, sort_by)
+
+        lines = ['Generator classes, sorted by %s:' % sort_by, header % 'class']
+        for stats in sorted(self._cls_stats.values(), key=sort_key, reverse=True):
+            lines.append(row_fmt % (stats.self_time, stats.cum_time, stats.hits, stats.misses,
+                                    stats.num_geometries,
+                                    '%s (%d masters)' % (stats.name, stats.num_masters)))
+
+        master_list = sorted(self._master_stats.values(), key=sort_key, reverse=True)
+        if num_masters >= 0:
+            master_list = master_list[:num_masters]
+        lines.append('')
+        lines.append('Masters, sorted by %s:' % sort_by)
+        lines.append(header % 'cell (class)')
+        for stats in master_list:
+            lines.append(row_fmt % (stats.self_time, stats.cum_time, stats.hits, stats.misses,
+                                    stats.num_geometries,
+                                    '%s (%s)' % (stats.cell_name, stats.name)))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def write_report(self, fname, sort_by='self_time', num_masters=-1):
+        # type: (str, str, int) -> None
+        """Write the text report to the given file.
+
+        Parameters
+        ----------
+        fname : str
+            the output file name.
+        sort_by : str
+            the MasterStats attribute to sort by, in descending order.
+        num_masters : int
+            number of masters to list.  Negative to list all masters.
+        """
+        with open(fname, 'w') as f:
+            f.write(self.get_report(sort_by=sort_by, num_masters=num_masters))
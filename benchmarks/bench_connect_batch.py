@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of connecting many wires to tracks.
+
+Compares one connect_to_tracks() call per connection against a single
+connect_to_tracks_batch() call, on a data path of parallel bits.
+"""
+
+import time
+import argparse
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.routing import RoutingGrid, TrackID
+from bag.layout.template import TemplateDB, TemplateBase
+
+
+class ViaTechInfo(DummyTechInfo):
+    """A DummyTechInfo that can draw square vias."""
+
+    def get_layer_id(self, layer_name):
+        return int(layer_name[1:])
+
+    def get_layer_name(self, layer_id):
+        return 'M%d' % layer_id
+
+    def get_via_drc_info(self, vname, vtype, mtype, mw_unit, is_bot):
+        if vtype != 'square':
+            raise ValueError('only square vias are supported.')
+        return (20, 20), None, None, (20, 20), [(10, 10)], None, None
+
+
+class DataPath(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        return dict(nbits='number of bits.', batch='True to use connect_to_tracks_batch().')
+
+    def draw_layout(self):
+        conn_list = []
+        for idx in range(self.params['nbits']):
+            bot = self.add_wires(1, 2 * idx, 0, 400, unit_mode=True)
+            top = self.add_wires(3, 2 * (idx % 16), 200 * idx, 200 * idx + 400, unit_mode=True)
+            conn_list.append(([bot, top], TrackID(2, 2 * (idx % 16))))
+
+        start = time.perf_counter()
+        if self.params['batch']:
+            self.connect_to_tracks_batch(conn_list, min_len_mode=0)
+        else:
+            for wires, tid in conn_list:
+                self.connect_to_tracks(wires, tid, min_len_mode=0)
+        self.route_time = time.perf_counter() - start
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark batch track connections.')
+    parser.add_argument('-n', '--nbits', type=int, default=20000)
+    args = parser.parse_args()
+
+    grid = RoutingGrid(ViaTechInfo({}), [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    print('%d connections' % args.nbits)
+    for name, batch in (('connect_to_tracks', False), ('connect_to_tracks_batch', True)):
+        tdb = TemplateDB('', grid, 'bench_lib')
+        temp = tdb.new_template(params=dict(nbits=args.nbits, batch=batch), temp_cls=DataPath)
+        print('  %-28s %8.3f s' % (name + ':', temp.route_time))
+
+
+if __name__ == '__main__':
+    run_main()
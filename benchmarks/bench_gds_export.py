@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of GDS export on a synthetic library.
+
+Compares the native GDS and OASIS writers, serially and with worker processes, against
+building the library with gdspy as BAG did before, if gdspy is installed.  Each cell
+instantiates two previous cells, and contains plain rectangles, arrayed rectangles, via
+arrays, and a pin.
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import yaml
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.routing import RoutingGrid
+from bag.layout.template import TemplateDB
+from bag.layout.objects import InstanceInfo, ViaInfo, PinInfo
+
+try:
+    # noinspection PyPackageRequirements
+    import gdspy
+except ImportError:
+    gdspy = None
+
+LAY_MAP_YAML = """layer_map:
+  !!python/tuple [M1, drawing]: [1, 0]
+  !!python/tuple [M1, pin]: [1, 2]
+  !!python/tuple [V1, drawing]: [2, 0]
+  !!python/tuple [M2, drawing]: [3, 0]
+via_info:
+  V1: {bot_layer: !!python/tuple [M1, drawing], top_layer: !!python/tuple [M2, drawing],
+       via_layer: !!python/tuple [V1, drawing], cut_width: 0.032, cut_height: 0.032}
+"""
+
+
+def make_content(idx, res):
+    name = 'cell%d' % idx
+    inst_list = []
+    for cidx in range(max(0, idx - 2), idx):
+        inst_list.append(InstanceInfo(res, lib='lib', cell='cell%d' % cidx, view='layout',
+                                      name='X%d' % cidx, loc=[0.0, 2.0 * (idx - cidx)],
+                                      orient='R0', num_rows=1, num_cols=2, sp_rows=0.0,
+                                      sp_cols=4.0))
+    rect_list = []
+    for ridx in range(20):
+        y = 0.2 * ridx
+        rect_list.append(dict(layer=['M1', 'drawing'], bbox=[[0.0, y], [3.0, y + 0.1]]))
+    for ridx in range(4):
+        x = 0.05 * ridx
+        rect_list.append(dict(layer=['M2', 'drawing'], bbox=[[x, 0.0], [x + 0.02, 4.0]],
+                              arr_nx=40, arr_ny=1, arr_spx=0.2, arr_spy=0.0))
+    via_list = []
+    for vidx in range(4):
+        via_list.append(ViaInfo(res, id='V1', loc=[0.5 + vidx, 0.5], orient='R0', num_rows=2,
+                                num_cols=2, sp_rows=0.05, sp_cols=0.05, enc1=[0.01] * 4,
+                                enc2=[0.02, 0.02, 0.0, 0.0], arr_nx=1, arr_ny=20,
+                                arr_spx=0.0, arr_spy=0.2))
+    pin_list = [PinInfo(res, net_name='out', pin_name='out', label='out',
+                        layer=['M1', 'pin'], bbox=[[0.0, 0.0], [3.0, 0.1]], make_rect=True)]
+    return [name, inst_list, rect_list, via_list, pin_list, [], [], [], []]
+
+
+def content_iter(num_cells, res):
+    for idx in range(num_cells):
+        yield make_content(idx, res)
+
+
+def write_gdspy(fname, lib_name, contents, lay_map, via_info, res, lay_unit):
+    """Build the library with gdspy, as BAG did before the native writer."""
+    gds_lib = gdspy.GdsLibrary(name=lib_name)
+    for (cell_name, inst_list, rect_list, via_list, pin_list, _, _, _, _) in contents:
+        gds_cell = gdspy.Cell(cell_name, exclude_from_current=True)
+        for inst in inst_list:
+            gds_cell.add(gdspy.CellArray(gds_lib.cell_dict[inst.cell], inst.num_cols,
+                                         inst.num_rows, (inst.sp_cols, inst.sp_rows),
+                                         origin=inst.loc))
+        for rect in rect_list:
+            (x0, y0), (x1, y1) = rect['bbox']
+            lay_id, purp_id = lay_map[tuple(rect['layer'])]
+            nx, ny = rect.get('arr_nx', 1), rect.get('arr_ny', 1)
+            spx, spy = rect.get('arr_spx', 0), rect.get('arr_spy', 0)
+            for xidx in range(nx):
+                for yidx in range(ny):
+                    dx, dy = xidx * spx, yidx * spy
+                    gds_cell.add(gdspy.Rectangle((x0 + dx, y0 + dy), (x1 + dx, y1 + dy),
+                                                 layer=lay_id, datatype=purp_id))
+        for via in via_list:
+            info = via_info[via.id]
+            cw, ch = info['cut_width'], info['cut_height']
+            w_arr = via.num_cols * cw + (via.num_cols - 1) * via.sp_cols
+            h_arr = via.num_rows * ch + (via.num_rows - 1) * via.sp_rows
+            for xidx in range(via.arr_nx):
+                for yidx in range(via.arr_ny):
+                    x0 = via.loc[0] + xidx * via.arr_spx - w_arr / 2
+                    y0 = via.loc[1] + yidx * via.arr_spy - h_arr / 2
+                    for lay, (el, er, et, eb) in ((info['bot_layer'], via.enc1),
+                                                  (info['top_layer'], via.enc2)):
+                        lay_id, purp_id = lay_map[lay]
+                        gds_cell.add(gdspy.Rectangle((x0 - el, y0 - eb),
+                                                     (x0 + w_arr + er, y0 + h_arr + et),
+                                                     layer=lay_id, datatype=purp_id))
+                    lay_id, purp_id = lay_map[info['via_layer']]
+                    for cidx in range(via.num_cols):
+                        for ridx in range(via.num_rows):
+                            dx, dy = cidx * (cw + via.sp_cols), ridx * (ch + via.sp_rows)
+                            gds_cell.add(gdspy.Rectangle((x0 + dx, y0 + dy),
+                                                         (x0 + dx + cw, y0 + dy + ch),
+                                                         layer=lay_id, datatype=purp_id))
+        for pin in pin_list:
+            lay_id, purp_id = lay_map[pin.layer]
+            bbox = pin.bbox
+            gds_cell.add(gdspy.Rectangle((bbox.left, bbox.bottom), (bbox.right, bbox.top),
+                                         layer=lay_id, datatype=purp_id))
+            gds_cell.add(gdspy.Label(pin.label, (bbox.xc, bbox.yc), layer=lay_id,
+                                     texttype=purp_id))
+        gds_lib.add(gds_cell)
+    gds_lib.write_gds(fname, unit=lay_unit, precision=res * lay_unit)
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark GDS export.')
+    parser.add_argument('-n', '--num_cells', type=int, default=10000)
+    parser.add_argument('-w', '--num_workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    tech_info = DummyTechInfo({})
+    res = tech_info.resolution
+    grid = RoutingGrid(tech_info, [1, 2], [0.1, 0.1], [0.1, 0.1], 'x')
+    num_cells = args.num_cells
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        lay_fname = os.path.join(tmp_dir, 'gds_map.yaml')
+        with open(lay_fname, 'w') as f:
+            f.write(LAY_MAP_YAML)
+
+        print('%d cells' % num_cells)
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            for stream_fmt, ext in (('gds', 'gds'), ('oasis', 'oas')):
+                for num_workers in sorted({0, args.num_workers}):
+                    lib_name = 'native%d' % num_workers
+                    tdb = TemplateDB('', grid, lib_name, gds_lay_file=lay_fname,
+                                     gds_num_workers=num_workers, stream_fmt=stream_fmt)
+                    start = time.perf_counter()
+                    tdb.create_masters_in_db(lib_name, content_iter(num_cells, res))
+                    stop = time.perf_counter()
+                    fsize = os.path.getsize('%s.%s' % (lib_name, ext))
+                    print('  native %5s, %2d workers: %8.3f s, %8.2f MB' %
+                          (stream_fmt, num_workers, stop - start, fsize / 1e6))
+
+            if gdspy is None:
+                print('  gdspy not found, skipping gdspy export.')
+            else:
+                lay_info = yaml.load(LAY_MAP_YAML, Loader=yaml.Loader)
+                lay_map, via_info = lay_info['layer_map'], lay_info['via_info']
+                start = time.perf_counter()
+                write_gdspy('gdspy.gds', 'gdspy', content_iter(num_cells, res), lay_map,
+                            via_info, res, tech_info.layout_unit)
+                stop = time.perf_counter()
+                fsize = os.path.getsize('gdspy.gds')
+                print('  gdspy:                      %8.3f s, %8.2f MB' %
+                      (stop - start, fsize / 1e6))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the geometry primitives used during routing.
+
+Measures construction time, common operations, and memory per object of BBox, BBoxArray,
+TrackID and WireArray.
+"""
+
+import time
+import argparse
+import tracemalloc
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.util import BBox, BBoxArray
+from bag.layout.routing import RoutingGrid, TrackID, WireArray
+
+
+def timeit(name, fun, num):
+    start = time.perf_counter()
+    fun(num)
+    stop = time.perf_counter()
+    print('  %-28s %8.1f ns/op' % (name + ':', (stop - start) * 1e9 / num))
+
+
+def memory(name, fun, num):
+    tracemalloc.start()
+    obj_list = fun(num)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('  %-28s %8.1f bytes/object' % (name + ':', size / len(obj_list)))
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark geometry primitives.')
+    parser.add_argument('-n', '--num', type=int, default=200000)
+    args = parser.parse_args()
+    num = args.num
+
+    tech_info = DummyTechInfo({})
+    res = tech_info.resolution
+    grid = RoutingGrid(tech_info, [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    box = BBox(0, 0, 100, 200, res, unit_mode=True)
+    box2 = BBox(50, -50, 300, 100, res, unit_mode=True)
+    tid = TrackID(1, 3, width=1, num=4, pitch=2)
+    warr = WireArray(tid, 0, 1000, res=res, unit_mode=True)
+
+    def make_boxes(n):
+        return [BBox(idx, 0, idx + 100, 200, res, unit_mode=True) for idx in range(n)]
+
+    def make_box_arrays(n):
+        return [BBoxArray(box, nx=2, spx=idx, unit_mode=True) for idx in range(n)]
+
+    def make_track_ids(n):
+        return [TrackID(1, idx, num=2, pitch=1) for idx in range(n)]
+
+    def make_wire_arrays(n):
+        return [WireArray(tid, idx, idx + 100, res=res, unit_mode=True) for idx in range(n)]
+
+    def transform_boxes(n):
+        for _ in range(n):
+            box.transform((10, 20), 'MX', unit_mode=True)
+
+    def merge_boxes(n):
+        for _ in range(n):
+            box.merge(box2)
+
+    def hash_boxes(n):
+        for _ in range(n):
+            hash(box)
+
+    def get_bbox_arrays(n):
+        for _ in range(n):
+            warr.get_bbox_array(grid)
+
+    def iter_wire_arrays(n):
+        for _ in range(n // 4):
+            for _ in warr.wire_arr_iter(grid):
+                pass
+
+    print('time')
+    timeit('BBox()', make_boxes, num)
+    timeit('BBox.transform()', transform_boxes, num)
+    timeit('BBox.merge()', merge_boxes, num)
+    timeit('hash(BBox)', hash_boxes, num)
+    timeit('BBoxArray()', make_box_arrays, num)
+    timeit('TrackID()', make_track_ids, num)
+    timeit('WireArray()', make_wire_arrays, num)
+    timeit('WireArray.get_bbox_array()', get_bbox_arrays, num)
+    timeit('WireArray.wire_arr_iter()', iter_wire_arrays, num)
+    print('memory')
+    memory('BBox', make_boxes, num)
+    memory('BBoxArray', make_box_arrays, num)
+    memory('TrackID', make_track_ids, num)
+    memory('WireArray', make_wire_arrays, num)
+
+
+if __name__ == '__main__':
+    run_main()
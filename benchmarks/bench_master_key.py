@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of master key computation: nested tuple keys versus digest keys.
+
+Simulates cache-hit lookups in MasterDB with parameter dictionaries containing large
+nested per-finger configurations.
+"""
+
+import time
+import argparse
+
+from bag.util.cache import DesignMaster
+from bag.util.hashkey import KeyEncoder
+
+
+def make_params(num_fingers, seg, frozen):
+    # finger configurations are shared by all parameter sets, as when passed down a hierarchy.
+    if frozen:
+        finger_list = tuple((('w', 4), ('l', 16e-9), ('dum', (1, 0, 2)), ('flip', idx % 2 == 0),
+                             ('taps', tuple(range(8))))
+                            for idx in range(num_fingers))
+    else:
+        finger_list = [dict(w=4, l=16e-9, dum=[1, 0, 2], flip=(idx % 2 == 0),
+                            taps=list(range(8)))
+                       for idx in range(num_fingers)]
+    return dict(lch=16e-9, ptap_w=6, ntap_w=6, seg=seg, fingers=finger_list,
+                tr_widths=dict(sig=1, clk=2, sup=3), show_pins=True)
+
+
+def run_bench(fun, params_list, num_iter):
+    table = {fun(params): idx for idx, params in enumerate(params_list)}
+    start = time.perf_counter()
+    for _ in range(num_iter):
+        for params in params_list:
+            # every lookup is a cache hit, as in new_master() of existing masters.
+            _ = table[fun(params)]
+    stop = time.perf_counter()
+    return (stop - start) / (num_iter * len(params_list))
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark master key computation.')
+    parser.add_argument('-n', '--num_fingers', type=int, default=64)
+    parser.add_argument('-p', '--num_params', type=int, default=50)
+    parser.add_argument('-i', '--num_iter', type=int, default=20)
+    args = parser.parse_args()
+
+    name = 'bench.Template'
+
+    def tuple_key(params):
+        return DesignMaster.to_immutable_id((name, params))
+
+    encoder = KeyEncoder()
+
+    def digest_key(params):
+        return encoder.get_key((name, params))
+
+    print('%d fingers, %d parameter sets' % (args.num_fingers, args.num_params))
+    for frozen in (False, True):
+        params_list = [make_params(args.num_fingers, seg, frozen)
+                       for seg in range(args.num_params)]
+        t_tuple = run_bench(tuple_key, params_list, args.num_iter)
+        t_digest = run_bench(digest_key, params_list, args.num_iter)
+        print('%s finger configurations:' % ('tuple' if frozen else 'list'))
+        print('  tuple key lookup:  %8.2f us' % (t_tuple * 1e6))
+        print('  digest key lookup: %8.2f us' % (t_digest * 1e6))
+        print('  speedup: %.2fx' % (t_tuple / t_digest))
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the maze router.
+
+Generates random two pin nets with short pins on the bottom layer of a block, with random
+blockages on the routing layers, and routes them in order with MazeRouter.
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.util import BBox
+from bag.layout.routing import RoutingGrid, MazeRouter
+from bag.layout.template import TemplateDB, TemplateBase
+
+
+class ViaTechInfo(DummyTechInfo):
+    """A DummyTechInfo that can draw square vias."""
+
+    def get_layer_id(self, layer_name):
+        return int(layer_name[1:])
+
+    def get_layer_name(self, layer_id):
+        return 'M%d' % layer_id
+
+    def get_via_drc_info(self, vname, vtype, mtype, mw_unit, is_bot):
+        if vtype != 'square':
+            raise ValueError('only square vias are supported.')
+        return (20, 20), None, None, (20, 20), [(10, 10)], None, None
+
+
+def make_nets(num_nets, ntr, max_dist, seed):
+    """Returns random pins and blockages, as (layer_id, track_idx, lower, upper) tuples.
+
+    Pins are 2 tracks long, in slots of 5 tracks on every other bottom layer track, and
+    the destination pin is within max_dist slots of the source pin.
+    """
+    rng = np.random.RandomState(seed)
+    nslot = ntr // 5
+    nrow = ntr // 2
+    used = set()
+
+    def new_slot(row0=None, slot0=None):
+        while True:
+            if row0 is None:
+                row, slot = rng.randint(nrow), rng.randint(nslot)
+            else:
+                row = min(max(row0 + rng.randint(-max_dist, max_dist + 1), 0), nrow - 1)
+                slot = min(max(slot0 + rng.randint(-max_dist, max_dist + 1), 0), nslot - 1)
+            if (row, slot) not in used:
+                used.add((row, slot))
+                return row, slot
+
+    net_list = []
+    for _ in range(num_nets):
+        src = new_slot()
+        dst = new_slot(*src)
+        net_list.append(tuple((1, 2 * row, 1000 * slot + 200, 1000 * slot + 600)
+                              for row, slot in (src, dst)))
+
+    # blockages are segments on the layers above
+    blk_list = []
+    for layer_id in (2, 3, 4):
+        for _ in range(ntr // 4):
+            lower = 200 * rng.randint(ntr)
+            blk_list.append((layer_id, rng.randint(ntr), lower,
+                             lower + 200 * rng.randint(2, ntr // 8)))
+    return net_list, blk_list
+
+
+class RouteBlock(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        return dict(ntr='number of tracks per side.', net_list='list of pins.',
+                    blk_list='list of blockages.', top_layer='the top routing layer.')
+
+    def draw_layout(self):
+        top_layer = self.params['top_layer']
+        size = 200 * self.params['ntr']
+        self.set_size_from_bound_box(top_layer, BBox(0, 0, size, size, self.grid.resolution,
+                                                     unit_mode=True))
+        for args in self.params['blk_list']:
+            self.add_wires(*args, unit_mode=True)
+        pin_list = [tuple(self.add_wires(*args, unit_mode=True) for args in pins)
+                    for pins in self.params['net_list']]
+
+        start = time.perf_counter()
+        router = MazeRouter(self, 1, top_layer)
+        self.setup_time = time.perf_counter() - start
+        start = time.perf_counter()
+        self.route_list = router.route_nets(pin_list)
+        self.route_time = time.perf_counter() - start
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark the maze router.')
+    parser.add_argument('-n', '--num_nets', type=int, default=300)
+    parser.add_argument('-t', '--ntr', type=int, default=200)
+    parser.add_argument('-d', '--max_dist', type=int, default=8)
+    parser.add_argument('-l', '--top_layer', type=int, default=4)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tech_info = ViaTechInfo({})
+    layers = list(range(1, args.top_layer + 1))
+    grid = RoutingGrid(tech_info, layers, [0.1] * len(layers), [0.1] * len(layers), 'x')
+    tdb = TemplateDB('', grid, 'bench_lib')
+    net_list, blk_list = make_nets(args.num_nets, args.ntr, args.max_dist, args.seed)
+    params = dict(ntr=args.ntr, net_list=net_list, blk_list=blk_list,
+                  top_layer=args.top_layer)
+    temp = tdb.new_template(params=params, temp_cls=RouteBlock)
+
+    routes = [warr_list for warr_list in temp.route_list if warr_list is not None]
+    num_vias = sum(len(warr_list) - 1 for warr_list in routes)
+    length = sum(warr.upper_unit - warr.lower_unit for warr_list in routes
+                 for warr in warr_list)
+    print('%d x %d tracks, layers 1-%d, %d nets, %d blockages' %
+          (args.ntr, args.ntr, args.top_layer, len(net_list), len(blk_list)))
+    print('  routed:         %d / %d' % (len(routes), len(net_list)))
+    print('  wire length:    %d' % length)
+    print('  vias:           %d' % num_vias)
+    print('  router setup:   %8.3f s' % temp.setup_time)
+    print('  routing:        %8.3f s' % temp.route_time)
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of draw_vias_on_intersections() on a power mesh.
+
+Compares drawing one via per intersection, as draw_vias_on_intersections() did before,
+against the vectorized version, which draws one via array per lattice of intersections.
+"""
+
+import time
+import argparse
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.util import BBox
+from bag.layout.routing import RoutingGrid
+from bag.layout.template import TemplateDB, TemplateBase
+
+
+class ViaTechInfo(DummyTechInfo):
+    """A DummyTechInfo that can draw square vias."""
+
+    def get_layer_id(self, layer_name):
+        return int(layer_name[1:])
+
+    def get_layer_name(self, layer_id):
+        return 'M%d' % layer_id
+
+    def get_via_drc_info(self, vname, vtype, mtype, mw_unit, is_bot):
+        if vtype != 'square':
+            raise ValueError('only square vias are supported.')
+        return (20, 20), None, None, (20, 20), [(10, 10)], None, None
+
+
+class PowerMesh(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        return dict(num='number of wire arrays per layer.', ntr='tracks per wire array.',
+                    vectorized='True to use draw_vias_on_intersections().')
+
+    def draw_layout(self):
+        num = self.params['num']
+        ntr = self.params['ntr']
+        length = 200 * 2 * ntr * num
+        bot_warrs = [self.add_wires(1, 2 * ntr * idx, 0, length, width=1, num=ntr, pitch=2,
+                                    unit_mode=True) for idx in range(num)]
+        top_warrs = [self.add_wires(2, 2 * ntr * idx, 0, length, width=1, num=ntr, pitch=2,
+                                    unit_mode=True) for idx in range(num)]
+
+        start = time.perf_counter()
+        if self.params['vectorized']:
+            self.draw_vias_on_intersections(bot_warrs, top_warrs)
+        else:
+            self.draw_vias_per_intersection(bot_warrs, top_warrs)
+        self.via_time = time.perf_counter() - start
+        self.num_vias = sum(via.nx * via.ny for via in self._layout._via_list)
+        self.num_objects = len(self._layout._via_list)
+
+    def draw_vias_per_intersection(self, bot_warr_list, top_warr_list):
+        """The loop draw_vias_on_intersections() used before."""
+        grid = self.grid
+        res = grid.resolution
+        for bwarr in bot_warr_list:
+            bot_tl, bot_tu = bwarr.lower_unit, bwarr.upper_unit
+            bot_layer_id = bwarr.layer_id
+            bot_dir = grid.get_direction(bot_layer_id)
+            for bot_index in bwarr.track_id:
+                bot_lay_name = grid.get_layer_name(bot_layer_id, bot_index)
+                btl, btu = grid.get_wire_bounds(bot_layer_id, bot_index, width=bwarr.width,
+                                                unit_mode=True)
+                for twarr in top_warr_list:
+                    if twarr.upper_unit >= btu and twarr.lower_unit <= btl:
+                        for top_index in twarr.track_id:
+                            ttl, ttu = grid.get_wire_bounds(bot_layer_id + 1, top_index,
+                                                            width=twarr.width, unit_mode=True)
+                            if bot_tu >= ttu and bot_tl <= ttl:
+                                if bot_dir == 'x':
+                                    box = BBox(ttl, btl, ttu, btu, res, unit_mode=True)
+                                else:
+                                    box = BBox(btl, ttl, btu, ttu, res, unit_mode=True)
+                                top_lay_name = grid.get_layer_name(bot_layer_id + 1, top_index)
+                                self.add_via(box, bot_lay_name, top_lay_name, bot_dir)
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark power mesh vias.')
+    parser.add_argument('-n', '--num', type=int, default=8)
+    parser.add_argument('-t', '--ntr', type=int, default=32)
+    args = parser.parse_args()
+
+    grid = RoutingGrid(ViaTechInfo({}), [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    print('%d x %d wires' % (args.num * args.ntr, args.num * args.ntr))
+    num_vias = None
+    for name, vectorized in (('per intersection', False), ('vectorized', True)):
+        tdb = TemplateDB('', grid, 'bench_lib')
+        temp = tdb.new_template(params=dict(num=args.num, ntr=args.ntr, vectorized=vectorized),
+                                temp_cls=PowerMesh)
+        print('  %-18s %8.3f s, %d vias in %d Via objects' %
+              (name + ':', temp.via_time, temp.num_vias, temp.num_objects))
+        if num_vias is not None and num_vias != temp.num_vias:
+            raise ValueError('number of vias does not match.')
+        num_vias = temp.num_vias
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of used track queries on a large arrayed instance.
+
+Compares merging the used tracks of a 64 x 64 instance array one BBox at a time, as
+merge_inst_tracks() did before, against the batch rectangle arrays.
+"""
+
+import time
+import argparse
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.util import BBox
+from bag.layout.routing import RoutingGrid
+from bag.layout.routing.fill import UsedTracks
+from bag.layout.template import TemplateDB, TemplateBase
+
+
+class UnitCell(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        return dict(ntr='number of tracks.')
+
+    def draw_layout(self):
+        res = self.grid.resolution
+        for idx in range(self.params['ntr']):
+            for layer_id in (1, 2):
+                box = self.grid.get_bbox(layer_id, idx, 0, 2000, unit_mode=True)
+                self.used_tracks.record_box(layer_id, box, 20, 10, res)
+        self.set_size_from_bound_box(2, BBox(0, 0, 2000, 2000, res, unit_mode=True),
+                                     round_up=True)
+
+
+class ArrayCell(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        return dict(ntr='number of tracks.', num='number of rows and columns.')
+
+    def draw_layout(self):
+        num = self.params['num']
+        master = self.new_template(params=dict(ntr=self.params['ntr']), temp_cls=UnitCell)
+        self.add_instance(master, nx=num, ny=num, spx=2000, spy=2000, unit_mode=True)
+        self.set_size_from_bound_box(2, BBox(0, 0, 2000 * num, 2000 * num,
+                                             self.grid.resolution, unit_mode=True),
+                                     round_up=True)
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark used track queries.')
+    parser.add_argument('-n', '--num', type=int, default=64)
+    parser.add_argument('-t', '--ntr', type=int, default=8)
+    args = parser.parse_args()
+
+    tech_info = DummyTechInfo({})
+    res = tech_info.resolution
+    grid = RoutingGrid(tech_info, [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    tdb = TemplateDB('', grid, 'bench_lib')
+    temp = tdb.new_template(params=dict(ntr=args.ntr, num=args.num), temp_cls=ArrayCell)
+    inst = next(temp.instance_iter())
+    print('%d x %d array, %d rectangles per element' % (args.num, args.num, 2 * args.ntr))
+
+    start = time.perf_counter()
+    used_tracks = UsedTracks()
+    for layer_id, box, dx, dy in inst.all_rect_iter():
+        used_tracks.record_box(layer_id, box, dx, dy, res)
+    stop = time.perf_counter()
+    print('  BBox objects:       %8.3f s' % (stop - start))
+
+    start = time.perf_counter()
+    used_tracks = UsedTracks()
+    for layer_id, rect_arr in inst.get_all_rect_arrays().items():
+        used_tracks.record_box_array(layer_id, rect_arr[:, :4], rect_arr[:, 4], rect_arr[:, 5],
+                                     res)
+    stop = time.perf_counter()
+    print('  rectangle arrays:   %8.3f s' % (stop - start))
+
+    test_box = BBox(0, 0, 2000 * args.num, 4000, res, unit_mode=True)
+    start = time.perf_counter()
+    num_blk = len(list(temp.blockage_iter(1, test_box, spx=20, spy=20)))
+    stop = time.perf_counter()
+    print('  blockage_iter (%d): %8.3f s' % (num_blk, stop - start))
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the used track spatial index.
+
+Compares insert and query throughput of RectIndex against the rtree index it replaced,
+if rtree is installed, on horizontal wires on a routing grid.
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from bag.layout.util import BBox
+from bag.layout.routing.fill import RectIndex
+
+try:
+    # noinspection PyPackageRequirements
+    from rtree.index import Index
+except ImportError:
+    Index = None
+
+
+def make_boxes(num_rects, pitch):
+    rng = np.random.RandomState(0)
+    xl = rng.randint(0, 100 * pitch, size=num_rects)
+    yb = pitch * rng.randint(0, num_rects // 50 + 1, size=num_rects)
+    return np.stack((xl, yb, xl + rng.randint(pitch, 20 * pitch, size=num_rects),
+                     yb + pitch // 2), axis=1)
+
+
+def make_queries(num_query, pitch, num_rects):
+    rng = np.random.RandomState(1)
+    xl = rng.randint(0, 100 * pitch, size=num_query)
+    yb = pitch * rng.randint(0, num_rects // 50 + 1, size=num_query)
+    return np.stack((xl, yb, xl + 10 * pitch, yb + pitch // 2), axis=1).tolist()
+
+
+def timeit(name, fun, num):
+    start = time.perf_counter()
+    ans = fun()
+    stop = time.perf_counter()
+    print('  %-28s %8.3f s, %10.0f /s' % (name + ':', stop - start, num / (stop - start)))
+    return ans
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark the used track index.')
+    parser.add_argument('-n', '--num_rects', type=int, default=200000)
+    parser.add_argument('-q', '--num_query', type=int, default=20000)
+    args = parser.parse_args()
+
+    res = 0.001
+    pitch = 100
+    num_rects = args.num_rects
+    num_query = args.num_query
+    boxes = make_boxes(num_rects, pitch)
+    box_list = boxes.tolist()
+    queries = make_queries(num_query, pitch, num_rects)
+    query_boxes = [BBox(xl, yb, xr, yt, res, unit_mode=True) for xl, yb, xr, yt in queries]
+    print('%d rectangles, %d queries' % (num_rects, num_query))
+
+    def insert_single():
+        index = RectIndex(res)
+        for xl, yb, xr, yt in box_list:
+            index.record_box(BBox(xl, yb, xr, yt, res, unit_mode=True), 20, 10)
+        return index
+
+    def insert_batch():
+        index = RectIndex(res)
+        index.record_box_array(boxes, 20, 10)
+        return index
+
+    def query_index(index):
+        return sum(index.get_rect_array(box).shape[0] for box in query_boxes)
+
+    timeit('RectIndex.record_box', insert_single, num_rects)
+    index = timeit('RectIndex.record_box_array', insert_batch, num_rects)
+    # the first query sorts the index
+    timeit('RectIndex first query', lambda: index.get_rect_array(query_boxes[0]), 1)
+    cnt = timeit('RectIndex.get_rect_array', lambda: query_index(index), num_query)
+
+    if Index is None:
+        print('  rtree not found, skipping rtree.')
+        return
+
+    def rtree_insert_single():
+        index = Index(interleaved=True)
+        for idx, (xl, yb, xr, yt) in enumerate(box_list):
+            index.insert(idx, (xl - 20, yb - 10, xr + 20, yt + 10), obj=(xl, yb, xr, yt, 20, 10))
+        return index
+
+    def rtree_insert_bulk():
+        stream = ((idx, (xl - 20, yb - 10, xr + 20, yt + 10), (xl, yb, xr, yt, 20, 10))
+                  for idx, (xl, yb, xr, yt) in enumerate(box_list))
+        return Index(stream, interleaved=True)
+
+    def rtree_query(index):
+        return sum(np.array(list(index.intersection(box.get_bounds(unit_mode=True),
+                                                    objects='raw')),
+                            dtype=np.int64).reshape(-1, 6).shape[0]
+                   for box in query_boxes)
+
+    timeit('rtree insert', rtree_insert_single, num_rects)
+    index = timeit('rtree bulk load', rtree_insert_bulk, num_rects)
+    rtree_cnt = timeit('rtree intersection', lambda: rtree_query(index), num_query)
+    if rtree_cnt != cnt:
+        raise ValueError('rtree found %d rectangles, RectIndex found %d' % (rtree_cnt, cnt))
+
+
+if __name__ == '__main__':
+    run_main()
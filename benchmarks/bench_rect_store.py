@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of rectangle storage in BagLayout.
+
+Compares memory per rectangle and finalize time of Rect objects, as BagLayout stored them
+before, against the columnar RectStore.  Before, each Rect was kept until finalize() and
+then converted to a content dictionary; both are counted.
+"""
+
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from bag.layout.util import BBox
+from bag.layout.objects import Rect
+from bag.layout.core import RectStore
+
+
+def make_rects(num_rects, res):
+    ans = []
+    for idx in range(num_rects):
+        y = 200 * idx
+        ans.append(Rect(('M1', 'drawing'), BBox(0, y, 1000, y + 100, res, unit_mode=True)))
+    return ans
+
+
+def measure(fun):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fun()
+    stop = time.perf_counter()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, stop - start
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark rectangle storage.')
+    parser.add_argument('-n', '--num_rects', type=int, default=1000000)
+    args = parser.parse_args()
+
+    res = 0.001
+    num_rects = args.num_rects
+    print('%d rectangles' % num_rects)
+
+    rect_list, obj_size, obj_time = measure(lambda: make_rects(num_rects, res))
+    content, content_size, content_time = measure(lambda: [rect.content for rect in rect_list])
+    print('  Rect objects:  %6.1f bytes/rect, add %6.3f s, finalize %6.3f s' %
+          ((obj_size + content_size) / num_rects, obj_time, content_time))
+    del rect_list, content
+
+    def add_single():
+        store = RectStore(res)
+        for idx in range(num_rects):
+            y = 200 * idx
+            store.add(('M1', 'drawing'), 0, y, 1000, y + 100)
+        return store
+
+    def add_batch():
+        store = RectStore(res)
+        y = np.arange(num_rects, dtype=np.int64) * 200
+        store.add_boxes(('M1', 'drawing'),
+                        np.stack((np.zeros_like(y), y, np.full_like(y, 1000), y + 100), axis=1))
+        return store
+
+    for name, fun in (('RectStore.add', add_single), ('RectStore.add_boxes', add_batch)):
+        store, _, add_time = measure(fun)
+        _, _, final_time = measure(store.compact)
+        del store
+        # memory held by the finalized store, after unused capacity is released
+        _, size, _ = measure(lambda: _finalize(fun()))
+        print('  %-19s %6.1f bytes/rect, add %6.3f s, finalize %6.3f s' %
+              (name + ':', size / num_rects, add_time, final_time))
+
+
+def _finalize(store):
+    store.compact()
+    return store
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of coordinate and track index conversions in RoutingGrid.
+
+Compares the scalar conversion methods, called once per coordinate or track, against their
+NumPy batch versions, and checks that both give the same results.
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.routing import RoutingGrid
+
+
+def timeit(name, fun, num):
+    start = time.perf_counter()
+    ans = fun()
+    stop = time.perf_counter()
+    print('  %-40s %8.3f s, %8.1f ns/op' % (name + ':', stop - start,
+                                            (stop - start) * 1e9 / num))
+    return ans
+
+
+def compare(name, scalar_fun, array_fun, num):
+    ref = timeit(name + ' scalar', scalar_fun, num)
+    ans = timeit(name + ' array', array_fun, num)
+    if np.asarray(ans).tolist() != ref:
+        raise ValueError('%s: batch version does not match scalar version' % name)
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark track conversions.')
+    parser.add_argument('-n', '--num', type=int, default=200000)
+    args = parser.parse_args()
+    num = args.num
+
+    layer_id = 1
+    tech_info = DummyTechInfo({})
+    grid = RoutingGrid(tech_info, [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    pitch = grid.get_track_pitch(layer_id, unit_mode=True)
+    rng = np.random.RandomState(0)
+    coords = rng.randint(-1000 * pitch, 1000 * pitch, size=num)
+    coord_list = coords.tolist()
+    tracks = rng.randint(-2000, 2000, size=num) / 2
+    track_list = tracks.tolist()
+    on_track = grid.track_to_coord_array(layer_id, tracks, unit_mode=True)
+    on_track_list = on_track.tolist()
+    print('%d conversions' % num)
+
+    compare('coord_to_track',
+            lambda: [grid.coord_to_track(layer_id, c, unit_mode=True) for c in on_track_list],
+            lambda: grid.coord_to_track_array(layer_id, on_track, unit_mode=True), num)
+    compare('track_to_coord',
+            lambda: [grid.track_to_coord(layer_id, tr, unit_mode=True) for tr in track_list],
+            lambda: grid.track_to_coord_array(layer_id, tracks, unit_mode=True), num)
+    for mode in (0, -2, 1):
+        compare('coord_to_nearest_track(mode=%d)' % mode,
+                lambda: [grid.coord_to_nearest_track(layer_id, c, half_track=True, mode=mode,
+                                                     unit_mode=True) for c in coord_list],
+                lambda: grid.coord_to_nearest_track_array(layer_id, coords, half_track=True,
+                                                          mode=mode, unit_mode=True), num)
+    compare('get_wire_bounds',
+            lambda: [list(grid.get_wire_bounds(layer_id, tr, width=2, unit_mode=True))
+                     for tr in track_list],
+            lambda: np.stack(grid.get_wire_bounds_array(layer_id, tracks, width=2,
+                                                        unit_mode=True), axis=1), num)
+    compare('transform_track',
+            lambda: [grid.transform_track(layer_id, tr, dx=200, dy=-300, orient='MX',
+                                          unit_mode=True) for tr in track_list],
+            lambda: grid.transform_track_array(layer_id, tracks, dx=200, dy=-300, orient='MX',
+                                               unit_mode=True), num)
+
+
+if __name__ == '__main__':
+    run_main()
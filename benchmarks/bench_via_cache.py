@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of via solutions on a synthetic power grid.
+
+Draws vias at all intersections of horizontal and vertical power straps of a few widths,
+with the via solution cache of TechInfo.get_via_info() cleared before every via and with
+the cache enabled, then prints the cache statistics of each via signature.
+"""
+
+import time
+import argparse
+
+from bag.layout.core import DummyTechInfo
+from bag.layout.util import BBox
+
+
+class ViaTechInfo(DummyTechInfo):
+    """A DummyTechInfo with square and rectangular vias."""
+
+    def get_layer_id(self, layer_name):
+        return int(layer_name[1:])
+
+    def get_layer_name(self, layer_id):
+        return 'M%d' % layer_id
+
+    def get_layer_type(self, layer_name):
+        return layer_name
+
+    def get_via_name(self, bot_layer_id):
+        return 'V%d' % bot_layer_id
+
+    def get_via_drc_info(self, vname, vtype, mtype, mw_unit, is_bot):
+        dim = dict(square=(20, 20), vrect=(20, 50), hrect=(50, 20))[vtype]
+        enc = [(10, 10), (0, 30)] if is_bot else [(15, 5)]
+        return (20, 25), [(30, 30)], [(40, 40)], dim, enc, None, None
+
+
+def get_via_boxes(num, res):
+    """Returns the via boxes at all intersections of num x num straps."""
+    widths = [200, 400, 800, 2000]
+    pitch = 4000
+    box_list = []
+    for row in range(num):
+        hw = widths[row % len(widths)]
+        yb = row * pitch
+        for col in range(num):
+            vw = widths[(col // 2) % len(widths)]
+            xl = col * pitch
+            box_list.append(BBox(xl, yb, xl + vw, yb + hw, res, unit_mode=True))
+    return box_list
+
+
+def run_main():
+    parser = argparse.ArgumentParser(description='Benchmark via solution caching.')
+    parser.add_argument('-n', '--num', type=int, default=40)
+    args = parser.parse_args()
+
+    tech_info = ViaTechInfo({})
+    box_list = get_via_boxes(args.num, tech_info.resolution)
+    num_vias = len(box_list)
+    print('%d vias' % num_vias)
+
+    start = time.perf_counter()
+    ref_list = []
+    for box in box_list:
+        tech_info.clear_via_cache()
+        ref_list.append(tech_info.get_via_info(box, 'M1', 'M2', 'x'))
+    stop = time.perf_counter()
+    print('  %-12s %8.3f s, %8.1f us/via' % ('uncached:', stop - start,
+                                              (stop - start) * 1e6 / num_vias))
+
+    tech_info.clear_via_cache()
+    start = time.perf_counter()
+    info_list = [tech_info.get_via_info(box, 'M1', 'M2', 'x') for box in box_list]
+    stop = time.perf_counter()
+    print('  %-12s %8.3f s, %8.1f us/via' % ('cached:', stop - start,
+                                              (stop - start) * 1e6 / num_vias))
+
+    for info, ref in zip(info_list, ref_list):
+        if (info['params'] != ref['params'] or info['top_box'] != ref['top_box'] or
+                info['bot_box'] != ref['bot_box']):
+            raise ValueError('cached via solution does not match.')
+
+    print('via signature (bot, top, bot_dir, top_dir, w, h, extend, bot_len, top_len): '
+          'hits/misses')
+    for sig, (hits, misses) in sorted(tech_info.get_via_cache_stats().items()):
+        print('  %s: %d/%d' % (sig, hits, misses))
+
+
+if __name__ == '__main__':
+    run_main()
@@ -29,7 +29,6 @@ setup(
         'pyzmq>=15.2.0',
         'scipy>=0.17',
         'matplotlib>=1.5',
-        'rtree',
         'h5py',
         'Shapely',
     ],
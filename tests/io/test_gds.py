@@ -0,0 +1,103 @@
+import struct
+import time
+
+import pytest
+import numpy as np
+
+from bag.io.gds import GDSCell, GDSWriter, get_box_cell_name
+
+
+def read_records(fname):
+    """Returns a list of (record type, payload) in the given GDS file."""
+    with open(fname, 'rb') as f:
+        data = f.read()
+    ans = []
+    idx = 0
+    while idx < len(data):
+        size, rtype = struct.unpack('>2H', data[idx:idx + 4])
+        ans.append((rtype, data[idx + 4:idx + size]))
+        idx += size
+    return ans
+
+
+def get_structures(records):
+    """Returns a dictionary from structure name to its element records."""
+    ans = {}
+    cur = None
+    for rtype, payload in records:
+        if rtype == 0x0606:
+            cur = ans[payload.rstrip(b'\x00').decode('ascii')] = []
+        elif rtype == 0x0700:
+            cur = None
+        elif cur is not None:
+            cur.append((rtype, payload))
+    return ans
+
+
+def test_real8_units(tmpdir):
+    fname = str(tmpdir.join('units.gds'))
+    with GDSWriter(fname, 'lib', 1e-6, 1e-9):
+        pass
+    records = read_records(fname)
+    units = [payload for rtype, payload in records if rtype == 0x0305][0]
+    # reference encoding of 1e-3 and 1e-9
+    assert units == bytes.fromhex('3e4189374bc6a7f0') + bytes.fromhex('3944b82fa09b5a54')
+    assert records[-1] == (0x0400, b'')
+
+
+def test_add_boxes():
+    boxes = np.array([[0, 0, 10, 20], [-5, 3, 7, 9]], dtype=np.int64)
+    ref = GDSCell('ref')
+    for x0, y0, x1, y1 in boxes.tolist():
+        ref.add_box(3, 1, x0, y0, x1, y1)
+    cell = GDSCell('ref')
+    cell.add_boxes(3, 1, boxes)
+    assert cell.get_data() == ref.get_data()
+
+
+def test_box_array(tmpdir):
+    fname = str(tmpdir.join('arr.gds'))
+    stamp = time.localtime(0)
+    with GDSWriter(fname, 'lib', 1e-6, 1e-9, timestamp=stamp) as writer:
+        for name in ('top', 'top2'):
+            cell = writer.new_cell(name)
+            cell.add_box_array(3, 0, 10, 20, 30, 60, nx=4, ny=2, spx=100, spy=200)
+            cell.add_ref('sub', 5, 7, angle=90, reflect=True, nx=2, ny=3, spx=10, spy=20)
+            writer.write_cell(cell)
+
+    structs = get_structures(read_records(fname))
+    box_name = get_box_cell_name(3, 0, 20, 40)
+    # the shared box cell is written once, before its first user
+    assert list(structs.keys()) == [box_name, 'top', 'top2']
+    assert [rtype for rtype, _ in structs[box_name]] == [0x0800, 0x0D02, 0x0E02, 0x1003,
+                                                          0x1100]
+
+    elements = structs['top']
+    assert elements[0] == (0x0B00, b'')
+    assert elements[1][1].rstrip(b'\x00').decode('ascii') == box_name
+    assert struct.unpack('>2h', elements[2][1]) == (4, 2)
+    assert struct.unpack('>6l', elements[3][1]) == (10, 20, 410, 20, 10, 420)
+    # rotated and reflected array reference
+    assert elements[6][1].rstrip(b'\x00') == b'sub'
+    assert elements[7] == (0x1A01, struct.pack('>H', 0x8000))
+    assert elements[8][0] == 0x1C05
+    assert struct.unpack('>6l', elements[10][1]) == (5, 7, 5, 27, 65, 7)
+
+
+def test_shared_cells(tmpdir):
+    fname = str(tmpdir.join('shared.gds'))
+    with GDSWriter(fname, 'lib', 1e-6, 1e-9) as writer:
+        shared = writer.new_cell('shared')
+        shared.add_box_array(1, 0, 0, 0, 10, 10, nx=2, spx=20)
+        for name in ('top', 'top2'):
+            cell = writer.new_cell(name)
+            cell.add_shared_ref(shared, 0, 0, nx=3, spx=100)
+            writer.write_cell(cell)
+
+    structs = get_structures(read_records(fname))
+    # shared cells are written once, after their own shared cells
+    assert list(structs.keys()) == [get_box_cell_name(1, 0, 10, 10), 'shared', 'top', 'top2']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,155 @@
+import zlib
+
+import pytest
+
+from bag.io.oasis import OASISWriter
+
+
+class Reader(object):
+    """A minimal OASIS reader of the records written by OASISWriter."""
+
+    def __init__(self, data):
+        self.data = data
+        self.idx = 0
+
+    def uint(self):
+        ans = shift = 0
+        while True:
+            byte = self.data[self.idx]
+            self.idx += 1
+            ans |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                return ans
+
+    def byte(self):
+        self.idx += 1
+        return self.data[self.idx - 1]
+
+    def sint(self):
+        val = self.uint()
+        return -(val >> 1) if val & 1 else val >> 1
+
+    def string(self):
+        num = self.uint()
+        self.idx += num
+        return self.data[self.idx - num:self.idx]
+
+    def real(self):
+        rtype = self.uint()
+        assert rtype in (0, 1)
+        val = self.uint()
+        return -val if rtype == 1 else val
+
+    def gdelta(self):
+        val = self.uint()
+        assert val & 1
+        dx = -(val >> 2) if val & 2 else val >> 2
+        return dx, self.sint()
+
+    def repetition(self):
+        rtype = self.uint()
+        if rtype == 1:
+            return rtype, (self.uint() + 2, self.uint() + 2, self.uint(), self.uint())
+        if rtype in (2, 3):
+            return rtype, (self.uint() + 2, self.uint())
+        if rtype == 8:
+            return rtype, (self.uint() + 2, self.uint() + 2, self.gdelta(), self.gdelta())
+        assert rtype == 9
+        return rtype, (self.uint() + 2, self.gdelta())
+
+    def records(self):
+        """Returns a list of (record ID, fields) tuples."""
+        ans = []
+        while self.idx < len(self.data):
+            rid = self.uint()
+            if rid == 34:
+                assert self.uint() == 0
+                size = self.uint()
+                comp = self.string()
+                data = zlib.decompress(comp, -15)
+                assert len(data) == size
+                ans.extend(Reader(data).records())
+            elif rid == 14:
+                ans.append((rid, self.string()))
+            elif rid == 20:
+                info = self.byte()
+                fields = [self.uint(), self.uint(), self.uint(), self.uint(), self.sint(),
+                          self.sint()]
+                if info & 0x04:
+                    fields.append(self.repetition())
+                ans.append((rid, tuple(fields)))
+            elif rid == 17:
+                info = self.byte()
+                fields = [self.string(), (info >> 1) & 3, info & 1, self.sint(), self.sint()]
+                if info & 0x08:
+                    fields.append(self.repetition())
+                ans.append((rid, tuple(fields)))
+            elif rid == 19:
+                self.byte()
+                ans.append((rid, (self.string(), self.uint(), self.uint(), self.sint(),
+                                  self.sint())))
+            elif rid == 21:
+                self.byte()
+                layer, dtype = self.uint(), self.uint()
+                assert self.uint() == 4
+                deltas = [self.gdelta() for _ in range(self.uint())]
+                ans.append((rid, (layer, dtype, deltas, self.sint(), self.sint())))
+            elif rid == 2:
+                ans.append((rid, self.string()))
+                assert self.uint() == 0
+            else:
+                raise ValueError('Unexpected record %d' % rid)
+        return ans
+
+
+def read_oasis(fname):
+    with open(fname, 'rb') as f:
+        data = f.read()
+    assert data.startswith(b'%SEMI-OASIS\r\n')
+    reader = Reader(data)
+    reader.idx = 13
+    assert reader.uint() == 1 and reader.string() == b'1.0'
+    unit = reader.real()
+    assert reader.uint() == 0 and [reader.uint() for _ in range(12)] == [0] * 12
+    end_start = len(data) - 256
+    records = Reader(data[reader.idx:end_start]).records()
+    end_reader = Reader(data[end_start:])
+    assert end_reader.records()[0][0] == 2
+    return unit, records
+
+
+def test_oasis_writer(tmpdir):
+    fname = str(tmpdir.join('test.oas'))
+    with OASISWriter(fname, 1e-6, 1e-9) as writer:
+        via = writer.new_cell('via')
+        via.add_box_array(3, 0, -5, -5, 5, 5, nx=2, ny=2, spx=20, spy=30)
+        top = writer.new_cell('top')
+        for idx in range(20):
+            top.add_box(1, 0, 0, idx * 10, 100, idx * 10 + 5)
+        top.add_box_array(2, 1, 0, 0, 10, 1000, nx=40, spx=-20)
+        top.add_shared_ref(via, 100, 200, nx=1, ny=4, spy=50)
+        top.add_ref('sub', 5, 7, angle=90, reflect=True, nx=2, ny=3, spx=10, spy=20)
+        top.add_polygon(4, 0, [(0, 0), (10, 0), (0, 10)])
+        top.add_text(1, 2, 'out', 50, 2)
+        writer.write_cell(top)
+        writer.write_cell(top)
+
+    unit, records = read_oasis(fname)
+    assert unit == 1000
+    cell_names = [fields for rid, fields in records if rid == 14]
+    # the shared cell is written once, before its first user
+    assert cell_names == [b'via', b'top', b'top']
+    assert records[1] == (20, (3, 0, 10, 10, -5, -5, (1, (2, 2, 20, 30))))
+    top_records = records[3:records.index((14, b'top'), 3)]
+    assert len(top_records) == 25
+    assert top_records[20] == (20, (2, 1, 10, 1000, 0, 0, (9, (40, (-20, 0)))))
+    assert top_records[21] == (17, (b'via', 0, 0, 100, 200, (3, (4, 50))))
+    # repetition displacements are rotated into the parent coordinate system
+    assert top_records[22] == (17, (b'sub', 1, 1, 5, 7, (8, (2, 3, (0, 10), (20, 0)))))
+    assert top_records[23] == (21, (4, 0, [(10, 0), (-10, 10)], 0, 0))
+    assert top_records[24] == (19, (b'out', 1, 2, 50, 2))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
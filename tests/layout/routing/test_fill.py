@@ -1,8 +1,11 @@
 from itertools import product
+import pickle
 
 import pytest
+import numpy as np
 
-from bag.layout.routing.fill import fill_symmetric_helper
+from bag.layout.util import BBox
+from bag.layout.routing.fill import fill_symmetric_helper, RectIndex
 
 
 def check_disjoint_union(outer_list, inner_list, start, stop):
@@ -208,3 +211,62 @@ def test_fill_symmetric_cyclic_edge_space():
                     # test other properties
                     check_props(fill_list, space_list, num_diff_sp1, num_diff_sp2, nfill, tot_intv, inc_sp, sp,
                                 1, 2, nfill, False, sintv[0], eintv[1], 2, sp_edge_tweak)
+
+
+def test_rect_index(tmpdir):
+    rng = np.random.RandomState(0)
+    res = 0.001
+    index = RectIndex(res)
+    ref = np.empty((0, 6), dtype=np.int64)
+    for batch in range(20):
+        # horizontal wires on a 100 pitch, plus a few large blocks
+        num = int(rng.randint(1, 200))
+        xl = rng.randint(-5000, 5000, size=num)
+        yb = 100 * rng.randint(-50, 50, size=num)
+        boxes = np.stack((xl, yb, xl + rng.randint(100, 3000, size=num), yb + 40), axis=1)
+        if batch % 5 == 0:
+            boxes[0] = (-3000, -3000, 2000, 2000)
+        dx = rng.randint(0, 30, size=num)
+        if batch % 2 == 0:
+            index.record_box_array(boxes, dx, 10)
+        else:
+            for box, sdx in zip(boxes.tolist(), dx.tolist()):
+                index.record_box(BBox(box[0], box[1], box[2], box[3], res, unit_mode=True),
+                                 sdx, 10)
+        rects = np.empty((num, 6), dtype=np.int64)
+        rects[:, :4] = boxes
+        rects[:, 4] = dx
+        rects[:, 5] = 10
+        ref = np.concatenate((ref, rects))
+
+        for _ in range(10):
+            x0, y0 = rng.randint(-6000, 6000, size=2).tolist()
+            x1, y1 = x0 + int(rng.randint(0, 2000)), y0 + int(rng.randint(0, 500))
+            test_box = BBox(x0, y0, x1, y1, res, unit_mode=True)
+            # spacing boxes that intersect or touch the test box
+            keep = ((ref[:, 0] - ref[:, 4] <= x1) & (ref[:, 2] + ref[:, 4] >= x0) &
+                    (ref[:, 1] - ref[:, 5] <= y1) & (ref[:, 3] + ref[:, 5] >= y0))
+            assert sorted(map(tuple, index.get_rect_array(test_box).tolist())) == \
+                sorted(map(tuple, ref[keep].tolist()))
+
+    assert len(index) == ref.shape[0]
+    sp_boxes = ref[:, :4] + ref[:, [4, 5, 4, 5]] * [-1, -1, 1, 1]
+    assert index.bound_box.get_bounds(unit_mode=True) == \
+        tuple(sp_boxes[:, :2].min(axis=0).tolist() + sp_boxes[:, 2:].max(axis=0).tolist())
+
+    index2 = pickle.loads(pickle.dumps(index))
+    assert sorted(map(tuple, index2.get_rect_array().tolist())) == \
+        sorted(map(tuple, ref.tolist()))
+
+    basename = str(tmpdir.join('tracks'))
+    index.close()
+    index2 = RectIndex(res, basename, overwrite=True)
+    index2.record_box_array(ref[:, :4], ref[:, 4], ref[:, 5])
+    index2.close()
+    assert RectIndex(res, basename).get_rect_array().tolist() == ref.tolist()
+    # rectangles recorded after loading are saved with the loaded ones
+    index3 = RectIndex(res, basename)
+    index3.record_box(BBox(0, 0, 100, 50, res, unit_mode=True), 10, 20)
+    index3.close()
+    assert len(RectIndex(res, basename)) == len(ref) + 1
+    assert len(RectIndex(res, basename, overwrite=True)) == 0
@@ -0,0 +1,137 @@
+import pytest
+import numpy as np
+
+from bag.layout.tech import TechInfoConfig
+from bag.layout.routing import RoutingGrid
+
+
+class RuleTechInfo(TechInfoConfig):
+    def __init__(self):
+        rule = dict(w_list=[100, 50, 200, 200, 400], sp_list=[60, 10, 90, 70, 150])
+        config = dict(
+            resolution=0.001,
+            layout_unit=1e-6,
+            tech_lib='tech',
+            layer_name={1: 'M1', 2: 'M2'},
+            layer_type={'M1': 'x1', 'M2': 'x1'},
+            sp_min=dict(x1=rule),
+            sp_le_min=dict(x1=dict(w_list=[100, 1000], sp_list=[80, 120])),
+            len_min=dict(x1=dict(w_list=[100, 1000], w_al_list=[[10000, 0], [0, 500]],
+                                 md_list=[], md_al_list=[])),
+        )
+        TechInfoConfig.__init__(self, config, dict(layout=dict(em=dict(dc_temp=0, rms_dt=0))))
+
+    def get_metal_em_specs(self, layer_name, w, l=-1, vertical=False, **kwargs):
+        return TechInfoConfig.get_metal_em_specs(self, layer_name, w)
+
+    def get_via_em_specs(self, via_name, bm_layer, tm_layer, via_type='square',
+                         bm_dim=(-1, -1), tm_dim=(-1, -1), array=False, **kwargs):
+        return TechInfoConfig.get_via_em_specs(self, via_name, bm_layer, tm_layer)
+
+    def get_res_em_specs(self, res_type, w, l=-1, **kwargs):
+        return TechInfoConfig.get_res_em_specs(self, res_type, w)
+
+    def add_cell_boundary(self, template, box):
+        pass
+
+    def draw_device_blockage(self, template):
+        pass
+
+    def get_via_arr_enc(self, vname, vtype, mtype, mw_unit, is_bot):
+        return None, None
+
+
+def ref_space(width, w_list, sp_list):
+    for w, sp in zip(w_list, sp_list):
+        if width <= w:
+            return sp
+    return None
+
+
+def test_rule_tables():
+    tech_info = RuleTechInfo()
+    rule = tech_info.config['sp_min']['x1']
+    widths = list(range(0, 405, 5))
+    ref = [ref_space(w, rule['w_list'], rule['sp_list']) for w in widths]
+    assert [tech_info.get_min_space('x1', w, unit_mode=True) for w in widths] == ref
+    assert tech_info.get_min_space_array('x1', np.array(widths)).tolist() == ref
+    assert tech_info.get_min_space('x1', 401, unit_mode=True) is None
+    assert tech_info.get_min_line_end_space_array('x1', np.array([[20, 150]])).tolist() == \
+        [[80, 120]]
+    assert tech_info.get_min_length_unit('x1', 50) == 200
+    assert tech_info.get_min_length_unit('x1', 50) == 200
+
+
+def test_grid_rule_cache():
+    grid = RoutingGrid(RuleTechInfo(), [1, 2], [0.1, 0.1], [0.1, 0.1], 'x')
+    width_ntr = np.array([1, 2, 3, 1])
+    assert grid.get_track_width_array(1, width_ntr).tolist() == [100, 300, 500, 100]
+    assert grid.get_space(1, 1, unit_mode=True) == 60
+    assert grid.get_space(1, 1, unit_mode=True) == 60
+    assert grid.get_line_end_space(1, 2, unit_mode=True) == 120
+    assert grid.get_num_space_tracks(1, 1) == 0
+    assert grid.get_min_length(1, 1, unit_mode=True) == 100
+
+    # width overrides invalidate cached rules, but not those of copies
+    grid2 = grid.copy()
+    grid.add_width_override(1, 2, 0.2)
+    assert grid.get_track_width_array(1, width_ntr).tolist() == [100, 200, 500, 100]
+    # scalars and other shapes work with width overrides
+    assert grid.get_track_width_array(1, 2).tolist() == 200
+    assert grid.get_track_width_array(1, 3).tolist() == 500
+    assert grid.get_track_width_array(1, width_ntr.reshape(2, 2)).tolist() == \
+        [[100, 200], [500, 100]]
+    assert grid.get_space(1, 2, unit_mode=True) == 90
+    assert grid2.get_space(1, 2, unit_mode=True) == 150
+    assert grid.get_space_array(1, np.array([1, 2, 1])).tolist() == [60, 90, 60]
+    assert grid.get_line_end_space_array(1, width_ntr).tolist() == [80, 120, 120, 80]
+    # wires wider than all rules have no spacing
+    assert grid.get_space(1, 3, unit_mode=True) is None
+    with pytest.raises(ValueError):
+        grid.get_space_array(1, width_ntr)
+
+
+@pytest.mark.parametrize('layer_id', [1, 2])
+def test_track_conversion_arrays(layer_id):
+    grid = RoutingGrid(RuleTechInfo(), [1, 2], [0.1, 0.1], [0.1, 0.1], 'x')
+    coords = np.arange(-250, 260, 10)
+    for half_track in (False, True):
+        for mode in (-2, -1, 0, 1, 2):
+            ref = [grid.coord_to_nearest_track(layer_id, c, half_track=half_track, mode=mode,
+                                               unit_mode=True) for c in coords]
+            ans = grid.coord_to_nearest_track_array(layer_id, coords, half_track=half_track,
+                                                    mode=mode, unit_mode=True)
+            assert ans.tolist() == ref
+
+    tracks = np.arange(-5, 5.5, 0.5)
+    ref = [grid.track_to_coord(layer_id, tr, unit_mode=True) for tr in tracks]
+    coord_arr = grid.track_to_coord_array(layer_id, tracks, unit_mode=True)
+    assert coord_arr.tolist() == ref
+    assert grid.coord_to_track_array(layer_id, coord_arr, unit_mode=True).tolist() == \
+        tracks.tolist()
+    assert grid.coord_to_track_array(layer_id, coord_arr * 0.001).tolist() == tracks.tolist()
+    with pytest.raises(ValueError):
+        grid.coord_to_track_array(layer_id, coord_arr + 10, unit_mode=True)
+
+    # width overrides apply to scalar and array widths
+    grid_ovr = grid.copy()
+    grid_ovr.add_width_override(layer_id, 2, 0.25)
+    widths = np.arange(tracks.size) % 3 + 1
+    for test_grid in (grid, grid_ovr):
+        for width in (1, 2):
+            lower, upper = test_grid.get_wire_bounds_array(layer_id, tracks, width=width,
+                                                           unit_mode=True)
+            assert list(zip(lower.tolist(), upper.tolist())) == \
+                [test_grid.get_wire_bounds(layer_id, tr, width=width, unit_mode=True)
+                 for tr in tracks]
+        lower, upper = test_grid.get_wire_bounds_array(layer_id, tracks, width=widths,
+                                                       unit_mode=True)
+        assert list(zip(lower.tolist(), upper.tolist())) == \
+            [test_grid.get_wire_bounds(layer_id, tr, width=w, unit_mode=True)
+             for tr, w in zip(tracks, widths.tolist())]
+
+    for orient in ('R0', 'MX', 'MY', 'R180'):
+        ref = [grid.transform_track(layer_id, tr, dx=300, dy=-500, orient=orient,
+                                    unit_mode=True) for tr in tracks]
+        assert grid.transform_track_array(layer_id, tracks, dx=300, dy=-500, orient=orient,
+                                          unit_mode=True).tolist() == ref
@@ -0,0 +1,883 @@
+from typing import Dict, Any
+
+import pickle
+
+import pytest
+import numpy as np
+
+from bag.layout.core import DummyTechInfo, RectStore
+from bag.layout.util import BBox, transform_table, transform_box_array, transform_loc_orient
+from bag.layout.objects import Rect, ViaInfo
+from bag.layout.routing import RoutingGrid, TrackID, WireArray, MazeRouter
+from bag.layout.template import TemplateDB, TemplateBase, GDSBlackBoxTemplate
+from bag.util.cache import MasterStore
+from bag.util.interval import IntervalSet
+from bag.util.profiler import GenerationProfiler
+from bag.io.gds import GDSWriter, get_box_cell_name
+
+from ..io.test_gds import read_records, get_structures
+from ..io.test_oasis import read_oasis
+
+
+class Leaf(TemplateBase):
+    draw_cnt = 0
+    width = 1000
+
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(ntr='number of tracks.')
+
+    def draw_layout(self):
+        Leaf.draw_cnt += 1
+        ntr = self.params['ntr']
+        self.add_wires(1, 0, 0, 1000, num=ntr, pitch=2, unit_mode=True)
+        self.add_rect('M2', self.grid.get_bbox(2, 1, 0, 500, unit_mode=True))
+        self.set_size_from_bound_box(2, BBox(0, 0, Leaf.width, 1000, self.grid.resolution,
+                                             unit_mode=True), round_up=True)
+        self.add_pin('out', self.add_wires(2, 0, 0, 1000, unit_mode=True))
+        # DummyTechInfo has no layer IDs, so record track usage directly.
+        self.used_tracks.record_box(1, self.grid.get_bbox(1, 0, 0, 1000, unit_mode=True),
+                                    20, 10, self.grid.resolution)
+        self.leaf_info = dict(ntr=ntr)
+
+
+class Parent(TemplateBase):
+    draw_cnt = 0
+
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(ntr_list='list of leaf track numbers.')
+
+    def draw_layout(self):
+        Parent.draw_cnt += 1
+        x = 0
+        for ntr in self.params['ntr_list']:
+            master = self.new_template(params=dict(ntr=ntr), temp_cls=Leaf)
+            inst = self.add_instance(master, loc=(x, 0), unit_mode=True)
+            self.reexport(inst.get_port('out'), net_name='out%d' % x)
+            x += master.bound_box.width_unit
+        self.set_size_from_bound_box(2, BBox(0, 0, x, 1000, self.grid.resolution,
+                                             unit_mode=True), round_up=True)
+
+
+class Block(TemplateBase):
+    draw_cnt = 0
+
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(w='block width.')
+
+    def draw_layout(self):
+        Block.draw_cnt += 1
+        box = BBox(0, 0, self.params['w'], 1000, self.grid.resolution, unit_mode=True)
+        self.add_rect('M2', box)
+        self.set_size_from_bound_box(2, box, round_up=True)
+
+
+class Top(TemplateBase):
+    draw_cnt = 0
+
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(ntr_list='list of leaf track numbers.')
+
+    def draw_layout(self):
+        Top.draw_cnt += 1
+        master = self.new_template(params=self.params, temp_cls=Parent)
+        self.add_instance(master, unit_mode=True)
+        blk_master = self.new_template(params=dict(w=2000), temp_cls=Block)
+        self.add_instance(blk_master, loc=(0, 2000), unit_mode=True)
+        self.set_size_from_bound_box(2, BBox(0, 0, master.bound_box.width_unit, 3000,
+                                             self.grid.resolution, unit_mode=True),
+                                     round_up=True)
+
+
+class ArrayTop(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(ntr_list='list of leaf track numbers.')
+
+    def draw_layout(self):
+        master = self.new_template(params=self.params, temp_cls=Parent)
+        self.add_instance(master, loc=(0, 4000), orient='MX', nx=2, ny=3, spx=5000, spy=4000,
+                          unit_mode=True)
+        blk_master = self.new_template(params=dict(w=2000), temp_cls=Block)
+        self.add_instance(blk_master, loc=(20000, 1000), orient='R180', ny=2, spy=3000,
+                          unit_mode=True)
+        self.add_instance(blk_master, loc=(3000, 20000), orient='MY', unit_mode=True)
+        self.set_size_from_bound_box(2, BBox(0, 0, 20000, 20000, self.grid.resolution,
+                                             unit_mode=True), round_up=True)
+
+
+def make_grid():
+    # type: () -> RoutingGrid
+    tech_info = DummyTechInfo({})
+    return RoutingGrid(tech_info, [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+
+
+def make_db(**kwargs):
+    # type: (**Any) -> TemplateDB
+    return TemplateDB('', make_grid(), 'test_lib', **kwargs)
+
+
+def get_raw_content(tdb, temp_list):
+    """Returns the layout content of all given templates."""
+    content_list = []
+    tdb.create_masters_in_db = lambda lib_name, clist, debug=False: content_list.extend(clist)
+    tdb.instantiate_masters(temp_list)
+    return content_list
+
+
+def get_all_content(tdb, temp):
+    """Returns all layout content, with cell names replaced by creation order."""
+    content_list = get_raw_content(tdb, [temp])
+
+    name_table = {content[0]: 'cell%d' % idx for idx, content in enumerate(content_list)}
+    for content in content_list:
+        content[0] = name_table[content[0]]
+        for inst_info in content[1]:
+            inst_info['cell'] = name_table[inst_info['cell']]
+    return content_list
+
+
+def test_master_store(tmpdir):
+    store_dir = str(tmpdir.join('store'))
+    params = dict(ntr_list=[1, 3, 1])
+
+    Leaf.draw_cnt = Parent.draw_cnt = 0
+    tdb = make_db(store_dir=store_dir)
+    temp = tdb.new_template(params=params, temp_cls=Parent)
+    ref_content = get_all_content(tdb, temp)
+    ref_cnt = (Leaf.draw_cnt, Parent.draw_cnt)
+
+    # a new database loads every master from the store
+    tdb2 = make_db(store_dir=store_dir)
+    temp2 = tdb2.new_template(params=params, temp_cls=Parent)
+    assert (Leaf.draw_cnt, Parent.draw_cnt) == ref_cnt
+    # unchanged cells are not emitted again unless we forget them
+    assert get_raw_content(tdb2, [temp2]) == []
+    tdb2.master_store.clear_emitted('test_lib')
+    assert get_all_content(tdb2, temp2) == ref_content
+    assert temp2.bound_box == temp.bound_box
+    assert sorted(temp2.port_names_iter()) == sorted(temp.port_names_iter())
+    rect_set = set(temp.all_rect_iter())
+    assert rect_set and set(temp2.all_rect_iter()) == rect_set
+    assert not temp2.is_track_available(1, 0, 0, 100, unit_mode=True)
+    assert temp2.is_track_available(1, 4, 0, 100, unit_mode=True)
+
+    # changing the environment invalidates the stored masters
+    tdb3 = make_db(store_dir=store_dir, name_prefix='A')
+    tdb3.grid.add_new_layer(4, 0.2, 0.2, 'y', is_private=False)
+    tdb3.new_template(params=params, temp_cls=Parent)
+    assert (Leaf.draw_cnt, Parent.draw_cnt) == (2 * ref_cnt[0], 2 * ref_cnt[1])
+
+
+def test_incremental_regeneration(tmpdir, monkeypatch):
+    store_dir = str(tmpdir.join('store'))
+    params = dict(ntr_list=[1, 2])
+
+    def get_draw_cnt():
+        return Leaf.draw_cnt, Parent.draw_cnt, Top.draw_cnt, Block.draw_cnt
+
+    tdb = make_db(store_dir=store_dir)
+    top = tdb.new_template(params=params, temp_cls=Top)
+    num_cells = len(get_raw_content(tdb, [top]))
+
+    # nothing changed, so nothing is drawn or emitted
+    Leaf.draw_cnt = Parent.draw_cnt = Top.draw_cnt = Block.draw_cnt = 0
+    tdb = make_db(store_dir=store_dir)
+    top = tdb.new_template(params=params, temp_cls=Top)
+    assert get_draw_cnt() == (0, 0, 0, 0)
+    assert get_raw_content(tdb, [top]) == []
+
+    # edit the leaf generator
+    monkeypatch.setattr(Leaf, 'width', 2000)
+    get_class_fingerprint = MasterStore.get_class_fingerprint
+
+    def get_edited_fingerprint(self, gen_cls):
+        ans = get_class_fingerprint(self, gen_cls)
+        return ans + 'edited' if gen_cls is Leaf else ans
+
+    monkeypatch.setattr(MasterStore, 'get_class_fingerprint', get_edited_fingerprint)
+
+    # only the leaf and its dependents are drawn and emitted again
+    tdb = make_db(store_dir=store_dir)
+    top = tdb.new_template(params=params, temp_cls=Top)
+    leaf_cnt, parent_cnt, top_cnt, block_cnt = get_draw_cnt()
+    assert leaf_cnt > 0 and parent_cnt > 0 and top_cnt == 1 and block_cnt == 0
+    cell_names = [content[0] for content in get_raw_content(tdb, [top])]
+    assert len(cell_names) == num_cells - 1
+    assert top.cell_name in cell_names
+    assert not any(name.startswith('Block') for name in cell_names)
+
+    # the updated masters are reused
+    Leaf.draw_cnt = Parent.draw_cnt = Top.draw_cnt = Block.draw_cnt = 0
+    tdb = make_db(store_dir=store_dir)
+    top = tdb.new_template(params=params, temp_cls=Top)
+    assert get_draw_cnt() == (0, 0, 0, 0)
+    assert get_raw_content(tdb, [top]) == []
+
+
+def test_bounded_memory():
+    spec_list = [(Parent, dict(ntr_list=[ntr, ntr + 1])) for ntr in range(1, 7)]
+
+    tdb = make_db()
+    ref_list = [tdb.new_template(params=params, temp_cls=temp_cls)
+                for temp_cls, params in spec_list]
+    ref_content = [get_all_content(tdb, temp) for temp in ref_list]
+
+    Leaf.draw_cnt = Parent.draw_cnt = 0
+    tdb = make_db(max_masters=3)
+    temp_list = [tdb.new_template(params=params, temp_cls=temp_cls)
+                 for temp_cls, params in spec_list]
+    assert tdb.num_resident_masters == 3
+    draw_cnt = (Leaf.draw_cnt, Parent.draw_cnt)
+    # evicted masters keep their identity, and are reloaded on a cache hit
+    temp0 = temp_list[0]
+    assert '_layout' not in temp0.__dict__
+    assert tdb.new_template(params=spec_list[0][1], temp_cls=Parent) is temp0
+    assert '_layout' in temp0.__dict__
+    assert tdb.num_resident_masters == 3
+    # or when they are used
+    assert '_layout' not in temp_list[1].__dict__
+    assert temp_list[1].bound_box == ref_list[1].bound_box
+    assert [get_all_content(tdb, temp) for temp in temp_list] == ref_content
+    assert (Leaf.draw_cnt, Parent.draw_cnt) == draw_cnt
+
+
+def test_profiler(tmpdir):
+    tdb = make_db()
+    tdb.profiler = profiler = GenerationProfiler()
+    temp = tdb.new_template(params=dict(ntr_list=[1, 2, 1]), temp_cls=Parent)
+    tdb.new_template(params=dict(ntr_list=[1, 2, 1]), temp_cls=Parent)
+
+    leaf_name = '%s.%s' % (Leaf.__module__, Leaf.__name__)
+    parent_name = '%s.%s' % (Parent.__module__, Parent.__name__)
+    cls_stats = profiler.class_stats
+    parent_stats, leaf_stats = cls_stats[parent_name], cls_stats[leaf_name]
+    assert (parent_stats.hits, parent_stats.misses) == (1, 1)
+    assert leaf_stats.hits >= 1 and leaf_stats.misses == leaf_stats.num_masters >= 2
+    assert leaf_stats.cum_time <= parent_stats.cum_time
+    assert parent_stats.self_time < parent_stats.cum_time
+    assert parent_stats.num_geometries == temp.get_num_geometries() > 0
+    assert profiler.master_stats[temp.key].cell_name == temp.cell_name
+
+    fname = str(tmpdir.join('profile'))
+    profiler.write_report(fname)
+    profiler.write_folded(fname + '.folded')
+    with open(fname + '.folded') as f:
+        stacks = [line.rsplit(' ', 1)[0] for line in f]
+    assert sorted(stacks) == sorted([parent_name, '%s;%s' % (parent_name, leaf_name)])
+    with open(fname) as f:
+        report = f.read()
+    assert temp.cell_name in report and leaf_name in report
+
+
+def test_gds_export(tmpdir):
+    lay_file = tmpdir.join('gds_map.yaml')
+    lay_file.write('layer_map:\n'
+                   '  !!python/tuple ["", drawing]: [1, 0]\n'
+                   '  !!python/tuple ["", pin]: [1, 2]\n'
+                   '  !!python/tuple [M2, drawing]: [2, 0]\n'
+                   'via_info: {}\n')
+    tdb = TemplateDB('', make_grid(), 'gds_lib', gds_lay_file=str(lay_file))
+    temp = tdb.new_template(params=dict(ntr_list=[1, 3]), temp_cls=Parent)
+    with tmpdir.as_cwd():
+        tdb.instantiate_masters([temp])
+    records = read_records(str(tmpdir.join('gds_lib.gds')))
+    structs = get_structures(records)
+
+    # the 3-track wire array is an array reference of a shared box cell
+    box_name = get_box_cell_name(1, 0, 1000, 100)
+    assert set(structs.keys()) == {box_name, 'Leaf_2', 'Leaf_3', 'Parent'}
+    assert list(structs.keys()).index(box_name) < list(structs.keys()).index('Leaf_3')
+    leaf_types = [rtype for rtype, _ in structs['Leaf_3']]
+    assert leaf_types.count(0x0B00) == 1 and leaf_types.count(0x0800) == 3
+    assert [rtype for rtype, _ in structs['Parent']].count(0x0A00) == 2
+
+    # identical vias share a single via cell
+    via_lay_file = tmpdir.join('gds_via_map.yaml')
+    via_lay_file.write('layer_map:\n'
+                       '  !!python/tuple [M1, drawing]: [1, 0]\n'
+                       '  !!python/tuple [V1, drawing]: [2, 0]\n'
+                       '  !!python/tuple [M2, drawing]: [3, 0]\n'
+                       'via_info:\n'
+                       '  V1: {bot_layer: !!python/tuple [M1, drawing], '
+                       'top_layer: !!python/tuple [M2, drawing], '
+                       'via_layer: !!python/tuple [V1, drawing], '
+                       'cut_width: 0.032, cut_height: 0.032}\n')
+    res = tdb.grid.resolution
+    via_params = dict(id='V1', orient='R0', num_rows=2, num_cols=3, sp_rows=0.05,
+                      sp_cols=0.05, enc1=[0.01] * 4, enc2=[0.02, 0.02, 0, 0])
+    via_list = [ViaInfo(res, loc=[0.5, 0.5], **via_params),
+                ViaInfo(res, loc=[1.5, 0.5], arr_nx=4, arr_ny=1, arr_spx=0.5, arr_spy=0,
+                        **via_params),
+                ViaInfo(res, loc=[1.5, 1.5], **dict(via_params, num_rows=1))]
+    tdb = TemplateDB('', make_grid(), 'via_lib', gds_lay_file=str(via_lay_file))
+    with tmpdir.as_cwd():
+        tdb.create_masters_in_db('via_lib', [['top', [], [], via_list, [], [], [], [], []]])
+    structs = get_structures(read_records(str(tmpdir.join('via_lib.gds'))))
+    via_names = [name for name in structs if name.startswith('BAG_VIA_V1_')]
+    assert len(via_names) == 2 and len(structs) == 4
+    top_types = [rtype for rtype, _ in structs['top']]
+    assert top_types.count(0x0A00) == 2 and top_types.count(0x0B00) == 1
+    assert 0x0800 not in top_types
+
+
+def test_oasis_export(tmpdir):
+    lay_file = tmpdir.join('gds_map.yaml')
+    lay_file.write('layer_map:\n'
+                   '  !!python/tuple ["", drawing]: [1, 0]\n'
+                   '  !!python/tuple ["", pin]: [1, 2]\n'
+                   '  !!python/tuple [M2, drawing]: [2, 0]\n'
+                   'via_info: {}\n')
+    tdb = TemplateDB('', make_grid(), 'oas_lib', gds_lay_file=str(lay_file), stream_fmt='oasis')
+    temp = tdb.new_template(params=dict(ntr_list=[1, 3]), temp_cls=Parent)
+    with tmpdir.as_cwd():
+        tdb.instantiate_masters([temp])
+    unit, records = read_oasis(str(tmpdir.join('oas_lib.oas')))
+
+    assert unit == 1000
+    assert [fields for rid, fields in records if rid == 14] == [b'Leaf_3', b'Leaf_2', b'Parent']
+    # the 3-track wire array is a rectangle with a repetition
+    rep_list = [fields[-1] for rid, fields in records if rid == 20 and len(fields) == 7]
+    assert rep_list == [(3, (3, 400))]
+    assert len([rid for rid, _ in records if rid == 17]) == 2
+
+
+def test_gds_parallel_export(tmpdir):
+    lay_file = tmpdir.join('gds_map.yaml')
+    lay_file.write('layer_map:\n'
+                   '  !!python/tuple ["", drawing]: [1, 0]\n'
+                   '  !!python/tuple ["", pin]: [1, 2]\n'
+                   '  !!python/tuple [M2, drawing]: [2, 0]\n'
+                   'via_info: {}\n')
+    spec_list = [(Parent, dict(ntr_list=[ntr, ntr + 1, 1])) for ntr in range(1, 40)]
+
+    structs_list = []
+    for idx, num_workers in enumerate((0, 3)):
+        lib_name = 'gds_lib%d' % idx
+        tdb = TemplateDB('', make_grid(), lib_name, gds_lay_file=str(lay_file),
+                         gds_num_workers=num_workers)
+        temp_list = tdb.new_template_list(spec_list)
+        with tmpdir.as_cwd():
+            tdb.instantiate_masters(temp_list)
+        records = read_records(str(tmpdir.join('%s.gds' % lib_name)))
+        # ignore timestamps and library name
+        records = [item for item in records if item[0] not in (0x0102, 0x0206, 0x0502)]
+        structs_list.append(records)
+
+    assert structs_list[0] == structs_list[1]
+
+
+class LayerTechInfo(DummyTechInfo):
+    def get_layer_id(self, layer_name):
+        if layer_name in ('M1', 'M2', 'M3'):
+            return int(layer_name[1])
+        raise ValueError('Unknown layer %s' % layer_name)
+
+
+def test_gds_black_box(tmpdir):
+    lay_file = tmpdir.join('gds_map.yaml')
+    lay_file.write('layer_map:\n'
+                   '  !!python/tuple [M1, drawing]: [1, 0]\n'
+                   '  !!python/tuple [M2, drawing]: [2, 0]\n'
+                   '  !!python/tuple [OD, drawing]: [5, 0]\n')
+    gds_fname = str(tmpdir.join('ip.gds'))
+    with GDSWriter(gds_fname, 'ip_lib', 1e-6, 1e-9) as writer:
+        sub = writer.new_cell('SUB')
+        sub.add_box(2, 0, 0, 0, 100, 1000)
+        writer.write_cell(sub)
+        top = writer.new_cell('IP')
+        top.add_box(1, 0, 0, 50, 1000, 150)
+        top.add_box(5, 0, -100, -100, 2000, 1000)
+        # M2 wires on every other track, except the first one
+        top.add_ref('SUB', 450, 0, nx=3, spx=400)
+        writer.write_cell(top)
+
+    grid = RoutingGrid(LayerTechInfo({}), [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    tdb = TemplateDB('', grid, 'test_lib', gds_lay_file=str(lay_file))
+    temp = tdb.new_template(params=dict(lib_name='ip_lib', cell_name='IP', gds_fname=gds_fname,
+                                        top_layer=2), temp_cls=GDSBlackBoxTemplate)
+    assert temp.prim_bound_box.get_bounds(unit_mode=True) == (-100, -100, 2000, 1000)
+    assert not temp.is_track_available(1, 0, 0, 1000, unit_mode=True)
+    assert temp.is_track_available(1, 1, 0, 1000, unit_mode=True)
+    assert temp.is_track_available(2, 1, 0, 1000, unit_mode=True)
+    assert [temp.is_track_available(2, idx, 0, 1000, unit_mode=True)
+            for idx in (2, 3, 4, 5, 6)] == [False, True, False, True, False]
+    assert len(list(temp.blockage_iter(2, BBox(0, 0, 2000, 1000, grid.resolution,
+                                                unit_mode=True)))) == 3
+
+
+def test_parallel_finalize():
+    spec_list = [(Parent, dict(ntr_list=ntr_list)) for ntr_list in ([1, 2], [2, 3], [3, 1, 4])]
+
+    tdb = make_db()
+    ref_list = [tdb.new_template(params=params, temp_cls=temp_cls)
+                for temp_cls, params in spec_list]
+    ref_content = [get_all_content(tdb, temp) for temp in ref_list]
+
+    par_content = None
+    for _ in range(2):
+        tdb2 = make_db()
+        temp_list = tdb2.new_template_list(spec_list, num_workers=3)
+        assert [get_all_content(tdb2, temp) for temp in temp_list] == ref_content
+        # cell names must not depend on worker scheduling
+        content = get_raw_content(tdb2, temp_list)
+        assert par_content is None or content == par_content
+        par_content = content
+
+
+def get_flat_box_list(temp, loc=(0, 0), orient='R0'):
+    """Returns all boxes in the given template, flattened one box at a time."""
+    res = temp.grid.resolution
+    ans = []
+    for layer, boxes in temp._layout.get_box_arrays().items():
+        for xl, yb, xr, yt in boxes.tolist():
+            box = BBox(xl, yb, xr, yt, res, unit_mode=True).transform(loc, orient,
+                                                                      unit_mode=True)
+            ans.append((layer, box.left_unit, box.bottom_unit, box.right_unit, box.top_unit))
+    for inst in temp.instance_iter():
+        for row in range(inst.ny):
+            for col in range(inst.nx):
+                dx, dy = inst.get_item_location(row=row, col=col, unit_mode=True)
+                inst_loc = inst.location_unit[0] + dx, inst.location_unit[1] + dy
+                new_loc, new_orient = transform_loc_orient(inst_loc, inst.orientation, loc,
+                                                           orient)
+                new_loc = int(round(new_loc[0])), int(round(new_loc[1]))
+                ans.extend(get_flat_box_list(inst.master, new_loc, new_orient))
+    return ans
+
+
+def test_transform_box_array():
+    boxes = np.array([[0, 0, 10, 20], [-5, 3, 7, 9]], dtype=np.int64)
+    for orient in transform_table:
+        ans = transform_box_array(boxes, (100, 200), orient, nx=2, ny=3, spx=50, spy=70)
+        expected = []
+        for row in range(3):
+            for col in range(2):
+                loc = (100 + 50 * col, 200 + 70 * row)
+                for xl, yb, xr, yt in boxes.tolist():
+                    box = BBox(xl, yb, xr, yt, 0.001, unit_mode=True).transform(loc, orient,
+                                                                                unit_mode=True)
+                    expected.append([box.left_unit, box.bottom_unit, box.right_unit,
+                                     box.top_unit])
+        assert ans.tolist() == expected
+
+
+def test_rect_store(capsys):
+    res = 0.001
+    rect_list = [Rect(('M1', 'drawing'), BBox(0, 0, 100, 20, res, unit_mode=True)),
+                 Rect('M2', BBox(10, -50, 30, 200, res, unit_mode=True), nx=3, ny=2, spx=40,
+                      spy=300, unit_mode=True),
+                 Rect(('M1', 'drawing'), BBox(-30, 40, 70, 60, res, unit_mode=True))]
+    store = RectStore(res)
+    for rect in rect_list:
+        bbox = rect.bbox
+        store.add(rect.layer, bbox.left_unit, bbox.bottom_unit, bbox.right_unit,
+                  bbox.top_unit, nx=rect.nx, ny=rect.ny, spx=rect.spx_unit, spy=rect.spy_unit)
+    store.add_boxes('M3', np.array([[0, 0, 5, 5], [10, 0, 10, 5]]))
+    assert len(store) == 5
+
+    store.compact()
+    assert 'non-physical' in capsys.readouterr().out
+    assert len(store) == 4
+    assert list(store)[:3] == [rect.content for rect in rect_list]
+    assert store.layers == [('M1', 'drawing'), ('M2', 'drawing'), ('M3', 'drawing')]
+
+    overall = store.get_overall_bbox(('M2', 'drawing'))
+    assert (overall.left_unit, overall.bottom_unit, overall.right_unit,
+            overall.top_unit) == (10, -50, 110, 500)
+    assert not store.get_overall_bbox(('M4', 'drawing')).is_valid()
+    box_arrays = store.get_box_arrays()
+    assert box_arrays[('M1', 'drawing')].tolist() == [[0, 0, 100, 20], [-30, 40, 70, 60]]
+    assert len(box_arrays[('M2', 'drawing')]) == 6
+
+    store.move_by(1, 2)
+    assert store.boxes[0].tolist() == [1, 2, 101, 22]
+    assert pickle.loads(pickle.dumps(store)).boxes.tolist() == store.boxes.tolist()
+
+
+def test_flatten():
+    tdb = make_db(flatten=True)
+    assert tdb.flatten
+    temp = tdb.new_template(params=dict(ntr_list=[1, 2]), temp_cls=ArrayTop)
+    flat_boxes = temp.get_flat_boxes()
+
+    # masters are flattened once, and the result is memoized
+    assert temp.get_flat_boxes() is flat_boxes
+    parent = next(temp.instance_iter()).master
+    assert parent._flat_boxes is not None
+
+    box_list = [(layer, xl, yb, xr, yt) for layer, boxes in flat_boxes.items()
+                for xl, yb, xr, yt in boxes.tolist()]
+    assert sorted(box_list) == sorted(get_flat_box_list(temp))
+    assert not flat_boxes[('M2', 'drawing')].flags.writeable
+
+    # templates are not flattened until requested otherwise
+    tdb = make_db()
+    temp = tdb.new_template(params=dict(ntr_list=[1, 2]), temp_cls=ArrayTop)
+    assert temp._flat_boxes is None
+    assert {layer: boxes.tolist() for layer, boxes in temp.get_flat_boxes().items()} == \
+        {layer: boxes.tolist() for layer, boxes in flat_boxes.items()}
+
+
+def get_flat_rect_list(temp, loc=(0, 0), orient='R0'):
+    """Returns all used track rectangles in the given template, one array element at a time."""
+    ans = []
+    flip = orient in ('R90', 'R270', 'MXR90', 'MYR90')
+    for layer_id, box, dx, dy in temp.used_tracks.all_rect_iter():
+        box = box.transform(loc, orient, unit_mode=True)
+        if flip:
+            dx, dy = dy, dx
+        ans.append((layer_id, box.left_unit, box.bottom_unit, box.right_unit, box.top_unit,
+                    dx, dy))
+    for inst in temp.instance_iter():
+        for row in range(inst.ny):
+            for col in range(inst.nx):
+                dx, dy = inst.get_item_location(row=row, col=col, unit_mode=True)
+                inst_loc = inst.location_unit[0] + dx, inst.location_unit[1] + dy
+                new_loc, new_orient = transform_loc_orient(inst_loc, inst.orientation, loc,
+                                                           orient)
+                new_loc = int(round(new_loc[0])), int(round(new_loc[1]))
+                ans.extend(get_flat_rect_list(inst.master, new_loc, new_orient))
+    return ans
+
+
+def test_rect_arrays():
+    tdb = make_db()
+    temp = tdb.new_template(params=dict(ntr_list=[1, 2]), temp_cls=ArrayTop)
+    res = temp.grid.resolution
+    ref_list = get_flat_rect_list(temp)
+    assert len(ref_list) == 12
+
+    rect_list = [(layer_id,) + tuple(rect) for layer_id, rect_arr in
+                 temp.get_all_rect_arrays().items() for rect in rect_arr.tolist()]
+    assert sorted(rect_list) == sorted(ref_list)
+    assert sorted((layer_id, box.left_unit, box.bottom_unit, box.right_unit, box.top_unit, dx, dy)
+                  for layer_id, box, dx, dy in temp.all_rect_iter()) == sorted(ref_list)
+
+    for bnds in ((0, 0, 20000, 20000), (0, 3960, 100, 4000), (5000, 0, 5100, 4100),
+                 (-100, 7000, 5000, 12000), (1000, 0, 6000, 3990)):
+        test_box = BBox(bnds[0], bnds[1], bnds[2], bnds[3], res, unit_mode=True)
+        # all rectangles whose spacing box touches the test box
+        ref = sorted(rect[1:] for rect in ref_list
+                     if rect[1] - rect[5] <= bnds[2] and rect[3] + rect[5] >= bnds[0] and
+                     rect[2] - rect[6] <= bnds[3] and rect[4] + rect[6] >= bnds[1])
+        assert sorted(map(tuple, temp.get_rect_array(1, test_box).tolist())) == ref
+        assert sorted(box.get_bounds(unit_mode=True)
+                      for box in temp.intersection_rect_iter(1, test_box)) == \
+            sorted(rect[:4] for rect in ref)
+        # blockages, computed one rectangle at a time
+        ref = []
+        for _, xl, yb, xr, yt, sdx, sdy in ref_list:
+            box = BBox(xl, yb, xr, yt, res, unit_mode=True)
+            if (box.expand(dx=sdx, dy=sdy, unit_mode=True).overlaps(test_box) or
+                    test_box.expand(dx=30, dy=5, unit_mode=True).overlaps(box)):
+                box = box.expand(dx=max(30, sdx), dy=max(5, sdy), unit_mode=True)
+                ref.append(box.get_bounds(unit_mode=True))
+        assert sorted(box.get_bounds(unit_mode=True) for box in
+                      temp.blockage_iter(1, test_box, spx=30, spy=5)) == sorted(ref)
+
+    # finalized masters cache query results, in master coordinate
+    parent = next(temp.instance_iter()).master
+    assert parent._rect_query_cache
+    key = next(iter(parent._rect_query_cache))
+    box = BBox(key[1], key[2], key[3], key[4], res, unit_mode=True)
+    rect_arr = parent.get_rect_array(key[0], box)
+    assert parent.get_rect_array(key[0], box) is rect_arr and not rect_arr.flags.writeable
+
+    temp.merge_inst_tracks()
+    rect_list = [(layer_id,) + tuple(rect) for layer_id, rect_arr in
+                 temp.get_all_rect_arrays().items() for rect in rect_arr.tolist()]
+    assert sorted(rect_list) == sorted(ref_list)
+
+
+def test_track_occupancy():
+    tdb = make_db()
+    temp = tdb.new_template(params=dict(ntr_list=[1, 2]), temp_cls=ArrayTop)
+    grid = temp.grid
+
+    def ref_available(tr_idx, lower, upper, sp, sp_le):
+        test_box = grid.get_bbox(1, tr_idx, lower, upper, unit_mode=True)
+        return not list(temp.blockage_iter(1, test_box, spx=sp_le, spy=sp))
+
+    tr_list = [0.5 * idx for idx in range(-2, 180)]
+    intv_list = [(0, 20000), (-100, 990), (1020, 4980), (1025, 4975), (5990, 6010)]
+    for sp, sp_le in ((0, 0), (30, 5), (5, 40), (150, 0), (20, 20)):
+        for lower, upper in intv_list:
+            ref = [tr_idx for tr_idx in tr_list if ref_available(tr_idx, lower, upper, sp, sp_le)]
+            if sp == sp_le:
+                assert temp.get_available_tracks(1, tr_list, lower, upper, margin=sp,
+                                                 unit_mode=True) == ref
+            assert [tr_idx for tr_idx in tr_list
+                    if temp.is_track_available(1, tr_idx, lower, upper, sp=sp, sp_le=sp_le,
+                                               unit_mode=True)] == ref
+
+    # open intervals are the complement of blockages
+    tid = TrackID(1, 38.5)
+    test_box = grid.get_bbox(1, 38.5, 0, 20000, unit_mode=True)
+    ref = IntervalSet()
+    for box in temp.blockage_iter(1, test_box, spx=5, spy=30):
+        ref.add((max(box.left_unit, 0), min(box.right_unit, 20000)), merge=True, abut=True)
+    assert list(temp.open_interval_iter(tid, 0, 20000, sp=30, sp_le=5)) == \
+        list(ref.complement_iter((0, 20000)))
+    assert list(temp.open_interval_iter(tid, 0, 20000, sp=30, sp_le=5, min_len=4000)) == \
+        [intv for intv in ref.complement_iter((0, 20000)) if intv[1] - intv[0] >= 4000]
+
+    # the cache is cleared when new tracks are recorded before finalization, but only on
+    # the recorded layer.
+    temp._finalized = False
+    assert temp.is_track_available(1, 150, 0, 1000, unit_mode=True)
+    occ_table = temp._get_track_occupancy_table(1)
+    temp.used_tracks.record_box(2, grid.get_bbox(2, 150, 500, 600, unit_mode=True), 0, 0,
+                                grid.resolution)
+    assert temp._get_track_occupancy_table(1) is occ_table
+    temp.used_tracks.record_box(1, grid.get_bbox(1, 150, 500, 600, unit_mode=True), 0, 0,
+                                grid.resolution)
+    assert not temp.is_track_available(1, 150, 0, 1000, unit_mode=True)
+
+    # misses only compute a window around the query
+    key = (301, 1, 0, 0)
+    wl, wu, _ = temp._get_track_occupancy_table(1)[key]
+    assert wu - wl < 100000
+    assert temp.is_track_available(1, 150, 500000, 501000, unit_mode=True)
+    assert temp._get_track_occupancy_table(1)[key][0] > wu
+
+    # the cache is cleared when instances change
+    def get_available():
+        return [[tr_idx for tr_idx in tr_list
+                 if temp.is_track_available(1, tr_idx, lower, upper, sp=sp, sp_le=sp_le,
+                                            unit_mode=True)]
+                for lower, upper in intv_list for sp, sp_le in ((0, 0), (30, 5))]
+
+    old_list = get_available()
+    next(temp.instance_iter()).move_by(dy=300, unit_mode=True)
+    ref_list = [[tr_idx for tr_idx in tr_list if ref_available(tr_idx, lower, upper, sp, sp_le)]
+                for lower, upper in intv_list for sp, sp_le in ((0, 0), (30, 5))]
+    assert ref_list != old_list
+    assert get_available() == ref_list
+
+
+class ViaTechInfo(LayerTechInfo):
+    def get_layer_name(self, layer_id):
+        return 'M%d' % layer_id
+
+    def get_via_drc_info(self, vname, vtype, mtype, mw_unit, is_bot):
+        if vtype != 'square':
+            raise ValueError('only square vias are supported.')
+        return (20, 20), None, None, (20, 20), [(10, 10)], None, None
+
+
+class QueryThenWire(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return {}
+
+    def draw_layout(self):
+        assert self.is_track_available(1, 5, 0, 1000, unit_mode=True)
+        self.add_wires(1, 5, 0, 1000, unit_mode=True)
+        self.set_size_from_bound_box(2, BBox(0, 0, 2000, 2000, self.grid.resolution,
+                                             unit_mode=True), round_up=True)
+
+
+def test_track_occupancy_after_finalize():
+    grid = RoutingGrid(ViaTechInfo({}), [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    temp = TemplateDB('', grid, 'test_lib').new_template(params={}, temp_cls=QueryThenWire)
+    test_box = grid.get_bbox(1, 5, 0, 1000, unit_mode=True)
+    assert list(temp.blockage_iter(1, test_box))
+    assert not temp.is_track_available(1, 5, 0, 1000, unit_mode=True)
+    assert not list(temp.open_interval_iter(TrackID(1, 5), 0, 1000))
+    assert temp.get_available_tracks(1, [4, 5, 6], 0, 1000, unit_mode=True) == [4, 6]
+
+
+class ConnectCell(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(num='number of connections.', batch='True to use the batch method.')
+
+    def draw_layout(self):
+        conn_list = []
+        for idx in range(self.params['num']):
+            bot = self.add_wires(1, 4 * idx, 0, 300 + 100 * (idx % 3), unit_mode=True)
+            top = self.add_wires(3, 2 * idx, 0, 300, width=1 + idx % 2, num=2, pitch=2,
+                                 unit_mode=True)
+            conn_list.append(([bot, top], TrackID(2, 3 * idx, width=1 + idx % 2)))
+        if self.params['batch']:
+            self.warr_list = self.connect_to_tracks_batch(conn_list, min_len_mode=0)
+        else:
+            self.warr_list = [self.connect_to_tracks(wires, tid, min_len_mode=0)
+                              for wires, tid in conn_list]
+
+
+def test_connect_to_tracks_batch():
+    grid = RoutingGrid(ViaTechInfo({}), [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    result_list = []
+    for batch in (False, True):
+        tdb = TemplateDB('', grid, 'test_lib')
+        temp = tdb.new_template(params=dict(num=6, batch=batch), temp_cls=ConnectCell)
+        layout = temp._layout
+        vias = sorted(str(sorted(via.content.items())) for via in layout._via_list)
+        boxes = {layer: sorted(box_arr.tolist()) for layer, box_arr in
+                 layout.get_box_arrays().items()}
+        tracks = {layer_id: sorted(rect_arr.tolist()) for layer_id, rect_arr in
+                  temp.used_tracks.get_all_rect_arrays().items()}
+        warrs = [(warr.layer_id, warr.track_id.base_index, warr.width, warr.lower_unit,
+                  warr.upper_unit) for warr in temp.warr_list]
+        result_list.append((vias, boxes, tracks, warrs))
+
+    assert result_list[0] == result_list[1]
+    vias, boxes, tracks, warrs = result_list[0]
+    assert len(vias) == 12
+    assert sorted(tracks) == [1, 2, 3]
+    assert warrs[1] == (2, 3, 2, 350, 1050)
+
+
+def test_via_cache(monkeypatch):
+    tech_info = ViaTechInfo({})
+    res = tech_info.resolution
+    assert list(tech_info._via_nxy_iter(3, 2)) == \
+        sorted(((nx * ny, nx, ny) for nx in range(1, 4) for ny in range(1, 3)), reverse=True)
+
+    info0 = tech_info.get_via_info(BBox(0, 0, 100, 200, res, unit_mode=True), 'M1', 'M2', 'x')
+    info1 = tech_info.get_via_info(BBox(300, 50, 400, 250, res, unit_mode=True), 'M1', 'M2', 'x')
+    assert info1['top_box'] == info0['top_box'].move_by(300, 50, unit_mode=True)
+    assert info1['bot_box'] == info0['bot_box'].move_by(300, 50, unit_mode=True)
+    assert info1['params']['loc'] == (350 * res, 150 * res)
+    assert info1['params']['num_rows'] == info0['params']['num_rows'] == 5
+    # no via fits in a 10 x 10 box
+    assert tech_info.get_via_info(BBox(0, 0, 10, 10, res, unit_mode=True), 'M1', 'M2',
+                                  'y') is None
+    assert tech_info.get_via_info(BBox(0, 0, 10, 10, res, unit_mode=True), 'M1', 'M2',
+                                  'y') is None
+    assert tech_info.get_via_cache_stats() == {
+        ('M1', 'M2', 'x', 'y', 100, 200, True, -1, -1): (1, 1),
+        ('M1', 'M2', 'y', 'x', 10, 10, True, -1, -1): (1, 1),
+    }
+
+    # the cache is bounded
+    monkeypatch.setattr('bag.layout.core._VIA_CACHE_SIZE', 4)
+    for w in range(40, 400, 40):
+        tech_info.get_via_info(BBox(0, 0, w, 100, res, unit_mode=True), 'M1', 'M2', 'x')
+    assert len(tech_info._via_cache) == 4
+    assert len(tech_info.get_via_cache_stats()) == 4
+    tech_info.clear_via_cache()
+    assert not tech_info.get_via_cache_stats()
+
+
+class MeshCell(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(bot_list='bottom wire parameters.', top_list='top wire parameters.')
+
+    def draw_layout(self):
+        bot_warrs = [self.add_wires(1, *args, unit_mode=True) for args in self.params['bot_list']]
+        top_warrs = [self.add_wires(2, *args, unit_mode=True) for args in self.params['top_list']]
+        self.draw_vias_on_intersections(bot_warrs, top_warrs)
+
+
+@pytest.mark.parametrize('w_override', [False, True])
+def test_draw_vias_on_intersections(w_override):
+    # (track_idx, lower, upper, width, num, pitch)
+    bot_list = [(0, 0, 3000, 1, 10, 2), (21, 500, 1500, 2, 4, 3), (40.5, 0, 3000)]
+    top_list = [(1, 0, 4500, 1, 12, 1), (20, 100, 1950, 3, 2, 5), (3, 2000, 4000)]
+    grid = RoutingGrid(ViaTechInfo({}), [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    if w_override:
+        grid.add_width_override(1, 2, 0.25)
+        grid.add_width_override(2, 3, 0.4)
+    tdb = TemplateDB('', grid, 'test_lib')
+    temp = tdb.new_template(params=dict(bot_list=bot_list, top_list=top_list),
+                            temp_cls=MeshCell)
+
+    ref_list = []
+    for tr_idx, lower, upper, *arr_info in bot_list:
+        bwarr = WireArray(TrackID(1, tr_idx, *arr_info), lower, upper, res=grid.resolution,
+                          unit_mode=True)
+        for btr in bwarr.track_id:
+            btl, btu = grid.get_wire_bounds(1, btr, width=bwarr.width, unit_mode=True)
+            for ttr_idx, tlower, tupper, *tarr_info in top_list:
+                tid = TrackID(2, ttr_idx, *tarr_info)
+                for ttr in tid:
+                    ttl, ttu = grid.get_wire_bounds(2, ttr, width=tid.width, unit_mode=True)
+                    if tupper >= btu and tlower <= btl and upper >= ttu and lower <= ttl:
+                        ref_list.append((ttl, btl, ttu, btu))
+
+    via_list = temp._layout._via_list
+    box_list = [box.get_bounds(unit_mode=True) for via in via_list for box in via.bbox_array]
+    assert sorted(box_list) == sorted(ref_list)
+    # the regular lattices are drawn as via arrays
+    # each regular lattice of intersections is one via array
+    assert sorted((via.nx, via.ny) for via in via_list) == [(1, 5), (4, 1), (12, 10)]
+
+
+class RouteCell(TemplateBase):
+    @classmethod
+    def get_params_info(cls):
+        # type: () -> Dict[str, str]
+        return dict(obs_list='obstacle wire parameters.', net_list='pin wire parameters.')
+
+    def draw_layout(self):
+        res = self.grid.resolution
+        self.set_size_from_bound_box(3, BBox(0, 0, 6000, 6000, res, unit_mode=True))
+        self.obs_list = [self.add_wires(*args, unit_mode=True) for args in self.params['obs_list']]
+        self.pin_list = [tuple(self.add_wires(*args, unit_mode=True) for args in pins)
+                         for pins in self.params['net_list']]
+        router = MazeRouter(self, 1, 3)
+        self.route_list = router.route_nets(self.pin_list)
+
+
+def test_maze_router():
+    # (layer_id, track_idx, lower, upper)
+    obs_list = [(2, 0, 0, 6000), (2, 1, 900, 1500), (2, 20, 0, 6000), (2, 21, 0, 6000),
+                (1, 20, 3000, 3950), (1, 20, 4450, 6000)]
+    net_list = [((1, 2, 0, 400), (1, 10, 0, 400)),
+                ((1, 6, 0, 1000), (1, 6, 3000, 3500)),
+                ((1, 20, 4000, 4400), (1, 25, 0, 400))]
+    grid = RoutingGrid(ViaTechInfo({}), [1, 2, 3], [0.1, 0.1, 0.1], [0.1, 0.1, 0.1], 'x')
+    tdb = TemplateDB('', grid, 'test_lib')
+    temp = tdb.new_template(params=dict(obs_list=obs_list, net_list=net_list),
+                            temp_cls=RouteCell)
+
+    def get_boxes(warr_list):
+        return [(warr.layer_id, box) for warr in warr_list
+                for box in warr.get_bbox_array(grid)]
+
+    # the first net jumps over the obstacles, the second extends its pins, and the source
+    # pin of the last net is enclosed.
+    assert [warr.layer_id for warr in temp.route_list[0]] == [1, 2, 1]
+    assert len(temp.route_list[1]) == 1
+    assert temp.route_list[2] is None
+    net_boxes = [get_boxes(temp.obs_list)]
+    for (src, dst), warr_list in zip(temp.pin_list[:2], temp.route_list[:2]):
+        # wires end on the pins, and each pair of consecutive wires is connected by a via.
+        assert warr_list[0].layer_id == 1
+        assert warr_list[0].track_id.base_index == src.track_id.base_index
+        assert warr_list[-1].layer_id == 1
+        assert warr_list[-1].track_id.base_index == dst.track_id.base_index
+        for warr0, warr1 in zip(warr_list[:-1], warr_list[1:]):
+            assert abs(warr0.layer_id - warr1.layer_id) == 1
+            box0 = warr0.get_bbox_array(grid).base
+            box1 = warr1.get_bbox_array(grid).base
+            assert box0.overlaps(box1)
+        net_boxes.append(get_boxes(warr_list) + get_boxes([src, dst]))
+    assert len(temp._layout._via_list) == sum(len(warr_list) - 1
+                                               for warr_list in temp.route_list[:2])
+
+    # wires of different nets do not touch
+    for idx, box_list in enumerate(net_boxes):
+        for other_list in net_boxes[idx + 1:]:
+            for lay0, box0 in box_list:
+                for lay1, box1 in other_list:
+                    assert lay0 != lay1 or not box0.overlaps(box1)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,71 @@
+import pickle
+
+import pytest
+
+from bag.layout.util import BBox, BBoxArray, transform_table
+from bag.layout.routing import TrackID, WireArray
+
+
+def test_bbox_slots():
+    box = BBox(1.5, 2, 10.4, 20, 0.001, unit_mode=True)
+    assert box.get_bounds(unit_mode=True) == (2, 2, 10, 20)
+    assert all(type(val) is int for val in box.get_bounds(unit_mode=True))
+    with pytest.raises(AttributeError):
+        box.foo = 1
+
+    h = hash(box)
+    box2 = pickle.loads(pickle.dumps(box))
+    assert box2 == box and hash(box2) == h
+    assert box2 != BBox(2, 2, 10, 21, 0.001, unit_mode=True)
+    assert {box: 1}[BBox(0.002, 0.002, 0.01, 0.02, 0.001)] == 1
+
+
+def test_bbox_transform():
+    box = BBox(10, -20, 30, 50, 0.001, unit_mode=True)
+    for orient, mat in transform_table.items():
+        pts = [mat.dot((x, y)) + (7, 9) for x, y in box.get_points(unit_mode=True)]
+        xs = [int(pt[0]) for pt in pts]
+        ys = [int(pt[1]) for pt in pts]
+        ans = box.transform((7, 9), orient, unit_mode=True)
+        assert ans.get_bounds(unit_mode=True) == (min(xs), min(ys), max(xs), max(ys))
+    with pytest.raises(ValueError):
+        box.transform((0, 0), 'R45', unit_mode=True)
+
+    box_arr = pickle.loads(pickle.dumps(BBoxArray(box, nx=2, spx=100, unit_mode=True)))
+    assert box_arr.right_unit == 130 and box_arr.base == box
+
+
+def test_track_id_from_htr():
+    tid = TrackID(3, 2.5, width=2, num=3, pitch=1.5)
+    tid2 = TrackID.from_htr(3, tid.index_htr, width=2, num=3, hpitch=tid.pitch_htr)
+    assert tid2.get_immutable_key() == tid.get_immutable_key()
+    assert list(tid2) == [2.5, 4, 5.5]
+
+    warr = WireArray(tid, 0, 100, res=0.001, unit_mode=True)
+    assert [w.track_id.base_index for w in warr.warr_iter()] == [2.5, 4, 5.5]
+    warr2 = pickle.loads(pickle.dumps(warr))
+    assert warr2.get_immutable_key() == warr.get_immutable_key()
+
+
+def test_legacy_pickle_state():
+    # objects pickled before __slots__ was added store their __dict__
+    box = BBox.__new__(BBox)
+    box.__setstate__(dict(_left_unit=1, _bot_unit=2, _right_unit=3, _top_unit=4, _res=0.001))
+    assert box == BBox(1, 2, 3, 4, 0.001, unit_mode=True)
+    assert hash(box) == hash(BBox(1, 2, 3, 4, 0.001, unit_mode=True))
+
+    box_arr = BBoxArray.__new__(BBoxArray)
+    box_arr.__setstate__(dict(_bbox=box, _nx=2, _ny=1, _spx_unit=10, _spy_unit=0))
+    assert box_arr.right_unit == 13
+
+    tid = TrackID.__new__(TrackID)
+    tid.__setstate__(dict(_layer_id=3, _hidx=6, _w=2, _n=3, _hpitch=3))
+    assert tid.get_immutable_key() == TrackID(3, 2.5, width=2, num=3, pitch=1.5).get_immutable_key()
+
+    warr = WireArray.__new__(WireArray)
+    warr.__setstate__((None, dict(_track_id=tid, _res=0.001, _lower_unit=0, _upper_unit=100)))
+    assert warr.get_immutable_key() == WireArray(tid, 0, 100, res=0.001,
+                                                 unit_mode=True).get_immutable_key()
+
+    with pytest.raises(ValueError):
+        BBox.__new__(BBox).__setstate__(dict(_left_unit=1))
@@ -0,0 +1,58 @@
+import pytest
+
+from bag.layout.util import BBox
+from bag.util.cache import DesignMaster
+from bag.util.hashkey import KeyEncoder
+
+
+@pytest.mark.parametrize("val1, val2", [
+    ([1, 2, 3], (1, 2, 3)),
+    (dict(a=1, b=[2.0, 3]), dict(b=(2, 3.0), a=True)),
+    (list(range(20)), tuple(range(20))),
+    ([list(range(10))] * 3, [tuple(range(10)) for _ in range(3)]),
+    ({'x': BBox(0, 0, 10, 10, 0.001, unit_mode=True)},
+     {'x': BBox(0, 0, 0.01, 0.01, 0.001)}),
+])
+def test_equal_keys(val1, val2):
+    assert DesignMaster.to_immutable_id(val1) == DesignMaster.to_immutable_id(val2)
+    encoder = KeyEncoder()
+    key = encoder.get_key(val1)
+    assert len(key) == 16
+    assert key == encoder.get_key(val2)
+    # interned digests do not change the result
+    assert key == encoder.get_key(val1)
+    assert key == KeyEncoder().get_key(val2)
+
+
+@pytest.mark.parametrize("val1, val2", [
+    ([1, 2, 3], [1, 2, 4]),
+    (['ab', 'c'], ['a', 'bc']),
+    ([[1, 2], 3], [1, [2, 3]]),
+    (dict(a=1), dict(b=1)),
+    (list(range(20)), list(range(1, 21))),
+    (0.5, 1),
+    (None, 'N'),
+])
+def test_different_keys(val1, val2):
+    encoder = KeyEncoder()
+    assert encoder.get_key(val1) != encoder.get_key(val2)
+
+
+def test_unrecognized_value():
+    with pytest.raises(Exception):
+        KeyEncoder().get_key([object()])
+
+
+class _TempKey(object):
+    def __init__(self, val):
+        self.items = [val] * 40
+
+    def get_immutable_key(self):
+        # a new temporary list on every call, freed right after it is encoded.
+        return self.items[:]
+
+
+def test_temporary_sub_keys():
+    # the second temporary list can reuse the ID of the first one.
+    assert KeyEncoder().get_key([_TempKey(0), _TempKey(1)]) != \
+        KeyEncoder().get_key([_TempKey(0), _TempKey(0)])